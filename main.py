@@ -2,13 +2,27 @@
 import sys
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
 import random
 import asyncio
+import contextlib
+import functools
+import hashlib
+import json
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 from models.bet import Bet
-from utils.database import HybridDatabase, get_translations
+from models.panel import PANEL_TOMBSTONED, PanelRecord
+from utils.database import get_translations
+from utils.async_database import AsyncHybridDatabase
+from utils.locks import LocalLockProvider, LockTimeout, create_lock_provider
+from utils.panel_edits import create_panel_edit_scheduler
+from utils.matchmaking import (
+    ALREADY_QUEUED, IN_ACTIVE_BET, LEFT, MODE_SPECS, PANEL_FAMILIES, TEAM_FULL,
+    Match, ModeSpec, PanelState, get_mode_spec,
+)
 from aiohttp import web
 
 # Forçar logs para stdout sem buffer (ESSENCIAL para Railway)
@@ -54,11 +68,9 @@ def log(message):
     sys.stdout.flush()
     sys.stderr.flush()
 
-# Lock global para evitar race conditions na criação de apostas
-queue_locks = {}
-# Lock para proteção na criação de novos locks - INICIALIZADO AQUI
-import asyncio as _asyncio_init
-queue_locks_creation_lock = _asyncio_init.Lock()
+# Locks por fila para evitar race conditions na criação de apostas
+# (trocado por create_lock_provider(db) depois de conectar ao banco)
+queue_locks = LocalLockProvider()
 
 # Detectar ambiente de execução
 IS_FLYIO = os.getenv("FLY_APP_NAME") is not None
@@ -105,7 +117,7 @@ bot = commands.Bot(
     member_cache_flags=discord.MemberCacheFlags.none(),  # Sem cache de membros
     max_messages=10  # Cache ULTRA mínimo de mensagens (padrão é 1000)
 )
-db = HybridDatabase()
+db = AsyncHybridDatabase()
 
 MODES = ["1v1-misto", "1v1-mob", "2v2-misto", "2v2-mob", "3v3-misto", "3v3-mob", "4v4-misto", "4v4-mob"]
 ACTIVE_BETS_CATEGORY = "Apostas Ativas"
@@ -114,22 +126,8 @@ CREATOR_FOOTER = "StormBet - Bot feito por SKplay. Todos os direitos reservados
 CREATOR_ID = 1339336477661724674
 AUTO_AUTHORIZED_GUILD_ID = 1438184380395687978  # Servidor auto-autorizado
 
-MODE_LABELS = {
-    "1v1-mob": "1v1 MOB",
-    "1v1-misto": "1v1 MISTO",
-    "2v2-mob": "2v2 MOB",
-    "2v2-misto": "2v2 MISTO",
-    "3v3-mob": "3v3 MOB",
-    "3v3-misto": "3v3 MISTO",
-    "4v4-mob": "4v4 MOB",
-    "4v4-misto": "4v4 MISTO",
-}
-
-# Dicionário para mapear queue_id -> (channel_id, message_id, mode, bet_value)
-queue_messages = {}
-
 def format_mode_label(mode: str) -> str:
-    return MODE_LABELS.get(mode, mode.replace('-', ' ').title())
+    return get_mode_spec(mode).label
 
 def format_panel_title(guild_name: str, mode_label: str) -> str:
     if guild_name:
@@ -158,15 +156,7 @@ def is_4v4_mode(mode: str) -> bool:
 
 def get_team_size(mode: str) -> int:
     """Retorna o tamanho de cada time baseado no modo"""
-    if mode.startswith("1v1"):
-        return 1
-    elif mode.startswith("2v2"):
-        return 2
-    elif mode.startswith("3v3"):
-        return 3
-    elif mode.startswith("4v4"):
-        return 4
-    return 1  # padrão
+    return get_mode_spec(mode).team_size
 
 def get_total_players(mode: str) -> int:
     """Retorna o total de jogadores necessários"""
@@ -218,11 +208,11 @@ async def ensure_guild_authorized(guild: discord.Guild) -> bool:
     # Servidor auto-autorizado sempre tem acesso
     if guild.id == AUTO_AUTHORIZED_GUILD_ID:
         # Garante que tem assinatura permanente no banco
-        if not db.is_subscription_active(guild.id):
-            db.create_subscription(guild.id, None)  # Permanente
+        if not await db.is_subscription_active(guild.id):
+            await db.create_subscription(guild.id, None)  # Permanente
         return True
 
-    if db.is_subscription_active(guild.id):
+    if await db.is_subscription_active(guild.id):
         return True
 
     log(f"❌ Servidor {guild.name} ({guild.id}) não autorizado")
@@ -428,1164 +418,578 @@ def format_sonhos(value: float) -> str:
             return f"{value:.2f}".replace('.', ',')
 
 
-class QueueButton(discord.ui.View):
-    def __init__(self, mode: str, bet_value: float, mediator_fee: float, message_id: int = None, currency_type: str = "sonhos"):
-        super().__init__(timeout=None)
-        self.mode = mode
-        self.bet_value = bet_value
-        self.mediator_fee = mediator_fee
-        self.message_id = message_id
-        self.currency_type = currency_type
-        self.queue_id = f"{mode}_{message_id}" if message_id else ""
-
-    async def update_queue_message(self, channel, guild_icon_url=None, original_message_id=None):
-        """Atualiza a mensagem da fila com os jogadores atuais
-
-        Args:
-            channel: Canal onde a mensagem está
-            guild_icon_url: URL do ícone do servidor (opcional)
-            original_message_id: ID da mensagem original da fila (usado para buscar metadados após restart)
-        """
-        # Se não temos message_id na instância, tenta buscar dos metadados
-        if not self.message_id and original_message_id:
-            metadata = db.get_queue_metadata(original_message_id)
-            if metadata:
-                mode = metadata['mode']
-                bet_value = metadata['bet_value']
-                queue_id = metadata['queue_id']
-                message_id = metadata['message_id']
-                currency_type = metadata.get('currency_type', 'sonhos')
-                log(f"📋 Metadados recuperados do banco para mensagem {original_message_id}")
-            else:
-                log(f"⚠️ update_queue_message: metadados não encontrados para mensagem {original_message_id}")
-                return
-        else:
-            # Usa os valores da instância diretamente
-            mode = self.mode
-            bet_value = self.bet_value
-            queue_id = self.queue_id
-            message_id = self.message_id
-            currency_type = self.currency_type
-
-        if not message_id:
-            log("⚠️ update_queue_message: message_id não disponível")
-            return
-
-        try:
-            message = await channel.fetch_message(message_id)
-            queue = db.get_queue(queue_id)
-
-            log(f"📊 Atualizando fila {queue_id}: {len(queue)} jogadores restantes")
-
-            valor_formatado = format_bet_value(bet_value, currency_type)
-            players_text = render_team_mentions(queue)
-            guild_name = channel.guild.name if getattr(channel, "guild", None) else ""
-
-            embed_update = discord.Embed(
-                title=format_panel_title(guild_name, format_mode_label(mode)),
-                color=EMBED_COLOR
-            )
-            embed_update.add_field(name="Valor", value=valor_formatado, inline=True)
-            embed_update.add_field(name="Fila", value=f"{len(queue)}/2 {players_text}", inline=True)
-            if guild_icon_url:
-                embed_update.set_thumbnail(url=guild_icon_url)
-
-            await message.edit(embed=embed_update)
-            log(f"✅ Mensagem da fila {queue_id} editada com sucesso")
-        except discord.NotFound:
-            log(f"⚠️ Mensagem da fila {queue_id} não encontrada - ignorando atualização")
-        except Exception as e:
-            log(f"❌ Erro ao atualizar mensagem da fila: {e}")
-
-    @discord.ui.button(label='Entrar', style=discord.ButtonStyle.red, row=0, custom_id='persistent:join_queue')
-    async def join_queue_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        user_id = interaction.user.id
-        log(f"👆 Usuário {user_id} clicou em 'Entrar na Fila' (mensagem {interaction.message.id})")
-
-        # DEFER IMEDIATAMENTE para evitar timeout de 3 segundos
-        await interaction.response.defer(ephemeral=True)
-
-        # Busca metadados da fila do banco de dados
-        log(f"🔍 Buscando metadados para mensagem {interaction.message.id}")
+class QueueLockView(discord.ui.View):
+    """Base dos painéis de fila: registra o clique e avisa quando o lock da fila demora demais"""
 
-        try:
-            log(f"📊 Metadados disponíveis: {list(db.get_all_queue_metadata().keys())}")
-            metadata = db.get_queue_metadata(interaction.message.id)
-        except Exception as e:
-            log(f"❌ ERRO ao buscar metadados: {e}")
-            logger.exception("Stacktrace completo:")
-            await interaction.followup.send(
-                "Erro ao acessar dados da fila. Tente novamente em alguns segundos.",
-                ephemeral=True
-            )
-            return
-
-        if metadata:
-            mode = metadata['mode']
-            bet_value = metadata['bet_value']
-            mediator_fee = metadata['mediator_fee']
-            queue_id = metadata['queue_id']
-            currency_type = metadata.get('currency_type', 'sonhos')
-            log(f"✅ Metadados encontrados: queue_id={queue_id}, bet_value={bet_value}, mediator_fee={mediator_fee}, currency={currency_type}")
-        else:
-            # Se não encontrou metadados, pode ser problema temporário ou configuração incompleta
-            log(f"❌ ERRO: Metadados não encontrados para mensagem {interaction.message.id}")
-            log(f"📋 Metadados disponíveis no banco: {list(db.get_all_queue_metadata().keys())}")
-            await interaction.followup.send(
-                "⚠️ **Erro ao acessar esta fila**\n\n"
-                "Os dados desta fila não foram encontrados. Isso pode acontecer se:\n"
-                "• O painel é muito antigo e foi criado antes da atualização\n"
-                "• Houve uma reinicialização recente do bot\n\n"
-                "**Solução:** Peça ao mediador para criar um novo painel com `/mostrar-fila` ou `/preset-filas`.\n"
-                "Os novos painéis funcionarão indefinidamente sem problemas! ✅",
-                ephemeral=True
-            )
-            return
-
-        if db.is_user_in_active_bet(user_id):
-            await interaction.followup.send(
-                "Você já está em uma aposta ativa. Finalize ela antes de entrar em outra fila.",
-                ephemeral=True
-            )
-            return
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Clique num painel: a mensagem existe (registro de painéis)
+        if interaction.message is not None:
+            await db.touch_panel(interaction.message.id)
+        return True
 
-        # Adquire lock para esta fila para evitar race conditions
-        # Protege a criação do lock com um lock global
-        if queue_id not in queue_locks:
-            async with queue_locks_creation_lock:
-                # Double-check após adquirir o lock
-                if queue_id not in queue_locks:
-                    queue_locks[queue_id] = asyncio.Lock()
-
-        async with queue_locks[queue_id]:
-            # Recarrega a fila dentro do lock
-            queue = db.get_queue(queue_id)
-            log(f"📊 Fila {queue_id} antes de adicionar: {queue}")
-
-            if user_id in queue:
-                log(f"⚠️ Usuário {user_id} já está na fila {queue_id}")
-                await interaction.followup.send(
-                    "Você já está nesta fila.",
-                    ephemeral=True
-                )
-                return
+    async def on_error(self, interaction: discord.Interaction, error: Exception, item: discord.ui.Item):
+        if not isinstance(error, LockTimeout):
+            return await super().on_error(interaction, error, item)
+        await send_queue_busy(interaction, error)
 
-            # Adiciona à fila
-            log(f"➕ Adicionando usuário {user_id} à fila {queue_id}")
-            db.add_to_queue(queue_id, user_id)
-            queue = db.get_queue(queue_id)
-            log(f"📊 Fila {queue_id} após adicionar: {queue}")
-
-        # Verifica se tem 2 jogadores para criar aposta
-        if len(queue) >= 2:
-                log(f"🎯 2 jogadores encontrados na fila {queue_id}! Iniciando criação de aposta...")
-                log(f"💰 Valores antes de criar tópico: bet_value={bet_value} (type={type(bet_value)}), mediator_fee={mediator_fee} (type={type(mediator_fee)})")
-
-                # Garante conversão para float
-                bet_value = float(bet_value)
-                mediator_fee = float(mediator_fee)
-                log(f"💰 Valores após conversão: bet_value={bet_value}, mediator_fee={mediator_fee}")
-
-                player1_id = queue[0]
-                player2_id = queue[1]
-
-                # Envia mensagem de confirmação (sem validar se estão no servidor)
-                player1_mention = f"<@{player1_id}>"
-                player2_mention = f"<@{player2_id}>"
-                embed = discord.Embed(
-                    title="Aposta encontrada",
-                    description=f"Criando tópico para {player1_mention} vs {player2_mention}...",
-                    color=EMBED_COLOR
-                )
-                if interaction.guild.icon:
-                    embed.set_thumbnail(url=interaction.guild.icon.url)
-                embed.set_footer(text=CREATOR_FOOTER)
 
-                try:
-                    await interaction.followup.send(embed=embed, ephemeral=True)
-                    log(f"✅ Mensagem de confirmação enviada")
-                except Exception as e:
-                    log(f"⚠️ Erro ao enviar mensagem de confirmação: {e}")
+def panel_modes(panel: PanelRecord) -> tuple[str, ...]:
+    """Modos de um painel registrado (um só nas filas avulsas)"""
+    if panel.kind == 'panel':
+        return PANEL_FAMILIES.get(panel.mode, ())
+    return (panel.mode,)
 
-                # VALIDAÇÃO CRÍTICA: Verifica se o painel ainda existe ANTES de remover jogadores
-                try:
-                    message = await interaction.channel.fetch_message(interaction.message.id)
-                    log(f"✅ Painel ainda existe, prosseguindo com criação da aposta")
-                except discord.NotFound:
-                    log(f"❌ PAINEL FOI DELETADO! Cancelando criação de aposta")
-                    await interaction.followup.send(
-                        "⚠️ O painel foi deletado. A criação da aposta foi cancelada.",
-                        ephemeral=True
-                    )
-                    return
-                except Exception as e:
-                    log(f"⚠️ Erro ao verificar painel: {e}")
-                    await interaction.followup.send(
-                        "⚠️ Erro ao verificar painel. Tente novamente.",
-                        ephemeral=True
-                    )
-                    return
-
-                # Remove os jogadores da fila
-                db.remove_from_queue(queue_id, player1_id)
-                db.remove_from_queue(queue_id, player2_id)
-                log(f"🗑️ Removidos {player1_id} e {player2_id} da fila {queue_id}")
-
-                # Atualiza a mensagem MANUALMENTE após remover os jogadores
-                try:
-                    # Recarrega a fila atualizada (sem os 2 jogadores)
-                    updated_queue = db.get_queue(queue_id)
-                    log(f"📊 Fila após remoção: {updated_queue}")
-
-                    message = await interaction.channel.fetch_message(interaction.message.id)
 
-                    # Monta a lista de jogadores restantes
-                    players_text = render_team_mentions(updated_queue)
-                    valor_formatado = format_bet_value(bet_value, currency_type)
+class PanelRenderer:
+    """
+    Monta o embed dos painéis e evita edições que não mudam nada
 
-                    embed_update = discord.Embed(
-                        title=format_panel_title(interaction.guild.name if interaction.guild else "", format_mode_label(mode)),
-                        color=EMBED_COLOR
-                    )
-                    embed_update.add_field(name="Valor", value=valor_formatado, inline=True)
-                    embed_update.add_field(name="Fila", value=f"{len(updated_queue)}/2 {players_text}", inline=True)
-                    if interaction.guild.icon:
-                        embed_update.set_thumbnail(url=interaction.guild.icon.url)
+    As partes fixas de cada painel (título, valor, ícone e rodapé do
+    servidor) ficam em cache; só os campos das filas são montados a cada
+    render. Para cada mensagem fica guardado o hash do último embed
+    enviado, e `changed()` diz se uma edição nova mudaria alguma coisa.
+    """
 
-                    await message.edit(embed=embed_update)
-                    log(f"✅ Painel atualizado - jogadores removidos visualmente")
-                except discord.NotFound:
-                    log(f"⚠️ Mensagem do painel foi deletada - limpando fila {queue_id}")
-                    # Mensagem foi deletada - limpa a fila e metadados
-                    db.remove_from_queue(queue_id, player1_id)
-                    db.remove_from_queue(queue_id, player2_id)
-                    if queue_id in queue_messages:
-                        del queue_messages[queue_id]
-                except Exception as e:
-                    log(f"❌ Erro ao atualizar mensagem da fila: {e}")
-                    logger.exception("Stacktrace:")
+    def __init__(self, max_headers: int = 1024, max_messages: int = 4096):
+        self.max_headers = max_headers
+        self.max_messages = max_messages
+        self._headers: OrderedDict = OrderedDict()     # (servidor, painel) -> partes fixas
+        self._sent: OrderedDict = OrderedDict()        # message_id -> hash do último embed
+        self.edits_sent = 0
+        self.edits_skipped = 0
+
+    def _header(self, guild: Optional[discord.Guild], panel: PanelRecord) -> dict:
+        """Título, valor, ícone e rodapé (recalculados só se o servidor ou o painel mudar)"""
+        guild_name = guild.name if guild else ""
+        icon_url = guild.icon.url if guild and guild.icon else None
+        key = (guild_name, icon_url, panel.kind, panel.mode, panel.bet_value, panel.currency_type)
+        header = self._headers.get(key)
+        if header is not None:
+            self._headers.move_to_end(key)
+            return header
+
+        unified = panel.kind == 'panel'
+        header = {
+            'title': format_panel_title(guild_name, panel.mode if unified else format_mode_label(panel.mode)),
+            'color': EMBED_COLOR,
+            'fields': [{'name': "Valor", 'value': format_bet_value(panel.bet_value, panel.currency_type), 'inline': True}],
+            'footer': {'text': guild_name, **({'icon_url': icon_url} if icon_url else {})},
+        }
+        if icon_url:
+            header['thumbnail'] = {'url': icon_url}
+        self._headers[key] = header
+        if len(self._headers) > self.max_headers:
+            self._headers.popitem(last=False)
+        return header
+
+    @staticmethod
+    def _queue_fields(panel: PanelRecord, state: PanelState) -> list:
+        unified = panel.kind == 'panel'
+        fields = []
+        for mode in panel_modes(panel):
+            spec = get_mode_spec(mode)
+            teams = state.teams(mode)
+            if not spec.has_teams:
+                fields.append({
+                    'name': f"{spec.emoji} {spec.label}" if unified else "Fila",
+                    'value': f"{len(teams[0])}/2 {render_team_mentions(teams[0])}",
+                    'inline': True,
+                })
+            elif unified:
+                fields.append({
+                    'name': f"{spec.emoji} {spec.label}",
+                    'value': "\n".join(
+                        f"T{number} {len(team)}/{spec.team_size}\n{render_team_mentions(team)}"
+                        for number, team in enumerate(teams, 1)
+                    ),
+                    'inline': True,
+                })
+            else:
+                for number, team in enumerate(teams, 1):
+                    fields.append({'name': f"T{number}", 'value': f"{len(team)}/{spec.team_size} {render_team_mentions(team)}", 'inline': True})
+        return fields
+
+    def render(self, guild: Optional[discord.Guild], panel: PanelRecord, state: PanelState) -> dict:
+        """Embed do painel (formato de `Embed.to_dict`) a partir das filas atuais"""
+        header = self._header(guild, panel)
+        return {**header, 'fields': header['fields'] + self._queue_fields(panel, state)}
+
+    @staticmethod
+    def embed(payload: dict) -> discord.Embed:
+        return discord.Embed.from_dict(payload)
+
+    @staticmethod
+    def digest(payload: dict) -> str:
+        return hashlib.blake2b(json.dumps(payload, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+    def changed(self, message_id: int, payload: dict) -> bool:
+        """True se o embed difere do último enviado para a mensagem"""
+        if self._sent.get(message_id) == self.digest(payload):
+            self.edits_skipped += 1
+            return False
+        return True
 
+    def mark_sent(self, message_id: int, payload: dict):
+        self.edits_sent += 1
+        self._sent[message_id] = self.digest(payload)
+        self._sent.move_to_end(message_id)
+        if len(self._sent) > self.max_messages:
+            self._sent.popitem(last=False)
 
-                # VALIDAÇÃO FINAL: Verifica novamente antes de criar tópico
-                try:
-                    await interaction.channel.fetch_message(interaction.message.id)
-                except discord.NotFound:
-                    log(f"❌ Painel deletado durante atualização! Retornando jogadores à fila")
-                    db.add_to_queue(queue_id, player1_id)
-                    db.add_to_queue(queue_id, player2_id)
-                    return
+    def forget(self, message_id: int):
+        """Esquece o último embed da mensagem (apagada ou com edição que falhou)"""
+        self._sent.pop(message_id, None)
 
-                # Passa o ID do canal atual para criar o tópico nele
-                log(f"🏗️ Iniciando criação do tópico com valores: bet_value={bet_value}, mediator_fee={mediator_fee}")
-                try:
-                    await create_bet_channel(interaction.guild, mode, player1_id, player2_id, bet_value, mediator_fee, interaction.channel_id)
-                    log(f"✅ Tópico criado com sucesso!")
-                except Exception as e:
-                    log(f"❌ ERRO ao criar tópico: {e}")
-                    logger.exception("Stacktrace completo:")
 
-                    # Se falhou, retorna os jogadores para a fila
-                    db.add_to_queue(queue_id, player1_id)
-                    db.add_to_queue(queue_id, player2_id)
-                    log(f"♻️ Jogadores retornados à fila após erro")
+panel_renderer = PanelRenderer()
 
-                    # Atualiza a mensagem novamente
-                    try:
-                        guild_icon = interaction.guild.icon.url if interaction.guild.icon else None
-                        await self.update_queue_message(interaction.channel, guild_icon, interaction.message.id)
-                    except:
-                        pass
-        else:
-                # Apenas entrou na fila (menos de 2 jogadores) - sem mensagem
-                pass
 
-                # Atualiza a mensagem principal com os nomes REAIS dos jogadores
-                try:
-                    # Recarrega a fila para garantir dados atualizados
-                    queue = db.get_queue(queue_id)
-                    log(f"📊 Atualizando painel - fila atual: {queue}")
+async def edit_panel_message(channel, guild: Optional[discord.Guild], panel: PanelRecord, state: PanelState) -> bool:
+    """Edita a mensagem do painel se o embed mudou; False se a edição foi pulada
 
-                    message = await interaction.channel.fetch_message(interaction.message.id)
+    Erros da edição (NotFound, HTTPException) ficam para quem chamou.
+    """
+    payload = panel_renderer.render(guild, panel, state)
+    if not panel_renderer.changed(panel.message_id, payload):
+        return False
+    try:
+        await channel.get_partial_message(panel.message_id).edit(embed=panel_renderer.embed(payload))
+    except Exception:
+        panel_renderer.forget(panel.message_id)
+        raise
+    panel_renderer.mark_sent(panel.message_id, payload)
+    return True
 
-                    players_text = render_team_mentions(queue)
-                    valor_formatado = format_bet_value(bet_value, currency_type)
 
-                    embed_update = discord.Embed(
-                        title=format_panel_title(interaction.guild.name if interaction.guild else "", format_mode_label(mode)),
-                        color=EMBED_COLOR
-                    )
-                    embed_update.add_field(name="Valor", value=valor_formatado, inline=True)
-                    embed_update.add_field(name="Fila", value=f"{len(queue)}/2 {players_text}", inline=True)
-                    if interaction.guild.icon:
-                        embed_update.set_thumbnail(url=interaction.guild.icon.url)
+async def send_panel_edit(message_id: int):
+    """Edição agendada pelo panel_edits: redesenha com as filas do momento"""
+    panel = await db.get_panel(message_id)
+    if panel is None or panel.state == PANEL_TOMBSTONED:
+        return
+    channel = bot.get_channel(panel.channel_id)
+    if channel is None:
+        return
+    state = await db.get_panel_state(message_id, panel_modes(panel))
+    try:
+        await edit_panel_message(channel, channel.guild, panel, state)
+    except discord.NotFound:
+        log(f"⚠️ Mensagem do painel {message_id} não encontrada - ignorando atualização")
+        await db.mark_panel_missing(message_id)
 
-                    await message.edit(embed=embed_update)
-                    log(f"✅ Painel atualizado com sucesso")
-                except discord.NotFound:
-                    log(f"⚠️ Mensagem do painel foi deletada - limpando fila {queue_id}")
-                    # Mensagem foi deletada - limpa a fila e metadados
-                    db.remove_from_queue(queue_id, user_id)
-                    if queue_id in queue_messages:
-                        del queue_messages[queue_id]
-                except Exception as e:
-                    log(f"❌ Erro ao atualizar mensagem da fila: {e}")
-                    logger.exception("Stacktrace:")
 
-    @discord.ui.button(label='Sair', style=discord.ButtonStyle.gray, row=0, custom_id='persistent:leave_queue')
-    async def leave_queue_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        user_id = interaction.user.id
-        log(f"👆 Usuário {user_id} clicou em 'Sair da Fila' (mensagem {interaction.message.id})")
+# Edições de painel agrupadas: no máximo uma por painel a cada PANEL_EDIT_WINDOW
+panel_edits = create_panel_edit_scheduler(send_panel_edit)
 
-        # Busca metadados da fila do banco de dados
-        metadata = db.get_queue_metadata(interaction.message.id)
-        if metadata:
-            queue_id = metadata['queue_id']
-            log(f"✅ Metadados encontrados: queue_id={queue_id}")
-        else:
-            queue_id = self.queue_id
-            log(f"⚠️ Metadados não encontrados, usando self.queue_id={queue_id}")
 
-        queue = db.get_queue(queue_id)
-        log(f"📊 Fila {queue_id} atual: {queue}")
+def schedule_panel_edit(panel: PanelRecord):
+    """Marca o painel para ser redesenhado pelo panel_edits"""
+    panel_edits.mark_dirty(panel.channel_id, panel.message_id)
 
-        if user_id not in queue:
-            log(f"⚠️ Usuário {user_id} NÃO está na fila {queue_id}")
-            await interaction.response.send_message(
-                "Você não está nesta fila.",
-                ephemeral=True
-            )
-            return
 
-        log(f"➖ Removendo usuário {user_id} da fila {queue_id}")
-        db.remove_from_queue(queue_id, user_id)
+def new_panel(guild: discord.Guild, mode: str, bet_value: float, mediator_fee: float, currency_type: str,
+              channel_id: int) -> tuple[discord.Embed, discord.ui.View]:
+    """Embed (filas vazias) e view de um painel novo; `mode` = tipo (1v1...) para painel unificado"""
+    panel = PanelRecord(
+        message_id=0,
+        channel_id=channel_id,
+        kind='panel' if mode in PANEL_FAMILIES else 'queue',
+        mode=mode,
+        bet_value=bet_value,
+        mediator_fee=mediator_fee,
+        currency_type=currency_type,
+    )
+    return panel_renderer.embed(panel_renderer.render(guild, panel, PanelState(0))), PanelButtonsView(panel)
 
-        # Verifica se foi removido
-        queue_after = db.get_queue(queue_id)
-        log(f"📊 Fila {queue_id} após remover: {queue_after}")
 
-        await interaction.response.send_message("Você saiu da fila.", ephemeral=True)
+# ==================== AÇÕES DE FILA ====================
+# Usadas tanto pelos botões novos (PanelQueueButton) quanto pelas views
+# antigas (QueueButton, TeamQueueButton, UnifiedPanelView)
 
-        # Atualiza a mensagem principal com a fila atualizada
-        try:
-            metadata = db.get_queue_metadata(interaction.message.id)
-            if metadata:
-                mode = metadata['mode']
-                bet_value = metadata['bet_value']
-                currency_type = metadata.get('currency_type', 'sonhos')
-            else:
-                mode = self.mode
-                bet_value = self.bet_value
-                currency_type = self.currency_type
+# Tempo máximo de espera pelo lock num clique: o Discord exige a resposta
+# ao clique em até 3 segundos, e ela só sai depois da operação na fila
+CLICK_LOCK_TIMEOUT = 2.5
 
-            message = await interaction.channel.fetch_message(interaction.message.id)
 
-            players_text = render_team_mentions(queue_after)
-            valor_formatado = format_bet_value(bet_value, currency_type)
+@contextlib.asynccontextmanager
+async def lock_panel_queues(panel: PanelRecord, timeout: Optional[float] = CLICK_LOCK_TIMEOUT):
+    """Lock das filas do painel (None = tempo padrão do provedor)
 
-            embed_update = discord.Embed(
-                title=format_panel_title(interaction.guild.name if interaction.guild else "", format_mode_label(mode)),
-                color=EMBED_COLOR
-            )
-            embed_update.add_field(name="Valor", value=valor_formatado, inline=True)
-            embed_update.add_field(name="Fila", value=f"{len(queue_after)}/2 {players_text}", inline=True)
-            if interaction.guild.icon:
-                embed_update.set_thumbnail(url=interaction.guild.icon.url)
-            embed_update.set_footer(text=f"{interaction.guild.name if interaction.guild else ''}", icon_url=interaction.guild.icon.url if interaction.guild and interaction.guild.icon else None)
-            await message.edit(embed=embed_update)
-            log(f"✅ Painel atualizado após saída")
-        except discord.NotFound:
-            log(f"⚠️ Mensagem do painel foi deletada - limpando fila {queue_id}")
-            # Mensagem foi deletada - limpa a fila e metadados
-            db.remove_from_queue(queue_id, user_id)
-            if queue_id in queue_messages:
-                del queue_messages[queue_id]
-        except Exception as e:
-            log(f"❌ Erro ao atualizar painel: {e}")
-            logger.exception("Stacktrace:")
+    Com advisory locks (várias instâncias no mesmo PostgreSQL), as filas são
+    relidas do banco ao pegar o lock e gravadas nele antes de soltá-lo: quem
+    pegar o lock em seguida, em qualquer instância, parte do valor novo.
+    """
+    queue_ids = [qid for mode in panel_modes(panel) for qid in get_mode_spec(mode).queue_ids(panel.message_id)]
+    async with queue_locks.lock(f"panel_{panel.message_id}", timeout=timeout) as conn:
+        await db.sync_queues(conn, queue_ids)
+        yield
+        await db.commit_queues(conn, queue_ids)
 
 
-class TeamQueueButton(discord.ui.View):
-    def __init__(self, mode: str, bet_value: float, mediator_fee: float, message_id: int = None, currency_type: str = "sonhos"):
-        super().__init__(timeout=None)
-        self.mode = mode
-        self.bet_value = bet_value
-        self.mediator_fee = mediator_fee
-        self.message_id = message_id
-        self.currency_type = currency_type
-        self.queue_id = f"{mode}_{message_id}" if message_id else ""
+async def send_feedback(interaction: discord.Interaction, message: str = None, **kwargs):
+    """Mensagem efêmera: resposta do clique ou followup, se ele já foi respondido"""
+    if interaction.response.is_done():
+        await interaction.followup.send(message, ephemeral=True, **kwargs)
+    else:
+        await interaction.response.send_message(message, ephemeral=True, **kwargs)
 
-    def _team_queue_ids(self, queue_id: str) -> tuple[str, str]:
-        return f"{queue_id}_team1", f"{queue_id}_team2"
 
-    async def _update_panel(self, interaction: discord.Interaction, mode: str, bet_value: float, currency_type: str, queue_id: str):
-        team1_qid, team2_qid = self._team_queue_ids(queue_id)
-        team1 = db.get_queue(team1_qid)
-        team2 = db.get_queue(team2_qid)
+async def send_queue_busy(interaction: discord.Interaction, error: LockTimeout):
+    """Avisa que o lock da fila não foi obtido a tempo"""
+    log(f"⏳ {error}")
+    try:
+        await send_feedback(interaction, "⏳ A fila está ocupada no momento. Tente novamente em alguns segundos.")
+    except discord.HTTPException:
+        pass
 
-        valor_formatado = format_bet_value(bet_value, currency_type)
-        guild_name = interaction.guild.name if interaction.guild else ""
 
-        embed_update = discord.Embed(
-            title=format_panel_title(guild_name, format_mode_label(mode)),
-            color=EMBED_COLOR
-        )
-        embed_update.add_field(name="Valor", value=valor_formatado, inline=True)
-        embed_update.add_field(name="T1", value=f"{len(team1)}/2 {render_team_mentions(team1)}", inline=True)
-        embed_update.add_field(name="T2", value=f"{len(team2)}/2 {render_team_mentions(team2)}", inline=True)
-        if interaction.guild.icon:
-            embed_update.set_thumbnail(url=interaction.guild.icon.url)
-        embed_update.set_footer(text=f"{interaction.guild.name if interaction.guild else ''}", icon_url=interaction.guild.icon.url if interaction.guild and interaction.guild.icon else None)
+async def acknowledge_with_panel(interaction: discord.Interaction, panel: PanelRecord, state: PanelState,
+                                 feedback: str) -> bool:
+    """Responde ao clique já com o painel redesenhado; False se o painel foi apagado
 
+    Clique no próprio painel: `response.edit_message` confirma e edita numa
+    chamada só (ou só `defer`, se o embed não mudou). Em rajadas de cliques
+    o painel já tem edição pendente ou recente: o clique é só confirmado e
+    a edição fica com o panel_edits, que manda o estado mais recente.
+    Clique vindo de outra mensagem (escolha de time efêmera): ela passa a
+    mostrar `feedback` e o painel é agendado à parte.
+    """
+    if interaction.message is None or interaction.message.id != panel.message_id:
         try:
-            message = await interaction.channel.fetch_message(interaction.message.id)
-            await message.edit(embed=embed_update)
-        except Exception as e:
-            log(f"❌ Erro ao atualizar painel: {e}")
-            logger.exception("Stacktrace:")
+            await interaction.response.edit_message(content=feedback, view=None)
+        except discord.HTTPException as e:
+            log(f"⚠️ Erro ao responder clique: {e}")
+        registered = await db.get_panel(panel.message_id)
+        if registered is None or registered.state == PANEL_TOMBSTONED:
+            return False
+        schedule_panel_edit(registered)
+        return True
 
-    async def _load_metadata(self, interaction: discord.Interaction) -> Optional[dict]:
-        try:
-            return db.get_queue_metadata(interaction.message.id)
-        except Exception:
-            return None
-
-    async def _ensure_lock(self, queue_id: str):
-        if queue_id not in queue_locks:
-            async with queue_locks_creation_lock:
-                if queue_id not in queue_locks:
-                    queue_locks[queue_id] = asyncio.Lock()
-
-    async def _try_create_bet_if_full(self, interaction: discord.Interaction, mode: str, bet_value: float, mediator_fee: float, currency_type: str, queue_id: str):
-        team1_qid, team2_qid = self._team_queue_ids(queue_id)
-
-        team1 = db.get_queue(team1_qid)
-        team2 = db.get_queue(team2_qid)
-        if len(team1) < 2 or len(team2) < 2:
-            return
+    payload = panel_renderer.render(interaction.guild, panel, state)
+    if not panel_renderer.changed(panel.message_id, payload):
+        await interaction.response.defer()
+        return True
+    if not panel_edits.claim_inline_edit(panel.message_id):
+        await interaction.response.defer()
+        schedule_panel_edit(panel)
+        return True
+    try:
+        await interaction.response.edit_message(embed=panel_renderer.embed(payload))
+    except discord.NotFound:
+        log(f"⚠️ Mensagem do painel {panel.message_id} foi deletada")
+        panel_renderer.forget(panel.message_id)
+        await db.tombstone_panel(panel.message_id)
+        return False
+    except Exception:
+        panel_renderer.forget(panel.message_id)
+        raise
+    panel_renderer.mark_sent(panel.message_id, payload)
+    return True
 
-        # Limpa as filas antes de criar aposta (evita corrida/duplicação)
-        db.set_queue(team1_qid, [])
-        db.set_queue(team2_qid, [])
 
-        await self._update_panel(interaction, mode, bet_value, currency_type, queue_id)
+async def start_match(interaction: discord.Interaction, panel: PanelRecord, match: Match):
+    """Cria o tópico da partida; se falhar, os jogadores voltam para a fila"""
+    log(f"🎯 Partida {match.mode} no painel {panel.message_id}: {match.team1} vs {match.team2}")
+    embed = discord.Embed(
+        title="Aposta encontrada",
+        description=f"Criando tópico para {render_team_mentions(match.team1)} vs {render_team_mentions(match.team2)}...",
+        color=EMBED_COLOR
+    )
+    if interaction.guild.icon:
+        embed.set_thumbnail(url=interaction.guild.icon.url)
+    embed.set_footer(text=CREATOR_FOOTER)
+    try:
+        await send_feedback(interaction, embed=embed)
+    except Exception as e:
+        log(f"⚠️ Erro ao enviar mensagem de confirmação: {e}")
 
+    has_teams = get_mode_spec(match.mode).has_teams
+    try:
         await create_bet_channel(
             interaction.guild,
-            mode,
-            team1[0],
-            team2[0],
-            float(bet_value),
-            float(mediator_fee),
+            match.mode,
+            match.team1[0],
+            match.team2[0],
+            float(panel.bet_value),
+            float(panel.mediator_fee),
             interaction.channel_id,
-            team1_ids=team1,
-            team2_ids=team2,
-            currency_type=currency_type,
-        )
-
-    @discord.ui.button(label='Entrar no Time 1', style=discord.ButtonStyle.red, row=0, custom_id='persistent:join_team1')
-    async def join_team1_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        metadata = await self._load_metadata(interaction)
-        if not metadata:
-            await interaction.followup.send("⚠️ Dados da fila não encontrados. Recrie o painel.", ephemeral=True)
-            return
-
-        mode = metadata['mode']
-        bet_value = float(metadata['bet_value'])
-        mediator_fee = float(metadata['mediator_fee'])
-
-        queue_id = metadata['queue_id']
-        currency_type = metadata.get('currency_type', 'sonhos')
-
-        user_id = interaction.user.id
-        if db.is_user_in_active_bet(user_id):
-            await interaction.followup.send("Você já está em uma aposta ativa.", ephemeral=True)
-            return
-
-        team1_qid, team2_qid = self._team_queue_ids(queue_id)
-        await self._ensure_lock(queue_id)
-
-        async with queue_locks[queue_id]:
-            team1 = db.get_queue(team1_qid)
-            team2 = db.get_queue(team2_qid)
-
-            if user_id in team1 or user_id in team2:
-                await interaction.followup.send("Você já está nesta fila.", ephemeral=True)
-                return
-
-            if len(team1) >= 2:
-                await interaction.followup.send("Time 1 está cheio.", ephemeral=True)
-                return
-
-            db.add_to_queue(team1_qid, user_id)
-
-        await self._update_panel(interaction, mode, bet_value, currency_type, queue_id)
-        await self._try_create_bet_if_full(interaction, mode, bet_value, mediator_fee, currency_type, queue_id)
-
-    @discord.ui.button(label='Entrar no Time 2', style=discord.ButtonStyle.red, row=0, custom_id='persistent:join_team2')
-    async def join_team2_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        metadata = await self._load_metadata(interaction)
-        if not metadata:
-            await interaction.followup.send("⚠️ Dados da fila não encontrados. Recrie o painel.", ephemeral=True)
-            return
-
-        mode = metadata['mode']
-        bet_value = float(metadata['bet_value'])
-        mediator_fee = float(metadata['mediator_fee'])
-
-        queue_id = metadata['queue_id']
-        currency_type = metadata.get('currency_type', 'sonhos')
-
-        user_id = interaction.user.id
-        if db.is_user_in_active_bet(user_id):
-            await interaction.followup.send("Você já está em uma aposta ativa.", ephemeral=True)
-            return
-
-        team1_qid, team2_qid = self._team_queue_ids(queue_id)
-        await self._ensure_lock(queue_id)
-
-        async with queue_locks[queue_id]:
-            team1 = db.get_queue(team1_qid)
-            team2 = db.get_queue(team2_qid)
-
-            if user_id in team1 or user_id in team2:
-                await interaction.followup.send("Você já está nesta fila.", ephemeral=True)
-                return
-
-            if len(team2) >= 2:
-                await interaction.followup.send("Time 2 está cheio.", ephemeral=True)
-                return
-
-            db.add_to_queue(team2_qid, user_id)
-
-        await self._update_panel(interaction, mode, bet_value, currency_type, queue_id)
-        await self._try_create_bet_if_full(interaction, mode, bet_value, mediator_fee, currency_type, queue_id)
-
-    @discord.ui.button(label='Sair', style=discord.ButtonStyle.gray, row=0, custom_id='persistent:leave_team_queue')
-    async def leave_team_queue_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        metadata = await self._load_metadata(interaction)
-        if not metadata:
-            await interaction.followup.send("⚠️ Dados da fila não encontrados. Recrie o painel.", ephemeral=True)
-            return
-
-        mode = metadata['mode']
-        bet_value = float(metadata['bet_value'])
-        queue_id = metadata['queue_id']
-        currency_type = metadata.get('currency_type', 'sonhos')
-        user_id = interaction.user.id
-
-        team1_qid, team2_qid = self._team_queue_ids(queue_id)
-        await self._ensure_lock(queue_id)
-
-        async with queue_locks[queue_id]:
-            if user_id in db.get_queue(team1_qid):
-                db.remove_from_queue(team1_qid, user_id)
-            elif user_id in db.get_queue(team2_qid):
-                db.remove_from_queue(team2_qid, user_id)
-            else:
-                await interaction.followup.send("Você não está nesta fila.", ephemeral=True)
-                return
-
-        await self._update_panel(interaction, mode, bet_value, currency_type, queue_id)
-
-
-class Unified1v1PanelView(discord.ui.View):
-    def __init__(self):
-        super().__init__(timeout=None)
-
-    async def _load_panel(self, interaction: discord.Interaction) -> Optional[dict]:
-        try:
-            return db.get_panel_metadata(interaction.message.id)
-        except Exception:
-            return None
-
-    def _queue_ids(self, message_id: int) -> tuple[str, str]:
-        return f"1v1-mob_{message_id}", f"1v1-misto_{message_id}"
-
-    async def _ensure_lock(self, queue_id: str):
-        if queue_id not in queue_locks:
-            async with queue_locks_creation_lock:
-                if queue_id not in queue_locks:
-                    queue_locks[queue_id] = asyncio.Lock()
-
-    async def _update_panel(self, interaction: discord.Interaction, bet_value: float, currency_type: str):
-        mob_qid, misto_qid = self._queue_ids(interaction.message.id)
-        mob_queue = db.get_queue(mob_qid)
-        misto_queue = db.get_queue(misto_qid)
-
-        valor_formatado = format_bet_value(bet_value, currency_type)
-        guild_name = interaction.guild.name if interaction.guild else ""
-
-        embed_update = discord.Embed(
-            title=format_panel_title(guild_name, "1v1"),
-            color=EMBED_COLOR
+            team1_ids=match.team1 if has_teams else None,
+            team2_ids=match.team2 if has_teams else None,
+            currency_type=panel.currency_type,
         )
-        embed_update.add_field(name="Valor", value=valor_formatado, inline=True)
-        embed_update.add_field(name="📱 1v1 MOB", value=f"{len(mob_queue)}/2 {render_team_mentions(mob_queue)}", inline=True)
-        embed_update.add_field(name="💻 1v1 MISTO", value=f"{len(misto_queue)}/2 {render_team_mentions(misto_queue)}", inline=True)
-        if interaction.guild and interaction.guild.icon:
-            embed_update.set_thumbnail(url=interaction.guild.icon.url)
-        embed_update.set_footer(text=f"{interaction.guild.name if interaction.guild else ''}", icon_url=interaction.guild.icon.url if interaction.guild and interaction.guild.icon else None)
-
+    except Exception as e:
+        log(f"❌ ERRO ao criar tópico: {e}")
+        logger.exception("Stacktrace completo:")
         try:
-            message = await interaction.channel.fetch_message(interaction.message.id)
-            await message.edit(embed=embed_update)
-        except Exception as e:
-            log(f"❌ Erro ao atualizar painel 1v1 unificado: {e}")
-
-    async def _try_create_bet_if_ready(self, interaction: discord.Interaction, mode: str, queue_id: str, bet_value: float, mediator_fee: float):
-        queue = db.get_queue(queue_id)
-        if len(queue) < 2:
-            return
-
-        player1_id = queue[0]
-        player2_id = queue[1]
+            async with lock_panel_queues(panel, timeout=None):
+                await db.requeue_match(panel.message_id, match, panel_modes(panel))
+        except LockTimeout as lock_error:
+            # Melhor devolver sem o lock do que perder os jogadores
+            log(f"⏳ {lock_error}")
+            await db.requeue_match(panel.message_id, match, panel_modes(panel))
+        log("♻️ Jogadores retornados à fila após erro")
+        schedule_panel_edit(panel)
+
+
+async def join_panel_queue(interaction: discord.Interaction, panel: PanelRecord, mode: str, team: Optional[int] = None):
+    """Entra na fila do modo (e monta a partida se ela completou)"""
+    user_id = interaction.user.id
+    log(f"👆 Usuário {user_id} entrando em {mode} (painel {panel.message_id})")
 
-        db.remove_from_queue(queue_id, player1_id)
-        db.remove_from_queue(queue_id, player2_id)
+    async with lock_panel_queues(panel):
+        result = await db.join_queue(panel.message_id, mode, user_id, team, panel_modes(panel))
 
-        meta = db.get_panel_metadata(interaction.message.id) or {}
-        currency_type = meta.get('currency_type', 'sonhos')
-        await self._update_panel(interaction, bet_value, currency_type)
+    if result.status == IN_ACTIVE_BET:
+        await send_feedback(interaction, "Você já está em uma aposta ativa. Finalize ela antes de entrar em outra fila.")
+        return
+    if result.status == ALREADY_QUEUED:
+        await send_feedback(interaction, "Você já está em uma fila deste painel.")
+        return
+    if result.status == TEAM_FULL:
+        await send_feedback(interaction, f"Time {team} está cheio.")
+        return
 
-        await create_bet_channel(
-            interaction.guild,
-            mode,
-            player1_id,
-            player2_id,
-            float(bet_value),
-            float(mediator_fee),
-            interaction.channel_id,
-            currency_type=currency_type,
+    label = get_mode_spec(mode).label
+    joined = f"✅ Você entrou no Time {team} de {label}." if team else f"✅ Você entrou na fila {label}."
+    if not await acknowledge_with_panel(interaction, panel, result.state, joined):
+        await send_feedback(
+            interaction,
+            "⚠️ O painel foi deletado. A criação da aposta foi cancelada." if result.match else "⚠️ Este painel foi deletado."
         )
+        return
+    if result.match:
+        await start_match(interaction, panel, result.match)
 
-    @discord.ui.button(label='📱 1v1 MOB', style=discord.ButtonStyle.red, row=0, custom_id='persistent:panel_1v1_mob')
-    async def join_1v1_mob(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        meta = await self._load_panel(interaction)
-        if not meta:
-            await interaction.followup.send("⚠️ Dados do painel não encontrados. Recrie o painel.", ephemeral=True)
-            return
-
-        user_id = interaction.user.id
-        if db.is_user_in_active_bet(user_id):
-            await interaction.followup.send("Você já está em uma aposta ativa.", ephemeral=True)
-            return
-
-        mob_qid, misto_qid = self._queue_ids(interaction.message.id)
-        await self._ensure_lock(mob_qid)
-
-        async with queue_locks[mob_qid]:
-            mob_queue = db.get_queue(mob_qid)
-            misto_queue = db.get_queue(misto_qid)
-            if user_id in mob_queue or user_id in misto_queue:
-                await interaction.followup.send("Você já está em uma fila deste painel.", ephemeral=True)
-                return
-            db.add_to_queue(mob_qid, user_id)
-
-        meta = db.get_panel_metadata(interaction.message.id) or {}
-        currency_type = meta.get('currency_type', 'sonhos')
-        await self._update_panel(interaction, float(meta['bet_value']), currency_type)
-        await self._try_create_bet_if_ready(interaction, "1v1-mob", mob_qid, float(meta['bet_value']), float(meta['mediator_fee']))
-
-    @discord.ui.button(label='💻 1v1 MISTO', style=discord.ButtonStyle.red, row=0, custom_id='persistent:panel_1v1_misto')
-    async def join_1v1_misto(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        meta = await self._load_panel(interaction)
-        if not meta:
-            await interaction.followup.send("⚠️ Dados do painel não encontrados. Recrie o painel.", ephemeral=True)
-            return
-
-        user_id = interaction.user.id
-        if db.is_user_in_active_bet(user_id):
-            await interaction.followup.send("Você já está em uma aposta ativa.", ephemeral=True)
-            return
-
-        mob_qid, misto_qid = self._queue_ids(interaction.message.id)
-        await self._ensure_lock(misto_qid)
-
-        async with queue_locks[misto_qid]:
-            mob_queue = db.get_queue(mob_qid)
-            misto_queue = db.get_queue(misto_qid)
-            if user_id in mob_queue or user_id in misto_queue:
-                await interaction.followup.send("Você já está em uma fila deste painel.", ephemeral=True)
-                return
-            db.add_to_queue(misto_qid, user_id)
-
-        meta = db.get_panel_metadata(interaction.message.id) or {}
-        currency_type = meta.get('currency_type', 'sonhos')
-        await self._update_panel(interaction, float(meta['bet_value']), currency_type)
-        await self._try_create_bet_if_ready(interaction, "1v1-misto", misto_qid, float(meta['bet_value']), float(meta['mediator_fee']))
-
-    @discord.ui.button(label='Sair', style=discord.ButtonStyle.gray, row=0, custom_id='persistent:panel_1v1_leave')
-    async def leave_panel_1v1(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        meta = await self._load_panel(interaction)
-        if not meta:
-            await interaction.followup.send("⚠️ Dados do painel não encontrados. Recrie o painel.", ephemeral=True)
-            return
-
-        user_id = interaction.user.id
-        mob_qid, misto_qid = self._queue_ids(interaction.message.id)
-
-        removed = False
-
-        await self._ensure_lock(mob_qid)
-        await self._ensure_lock(misto_qid)
 
-        async with queue_locks[mob_qid]:
-            if user_id in db.get_queue(mob_qid):
-                db.remove_from_queue(mob_qid, user_id)
-                removed = True
+async def leave_panel_queues(interaction: discord.Interaction, panel: PanelRecord):
+    """Sai de qualquer fila do painel"""
+    async with lock_panel_queues(panel):
+        result = await db.leave_queue(panel.message_id, panel_modes(panel), interaction.user.id)
 
-        async with queue_locks[misto_qid]:
-            if user_id in db.get_queue(misto_qid):
-                db.remove_from_queue(misto_qid, user_id)
-                removed = True
+    if result.status != LEFT:
+        await send_feedback(interaction, "Você não está em nenhuma fila deste painel.")
+        return
+    if await acknowledge_with_panel(interaction, panel, result.state, "Você saiu da fila."):
+        await send_feedback(interaction, "Você saiu da fila.")
+    else:
+        await send_feedback(interaction, "⚠️ Este painel foi deletado.")
 
-        meta = db.get_panel_metadata(interaction.message.id) or {}
-        currency_type = meta.get('currency_type', 'sonhos')
-        await self._update_panel(interaction, float(meta['bet_value']), currency_type)
-        await interaction.followup.send("Você saiu da fila." if removed else "Você não está em nenhuma fila deste painel.", ephemeral=True)
 
+async def remove_from_all_panel_queues(user_ids: List[int]):
+    """Tira os jogadores de todas as filas, cada painel sob o próprio lock
 
-class Unified2v2PanelView(discord.ui.View):
-    def __init__(self):
-        super().__init__(timeout=None)
-
-    async def _load_panel(self, interaction: discord.Interaction) -> Optional[dict]:
-        try:
-            return db.get_panel_metadata(interaction.message.id)
-        except Exception:
-            return None
-
-    def _base_qid(self, mode: str, message_id: int) -> str:
-        return f"{mode}_{message_id}"
-
-    def _team_qids(self, base_qid: str) -> tuple[str, str]:
-        return f"{base_qid}_team1", f"{base_qid}_team2"
-
-    async def _ensure_lock(self, queue_id: str):
-        if queue_id not in queue_locks:
-            async with queue_locks_creation_lock:
-                if queue_id not in queue_locks:
-                    queue_locks[queue_id] = asyncio.Lock()
-
-    def _all_team_qids(self, message_id: int) -> list[str]:
-        mob_base = self._base_qid("2v2-mob", message_id)
-        misto_base = self._base_qid("2v2-misto", message_id)
-        mob_t1, mob_t2 = self._team_qids(mob_base)
-        misto_t1, misto_t2 = self._team_qids(misto_base)
-        return [mob_t1, mob_t2, misto_t1, misto_t2]
-
-    async def _update_panel(self, interaction: discord.Interaction, bet_value: float, currency_type: str, message_id_override: int | None = None):
-        message_id = message_id_override or interaction.message.id
-
-        mob_base = self._base_qid("2v2-mob", message_id)
-        misto_base = self._base_qid("2v2-misto", message_id)
-        mob_t1, mob_t2 = self._team_qids(mob_base)
-        misto_t1, misto_t2 = self._team_qids(misto_base)
-
-        mob1 = db.get_queue(mob_t1)
-        mob2 = db.get_queue(mob_t2)
-        misto1 = db.get_queue(misto_t1)
-        misto2 = db.get_queue(misto_t2)
-
-        if currency_type == "sonhos":
-            valor_formatado = format_sonhos(bet_value)
-            moeda_nome = "Sonhos"
-        else:
-            valor_formatado = f"$ {bet_value:.2f}"
-            moeda_nome = "Dinheiro"
-
-        embed_update = discord.Embed(title="Painel 2v2", color=EMBED_COLOR)
-        embed_update.add_field(name="Valor", value=valor_formatado, inline=True)
-        embed_update.add_field(name="Moeda", value=moeda_nome, inline=True)
-        embed_update.add_field(
-            name="📱 2v2 MOB",
-            value=(
-                f"T1 {len(mob1)}/2\n{render_team_mentions(mob1)}\n"
-                f"T2 {len(mob2)}/2\n{render_team_mentions(mob2)}"
-            ),
-            inline=True
-        )
-        embed_update.add_field(
-            name="💻 2v2 MISTO",
-            value=(
-                f"T1 {len(misto1)}/2\n{render_team_mentions(misto1)}\n"
-                f"T2 {len(misto2)}/2\n{render_team_mentions(misto2)}"
-            ),
-            inline=True
-        )
-        if interaction.guild and interaction.guild.icon:
-            embed_update.set_thumbnail(url=interaction.guild.icon.url)
-        embed_update.set_footer(text=f"{interaction.guild.name if interaction.guild else ''}", icon_url=interaction.guild.icon.url if interaction.guild and interaction.guild.icon else None)
-
+    Filas que não são de um painel registrado (ou cujo lock não saiu a
+    tempo) são limpas no final, sem lock.
+    """
+    panels = {}
+    for user_id in user_ids:
+        for panel in await db.get_user_panels(user_id):
+            panels[panel.message_id] = panel
+    for panel in panels.values():
         try:
-            message = await interaction.channel.fetch_message(message_id)
-            await message.edit(embed=embed_update)
-        except Exception as e:
-            log(f"❌ Erro ao atualizar painel 2v2 unificado: {e}")
-
-    async def _join_team(self, interaction: discord.Interaction, mode: str, team_number: int, message_id_override: int | None = None):
-        target_message_id = message_id_override or interaction.message.id
-        meta = db.get_panel_metadata(target_message_id)
-        if not meta:
-            await interaction.followup.send("⚠️ Dados do painel não encontrados. Recrie o painel.", ephemeral=True)
-            return
-
-        bet_value = float(meta['bet_value'])
-        mediator_fee = float(meta['mediator_fee'])
-        currency_type = meta.get('currency_type', 'sonhos')
-        message_id = target_message_id
-
-        base_qid = self._base_qid(mode, message_id)
-        team1_qid, team2_qid = self._team_qids(base_qid)
-
-        user_id = interaction.user.id
-        if db.is_user_in_active_bet(user_id):
-            await interaction.followup.send("Você já está em uma aposta ativa.", ephemeral=True)
-            return
-
-        await self._ensure_lock(base_qid)
-
-        async with queue_locks[base_qid]:
-            team1 = db.get_queue(team1_qid)
-            team2 = db.get_queue(team2_qid)
-
-            if user_id in team1 or user_id in team2:
-                await interaction.followup.send("Você já está nesta fila.", ephemeral=True)
-                return
-
-            target_team = team1 if team_number == 1 else team2
-            if len(target_team) >= 2:
-                await interaction.followup.send(f"Time {team_number} está cheio.", ephemeral=True)
-                return
-
-            db.add_to_queue(team1_qid if team_number == 1 else team2_qid, user_id)
+            async with lock_panel_queues(panel, timeout=None):
+                for user_id in user_ids:
+                    await db.leave_queue(panel.message_id, panel_modes(panel), user_id)
+        except LockTimeout as e:
+            log(f"⏳ {e}")
+        schedule_panel_edit(panel)
+    for user_id in user_ids:
+        await db.remove_from_all_queues(user_id)
+
+
+async def choose_panel_mode(interaction: discord.Interaction, panel: PanelRecord, spec: ModeSpec):
+    """Botão de modo de um painel unificado: entra direto (1v1) ou escolhe o time"""
+    if not spec.has_teams:
+        await join_panel_queue(interaction, panel, spec.mode)
+        return
+    await interaction.response.send_message(
+        f"Escolha o time para entrar em {spec.label}:",
+        ephemeral=True,
+        view=TeamSelectorView(panel, spec)
+    )
 
-        await self._update_panel(interaction, bet_value, currency_type, message_id_override=message_id)
-        await self._try_create_bet_if_full(interaction, mode, base_qid, bet_value, mediator_fee, currency_type, panel_message_id=message_id)
 
-    async def _try_create_bet_if_full(self, interaction: discord.Interaction, mode: str, base_qid: str, bet_value: float, mediator_fee: float, currency_type: str, panel_message_id: int):
-        team1_qid, team2_qid = self._team_qids(base_qid)
-        team1 = db.get_queue(team1_qid)
-        team2 = db.get_queue(team2_qid)
-        if len(team1) < 2 or len(team2) < 2:
-            return
+# ==================== BOTÕES DOS PAINÉIS ====================
 
-        db.set_queue(team1_qid, [])
-        db.set_queue(team2_qid, [])
+def _encode_number(value: float) -> str:
+    return format(float(value), '.12g')
 
-        await self._update_panel(interaction, bet_value, currency_type, message_id_override=panel_message_id)
 
-        await create_bet_channel(
-            interaction.guild,
-            mode,
-            team1[0],
-            team2[0],
-            float(bet_value),
-            float(mediator_fee),
-            interaction.channel_id,
-            currency_type=currency_type,
-        )
+class PanelQueueButton(
+    discord.ui.DynamicItem[discord.ui.Button],
+    template=(
+        r'sb:(?P<action>[jl]):(?P<panel>[0-9a-z-]+):(?P<mode>[0-9a-z-]*):(?P<team>[0-2]):'
+        r'(?P<value>[0-9.e+-]+):(?P<fee>[0-9.e+-]+):(?P<currency>[a-z]+)'
+    )
+):
+    """
+    Botão de painel sem estado: tipo do painel, modo, time, valor, taxa e
+    moeda vão no custom_id, então o clique é roteado sem ler o banco.
 
-    @discord.ui.button(label='📱 2v2 MOB', style=discord.ButtonStyle.red, row=0, custom_id='persistent:panel_2v2_mob')
-    async def choose_2v2_mob(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_message(
-            "Escolha o time para entrar em 2v2 MOB:",
-            ephemeral=True,
-            view=self._team_selector_view("2v2-mob", interaction.message.id)
-        )
+    `action` é 'j' (entrar) ou 'l' (sair); `panel` é o modo da fila
+    avulsa ou o tipo do painel unificado (1v1, 2v2...).
+    """
 
-    @discord.ui.button(label='💻 2v2 MISTO', style=discord.ButtonStyle.red, row=0, custom_id='persistent:panel_2v2_misto')
-    async def choose_2v2_misto(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_message(
-            "Escolha o time para entrar em 2v2 MISTO:",
-            ephemeral=True,
-            view=self._team_selector_view("2v2-misto", interaction.message.id)
+    def __init__(self, panel: PanelRecord, action: str, mode: str = "", team: int = 0,
+                 label: str = 'Sair', style: discord.ButtonStyle = discord.ButtonStyle.gray):
+        self.panel = panel
+        self.action = action
+        self.mode = mode
+        self.team = team
+        super().__init__(discord.ui.Button(
+            label=label,
+            style=style,
+            row=0,
+            custom_id=(
+                f"sb:{action}:{panel.mode}:{mode}:{team}:"
+                f"{_encode_number(panel.bet_value)}:{_encode_number(panel.mediator_fee)}:{panel.currency_type}"
+            )
+        ))
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        panel = PanelRecord(
+            message_id=interaction.message.id,
+            channel_id=interaction.channel_id,
+            kind='panel' if match['panel'] in PANEL_FAMILIES else 'queue',
+            mode=match['panel'],
+            bet_value=float(match['value']),
+            mediator_fee=float(match['fee']),
+            currency_type=match['currency'],
         )
+        return cls(panel, match['action'], match['mode'], int(match['team']), item.label, item.style)
 
-    def _team_selector_view(self, mode: str, panel_message_id: int) -> discord.ui.View:
-        parent = self
-
-        class TeamSelector(discord.ui.View):
-            def __init__(self):
-                super().__init__(timeout=60)
-
-            @discord.ui.button(label="Time 1", style=discord.ButtonStyle.red, row=0)
-            async def choose_team1(self, interaction: discord.Interaction, button: discord.ui.Button):
-                await interaction.response.defer(ephemeral=True)
-                await parent._join_team(interaction, mode, 1, message_id_override=panel_message_id)
-                self.stop()
-
-            @discord.ui.button(label="Time 2", style=discord.ButtonStyle.red, row=0)
-            async def choose_team2(self, interaction: discord.Interaction, button: discord.ui.Button):
-                await interaction.response.defer(ephemeral=True)
-                await parent._join_team(interaction, mode, 2, message_id_override=panel_message_id)
-                self.stop()
-
-        return TeamSelector()
-
-    @discord.ui.button(label='Sair', style=discord.ButtonStyle.gray, row=0, custom_id='persistent:panel_2v2_leave')
-    async def leave_panel_2v2(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        meta = await self._load_panel(interaction)
-        if not meta:
-            await interaction.followup.send("⚠️ Dados do painel não encontrados. Recrie o painel.", ephemeral=True)
-            return
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        await db.touch_panel(self.panel.message_id)
+        return True
 
-        user_id = interaction.user.id
-        message_id = interaction.message.id
-        removed = False
-
-        mob_base = self._base_qid("2v2-mob", message_id)
-        misto_base = self._base_qid("2v2-misto", message_id)
-
-        await self._ensure_lock(mob_base)
-        await self._ensure_lock(misto_base)
-
-        async with queue_locks[mob_base]:
-            for qid in self._all_team_qids(message_id)[:2]:
-                if user_id in db.get_queue(qid):
-                    db.remove_from_queue(qid, user_id)
-                    removed = True
-
-        async with queue_locks[misto_base]:
-            for qid in self._all_team_qids(message_id)[2:]:
-                queue = db.get_queue(qid)
-                if user_id in queue:
-                    db.remove_from_queue(qid, user_id)
-                    removed = True
-                    break
+    async def callback(self, interaction: discord.Interaction):
+        try:
+            if self.action == 'l':
+                await leave_panel_queues(interaction, self.panel)
+            elif self.panel.kind == 'panel':
+                await choose_panel_mode(interaction, self.panel, get_mode_spec(self.mode))
+            else:
+                await join_panel_queue(interaction, self.panel, self.mode, self.team or None)
+        except LockTimeout as error:
+            await send_queue_busy(interaction, error)
 
-        if removed:
-            meta = db.get_panel_metadata(interaction.message.id) or {}
-            currency_type = meta.get('currency_type', 'sonhos')
-            await self._update_panel(interaction, float(meta['bet_value']), currency_type)
-        await interaction.followup.send("Você saiu da fila." if removed else "Você não está em nenhuma fila deste painel.", ephemeral=True)
 
+class PanelButtonsView(discord.ui.View):
+    """Botões de um painel novo (PanelQueueButton), montados a partir do modo"""
 
-class Unified3v3PanelView(discord.ui.View):
-    def __init__(self):
+    def __init__(self, panel: PanelRecord):
         super().__init__(timeout=None)
-
-    async def _load_panel(self, interaction: discord.Interaction) -> Optional[dict]:
-        try:
-            return db.get_panel_metadata(interaction.message.id)
-        except Exception:
-            return None
-
-    def _base_qid(self, mode: str, message_id: int) -> str:
-        return f"{mode}_{message_id}"
-
-    def _team_qids(self, base_qid: str) -> tuple[str, str]:
-        return f"{base_qid}_team1", f"{base_qid}_team2"
-
-    async def _ensure_lock(self, queue_id: str):
-        if queue_id not in queue_locks:
-            async with queue_locks_creation_lock:
-                if queue_id not in queue_locks:
-                    queue_locks[queue_id] = asyncio.Lock()
-
-    def _all_team_qids(self, message_id: int) -> list[str]:
-        mob_base = self._base_qid("3v3-mob", message_id)
-        misto_base = self._base_qid("3v3-misto", message_id)
-        mob_t1, mob_t2 = self._team_qids(mob_base)
-        misto_t1, misto_t2 = self._team_qids(misto_base)
-        return [mob_t1, mob_t2, misto_t1, misto_t2]
-
-    async def _update_panel(self, interaction: discord.Interaction, bet_value: float, currency_type: str, message_id_override: int | None = None):
-        message_id = message_id_override or interaction.message.id
-
-        mob_base = self._base_qid("3v3-mob", message_id)
-        misto_base = self._base_qid("3v3-misto", message_id)
-        mob_t1, mob_t2 = self._team_qids(mob_base)
-        misto_t1, misto_t2 = self._team_qids(misto_base)
-
-        mob1 = db.get_queue(mob_t1)
-        mob2 = db.get_queue(mob_t2)
-        misto1 = db.get_queue(misto_t1)
-        misto2 = db.get_queue(misto_t2)
-
-        if currency_type == "sonhos":
-            valor_formatado = format_sonhos(bet_value)
-            moeda_nome = "Sonhos"
+        if panel.kind == 'panel':
+            for mode in panel_modes(panel):
+                spec = get_mode_spec(mode)
+                self.add_item(PanelQueueButton(panel, 'j', mode, 0, f"{spec.emoji} {spec.label}", discord.ButtonStyle.red))
+        elif get_mode_spec(panel.mode).has_teams:
+            for team in (1, 2):
+                self.add_item(PanelQueueButton(panel, 'j', panel.mode, team, f"Entrar no Time {team}", discord.ButtonStyle.red))
         else:
-            valor_formatado = f"$ {bet_value:.2f}"
-            moeda_nome = "Dinheiro"
-
-        embed_update = discord.Embed(title="Painel 3v3", color=EMBED_COLOR)
-        embed_update.add_field(name="Valor", value=valor_formatado, inline=True)
-        embed_update.add_field(name="Moeda", value=moeda_nome, inline=True)
-        embed_update.add_field(
-            name="📱 3v3 MOB",
-            value=(
-                f"T1 {len(mob1)}/3\n{render_team_mentions(mob1)}\n"
-                f"T2 {len(mob2)}/3\n{render_team_mentions(mob2)}"
-            ),
-            inline=True
-        )
-        embed_update.add_field(
-            name="💻 3v3 MISTO",
-            value=(
-                f"T1 {len(misto1)}/3\n{render_team_mentions(misto1)}\n"
-                f"T2 {len(misto2)}/3\n{render_team_mentions(misto2)}"
-            ),
-            inline=True
-        )
-        if interaction.guild and interaction.guild.icon:
-            embed_update.set_thumbnail(url=interaction.guild.icon.url)
-        embed_update.set_footer(text=f"{interaction.guild.name if interaction.guild else ''}", icon_url=interaction.guild.icon.url if interaction.guild and interaction.guild.icon else None)
+            self.add_item(PanelQueueButton(panel, 'j', panel.mode, 0, 'Entrar', discord.ButtonStyle.red))
+        self.add_item(PanelQueueButton(panel, 'l'))
 
-        try:
-            message = await interaction.channel.fetch_message(message_id)
-            await message.edit(embed=embed_update)
-        except Exception as e:
-            log(f"❌ Erro ao atualizar painel 3v3 unificado: {e}")
 
-    async def _join_team(self, interaction: discord.Interaction, mode: str, team_number: int, message_id_override: int | None = None):
-        target_message_id = message_id_override or interaction.message.id
-        meta = db.get_panel_metadata(target_message_id)
-        if not meta:
-            await interaction.followup.send("⚠️ Dados do painel não encontrados. Recrie o painel.", ephemeral=True)
-            return
+class TeamSelectorView(QueueLockView):
+    """Escolha de time (efêmera) de um modo com times num painel unificado"""
 
-        bet_value = float(meta['bet_value'])
-        mediator_fee = float(meta['mediator_fee'])
-        currency_type = meta.get('currency_type', 'sonhos')
-        message_id = target_message_id
+    def __init__(self, panel: PanelRecord, spec: ModeSpec):
+        super().__init__(timeout=60)
+        self.panel = panel
+        self.spec = spec
 
-        base_qid = self._base_qid(mode, message_id)
-        team1_qid, team2_qid = self._team_qids(base_qid)
+    @discord.ui.button(label="Time 1", style=discord.ButtonStyle.red, row=0)
+    async def choose_team1(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await join_panel_queue(interaction, self.panel, self.spec.mode, 1)
+        self.stop()
 
-        user_id = interaction.user.id
-        if db.is_user_in_active_bet(user_id):
-            await interaction.followup.send("Você já está em uma aposta ativa.", ephemeral=True)
-            return
+    @discord.ui.button(label="Time 2", style=discord.ButtonStyle.red, row=0)
+    async def choose_team2(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await join_panel_queue(interaction, self.panel, self.spec.mode, 2)
+        self.stop()
 
-        await self._ensure_lock(base_qid)
 
-        async with queue_locks[base_qid]:
-            team1 = db.get_queue(team1_qid)
-            team2 = db.get_queue(team2_qid)
+# ==================== PAINÉIS ANTIGOS ====================
+# custom_ids fixos ('persistent:...'): o painel vem do registro de painéis
 
-            if user_id in team1 or user_id in team2:
-                await interaction.followup.send("Você já está nesta fila.", ephemeral=True)
-                return
+class MatchmakingView(QueueLockView):
+    """Base das views antigas: busca o painel pelo message_id e delega às ações de fila"""
 
-            target_team = team1 if team_number == 1 else team2
-            if len(target_team) >= 3:
-                await interaction.followup.send(f"Time {team_number} está cheio.", ephemeral=True)
-                return
+    async def _load_panel(self, interaction: discord.Interaction) -> Optional[PanelRecord]:
+        panel = await db.get_panel(interaction.message.id)
+        if panel is None:
+            await send_feedback(interaction, "⚠️ Dados do painel não encontrados. Recrie o painel.")
+        return panel
 
-            db.add_to_queue(team1_qid if team_number == 1 else team2_qid, user_id)
+    async def _join(self, interaction: discord.Interaction, team: Optional[int] = None):
+        panel = await self._load_panel(interaction)
+        if panel is not None:
+            await join_panel_queue(interaction, panel, panel.mode, team)
 
-        await self._update_panel(interaction, bet_value, currency_type, message_id_override=message_id)
-        await self._try_create_bet_if_full(interaction, mode, base_qid, bet_value, mediator_fee, currency_type, panel_message_id=message_id)
+    async def _leave(self, interaction: discord.Interaction):
+        panel = await self._load_panel(interaction)
+        if panel is not None:
+            await leave_panel_queues(interaction, panel)
 
-    async def _try_create_bet_if_full(self, interaction: discord.Interaction, mode: str, base_qid: str, bet_value: float, mediator_fee: float, currency_type: str, panel_message_id: int):
-        team1_qid, team2_qid = self._team_qids(base_qid)
-        team1 = db.get_queue(team1_qid)
-        team2 = db.get_queue(team2_qid)
-        if len(team1) < 3 or len(team2) < 3:
-            return
 
-        db.set_queue(team1_qid, [])
-        db.set_queue(team2_qid, [])
+class QueueButton(MatchmakingView):
+    """Fila avulsa de 1v1 (painéis antigos)"""
 
-        await self._update_panel(interaction, bet_value, currency_type, message_id_override=panel_message_id)
+    def __init__(self):
+        super().__init__(timeout=None)
 
-        await create_bet_channel(
-            interaction.guild,
-            mode,
-            team1[0],
-            team2[0],
-            float(bet_value),
-            float(mediator_fee),
-            interaction.channel_id,
-            currency_type=currency_type,
-        )
+    @discord.ui.button(label='Entrar', style=discord.ButtonStyle.red, row=0, custom_id='persistent:join_queue')
+    async def join_queue_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._join(interaction)
 
-    @discord.ui.button(label='📱 3v3 MOB', style=discord.ButtonStyle.red, row=0, custom_id='persistent:panel_3v3_mob')
-    async def choose_3v3_mob(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_message(
-            "Escolha o time para entrar em 3v3 MOB:",
-            ephemeral=True,
-            view=self._team_selector_view("3v3-mob", interaction.message.id)
-        )
+    @discord.ui.button(label='Sair', style=discord.ButtonStyle.gray, row=0, custom_id='persistent:leave_queue')
+    async def leave_queue_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._leave(interaction)
 
-    @discord.ui.button(label='💻 3v3 MISTO', style=discord.ButtonStyle.red, row=0, custom_id='persistent:panel_3v3_misto')
-    async def choose_3v3_misto(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_message(
-            "Escolha o time para entrar em 3v3 MISTO:",
-            ephemeral=True,
-            view=self._team_selector_view("3v3-misto", interaction.message.id)
-        )
 
-    def _team_selector_view(self, mode: str, panel_message_id: int) -> discord.ui.View:
-        parent = self
-
-        class TeamSelector(discord.ui.View):
-            def __init__(self):
-                super().__init__(timeout=60)
-
-            @discord.ui.button(label="Time 1", style=discord.ButtonStyle.red, row=0)
-            async def choose_team1(self, interaction: discord.Interaction, button: discord.ui.Button):
-                await interaction.response.defer(ephemeral=True)
-                await parent._join_team(interaction, mode, 1, message_id_override=panel_message_id)
-                self.stop()
-
-            @discord.ui.button(label="Time 2", style=discord.ButtonStyle.red, row=0)
-            async def choose_team2(self, interaction: discord.Interaction, button: discord.ui.Button):
-                await interaction.response.defer(ephemeral=True)
-                await parent._join_team(interaction, mode, 2, message_id_override=panel_message_id)
-                self.stop()
-
-        return TeamSelector()
-
-    @discord.ui.button(label='Sair', style=discord.ButtonStyle.gray, row=0, custom_id='persistent:panel_3v3_leave')
-    async def leave_panel_3v3(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        meta = await self._load_panel(interaction)
-        if not meta:
-            await interaction.followup.send("⚠️ Dados do painel não encontrados. Recrie o painel.", ephemeral=True)
-            return
+class TeamQueueButton(MatchmakingView):
+    """Fila avulsa com times (painéis antigos)"""
 
-        user_id = interaction.user.id
-        message_id = interaction.message.id
-        removed = False
+    def __init__(self):
+        super().__init__(timeout=None)
 
-        mob_base = self._base_qid("3v3-mob", message_id)
-        misto_base = self._base_qid("3v3-misto", message_id)
+    @discord.ui.button(label='Entrar no Time 1', style=discord.ButtonStyle.red, row=0, custom_id='persistent:join_team1')
+    async def join_team1_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._join(interaction, team=1)
 
-        await self._ensure_lock(mob_base)
-        await self._ensure_lock(misto_base)
+    @discord.ui.button(label='Entrar no Time 2', style=discord.ButtonStyle.red, row=0, custom_id='persistent:join_team2')
+    async def join_team2_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._join(interaction, team=2)
 
-        async with queue_locks[mob_base]:
-            for qid in self._all_team_qids(message_id)[:2]:
-                queue = db.get_queue(qid)
-                if user_id in queue:
-                    db.remove_from_queue(qid, user_id)
-                    removed = True
-                    break
+    @discord.ui.button(label='Sair', style=discord.ButtonStyle.gray, row=0, custom_id='persistent:leave_team_queue')
+    async def leave_team_queue_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._leave(interaction)
 
-        async with queue_locks[misto_base]:
-            for qid in self._all_team_qids(message_id)[2:]:
-                queue = db.get_queue(qid)
-                if user_id in queue:
-                    db.remove_from_queue(qid, user_id)
-                    removed = True
-                    break
 
-        if removed:
-            meta = db.get_panel_metadata(message_id) or {}
-            currency_type = meta.get('currency_type', 'sonhos')
-            await self._update_panel(interaction, float(meta['bet_value']), currency_type)
+class UnifiedPanelView(MatchmakingView):
+    """Painel unificado (MOB + MISTO) antigo de um tipo: 1v1, 2v2, 3v3 ou 4v4"""
 
-        await interaction.followup.send("Você saiu da fila." if removed else "Você não está em nenhuma fila deste painel.", ephemeral=True)
+    def __init__(self, panel_type: str):
+        super().__init__(timeout=None)
+        for mode in PANEL_FAMILIES[panel_type]:
+            spec = MODE_SPECS[mode]
+            button = discord.ui.Button(
+                label=f"{spec.emoji} {spec.label}",
+                style=discord.ButtonStyle.red,
+                row=0,
+                custom_id=f"persistent:panel_{mode.replace('-', '_')}"
+            )
+            button.callback = functools.partial(self._choose_mode, spec)
+            self.add_item(button)
+        leave = discord.ui.Button(label='Sair', style=discord.ButtonStyle.gray, row=0, custom_id=f'persistent:panel_{panel_type}_leave')
+        leave.callback = self._leave
+        self.add_item(leave)
+
+    async def _choose_mode(self, spec: ModeSpec, interaction: discord.Interaction):
+        panel = await self._load_panel(interaction)
+        if panel is not None:
+            await choose_panel_mode(interaction, panel, spec)
 
 
 # ==================== CENTRAL DE MEDIADORES ====================
@@ -1608,10 +1012,10 @@ class MediatorCentralPixModal(discord.ui.Modal, title='Informe sua Chave PIX'):
         pix = str(self.pix_key.value).strip()
         
         # Salva o PIX para próximas vezes
-        db.save_mediator_pix(user_id, pix)
+        await db.save_mediator_pix(user_id, pix)
         
         # Adiciona ao central
-        success = db.add_mediator_to_central(self.guild_id, user_id, pix)
+        success = await db.add_mediator_to_central(self.guild_id, user_id, pix)
         
         if not success:
             await interaction.response.send_message(
@@ -1633,226 +1037,6 @@ class MediatorCentralPixModal(discord.ui.Modal, title='Informe sua Chave PIX'):
         log(f"✅ Mediador {user_id} entrou no central do guild {self.guild_id}")
 
 
-class Unified4v4PanelView(discord.ui.View):
-    def __init__(self):
-        super().__init__(timeout=None)
-
-    async def _load_panel(self, interaction: discord.Interaction) -> Optional[dict]:
-        try:
-            return db.get_panel_metadata(interaction.message.id)
-        except Exception:
-            return None
-
-    def _base_qid(self, mode: str, message_id: int) -> str:
-        return f"{mode}_{message_id}"
-
-    def _team_qids(self, base_qid: str) -> tuple[str, str]:
-        return f"{base_qid}_team1", f"{base_qid}_team2"
-
-    async def _ensure_lock(self, queue_id: str):
-        if queue_id not in queue_locks:
-            async with queue_locks_creation_lock:
-                if queue_id not in queue_locks:
-                    queue_locks[queue_id] = asyncio.Lock()
-
-    def _all_team_qids(self, message_id: int) -> list[str]:
-        mob_base = self._base_qid("4v4-mob", message_id)
-        misto_base = self._base_qid("4v4-misto", message_id)
-        mob_t1, mob_t2 = self._team_qids(mob_base)
-        misto_t1, misto_t2 = self._team_qids(misto_base)
-        return [mob_t1, mob_t2, misto_t1, misto_t2]
-
-    async def _update_panel(self, interaction: discord.Interaction, bet_value: float, currency_type: str, message_id_override: int | None = None):
-        message_id = message_id_override or interaction.message.id
-
-        mob_base = self._base_qid("4v4-mob", message_id)
-        misto_base = self._base_qid("4v4-misto", message_id)
-        mob_t1, mob_t2 = self._team_qids(mob_base)
-        misto_t1, misto_t2 = self._team_qids(misto_base)
-
-        mob1 = db.get_queue(mob_t1)
-        mob2 = db.get_queue(mob_t2)
-        misto1 = db.get_queue(misto_t1)
-        misto2 = db.get_queue(misto_t2)
-
-        if currency_type == "sonhos":
-            valor_formatado = format_sonhos(bet_value)
-            moeda_nome = "Sonhos"
-        else:
-            valor_formatado = f"$ {bet_value:.2f}"
-            moeda_nome = "Dinheiro"
-
-        embed_update = discord.Embed(title="Painel 4v4", color=EMBED_COLOR)
-        embed_update.add_field(name="Valor", value=valor_formatado, inline=True)
-        embed_update.add_field(name="Moeda", value=moeda_nome, inline=True)
-        embed_update.add_field(
-            name="📱 4v4 MOB",
-            value=(
-                f"T1 {len(mob1)}/4\n{render_team_mentions(mob1)}\n"
-                f"T2 {len(mob2)}/4\n{render_team_mentions(mob2)}"
-            ),
-            inline=True
-        )
-        embed_update.add_field(
-            name="💻 4v4 MISTO",
-            value=(
-                f"T1 {len(misto1)}/4\n{render_team_mentions(misto1)}\n"
-                f"T2 {len(misto2)}/4\n{render_team_mentions(misto2)}"
-            ),
-            inline=True
-        )
-        if interaction.guild and interaction.guild.icon:
-            embed_update.set_thumbnail(url=interaction.guild.icon.url)
-        embed_update.set_footer(text=f"{interaction.guild.name if interaction.guild else ''}", icon_url=interaction.guild.icon.url if interaction.guild and interaction.guild.icon else None)
-
-        try:
-            message = await interaction.channel.fetch_message(message_id)
-            await message.edit(embed=embed_update)
-        except Exception as e:
-            log(f"❌ Erro ao atualizar painel 4v4 unificado: {e}")
-
-    async def _join_team(self, interaction: discord.Interaction, mode: str, team_number: int, message_id_override: int | None = None):
-        target_message_id = message_id_override or interaction.message.id
-        meta = db.get_panel_metadata(target_message_id)
-        if not meta:
-            await interaction.followup.send("⚠️ Dados do painel não encontrados. Recrie o painel.", ephemeral=True)
-            return
-
-        bet_value = float(meta['bet_value'])
-        mediator_fee = float(meta['mediator_fee'])
-        currency_type = meta.get('currency_type', 'sonhos')
-        message_id = target_message_id
-
-        base_qid = self._base_qid(mode, message_id)
-        team1_qid, team2_qid = self._team_qids(base_qid)
-
-        user_id = interaction.user.id
-        if db.is_user_in_active_bet(user_id):
-            await interaction.followup.send("Você já está em uma aposta ativa.", ephemeral=True)
-            return
-
-        await self._ensure_lock(base_qid)
-
-        async with queue_locks[base_qid]:
-            team1 = db.get_queue(team1_qid)
-            team2 = db.get_queue(team2_qid)
-
-            if user_id in team1 or user_id in team2:
-                await interaction.followup.send("Você já está nesta fila.", ephemeral=True)
-                return
-
-            target_team = team1 if team_number == 1 else team2
-            if len(target_team) >= 4:
-                await interaction.followup.send(f"Time {team_number} está cheio.", ephemeral=True)
-                return
-
-            db.add_to_queue(team1_qid if team_number == 1 else team2_qid, user_id)
-
-        await self._update_panel(interaction, bet_value, currency_type, message_id_override=message_id)
-        await self._try_create_bet_if_full(interaction, mode, base_qid, bet_value, mediator_fee, currency_type, panel_message_id=message_id)
-
-    async def _try_create_bet_if_full(self, interaction: discord.Interaction, mode: str, base_qid: str, bet_value: float, mediator_fee: float, currency_type: str, panel_message_id: int):
-        team1_qid, team2_qid = self._team_qids(base_qid)
-        team1 = db.get_queue(team1_qid)
-        team2 = db.get_queue(team2_qid)
-        if len(team1) < 4 or len(team2) < 4:
-            return
-
-        db.set_queue(team1_qid, [])
-        db.set_queue(team2_qid, [])
-
-        await self._update_panel(interaction, bet_value, currency_type, message_id_override=panel_message_id)
-
-        await create_bet_channel(
-            interaction.guild,
-            mode,
-            team1[0],
-            team2[0],
-            float(bet_value),
-            float(mediator_fee),
-            interaction.channel_id,
-            currency_type=currency_type,
-        )
-
-    @discord.ui.button(label='📱 4v4 MOB', style=discord.ButtonStyle.red, row=0, custom_id='persistent:panel_4v4_mob')
-    async def choose_4v4_mob(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_message(
-            "Escolha o time para entrar em 4v4 MOB:",
-            ephemeral=True,
-            view=self._team_selector_view("4v4-mob", interaction.message.id)
-        )
-
-    @discord.ui.button(label='💻 4v4 MISTO', style=discord.ButtonStyle.red, row=0, custom_id='persistent:panel_4v4_misto')
-    async def choose_4v4_misto(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_message(
-            "Escolha o time para entrar em 4v4 MISTO:",
-            ephemeral=True,
-            view=self._team_selector_view("4v4-misto", interaction.message.id)
-        )
-
-    def _team_selector_view(self, mode: str, panel_message_id: int) -> discord.ui.View:
-        parent = self
-
-        class TeamSelector(discord.ui.View):
-            def __init__(self):
-                super().__init__(timeout=60)
-
-            @discord.ui.button(label="Time 1", style=discord.ButtonStyle.red, row=0)
-            async def choose_team1(self, interaction: discord.Interaction, button: discord.ui.Button):
-                await interaction.response.defer(ephemeral=True)
-                await parent._join_team(interaction, mode, 1, message_id_override=panel_message_id)
-                self.stop()
-
-            @discord.ui.button(label="Time 2", style=discord.ButtonStyle.red, row=0)
-            async def choose_team2(self, interaction: discord.Interaction, button: discord.ui.Button):
-                await interaction.response.defer(ephemeral=True)
-                await parent._join_team(interaction, mode, 2, message_id_override=panel_message_id)
-                self.stop()
-
-        return TeamSelector()
-
-    @discord.ui.button(label='Sair', style=discord.ButtonStyle.gray, row=0, custom_id='persistent:panel_4v4_leave')
-    async def leave_panel_4v4(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        meta = await self._load_panel(interaction)
-        if not meta:
-            await interaction.followup.send("⚠️ Dados do painel não encontrados. Recrie o painel.", ephemeral=True)
-            return
-
-        user_id = interaction.user.id
-        message_id = interaction.message.id
-        removed = False
-
-        mob_base = self._base_qid("4v4-mob", message_id)
-        misto_base = self._base_qid("4v4-misto", message_id)
-
-        await self._ensure_lock(mob_base)
-        await self._ensure_lock(misto_base)
-
-        async with queue_locks[mob_base]:
-            for qid in self._all_team_qids(message_id)[:2]:
-                queue = db.get_queue(qid)
-                if user_id in queue:
-                    db.remove_from_queue(qid, user_id)
-                    removed = True
-                    break
-
-        async with queue_locks[misto_base]:
-            for qid in self._all_team_qids(message_id)[2:]:
-                queue = db.get_queue(qid)
-                if user_id in queue:
-                    db.remove_from_queue(qid, user_id)
-                    removed = True
-                    break
-
-        if removed:
-            meta = db.get_panel_metadata(message_id) or {}
-            currency_type = meta.get('currency_type', 'sonhos')
-            await self._update_panel(interaction, float(meta['bet_value']), currency_type)
-
-        await interaction.followup.send("Você saiu da fila." if removed else "Você não está em nenhuma fila deste painel.", ephemeral=True)
-
-
 class ConfirmPaymentButton(discord.ui.View):
     """View para confirmar pagamento de aposta"""
     def __init__(self, bet_id: str):
@@ -1890,8 +1074,9 @@ class MediatorCentralView(discord.ui.View):
         log(f"👆 Mediador {user_id} clicou em 'Aguardar Aposta' no central")
         
         # Verifica se tem cargo de mediador
-        mediator_role_id = db.get_mediator_role(guild_id)
-        has_mediator_role = mediator_role_id and discord.utils.get(interaction.user.roles, id=mediator_role_id) is not None
+        config = await db.get_guild_config(guild_id)
+        mediator_role_id = config.mediator_role_id
+        has_mediator_role = config.is_mediator(interaction.user)
         
         if not has_mediator_role:
             if mediator_role_id:
@@ -1908,7 +1093,7 @@ class MediatorCentralView(discord.ui.View):
             return
         
         # Verifica se já está no central
-        if db.is_mediator_in_central(guild_id, user_id):
+        if await db.is_mediator_in_central(guild_id, user_id):
             await interaction.response.send_message(
                 "Você já está no Central de Mediadores aguardando apostas.",
                 ephemeral=True
@@ -1916,11 +1101,11 @@ class MediatorCentralView(discord.ui.View):
             return
         
         # Verifica se já tem PIX salvo
-        saved_pix = db.get_mediator_pix(user_id)
+        saved_pix = await db.get_mediator_pix(user_id)
         
         if saved_pix:
             # PIX já salvo - entra direto
-            success = db.add_mediator_to_central(guild_id, user_id, saved_pix)
+            success = await db.add_mediator_to_central(guild_id, user_id, saved_pix)
             
             if not success:
                 await interaction.response.send_message(
@@ -1949,14 +1134,14 @@ class MediatorCentralView(discord.ui.View):
         user_id = interaction.user.id
         guild_id = interaction.guild.id
         
-        if not db.is_mediator_in_central(guild_id, user_id):
+        if not await db.is_mediator_in_central(guild_id, user_id):
             await interaction.response.send_message(
                 "Você não está no Central de Mediadores.",
                 ephemeral=True
             )
             return
         
-        db.remove_mediator_from_central(guild_id, user_id)
+        await db.remove_mediator_from_central(guild_id, user_id)
         
         # Atualiza o painel
         await update_mediator_central_panel(interaction.guild)
@@ -1970,7 +1155,7 @@ class MediatorCentralView(discord.ui.View):
 
 async def update_mediator_central_panel(guild: discord.Guild):
     """Atualiza o painel do central de mediadores com a lista atual"""
-    config = db.get_mediator_central_config(guild.id)
+    config = await db.get_mediator_central_config(guild.id)
     if not config:
         return
     
@@ -1981,7 +1166,7 @@ async def update_mediator_central_panel(guild: discord.Guild):
         
         message = await channel.fetch_message(config['message_id'])
         
-        mediators = db.get_mediators_in_central(guild.id)
+        mediators = await db.get_mediators_in_central(guild.id)
         vagas_ocupadas = len(mediators)
         vagas_disponiveis = 10 - vagas_ocupadas
         
@@ -2031,7 +1216,7 @@ async def update_mediator_central_panel(guild: discord.Guild):
         
     except discord.NotFound:
         log(f"⚠️ Mensagem do central não encontrada - removendo configuração")
-        db.delete_mediator_central_config(guild.id)
+        await db.delete_mediator_central_config(guild.id)
     except Exception as e:
         log(f"❌ Erro ao atualizar painel do central: {e}")
 
@@ -2039,37 +1224,41 @@ async def update_mediator_central_panel(guild: discord.Guild):
 async def cleanup_expired_mediators_central():
     """Tarefa em background que remove mediadores que estão há mais de 2 horas no central"""
     await bot.wait_until_ready()
-    log("⏰ Iniciando limpeza de mediadores expirados do central (a cada 10 minutos)")
+    log("⏰ Iniciando limpeza de mediadores expirados do central (2 horas)")
     
     while not bot.is_closed():
         try:
-            await asyncio.sleep(600)  # 10 minutos
+            # Só servidores com mediadores vencidos (heap de expiração do central)
+            expired_by_guild = await db.get_expired_mediators(timeout_hours=2)
             
-            # Verifica todos os servidores com central configurado
-            for guild in bot.guilds:
-                if not db.is_mediator_central_configured(guild.id):
+            for guild_id, expired in expired_by_guild.items():
+                guild = bot.get_guild(guild_id)
+                if not guild:
                     continue
                 
-                expired = db.get_expired_mediators_in_central(guild.id, timeout_hours=2)
-                
-                if expired:
-                    for user_id in expired:
-                        db.remove_mediator_from_central(guild.id, user_id)
-                        log(f"⏰ Mediador {user_id} removido do central por timeout (2h)")
-                        
-                        # Tenta notificar o mediador via DM
-                        try:
-                            user = await bot.fetch_user(user_id)
-                            await user.send(
-                                f"Você foi removido do **Central de Mediadores** no servidor **{guild.name}** "
-                                f"por ficar 2 horas sem receber apostas.\n\n"
-                                f"Você pode entrar novamente a qualquer momento!"
-                            )
-                        except:
-                            pass
+                for user_id in expired:
+                    await db.remove_mediator_from_central(guild.id, user_id)
+                    log(f"⏰ Mediador {user_id} removido do central por timeout (2h)")
                     
-                    # Atualiza o painel
-                    await update_mediator_central_panel(guild)
+                    # Tenta notificar o mediador via DM
+                    try:
+                        user = await bot.fetch_user(user_id)
+                        await user.send(
+                            f"Você foi removido do **Central de Mediadores** no servidor **{guild.name}** "
+                            f"por ficar 2 horas sem receber apostas.\n\n"
+                            f"Você pode entrar novamente a qualquer momento!"
+                        )
+                    except:
+                        pass
+                
+                # Atualiza o painel
+                await update_mediator_central_panel(guild)
+            
+            # Dorme até o próximo prazo (mínimo de 1 minuto: mediadores de
+            # servidores que este bot não vê continuam vencidos no heap)
+            next_expiry = await db.get_next_mediator_expiry(timeout_hours=2)
+            delay = 600 if next_expiry is None else next_expiry - time.time()
+            await asyncio.sleep(min(max(delay, 60), 600))
                     
         except Exception as e:
             log(f"❌ Erro na limpeza de mediadores do central: {e}")
@@ -2087,13 +1276,57 @@ async def cleanup_orphaned_data_task():
             await asyncio.sleep(600)
 
             # Limpa dados órfãos
-            cleaned = db.cleanup_orphaned_data()
+            cleaned = await db.cleanup_orphaned_data()
             if cleaned:
                 log("🧹 Dados órfãos removidos (economia de espaço)")
         except Exception as e:
             log(f"Erro na limpeza de dados órfãos: {e}")
             await asyncio.sleep(600)
 
+async def verify_panels_task():
+    """Tarefa em background que verifica se as mensagens dos painéis ainda existem
+
+    Painéis sem cliques há PANEL_VERIFY_INTERVAL segundos são conferidos
+    (poucos por varredura); mensagem não encontrada duas vezes seguidas
+    vira tombstone, e tombstones mais antigos que PANEL_TOMBSTONE_GRACE
+    são removidos junto com as filas do painel.
+    """
+    await bot.wait_until_ready()
+    interval = float(os.getenv("PANEL_VERIFY_INTERVAL", "21600"))
+    grace = float(os.getenv("PANEL_TOMBSTONE_GRACE", "604800"))
+    log("🪧 Iniciando verificação de painéis (a cada 10 minutos)")
+
+    while not bot.is_closed():
+        try:
+            for panel in await db.get_panels_to_verify(interval, limit=50):
+                try:
+                    channel = bot.get_channel(panel.channel_id) or await bot.fetch_channel(panel.channel_id)
+                    await channel.fetch_message(panel.message_id)
+                    await db.mark_panel_verified(panel.message_id)
+                except discord.NotFound:
+                    state = await db.mark_panel_missing(panel.message_id)
+                    log(f"🪧 Painel {panel.message_id} não encontrado ({state})")
+                except (discord.Forbidden, discord.HTTPException):
+                    # Sem acesso (ou erro temporário): não dá para afirmar que sumiu
+                    await db.mark_panel_verified(panel.message_id, found=False)
+                await asyncio.sleep(1)
+
+            removed = await db.compact_panels(grace)
+            if removed:
+                log(f"🧹 {removed} painel(is) apagado(s) removido(s)")
+        except Exception as e:
+            log(f"Erro na verificação de painéis: {e}")
+        await asyncio.sleep(600)
+
+
+async def remove_expired_players(expired_players: Dict[str, List[int]], queue_ids: List[str]):
+    """Remove das filas informadas os jogadores expirados"""
+    for queue_id in queue_ids:
+        for user_id in expired_players.get(queue_id, ()):
+            await db.remove_from_queue(queue_id, user_id)
+            log(f"⏱️ Removido usuário {user_id} da fila {queue_id} (timeout)")
+
+
 async def cleanup_expired_queues():
     """Tarefa em background que remove jogadores que ficaram muito tempo na fila"""
     await bot.wait_until_ready()
@@ -2102,217 +1335,85 @@ async def cleanup_expired_queues():
     while not bot.is_closed():
         try:
             # Busca jogadores expirados (mais de 5 minutos na fila)
-            expired_players = db.get_expired_queue_players(timeout_minutes=5)
+            expired_players = await db.get_expired_queue_players(timeout_minutes=5)
 
             if expired_players:
                 log(f"🧹 Encontrados jogadores expirados em {len(expired_players)} filas")
 
-                for queue_id, user_ids in expired_players.items():
-                    # Remove cada jogador expirado
-                    for user_id in user_ids:
-                        db.remove_from_queue(queue_id, user_id)
-                        log(f"⏱️ Removido usuário {user_id} da fila {queue_id} (timeout)")
-
-                    # Log para debug: mostra estado da fila após remoções
-                    updated_queue = db.get_queue(queue_id)
-                    log(f"🔍 Fila {queue_id} após remoções: {len(updated_queue)} jogadores")
-
-                    # Extrai message_id do queue_id para buscar metadados
+                # Filas agrupadas por painel (message_id é o segundo trecho do queue_id)
+                panel_queues = {}
+                for queue_id in expired_players:
                     parts = queue_id.split('_')
-                    if len(parts) < 2:
+                    message_id = int(parts[1]) if len(parts) >= 2 and parts[1].isdigit() else None
+                    panel_queues.setdefault(message_id, []).append(queue_id)
+
+                for message_id, queue_ids in panel_queues.items():
+                    panel = await db.get_panel(message_id) if message_id is not None else None
+                    if not panel:
+                        log(f"⚠️ Painel {message_id} não registrado, removendo sem lock")
+                        await remove_expired_players(expired_players, queue_ids)
                         continue
 
                     try:
-                        message_id = int(parts[-1])
-                    except ValueError:
+                        async with lock_panel_queues(panel, timeout=None):
+                            # Relido sob o lock: quem voltou à fila em outra instância fica
+                            still_expired = await db.get_expired_queue_players(timeout_minutes=5)
+                            await remove_expired_players(still_expired, queue_ids)
+                    except LockTimeout as e:
+                        # Fica para a próxima volta
+                        log(f"⏳ {e}")
                         continue
 
-                    # Busca informações da fila (de memória OU de metadados)
-                    channel_id, mode, bet_value, currency_type = None, None, None, None
-
-                    if queue_id in queue_messages:
-                        # Usa dados em memória se disponíveis
-                        channel_id, message_id, mode, bet_value, currency_type = queue_messages[queue_id]
-                        log(f"📋 Usando dados em memória para {queue_id}")
-                    else:
-                        # Busca dos metadados se não estiver em memória (bot reiniciou)
-                        metadata = db.get_queue_metadata(message_id)
-                        if metadata:
-                            channel_id = metadata['channel_id']
-                            mode = metadata['mode']
-                            bet_value = metadata['bet_value']
-                            currency_type = metadata.get('currency_type', 'sonhos')
-                            # Reidrata queue_messages para próximas operações
-                            queue_messages[queue_id] = (channel_id, message_id, mode, bet_value, currency_type)
-                            log(f"🔄 Reidratado dados para {queue_id} a partir dos metadados")
-                        else:
-                            log(f"⚠️ Metadados não encontrados para {queue_id}, pulando atualização")
-                            continue
-
-                    # PRIMEIRO atualiza o painel (mostra "Vazio" se necessário)
-                    try:
-                        channel = bot.get_channel(channel_id)
-                        if channel:
-                            message = await channel.fetch_message(message_id)
-
-                            # Verifica se é 2v2, 3v3, 4v4 ou 1v1
-                            is_team_based_mode = "2v2" in mode or "3v3" in mode or "4v4" in mode
-
-                            if is_team_based_mode:
-                                team1_queue = db.get_queue(f"{queue_id}_team1")
-                                team2_queue = db.get_queue(f"{queue_id}_team2")
-
-                                # Usa menções diretas (economiza API calls)
-                                team1_text = "\n".join([f"<@{uid}>" for uid in team1_queue]) if team1_queue else "Nenhum jogador"
-                                team2_text = "\n".join([f"<@{uid}>" for uid in team2_queue]) if team2_queue else "Nenhum jogador"
-
-                                embed = discord.Embed(
-                                    title=mode.replace('-', ' ').title(),
-                                    color=EMBED_COLOR
-                                )
-
-                                # Formata valor baseado na moeda
-                                if currency_type == "sonhos":
-                                    valor_formatado = format_sonhos(bet_value)
-                                else:
-                                    valor_formatado = f"$ {bet_value:.2f}"
-
-                                embed.add_field(name="Valor", value=valor_formatado, inline=True)
-                                embed.add_field(name="Time 1", value=team1_text, inline=True)
-                                embed.add_field(name="Time 2", value=team2_text, inline=True)
-                                if channel.guild and channel.guild.icon:
-                                    embed.set_thumbnail(url=channel.guild.icon.url)
-                            else:
-                                current_queue = db.get_queue(queue_id)
-                                log(f"🔍 Atualizando painel {queue_id}: {len(current_queue)} jogadores na fila")
-
-                                # Usa menções diretas (economiza API calls)
-                                players_text = "\n".join([f"<@{uid}>" for uid in current_queue]) if current_queue else "Vazio"
-
-                                embed = discord.Embed(
-                                    title=mode.replace('-', ' ').title(),
-                                    color=EMBED_COLOR
-                                )
-
-                                # Formata valor baseado na moeda
-                                if currency_type == "sonhos":
-                                    valor_formatado = format_sonhos(bet_value)
-                                else:
-                                    valor_formatado = f"$ {bet_value:.2f}"
-
-                                embed.add_field(name="Valor", value=valor_formatado, inline=True)
-                                embed.add_field(name="Fila", value=players_text, inline=True)
-                                if channel.guild and channel.guild.icon:
-                                    embed.set_thumbnail(url=channel.guild.icon.url)
-
-                            await message.edit(embed=embed)
-                            log(f"✅ Painel {queue_id} atualizado com sucesso")
-                    except discord.NotFound:
-                        log(f"⚠️ Mensagem do painel {queue_id} não encontrada - ignorando atualização")
-                    except Exception as e:
-                        log(f"⚠️ Erro ao atualizar mensagem da fila {queue_id}: {e}")
+                    # Redesenha o painel (mostra "Vazio" se necessário)
+                    schedule_panel_edit(panel)
 
                     # NÃO limpa metadados - fila deve ficar sempre disponível 24/7
-                    # Removido: limpeza de metadados quando fila fica vazia
-                    # A fila permanece disponível para novos jogadores entrarem a qualquer momento
 
-            # Aguarda 60 segundos antes de verificar novamente (economiza processamento)
-            await asyncio.sleep(60)
+            # Dorme até o próximo prazo; sem ninguém na fila, quem entrar agora
+            # só expira daqui a 5 minutos
+            next_expiry = await db.get_next_queue_expiry(timeout_minutes=5)
+            delay = 300 if next_expiry is None else next_expiry - time.time()
+            await asyncio.sleep(min(max(delay, 1), 300))
 
         except Exception as e:
             log(f"Erro na limpeza de filas: {e}")
             await asyncio.sleep(60)
 
 
+async def clear_deleted_panel(message_id: int):
+    """Esvazia as filas do painel apagado e marca o tombstone"""
+    async with db.transaction():
+        for qid in await db.get_queue_ids_for_message(message_id):
+            if await db.get_queue(qid):
+                await db.set_queue(qid, [])
+        await db.tombstone_panel(message_id)
+
+
 @bot.event
 async def on_message_delete(message):
     """Detecta quando uma mensagem de painel é deletada
 
-    IMPORTANTE: NÃO deletamos metadados para permitir que os botões
-    funcionem indefinidamente, mesmo após reinicializações do bot.
-    Os jogadores na fila são limpos, mas os metadados são mantidos.
+    Os jogadores na fila são limpos e o painel vira tombstone no registro:
+    os metadados são removidos pela verificação de painéis depois do
+    prazo de carência (PANEL_TOMBSTONE_GRACE).
     """
     try:
-        # Verifica se a mensagem deletada tinha metadados de fila
-        metadata = db.get_queue_metadata(message.id)
-
-        if metadata:
-            if metadata.get('type') == 'panel':
-                panel_type = metadata.get('panel_type')
-                log(f"🗑️ Mensagem de painel deletada (ID: {message.id})")
-
-                data = db._load_data()
-                if panel_type == '1v1':
-                    mob_qid = f"1v1-mob_{message.id}"
-                    misto_qid = f"1v1-misto_{message.id}"
-                    for qid in (mob_qid, misto_qid):
-                        if qid in data.get('queues', {}):
-                            data['queues'][qid] = []
-                        if qid in data.get('queue_timestamps', {}):
-                            data['queue_timestamps'][qid] = {}
-                elif panel_type == '2v2':
-                    mob_base = f"2v2-mob_{message.id}"
-                    misto_base = f"2v2-misto_{message.id}"
-                    qids = [
-                        f"{mob_base}_team1", f"{mob_base}_team2",
-                        f"{misto_base}_team1", f"{misto_base}_team2",
-                    ]
-                    for qid in qids:
-                        if qid in data.get('queues', {}):
-                            data['queues'][qid] = []
-                        if qid in data.get('queue_timestamps', {}):
-                            data['queue_timestamps'][qid] = {}
-                elif panel_type == '3v3':
-                    mob_base = f"3v3-mob_{message.id}"
-                    misto_base = f"3v3-misto_{message.id}"
-                    qids = [
-                        f"{mob_base}_team1", f"{mob_base}_team2",
-                        f"{misto_base}_team1", f"{misto_base}_team2",
-                    ]
-                    for qid in qids:
-                        if qid in data.get('queues', {}):
-                            data['queues'][qid] = []
-                        if qid in data.get('queue_timestamps', {}):
-                            data['queue_timestamps'][qid] = {}
-                elif panel_type == '4v4':
-                    mob_base = f"4v4-mob_{message.id}"
-                    misto_base = f"4v4-misto_{message.id}"
-                    qids = [
-                        f"{mob_base}_team1", f"{mob_base}_team2",
-                        f"{misto_base}_team1", f"{misto_base}_team2",
-                    ]
-                    for qid in qids:
-                        if qid in data.get('queues', {}):
-                            data['queues'][qid] = []
-                        if qid in data.get('queue_timestamps', {}):
-                            data['queue_timestamps'][qid] = {}
-
-                db._save_data(data)
-                log(f"✅ Painel {panel_type} limpo (metadados preservados para reuso)")
-                return
+        # Verifica se a mensagem deletada era um painel registrado
+        panel = await db.get_panel(message.id)
 
-            queue_id = metadata['queue_id']
+        if panel:
             log(f"🗑️ Mensagem de painel deletada (ID: {message.id})")
-            log(f"🧹 Limpando apenas jogadores da fila {queue_id} (metadados preservados)...")
-
-            # NÃO REMOVE METADADOS - mantém para sempre para que botões funcionem indefinidamente
-            # Comentado: db.delete_queue_metadata(message.id)
-
-            # Remove do dicionário em memória
-            if queue_id in queue_messages:
-                del queue_messages[queue_id]
-
-            # Limpa apenas a fila de jogadores (remove todos jogadores)
-            # mas mantém os metadados para que possam criar nova fila no mesmo painel
-            data = db._load_data()
-            if queue_id in data.get('queues', {}):
-                data['queues'][queue_id] = []  # Limpa jogadores ao invés de deletar
-                log(f"✅ Jogadores da fila {queue_id} removidos")
-            if queue_id in data.get('queue_timestamps', {}):
-                data['queue_timestamps'][queue_id] = {}  # Limpa timestamps ao invés de deletar
-            db._save_data(data)
-
-            log(f"✅ Fila {queue_id} limpa (metadados preservados para reuso)")
+            panel_renderer.forget(message.id)
+            panel_edits.forget(message.id)
+
+            try:
+                async with lock_panel_queues(panel, timeout=None):
+                    await clear_deleted_panel(message.id)
+            except LockTimeout as e:
+                # A mensagem já era: melhor limpar sem o lock do que manter a fila
+                log(f"⏳ {e}")
+                await clear_deleted_panel(message.id)
+            log(f"✅ Painel {panel.mode} limpo (removido do registro após o prazo de carência)")
     except Exception as e:
         log(f"⚠️ Erro ao processar mensagem deletada: {e}")
 
@@ -2364,10 +1465,11 @@ async def on_ready():
     # Registra apenas UMA VEZ cada view persistente
     # IMPORTANTE: Não criar novas instâncias, reutilizar as mesmas
     if not hasattr(bot, '_persistent_views_registered'):
-        bot.add_view(QueueButton(mode="", bet_value=0, mediator_fee=0, currency_type="sonhos"))
-        bot.add_view(TeamQueueButton(mode="2v2-misto", bet_value=0, mediator_fee=0, currency_type="sonhos"))
-        bot.add_view(Unified1v1PanelView())
-        bot.add_view(Unified2v2PanelView())
+        bot.add_view(QueueButton())
+        bot.add_view(TeamQueueButton())
+        for panel_type in PANEL_FAMILIES:
+            bot.add_view(UnifiedPanelView(panel_type))
+        bot.add_dynamic_items(PanelQueueButton)
         bot.add_view(ConfirmPaymentButton(bet_id=""))
         bot.add_view(AcceptMediationButton(bet_id=""))
         bot.add_view(MediatorCentralView())
@@ -2379,38 +1481,19 @@ async def on_ready():
     # Recuperar metadados de filas existentes após restart
     if not hasattr(bot, '_queue_metadata_recovered'):
         log('🔄 Recuperando metadados de filas existentes...')
-        all_metadata = db.get_all_queue_metadata()
-
         # PASSO 1: Limpar jogadores que estão em apostas ativas das filas
-        active_bets = db.get_all_active_bets()
+        active_bets = await db.get_all_active_bets()
         active_players = set()
         for bet in active_bets.values():
             active_players.add(bet.player1_id)
             active_players.add(bet.player2_id)
 
         log(f'🧹 Limpando {len(active_players)} jogadores que estão em apostas ativas')
-        for player_id in active_players:
-            db.remove_from_all_queues(player_id)
+        await remove_from_all_panel_queues(list(active_players))
 
-        # PASSO 2: Recuperar metadados e popular queue_messages
-        for message_id_str, metadata in all_metadata.items():
-            if metadata.get('type') == 'panel':
-                continue
-            queue_id = metadata['queue_id']
-            channel_id = metadata['channel_id']
-            message_id = metadata['message_id']
-            mode = metadata['mode']
-            bet_value = metadata['bet_value']
-            currency_type = metadata.get('currency_type', 'sonhos')
-
-            # Restaura no dicionário em memória (com currency_type)
-            queue_messages[queue_id] = (channel_id, message_id, mode, bet_value, currency_type)
-
-            # Log detalhado de cada fila recuperada
-            current_queue = db.get_queue(queue_id)
-            log(f'📋 Fila {queue_id}: {len(current_queue)} jogadores')
-
-        log(f'✅ {len(all_metadata)} filas recuperadas e sincronizadas')
+        # PASSO 2: Painéis vêm do registro (montado ao carregar o estado)
+        stats = await db.get_panel_stats()
+        log(f'✅ Painéis registrados: {stats["live"]} ativos, {stats["missing"]} sem mensagem, {stats["tombstoned"]} apagados')
         bot._queue_metadata_recovered = True
 
     # Inicia a tarefa de limpeza automática de filas (apenas uma vez)
@@ -2418,6 +1501,7 @@ async def on_ready():
         bot.loop.create_task(cleanup_expired_queues())
         bot.loop.create_task(cleanup_orphaned_data_task())
         bot.loop.create_task(cleanup_expired_mediators_central())
+        bot.loop.create_task(verify_panels_task())
         bot._cleanup_task_started = True
         log('🧹 Tarefas de limpeza iniciadas')
     else:
@@ -2425,16 +1509,15 @@ async def on_ready():
 
     # Inicia a tarefa de verificação de assinaturas (apenas uma vez)
     if not hasattr(bot, '_subscription_task_started'):
-        check_expired_subscriptions.start()
+        bot.loop.create_task(check_expired_subscriptions())
         bot._subscription_task_started = True
-        log('🔐 Tarefa de verificação de assinaturas iniciada')
 
     # Garante assinatura permanente do servidor auto-autorizado
     if not hasattr(bot, '_auto_authorized_setup'):
         auto_guild = bot.get_guild(AUTO_AUTHORIZED_GUILD_ID)
         if auto_guild:
-            if not db.is_subscription_active(AUTO_AUTHORIZED_GUILD_ID):
-                db.create_subscription(AUTO_AUTHORIZED_GUILD_ID, None)
+            if not await db.is_subscription_active(AUTO_AUTHORIZED_GUILD_ID):
+                await db.create_subscription(AUTO_AUTHORIZED_GUILD_ID, None)
                 log(f"✅ Assinatura permanente automática criada para {auto_guild.name}")
         bot._auto_authorized_setup = True
 
@@ -2448,9 +1531,9 @@ async def on_ready():
                 continue
 
             # Se o servidor não tem assinatura ativa, cria por 5 dias automaticamente
-            if not db.is_subscription_active(guild.id):
+            if not await db.is_subscription_active(guild.id):
                 duration_seconds = 5 * 86400  # 5 dias
-                db.create_subscription(guild.id, duration_seconds)
+                await db.create_subscription(guild.id, duration_seconds)
                 log(f"✅ Auto-autorizado: {guild.name} ({guild.id}) - assinatura de 5 dias criada")
                 auto_authorized_count += 1
 
@@ -2498,28 +1581,9 @@ async def on_resumed():
     log(f'👤 Sessão retomada: {bot.user}')
     log(f'🌐 Servidores: {len(bot.guilds)}')
 
-    # PROTEÇÃO EXTRA: Verifica se queue_messages está sincronizado com o banco
-    try:
-        all_metadata = db.get_all_queue_metadata()
-
-        # Se queue_messages estiver vazio mas há metadados no banco, recupera
-        if not queue_messages and all_metadata:
-            log('⚠️ Detectado queue_messages vazio após reconexão - recuperando do banco...')
-            for message_id_str, metadata in all_metadata.items():
-                if metadata.get('type') == 'panel':
-                    continue
-                queue_id = metadata['queue_id']
-                channel_id = metadata['channel_id']
-                message_id = metadata['message_id']
-                mode = metadata['mode']
-                bet_value = metadata['bet_value']
-                currency_type = metadata.get('currency_type', 'sonhos')
-                queue_messages[queue_id] = (channel_id, message_id, mode, bet_value, currency_type)
-            log(f'✅ {len(all_metadata)} filas recuperadas após reconexão')
-        else:
-            log(f'✅ queue_messages sincronizado: {len(queue_messages)} filas em memória')
-    except Exception as e:
-        log(f'⚠️ Erro ao verificar sincronização de filas após reconexão: {e}')
+    # Painéis continuam no registro em memória (não dependem da sessão do gateway)
+    stats = await db.get_panel_stats()
+    log(f'✅ Painéis registrados: {stats["live"]} ativos, {stats["missing"]} sem mensagem')
 
 @bot.event
 async def on_connect():
@@ -2596,15 +1660,13 @@ def register_all_commands(target_bot):
     app_commands.Choice(name="Sonhos", value="sonhos"),
 ])
 async def mostrar_fila(interaction: discord.Interaction, modo: app_commands.Choice[str], valor: str, taxa: str, moeda: app_commands.Choice[str]):
-    # Obter idioma do servidor
-    lang = db.get_language(interaction.guild.id)
-    translations = get_translations(lang)
-    
-    # Busca o cargo de mediador configurado
-    mediator_role_id = db.get_mediator_role(interaction.guild.id)
+    # Configuração do servidor (idioma + cargo de mediador), do cache
+    config = await db.get_guild_config(interaction.guild.id)
+    translations = get_translations(config.language)
+    mediator_role_id = config.mediator_role_id
 
     # Verifica se tem o cargo de mediador configurado
-    has_mediator_role = mediator_role_id and discord.utils.get(interaction.user.roles, id=mediator_role_id) is not None
+    has_mediator_role = config.is_mediator(interaction.user)
 
     if not has_mediator_role:
         if mediator_role_id:
@@ -2657,56 +1719,10 @@ async def mostrar_fila(interaction: discord.Interaction, modo: app_commands.Choi
         return
 
     valor_formatado = format_bet_value(valor_numerico, currency_type)
-    guild_name = interaction.guild.name if interaction.guild else ""
-
-    # Decide view and embed based on mode
-    is_unified = mode in ("1v1", "2v2", "3v3", "4v4")
-    is_2v2 = mode.startswith("2v2")
-    is_3v3 = mode.startswith("3v3")
-    is_4v4 = mode.startswith("4v4")
-
-    if is_unified:
-        # Unified panel (MOB + MISTO in same panel)
-        title = format_panel_title(guild_name, "1v1" if mode == "1v1" else "2v2" if mode == "2v2" else "3v3" if mode == "3v3" else "4v4")
-        embed = discord.Embed(title=title, color=EMBED_COLOR)
-        embed.add_field(name="Valor", value=valor_formatado, inline=True)
-        if mode == "1v1":
-            embed.add_field(name="", value="0/2 —", inline=True)
-            embed.add_field(name="", value="0/2 —", inline=True)
-        elif mode == "2v2":
-            embed.add_field(name="", value="T1 0/2 —\nT2 0/2 —", inline=True)
-            embed.add_field(name="", value="T1 0/2 —\nT2 0/2 —", inline=True)
-        elif mode == "3v3":
-            embed.add_field(name="", value="T1 0/3 —\nT2 0/3 —", inline=True)
-            embed.add_field(name="", value="T1 0/3 —\nT2 0/3 —", inline=True)
-        elif mode == "4v4":
-            embed.add_field(name="", value="T1 0/4 —\nT2 0/4 —", inline=True)
-            embed.add_field(name="", value="T1 0/4 —\nT2 0/4 —", inline=True)
-        view = Unified2v2PanelView() if mode == "2v2" else Unified1v1PanelView() if mode == "1v1" else Unified3v3PanelView() if mode == "3v3" else Unified4v4PanelView()
-    else:
-        # Individual panel (only MOB or only MISTO)
-        title = format_panel_title(guild_name, format_mode_label(mode))
-        embed = discord.Embed(title=title, color=EMBED_COLOR)
-        embed.add_field(name="Valor", value=valor_formatado, inline=True)
-        if is_2v2:
-            embed.add_field(name="T1", value="0/2 —", inline=True)
-            embed.add_field(name="T2", value="0/2 —", inline=True)
-            view = TeamQueueButton(mode, valor_numerico, taxa_numerica, None, currency_type)
-        elif is_3v3:
-            embed.add_field(name="T1", value="0/3 —", inline=True)
-            embed.add_field(name="T2", value="0/3 —", inline=True)
-            view = TeamQueueButton(mode, valor_numerico, taxa_numerica, None, currency_type)
-        elif is_4v4:
-            embed.add_field(name="T1", value="0/4 —", inline=True)
-            embed.add_field(name="T2", value="0/4 —", inline=True)
-            view = TeamQueueButton(mode, valor_numerico, taxa_numerica, None, currency_type)
-        else:
-            embed.add_field(name="Fila", value="0/2 —", inline=True)
-            view = QueueButton(mode, valor_numerico, taxa_numerica, None, currency_type)
 
-    if interaction.guild.icon:
-        embed.set_thumbnail(url=interaction.guild.icon.url)
-    embed.set_footer(text=f"{interaction.guild.name if interaction.guild else ''}", icon_url=interaction.guild.icon.url if interaction.guild and interaction.guild.icon else None)
+    # Painel unificado (MOB + MISTO) quando o modo é só o tipo: 1v1, 2v2...
+    is_unified = mode in PANEL_FAMILIES
+    embed, view = new_panel(interaction.guild, mode, valor_numerico, taxa_numerica, currency_type, interaction.channel.id)
 
     # Defer a resposta para evitar timeout
     await interaction.response.defer()
@@ -2718,20 +1734,9 @@ async def mostrar_fila(interaction: discord.Interaction, modo: app_commands.Choi
 
     # Salva metadados após criar a mensagem
     if is_unified:
-        db.save_panel_metadata(message.id, mode, valor_numerico, taxa_numerica, interaction.channel.id, currency_type)
+        await db.save_panel_metadata(message.id, mode, valor_numerico, taxa_numerica, interaction.channel.id, currency_type)
     else:
-        db.save_queue_metadata(message.id, mode, valor_numerico, taxa_numerica, interaction.channel.id, currency_type)
-
-    # Atualiza view com message.id correto
-    if not is_unified:
-        if is_2v2:
-            view.message_id = message.id
-        elif is_3v3:
-            view.message_id = message.id
-        elif is_4v4:
-            view.message_id = message.id
-        else:
-            view.message_id = message.id
+        await db.save_queue_metadata(message.id, mode, valor_numerico, taxa_numerica, interaction.channel.id, currency_type)
 
     # Agora edita a mensagem com os botões
     await message.edit(embed=embed, view=view)
@@ -2780,10 +1785,11 @@ async def mostrar_fila(interaction: discord.Interaction, modo: app_commands.Choi
 ])
 async def preset_filas(interaction: discord.Interaction, modo: app_commands.Choice[str], taxa: str, moeda: app_commands.Choice[str]):
     # Busca o cargo de mediador configurado
-    mediator_role_id = db.get_mediator_role(interaction.guild.id)
+    config = await db.get_guild_config(interaction.guild.id)
+    mediator_role_id = config.mediator_role_id
 
     # Verifica se tem o cargo de mediador configurado
-    has_mediator_role = mediator_role_id and discord.utils.get(interaction.user.roles, id=mediator_role_id) is not None
+    has_mediator_role = config.is_mediator(interaction.user)
 
     if not has_mediator_role:
         if mediator_role_id:
@@ -2818,11 +1824,7 @@ async def preset_filas(interaction: discord.Interaction, modo: app_commands.Choi
 
     created_count = 0
     tasks = []
-    guild_name = interaction.guild.name if interaction.guild else ""
-    is_unified = mode in ("1v1", "2v2", "3v3", "4v4")
-    is_2v2 = mode.startswith("2v2")
-    is_3v3 = mode.startswith("3v3")
-    is_4v4 = mode.startswith("4v4")
+    is_unified = mode in PANEL_FAMILIES
 
     for valor_numerico in preset_values:
         try:
@@ -2851,48 +1853,7 @@ async def preset_filas(interaction: discord.Interaction, modo: app_commands.Choi
 
             valor_formatado = format_bet_value(valor_numerico, currency_type)
 
-            if is_unified:
-                # Unified panel (MOB + MISTO in same panel)
-                title = format_panel_title(guild_name, "1v1" if mode == "1v1" else "2v2" if mode == "2v2" else "3v3" if mode == "3v3" else "4v4")
-                embed = discord.Embed(title=title, color=EMBED_COLOR)
-                embed.add_field(name="Valor", value=valor_formatado, inline=True)
-                if mode == "1v1":
-                    embed.add_field(name="", value="0/2 —", inline=True)
-                    embed.add_field(name="", value="0/2 —", inline=True)
-                elif mode == "2v2":
-                    embed.add_field(name="", value="T1 0/2 —\nT2 0/2 —", inline=True)
-                    embed.add_field(name="", value="T1 0/2 —\nT2 0/2 —", inline=True)
-                elif mode == "3v3":
-                    embed.add_field(name="", value="T1 0/3 —\nT2 0/3 —", inline=True)
-                    embed.add_field(name="", value="T1 0/3 —\nT2 0/3 —", inline=True)
-                elif mode == "4v4":
-                    embed.add_field(name="", value="T1 0/4 —\nT2 0/4 —", inline=True)
-                    embed.add_field(name="", value="T1 0/4 —\nT2 0/4 —", inline=True)
-                view = Unified2v2PanelView() if mode == "2v2" else Unified1v1PanelView() if mode == "1v1" else Unified3v3PanelView() if mode == "3v3" else Unified4v4PanelView()
-            else:
-                # Individual panel (only MOB or only MISTO)
-                title = format_panel_title(guild_name, format_mode_label(mode))
-                embed = discord.Embed(title=title, color=EMBED_COLOR)
-                embed.add_field(name="Valor", value=valor_formatado, inline=True)
-                if is_2v2:
-                    embed.add_field(name="T1", value="0/2 —", inline=True)
-                    embed.add_field(name="T2", value="0/2 —", inline=True)
-                    view = TeamQueueButton(mode, valor_numerico, taxa_numerica, None, currency_type)
-                elif is_3v3:
-                    embed.add_field(name="T1", value="0/3 —", inline=True)
-                    embed.add_field(name="T2", value="0/3 —", inline=True)
-                    view = TeamQueueButton(mode, valor_numerico, taxa_numerica, None, currency_type)
-                elif is_4v4:
-                    embed.add_field(name="T1", value="0/4 —", inline=True)
-                    embed.add_field(name="T2", value="0/4 —", inline=True)
-                    view = TeamQueueButton(mode, valor_numerico, taxa_numerica, None, currency_type)
-                else:
-                    embed.add_field(name="Fila", value="0/2 —", inline=True)
-                    view = QueueButton(mode, valor_numerico, taxa_numerica, None, currency_type)
-
-            if interaction.guild.icon:
-                embed.set_thumbnail(url=interaction.guild.icon.url)
-            embed.set_footer(text=f"{interaction.guild.name if interaction.guild else ''}", icon_url=interaction.guild.icon.url if interaction.guild and interaction.guild.icon else None)
+            embed, view = new_panel(interaction.guild, mode, valor_numerico, taxa_numerica, currency_type, interaction.channel.id)
 
             # Envia a mensagem primeiro SEM botão (mais rápido)
             message = await interaction.channel.send(embed=embed)
@@ -2901,22 +1862,11 @@ async def preset_filas(interaction: discord.Interaction, modo: app_commands.Choi
 
             # Salva metadados após criar a mensagem
             if is_unified:
-                db.save_panel_metadata(message.id, mode, valor_numerico, taxa_numerica, interaction.channel.id, currency_type)
+                await db.save_panel_metadata(message.id, mode, valor_numerico, taxa_numerica, interaction.channel.id, currency_type)
             else:
-                db.save_queue_metadata(message.id, mode, valor_numerico, taxa_numerica, interaction.channel.id, currency_type)
-
-            # Atualiza view com message.id correto
-            if not is_unified:
-                if is_2v2:
-                    view.message_id = message.id
-                elif is_3v3:
-                    view.message_id = message.id
-                elif is_4v4:
-                    view.message_id = message.id
-                else:
-                    view.message_id = message.id
+                await db.save_queue_metadata(message.id, mode, valor_numerico, taxa_numerica, interaction.channel.id, currency_type)
 
-            # Adiciona a tarefa de editar com botões à lista (será executado em batch)
+    # Adiciona a tarefa de editar com botões à lista (será executado em batch)
             tasks.append((message, embed, view, valor_formatado))
             created_count += 1
 
@@ -2965,12 +1915,11 @@ async def create_bet_channel(guild: discord.Guild, mode: str, player1_id: int, p
 
     # Validação dupla com lock para evitar race condition
     for uid in all_player_ids:
-        if db.is_user_in_active_bet(uid):
+        if await db.is_user_in_active_bet(uid):
             log(f" Um dos jogadores já está em uma aposta ativa. Abortando criação.")
             return
 
-    for uid in all_player_ids:
-        db.remove_from_all_queues(uid)
+    await remove_from_all_panel_queues(all_player_ids)
     log(f" Jogadores removidos de todas as filas")
 
     try:
@@ -3004,8 +1953,8 @@ async def create_bet_channel(guild: discord.Guild, mode: str, player1_id: int, p
 
         if not source_channel:
             log(f" Canal de origem {source_channel_id} não encontrado. Abortando criação.")
-            db.add_to_queue(mode, player1_id)
-            db.add_to_queue(mode, player2_id)
+            await db.add_to_queue(mode, player1_id)
+            await db.add_to_queue(mode, player2_id)
             return
 
         log(f" Canal de origem encontrado: {source_channel.name}")
@@ -3098,12 +2047,10 @@ async def create_bet_channel(guild: discord.Guild, mode: str, player1_id: int, p
         if currency_type is None:
             currency_type = 'sonhos'  # Valor padrão
 
-            # Tenta encontrar nos metadados salvos (painéis antigos / filas antigas)
-            all_metadata = db.get_all_queue_metadata()
-            for msg_id, meta in all_metadata.items():
-                if meta.get('mode') == mode and meta.get('channel_id') == source_channel_id:
-                    currency_type = meta.get('currency_type', 'sonhos')
-                    break
+            # Tenta encontrar no registro de painéis (painéis antigos / filas antigas)
+            panel = await db.find_panel(source_channel_id, mode)
+            if panel:
+                currency_type = panel.currency_type
 
         bet = Bet(
             bet_id=bet_id,
@@ -3116,10 +2063,11 @@ async def create_bet_channel(guild: discord.Guild, mode: str, player1_id: int, p
             channel_id=thread.id,
             bet_value=float(bet_value),
             mediator_fee=float(mediator_fee),
-            currency_type=currency_type
+            currency_type=currency_type,
+            guild_id=guild.id
         )
 
-        db.add_active_bet(bet)
+        await db.add_active_bet(bet)
 
         log(f" Bet criado e salvo no banco:")
         log(f"   - bet_id: {bet.bet_id}")
@@ -3129,12 +2077,12 @@ async def create_bet_channel(guild: discord.Guild, mode: str, player1_id: int, p
 
     except Exception as e:
         log(f"Erro ao criar tópico de aposta: {e}")
-        db.add_to_queue(mode, player1_id)
-        db.add_to_queue(mode, player2_id)
+        await db.add_to_queue(mode, player1_id)
+        await db.add_to_queue(mode, player2_id)
         return
 
     # Busca o cargo de mediador configurado
-    mediator_role_id = db.get_mediator_role(guild.id)
+    mediator_role_id = await db.get_mediator_role(guild.id)
 
     if mediator_role_id:
         mediator_role = guild.get_role(mediator_role_id)
@@ -3153,7 +2101,7 @@ async def create_bet_channel(guild: discord.Guild, mode: str, player1_id: int, p
 
     # ========== CENTRAL DE MEDIADORES - ATRIBUIÇÃO AUTOMÁTICA ==========
     # Verifica se o Central de Mediadores está configurado
-    central_configured = db.is_mediator_central_configured(guild.id)
+    central_configured = await db.is_mediator_central_configured(guild.id)
     auto_mediator = None
     auto_mediator_pix = None
 
@@ -3161,19 +2109,19 @@ async def create_bet_channel(guild: discord.Guild, mode: str, player1_id: int, p
         log(f" Central de Mediadores está configurado para guild {guild.id}")
 
         # Tenta pegar o primeiro mediador da fila (sistema FIFO)
-        mediator_data = db.get_first_mediator_from_central(guild.id)
+        mediator_data = await db.get_first_mediator_from_central(guild.id)
 
         if mediator_data:
             auto_mediator_id, auto_mediator_pix = mediator_data
             log(f" Mediador automático selecionado: {auto_mediator_id}")
 
-            # Remove o mediador do central (já foi atribuído)
-            db.remove_mediator_from_central(guild.id, auto_mediator_id)
-
-            # Atualiza a aposta com o mediador automático
-            bet.mediator_id = auto_mediator_id
-            bet.mediator_pix = auto_mediator_pix
-            db.update_active_bet(bet)
+            # Remove o mediador do central (já foi atribuído) e atualiza a
+            # aposta com o mediador automático, numa única gravação
+            async with db.transaction():
+                await db.remove_mediator_from_central(guild.id, auto_mediator_id)
+                bet.mediator_id = auto_mediator_id
+                bet.mediator_pix = auto_mediator_pix
+                await db.update_active_bet(bet)
 
             # Busca o membro do mediador
             auto_mediator = guild.get_member(auto_mediator_id)
@@ -3186,7 +2134,7 @@ async def create_bet_channel(guild: discord.Guild, mode: str, player1_id: int, p
                     # Limpa o mediador da aposta se não encontrou
                     bet.mediator_id = 0
                     bet.mediator_pix = ""
-                    db.update_active_bet(bet)
+                    await db.update_active_bet(bet)
 
             # Atualiza o painel do central
             await update_mediator_central_panel(guild)
@@ -3336,11 +2284,11 @@ async def cancelar_aposta(interaction: discord.Interaction):
     log(f"   - Canal ID: {interaction.channel_id} (type={type(interaction.channel_id)})")
     log(f"   - É Thread? {isinstance(interaction.channel, discord.Thread)}")
 
-    bet = db.get_bet_by_channel(interaction.channel_id)
+    bet = await db.get_bet_by_channel(interaction.channel_id)
 
     if not bet:
         log(f"❌ Aposta não encontrada para canal {interaction.channel_id}")
-        all_bets = db.get_all_active_bets()
+        all_bets = await db.get_all_active_bets()
         log(f"📊 Apostas ativas: {len(all_bets)}")
         for bet_id, active_bet in all_bets.items():
             log(f"  - Bet {bet_id}: canal={active_bet.channel_id}")
@@ -3355,8 +2303,8 @@ async def cancelar_aposta(interaction: discord.Interaction):
     log(f"✅ Aposta encontrada: {bet.bet_id}")
 
     # Verifica se é o mediador da aposta OU se tem o cargo de mediador
-    mediator_role_id = db.get_mediator_role(interaction.guild.id)
-    has_mediator_role = mediator_role_id and discord.utils.get(interaction.user.roles, id=mediator_role_id) is not None
+    config = await db.get_guild_config(interaction.guild.id)
+    has_mediator_role = config.is_mediator(interaction.user)
     is_bet_mediator = interaction.user.id == bet.mediator_id
 
     if not is_bet_mediator and not has_mediator_role:
@@ -3381,9 +2329,9 @@ async def cancelar_aposta(interaction: discord.Interaction):
     # ========== DEVOLVE MEDIADOR AO FINAL DA FILA ==========
     # Se tinha mediador automático do central, devolve ao final da fila
     if bet.mediator_id and bet.mediator_pix:
-        central_configured = db.is_mediator_central_configured(interaction.guild.id)
+        central_configured = await db.is_mediator_central_configured(interaction.guild.id)
         if central_configured:
-            success = db.add_mediator_to_end_of_central(interaction.guild.id, bet.mediator_id, bet.mediator_pix)
+            success = await db.add_mediator_to_end_of_central(interaction.guild.id, bet.mediator_id, bet.mediator_pix)
             if success:
                 log(f"🔄 Mediador {bet.mediator_id} devolvido ao final da fila do central")
                 await update_mediator_central_panel(interaction.guild)
@@ -3391,7 +2339,9 @@ async def cancelar_aposta(interaction: discord.Interaction):
                 log(f"⚠️ Não foi possível devolver mediador {bet.mediator_id} à fila (cheia ou central não configurado)")
 
     bet.finished_at = datetime.now().isoformat()
-    db.finish_bet(bet)
+    if bet.guild_id is None:
+        bet.guild_id = interaction.guild.id
+    await db.finish_bet(bet)
 
     import asyncio
     await asyncio.sleep(10)
@@ -3406,24 +2356,23 @@ async def cancelar_aposta(interaction: discord.Interaction):
         log(f"Erro ao arquivar thread: {e}")
 
 
-@bot.tree.command(name="historico", description="Ver o histórico de apostas")
-async def historico(interaction: discord.Interaction):
-    history = db.get_bet_history()
+HISTORY_PAGE_SIZE = 10
 
-    if not history:
-        await interaction.response.send_message(
-            "Ainda não há histórico de apostas.",
-            ephemeral=True
-        )
-        return
+
+def build_history_embed(guild: discord.Guild, bets: list, total: int, page: int, player: Optional[discord.Member] = None) -> discord.Embed:
+    """Embed de uma página do histórico"""
+    pages = max((total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE, 1)
+    description = f"Total de apostas: {total}"
+    if player:
+        description = f"Apostas de {player.mention}\n{description}"
 
     embed = discord.Embed(
         title="Histórico de Apostas",
-        description=f"Total de apostas: {len(history)}",
+        description=description,
         color=EMBED_COLOR
     )
 
-    for bet in history[-10:]:
+    for bet in bets:
         winner_mention = f"<@{bet.winner_id}>" if bet.winner_id else "Cancelada"
         embed.add_field(
             name=f"{bet.mode.replace('-', ' ').title()}",
@@ -3434,19 +2383,84 @@ async def historico(interaction: discord.Interaction):
             ),
             inline=False
         )
-    if interaction.guild.icon:
-        embed.set_thumbnail(url=interaction.guild.icon.url)
-    embed.set_footer(text=CREATOR_FOOTER)
+    if guild.icon:
+        embed.set_thumbnail(url=guild.icon.url)
+    embed.set_footer(text=f"Página {page + 1}/{pages} • {CREATOR_FOOTER}")
+    return embed
+
+
+class HistoryPageView(discord.ui.View):
+    """Navegação do /historico: cada clique lê só a página pedida"""
+    def __init__(self, author_id: int, guild: discord.Guild, total: int, player: Optional[discord.Member] = None):
+        super().__init__(timeout=180)
+        self.author_id = author_id
+        self.guild = guild
+        self.player = player
+        self.total = total
+        self.page = 0
+        self._sync_buttons()
+
+    def _last_page(self) -> int:
+        return max((self.total - 1) // HISTORY_PAGE_SIZE, 0)
+
+    def _sync_buttons(self):
+        self.previous_page.disabled = self.page <= 0
+        self.next_page.disabled = self.page >= self._last_page()
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("Apenas quem usou o comando pode navegar.", ephemeral=True)
+            return False
+        return True
 
-    await interaction.response.send_message(embed=embed)
+    async def _show(self, interaction: discord.Interaction):
+        bets, self.total = await db.get_bet_history_page(
+            self.guild.id, self.page, HISTORY_PAGE_SIZE,
+            player_id=self.player.id if self.player else None
+        )
+        self.page = min(self.page, self._last_page())
+        self._sync_buttons()
+        embed = build_history_embed(self.guild, bets, self.total, self.page, self.player)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="◀ Anterior", style=discord.ButtonStyle.gray)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(self.page - 1, 0)
+        await self._show(interaction)
+
+    @discord.ui.button(label="Próxima ▶", style=discord.ButtonStyle.gray)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await self._show(interaction)
+
+
+@bot.tree.command(name="historico", description="Ver o histórico de apostas")
+@app_commands.describe(jogador="Mostrar apenas as apostas deste jogador")
+async def historico(interaction: discord.Interaction, jogador: Optional[discord.Member] = None):
+    bets, total = await db.get_bet_history_page(
+        interaction.guild.id, 0, HISTORY_PAGE_SIZE,
+        player_id=jogador.id if jogador else None
+    )
+
+    if not total:
+        await interaction.response.send_message(
+            "Ainda não há histórico de apostas.",
+            ephemeral=True
+        )
+        return
+
+    embed = build_history_embed(interaction.guild, bets, total, 0, jogador)
+    view = HistoryPageView(interaction.user.id, interaction.guild, total, jogador) if total > HISTORY_PAGE_SIZE else None
+    if view:
+        await interaction.response.send_message(embed=embed, view=view)
+    else:
+        await interaction.response.send_message(embed=embed)
 
 
 @bot.tree.command(name="minhas-apostas", description="Ver suas apostas ativas")
 async def minhas_apostas(interaction: discord.Interaction):
     user_id = interaction.user.id
-    active_bets = db.get_all_active_bets()
-
-    user_bets = [bet for bet in active_bets.values()
+    user_bets = [bet for bet in await db.get_active_bets_for_user(user_id)
                  if bet.player1_id == user_id or bet.player2_id == user_id]
 
     if not user_bets:
@@ -3486,7 +2500,7 @@ async def sair_todas_filas(interaction: discord.Interaction):
     user_id = interaction.user.id
 
     # Remove o usuário de todas as filas
-    db.remove_from_all_queues(user_id)
+    await remove_from_all_panel_queues([user_id])
 
     embed = discord.Embed(
         title="Removido de todas as filas",
@@ -3509,8 +2523,8 @@ async def desbugar_filas(interaction: discord.Interaction):
         )
         return
 
-    active_bets = db.get_all_active_bets()
-    all_metadata = db.get_all_queue_metadata()
+    active_bets = await db.get_all_active_bets()
+    all_metadata = await db.get_all_queue_metadata()
 
     if not active_bets and not all_metadata:
         await interaction.response.send_message(
@@ -3545,134 +2559,41 @@ async def desbugar_filas(interaction: discord.Interaction):
 
         # Mover para histórico sem vencedor (cancelada)
         bet.finished_at = datetime.now().isoformat()
-        db.finish_bet(bet)
+        await db.finish_bet(bet)
         cancelled_bets += 1
 
     # NÃO deletar painéis de fila - eles podem ser reutilizados indefinidamente!
     # Apenas limpar os jogadores das filas (preservando metadados)
 
     # Limpar apenas as listas de jogadores nas filas (mantém metadados para reuso)
-    data = db._load_data()
-
-    # Limpar jogadores de todas as filas
-    if 'queues' in data:
-        for queue_id in data['queues'].keys():
-            data['queues'][queue_id] = []  # Limpa jogadores mas mantém a estrutura
-
-    # Limpar timestamps
-    if 'queue_timestamps' in data:
-        for queue_id in data['queue_timestamps'].keys():
-            data['queue_timestamps'][queue_id] = {}  # Limpa timestamps mas mantém a estrutura
+    # Limpa jogadores e timestamps mas mantém a estrutura, numa única gravação
+    async with db.transaction():
+        for queue_id in await db.get_all_queue_ids():
+            await db.set_queue(queue_id, [])
 
     # CRÍTICO: NÃO DELETAR queue_metadata - painéis devem funcionar para sempre!
     # Os metadados são preservados para que os painéis continuem funcionando
 
-    db._save_data(data)
-
     log(f"✅ Filas limpas (metadados preservados para reuso dos painéis)")
 
     # ATUALIZAR TODOS OS PAINÉIS para mostrar que as filas estão vazias
     updated_panels = 0
-    for message_id_str, metadata in all_metadata.items():
+    for message_id_str in all_metadata:
         try:
-            message_id = int(message_id_str)
-            channel_id = metadata['channel_id']
-            
-            channel = bot.get_channel(channel_id)
-            if not channel:
+            panel = await db.get_panel(int(message_id_str))
+            if not panel or panel.state == PANEL_TOMBSTONED:
                 continue
-                
-            message = await channel.fetch_message(message_id)
-            
-            # Verifica tipo de painel e atualiza accordingly
-            if metadata.get('type') == 'panel':
-                panel_type = metadata.get('panel_type')
-                bet_value = metadata['bet_value']
-                currency_type = metadata.get('currency_type', 'sonhos')
-                
-                if panel_type == '1v1':
-                    # Atualizar painel 1v1 unificado
-                    mob_qid = f"1v1-mob_{message_id}"
-                    misto_qid = f"1v1-misto_{message_id}"
-                    mob_queue = []  # Fila vazia após limpeza
-                    misto_queue = []  # Fila vazia após limpeza
-                    
-                    valor_formatado = format_bet_value(bet_value, currency_type)
-                    guild_name = channel.guild.name if channel.guild else ""
-                    
-                    embed_update = discord.Embed(
-                        title=format_panel_title(guild_name, "1v1"),
-                        color=EMBED_COLOR
-                    )
-                    embed_update.add_field(name="Valor", value=valor_formatado, inline=True)
-                    embed_update.add_field(name="📱 1v1 MOB", value="0/2 —", inline=True)
-                    embed_update.add_field(name="💻 1v1 MISTO", value="0/2 —", inline=True)
-                    if channel.guild and channel.guild.icon:
-                        embed_update.set_thumbnail(url=channel.guild.icon.url)
-                    embed_update.set_footer(text=f"{channel.guild.name if channel.guild else ''}", icon_url=channel.guild.icon.url if channel.guild and channel.guild.icon else None)
-                    
-                    await message.edit(embed=embed_update)
-                    updated_panels += 1
-                    
-                elif panel_type == '2v2':
-                    # Atualizar painel 2v2 unificado
-                    embed_update = discord.Embed(title="Painel 2v2", color=EMBED_COLOR)
-                    
-                    valor_formatado = format_bet_value(bet_value, currency_type)
-                    moeda_nome = "Sonhos" if currency_type == "sonhos" else "Dinheiro"
-                    
-                    embed_update.add_field(name="Valor", value=valor_formatado, inline=True)
-                    embed_update.add_field(name="Moeda", value=moeda_nome, inline=True)
-                    embed_update.add_field(name="📱 2v2 MOB", value="T1 0/2\n—\nT2 0/2\n—", inline=True)
-                    embed_update.add_field(name="💻 2v2 MISTO", value="T1 0/2\n—\nT2 0/2\n—", inline=True)
-                    if channel.guild and channel.guild.icon:
-                        embed_update.set_thumbnail(url=channel.guild.icon.url)
-                    embed_update.set_footer(text=CREATOR_FOOTER)
-                    
-                    await message.edit(embed=embed_update)
-                    updated_panels += 1
-            else:
-                # Painel individual (modo específico)
-                mode = metadata['mode']
-                bet_value = metadata['bet_value']
-                currency_type = metadata.get('currency_type', 'sonhos')
-                queue_id = metadata['queue_id']
-                
-                # Fila vazia após limpeza
-                queue = []
-                
-                valor_formatado = format_bet_value(bet_value, currency_type)
-                guild_name = channel.guild.name if channel.guild else ""
-                
-                embed_update = discord.Embed(
-                    title=format_panel_title(guild_name, format_mode_label(mode)),
-                    color=EMBED_COLOR
-                )
-                embed_update.add_field(name="Valor", value=valor_formatado, inline=True)
-                
-                if is_2v2_mode(mode):
-                    # Para 2v2, mostrar times vazios
-                    embed_update.add_field(name="Time 1", value="0/2 —", inline=True)
-                    embed_update.add_field(name="Time 2", value="0/2 —", inline=True)
-                else:
-                    # Para 1v1, mostrar fila vazia
-                    embed_update.add_field(name="Fila", value="0/2 —", inline=True)
-                
-                if channel.guild and channel.guild.icon:
-                    embed_update.set_thumbnail(url=channel.guild.icon.url)
-                
-                await message.edit(embed=embed_update)
-                updated_panels += 1
-                
+
+            # Redesenho forçado: ignora o hash da última edição
+            panel_renderer.forget(panel.message_id)
+            schedule_panel_edit(panel)
+            updated_panels += 1
         except Exception as e:
             log(f"⚠️ Erro ao atualizar painel {message_id_str}: {e}")
             continue
     
     log(f"✅ {updated_panels} painéis atualizados após limpeza")
 
-    # Limpar dicionário em memória
-    queue_messages.clear()
-
     embed = discord.Embed(
         title="Sistema Desbugado",
         description="Todas as apostas ativas foram canceladas e filas limpas.\n\n✅ **Painéis preservados** - Os painéis de fila continuam funcionando e podem ser reutilizados!",
@@ -3717,15 +2638,15 @@ async def setup(interaction: discord.Interaction, cargo: discord.Role, canal_de_
         return
 
     # Salvar o cargo de mediador no banco de dados
-    db.set_mediator_role(interaction.guild.id, cargo.id)
+    await db.set_mediator_role(interaction.guild.id, cargo.id)
 
     # Salvar o canal de resultados se fornecido
     if canal_de_resultados:
-        db.set_results_channel(interaction.guild.id, canal_de_resultados.id)
+        await db.set_results_channel(interaction.guild.id, canal_de_resultados.id)
     
     # Salvar o idioma se fornecido
     if idioma:
-        db.set_guild_language(interaction.guild.id, idioma.value)
+        await db.set_guild_language(interaction.guild.id, idioma.value)
         
     # Obter traduções
     lang = idioma.value if idioma else "pt"
@@ -3776,10 +2697,10 @@ async def central_apostado(interaction: discord.Interaction):
         return
     
     # Verifica se já existe um central configurado
-    existing_config = db.get_mediator_central_config(interaction.guild.id)
+    existing_config = await db.get_mediator_central_config(interaction.guild.id)
     if existing_config:
         # Remove configuração antiga
-        db.delete_mediator_central_config(interaction.guild.id)
+        await db.delete_mediator_central_config(interaction.guild.id)
         log(f"♻️ Central anterior removido, criando novo")
     
     # Cria o embed do painel com emojis
@@ -3823,7 +2744,7 @@ async def central_apostado(interaction: discord.Interaction):
     message = await interaction.original_response()
     
     # Salva a configuração
-    db.save_mediator_central_config(interaction.guild.id, interaction.channel.id, message.id)
+    await db.save_mediator_central_config(interaction.guild.id, interaction.channel.id, message.id)
     
     log(f"✅ Central de Mediadores criado no guild {interaction.guild.id}")
 
@@ -3920,17 +2841,14 @@ async def servidores(interaction: discord.Interaction):
     )
 
     for guild in bot.guilds:
-        subscription = db.get_subscription(guild.id)
+        expires = await db.get_subscription_expiry(guild.id)
         status = "✅ Ativo"
-        if subscription:
-            if subscription.get('permanent'):
-                status = "♾️ Permanente"
-            elif subscription.get('expires_at'):
-                from datetime import datetime
-                expires = datetime.fromisoformat(subscription['expires_at'])
-                status = f"⏰ Expira: {expires.strftime('%d/%m/%Y %H:%M')}"
-        else:
+        if expires is None:
             status = "❌ Sem assinatura"
+        elif expires == float('inf'):
+            status = "♾️ Permanente"
+        elif expires > 0:
+            status = f"⏰ Expira: {datetime.fromtimestamp(expires).strftime('%d/%m/%Y %H:%M')}"
 
         # Tenta criar um convite
         invite_link = "Sem permissão para criar convite"
@@ -4013,7 +2931,7 @@ async def criar_assinatura(
         return
 
     # Cria a assinatura
-    db.create_subscription(guild_id, duration_seconds)
+    await db.create_subscription(guild_id, duration_seconds)
 
     # Calcula a data de expiração
     from datetime import datetime, timedelta
@@ -4050,7 +2968,7 @@ async def assinatura_permanente(
         return
 
     # Cria assinatura permanente
-    db.create_subscription(guild_id, None)
+    await db.create_subscription(guild_id, None)
 
     embed = discord.Embed(
         title="♾️ Assinatura Permanente Criada",
@@ -4089,7 +3007,7 @@ async def sair(
     guild_name = guild.name
 
     # Remove assinatura
-    db.remove_subscription(guild_id)
+    await db.remove_subscription(guild_id)
 
     # Sai do servidor
     try:
@@ -4146,7 +3064,7 @@ async def autorizar_servidor(
 
     # Se não especificou duração, cria permanente
     if not duracao:
-        db.create_subscription(guild_id, None)
+        await db.create_subscription(guild_id, None)
         embed = discord.Embed(
             title="♾️ Servidor Autorizado Permanentemente",
             description=f"Servidor ID `{guild_id}` agora tem acesso permanente ao bot.",
@@ -4174,7 +3092,7 @@ async def autorizar_servidor(
             await interaction.response.send_message("❌ Formato inválido. Use: 30d (dias) ou 60s (segundos)", ephemeral=True)
             return
 
-        db.create_subscription(guild_id, duration_seconds)
+        await db.create_subscription(guild_id, duration_seconds)
 
         from datetime import datetime, timedelta
         expires_at = datetime.now() + timedelta(seconds=duration_seconds)
@@ -4266,7 +3184,7 @@ async def aviso_de_atualizacao(interaction: discord.Interaction):
                 continue
 
             # Busca o cargo de mediador configurado
-            mediator_role_id = db.get_mediator_role(guild.id)
+            mediator_role_id = await db.get_mediator_role(guild.id)
             role_mention = None
 
             if mediator_role_id:
@@ -4467,16 +3385,29 @@ async def listar_autorizados(interaction: discord.Interaction):
 
 # ===== TASK PERIÓDICA PARA VERIFICAR ASSINATURAS =====
 
-@tasks.loop(minutes=10)
 async def check_expired_subscriptions():
+    """Tarefa em background: acorda quando a próxima assinatura expira
+
+    Também acorda quando uma assinatura é criada, renovada ou removida;
+    SUBSCRIPTION_CHECK_MAX_SLEEP limita a espera (segurança).
+    """
+    await bot.wait_until_ready()
+    max_sleep = float(os.getenv("SUBSCRIPTION_CHECK_MAX_SLEEP", "3600"))
+    log("🔐 Tarefa de verificação de assinaturas iniciada")
+
+    while not bot.is_closed():
+        await process_expired_subscriptions()
+        next_expiry = await db.get_next_subscription_expiry()
+        delay = max_sleep if next_expiry is None else next_expiry - time.time()
+        await db.wait_subscription_change(min(max(delay, 1), max_sleep))
+
+
+async def process_expired_subscriptions():
     """Verifica assinaturas expiradas e remove o bot dos servidores"""
     try:
-        log("🔍 Verificando assinaturas expiradas...")
-
-        expired_guilds = db.get_expired_subscriptions()
+        expired_guilds = await db.get_expired_subscriptions()
 
         if not expired_guilds:
-            log("✅ Nenhuma assinatura expirada")
             return
 
         log(f"⚠️ {len(expired_guilds)} assinatura(s) expirada(s)")
@@ -4526,10 +3457,10 @@ async def check_expired_subscriptions():
                     log(f"⚠️ Erro ao processar guild {guild_id}: {e}")
 
                 # Remove a assinatura do banco
-                db.remove_subscription(guild_id)
+                await db.remove_subscription(guild_id)
             else:
                 # Servidor não encontrado, apenas remove a assinatura
-                db.remove_subscription(guild_id)
+                await db.remove_subscription(guild_id)
                 log(f"🗑️ Assinatura removida para guild {guild_id} (servidor não encontrado)")
 
         log("✅ Verificação de assinaturas concluída")
@@ -4538,12 +3469,6 @@ async def check_expired_subscriptions():
         log(f"❌ Erro ao verificar assinaturas: {e}")
         logger.exception("Stacktrace:")
 
-@check_expired_subscriptions.before_loop
-async def before_check_subscriptions():
-    """Aguarda o bot estar pronto antes de iniciar a task"""
-    await bot.wait_until_ready()
-
-
 # ===== SERVIDOR HTTP PARA HEALTHCHECK (Railway/Railway) =====
 # Middleware para filtrar logs de health checks
 @web.middleware
@@ -4593,8 +3518,26 @@ async def dashboard(request):
 async def health_check(request):
     """Endpoint de healthcheck para Railway/Railway"""
     bot_status = "online" if bot.is_ready() else "starting"
+    storage = db.health()
+    lines = [f"Bot Status: {bot_status}", "Uptime: OK", f"Database: {storage['backend']}"]
+    if storage['snapshot_age'] is None:
+        lines.append("Snapshot: none yet")
+    else:
+        lines.append(f"Snapshot: {storage['snapshot_age']}s ago ({storage['snapshot_generations']} generations)")
+    if 'postgres' in storage:
+        pg = storage['postgres']
+        lines.append(f"PostgreSQL circuit: {pg['state']} (failures={pg['failures']}, pending_sections={pg['pending_sections']})")
+        lines.append(f"PostgreSQL CAS conflicts: {pg['cas_conflicts']}")
+    locks = queue_locks.status()
+    lines.append(f"Queue locks: {locks['provider']} (acquired={locks['acquired']}, contended={locks['contended']}, "
+                 f"timeouts={locks['timeouts']}, avg_wait={locks['avg_wait_ms']}ms, max_wait={locks['max_wait_ms']}ms)")
+    edits = panel_edits.status()
+    lines.append(f"Panel edits: pending={edits['pending']}, sent={edits['sent']}, coalesced={edits['coalesced']}, "
+                 f"skipped={panel_renderer.edits_skipped}, failed={edits['failed']}, "
+                 f"avg_delay={edits['avg_delay_ms']}ms, avg_latency={edits['avg_latency_ms']}ms, "
+                 f"max_latency={edits['max_latency_ms']}ms")
     return web.Response(
-        text=f"Bot Status: {bot_status}\nUptime: OK",
+        text="\n".join(lines),
         status=200,
         headers={'Content-Type': 'text/plain'}
     )
@@ -4647,6 +3590,12 @@ async def start_web_server():
     log(f"   💚 Health: /health, /ping")
     return site
 
+async def connect_storage():
+    """Conecta o storage e escolhe o provedor de locks de fila (local ou PostgreSQL)"""
+    global queue_locks
+    await db.connect()
+    queue_locks = create_lock_provider(db)
+
 async def run_bot_with_webserver():
     """Roda o bot Discord junto com o servidor web"""
     token = os.getenv("DISCORD_TOKEN") or os.getenv("TOKEN") or ""
@@ -4673,6 +3622,7 @@ async def run_bot_with_webserver():
 
     # Iniciar bot Discord
     try:
+        await connect_storage()
         await bot.start(token, reconnect=True)
     except Exception as e:
         log(f"❌ ERRO CRÍTICO ao iniciar bot: {e}")
@@ -4687,6 +3637,7 @@ async def run_bot_single():
         raise Exception("Configure DISCORD_TOKEN nas variáveis de ambiente.")
 
     log("🤖 Modo econômico: Iniciando 1 bot...")
+    await connect_storage()
     await bot.start(token, reconnect=True)
 
 def create_bot_instance():
@@ -4701,6 +3652,16 @@ def create_bot_instance():
 
 async def run_bot_with_token():
     """Inicia o bot com o(s) token(s) disponível(eis)"""
+    # Conecta o storage assíncrono (pool PostgreSQL + write-behind) no event loop
+    await connect_storage()
+    try:
+        await _start_bots()
+    finally:
+        await db.close()
+        log("💾 Estado pendente gravado e conexões do banco fechadas")
+
+async def _start_bots():
+    """Conecta o(s) bot(s) ao Discord"""
     # Buscar tokens nas variáveis de ambiente
     # Prioridade: Se tem TOKEN ou DISCORD_TOKEN, usa apenas 1 bot
     if os.getenv("TOKEN") or os.getenv("DISCORD_TOKEN"):
@@ -4765,10 +3726,11 @@ async def run_bot_with_token():
     
     # Adicionar views persistentes para todos os bots adicionais
     for i, bot_instance in enumerate(bot_instances[1:], start=2):
-        bot_instance.add_view(QueueButton(mode="", bet_value=0, mediator_fee=0, currency_type="sonhos"))
-        bot_instance.add_view(TeamQueueButton(mode="2v2-misto", bet_value=0, mediator_fee=0, currency_type="sonhos"))
-        bot_instance.add_view(Unified1v1PanelView())
-        bot_instance.add_view(Unified2v2PanelView())
+        bot_instance.add_view(QueueButton())
+        bot_instance.add_view(TeamQueueButton())
+        for panel_type in PANEL_FAMILIES:
+            bot_instance.add_view(UnifiedPanelView(panel_type))
+        bot_instance.add_dynamic_items(PanelQueueButton)
         bot_instance.add_view(ConfirmPaymentButton(bet_id=""))
         bot_instance.add_view(AcceptMediationButton(bet_id=""))
         log(f"📋 Views persistentes adicionadas ao bot #{i}")
@@ -4870,4 +3832,10 @@ except Exception as e:
         # No Railway, queremos saber exatamente o que deu errado
         import traceback
         traceback.print_exc()
-        raise
\ No newline at end of file
+        raise
+finally:
+    # Último recurso: grava no JSON o que ainda estiver pendente
+    try:
+        db.flush_sync()
+    except Exception as e:
+        log(f"❌ Erro ao gravar estado no shutdown: {e}")
\ No newline at end of file
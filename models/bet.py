@@ -1,9 +1,15 @@
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import MISSING, dataclass, fields
+from typing import Callable, Dict, List, Optional
 from datetime import datetime
 
+# Versão do formato gravado por Bet.to_dict(). Registros sem o campo são da
+# versão 0 (anteriores ao codec). Ao mudar o formato, incremente a versão e
+# registre em _UPGRADES a função que converte um registro da versão anterior.
+BET_SCHEMA_VERSION = 1
+_UPGRADES: Dict[int, Callable[[dict], dict]] = {}
 
-@dataclass
+
+@dataclass(slots=True)
 class Bet:
     """Representa uma aposta ativa"""
     bet_id: str
@@ -26,6 +32,7 @@ class Bet:
     created_at: str = ""
     finished_at: Optional[str] = None
     currency_type: str = "sonhos"
+    guild_id: Optional[int] = None
 
     def __post_init__(self):
         if not self.created_at:
@@ -43,52 +50,152 @@ class Bet:
         return self.player1_confirmed and self.player2_confirmed
 
     def to_dict(self) -> dict:
-        """Converte a aposta para dicionário"""
-        return {
-            'bet_id': self.bet_id,
-            'mode': self.mode,
-            'player1_id': self.player1_id,
-            'player2_id': self.player2_id,
-            'team1_ids': self.team1_ids,
-            'team2_ids': self.team2_ids,
-            'mediator_id': self.mediator_id,
-            'channel_id': self.channel_id,
-            'bet_value': self.bet_value,
-            'mediator_fee': self.mediator_fee,
-            'mediator_pix': self.mediator_pix,
-            'player1_confirmed': self.player1_confirmed,
-            'player2_confirmed': self.player2_confirmed,
-            'team1_confirmed': self.team1_confirmed,
-            'team2_confirmed': self.team2_confirmed,
-            'winner_id': self.winner_id,
-            'winner_team': self.winner_team,
-            'created_at': self.created_at,
-            'finished_at': self.finished_at,
-            'currency_type': self.currency_type
-        }
+        """Converte a aposta para dicionário (novo, sem compartilhar listas)"""
+        return _encode(self)
 
     @classmethod
     def from_dict(cls, data: dict) -> 'Bet':
-        """Cria uma aposta a partir de um dicionário"""
-        return cls(
-            bet_id=data['bet_id'],
-            mode=data['mode'],
-            player1_id=data['player1_id'],
-            player2_id=data['player2_id'],
-            team1_ids=data.get('team1_ids', []) or [],
-            team2_ids=data.get('team2_ids', []) or [],
-            mediator_id=data['mediator_id'],
-            channel_id=data['channel_id'],
-            bet_value=data['bet_value'],
-            mediator_fee=data['mediator_fee'],
-            mediator_pix=data.get('mediator_pix', None),
-            player1_confirmed=data.get('player1_confirmed', False),
-            player2_confirmed=data.get('player2_confirmed', False),
-            team1_confirmed=data.get('team1_confirmed', False),
-            team2_confirmed=data.get('team2_confirmed', False),
-            winner_id=data.get('winner_id', None),
-            winner_team=data.get('winner_team', None),
-            created_at=data.get('created_at', ''),
-            finished_at=data.get('finished_at', None),
-            currency_type=data.get('currency_type', 'sonhos')
-        )
\ No newline at end of file
+        """Cria uma aposta a partir de um dicionário
+
+        Campos ausentes usam o padrão, campos desconhecidos são ignorados e
+        os tipos são normalizados aqui; `data` nunca é alterado.
+        """
+        return _decode(_upgrade(data))
+
+    @staticmethod
+    def view(data: dict) -> 'BetView':
+        """Visão somente leitura de um registro, sem copiá-lo"""
+        return BetView(_upgrade(data))
+
+
+# ==================== CODEC ====================
+
+def _int_or_none(value):
+    return None if value is None else int(value)
+
+
+def _int_list(value):
+    return [int(item) for item in value] if value else []
+
+
+def _float(value):
+    return 0.0 if value is None else float(value)
+
+
+def _bool(value):
+    return bool(value)
+
+
+def _coercer(field_type):
+    """Normalização aplicada na decodificação, pelo tipo anotado do campo"""
+    if field_type is float:
+        return '_float'
+    if field_type is bool:
+        return '_bool'
+    if field_type is int or field_type == Optional[int]:
+        return '_int_or_none'
+    if field_type == List[int]:
+        return '_int_list'
+    return None
+
+
+_CODEC_GLOBALS = {
+    '_float': _float,
+    '_bool': _bool,
+    '_int_or_none': _int_or_none,
+    '_int_list': _int_list,
+    '_new': object.__new__,
+    'Bet': Bet,
+    'BET_SCHEMA_VERSION': BET_SCHEMA_VERSION,
+}
+
+
+def _build_codec():
+    """Gera as funções de (de)codificação a partir dos campos da dataclass
+
+    Uma função por direção, com uma linha por campo, no lugar de dicts
+    montados à mão: não há lookup de campos em tempo de execução.
+    """
+    decode = ["def _decode(data):", "    get = data.get", "    bet = _new(Bet)"]
+    encode = ["def _encode(bet):", "    return {", "        'schema_version': BET_SCHEMA_VERSION,"]
+    for field in fields(Bet):
+        name, coercer = field.name, _coercer(field.type)
+        if field.default is MISSING:
+            value = f"data[{name!r}]"
+        else:
+            _CODEC_GLOBALS[f'_default_{name}'] = field.default
+            value = f"get({name!r}, _default_{name})"
+        decode.append(f"    bet.{name} = {coercer}({value})" if coercer else f"    bet.{name} = {value}")
+
+        if field.type == List[int]:
+            encode.append(f"        {name!r}: list(bet.{name}),")
+        elif field.type is float:
+            encode.append(f"        {name!r}: float(bet.{name}),")
+        else:
+            encode.append(f"        {name!r}: bet.{name},")
+    decode += ["    bet.__post_init__()", "    return bet"]
+    encode.append("    }")
+
+    namespace = {}
+    exec("\n".join(decode + encode), _CODEC_GLOBALS, namespace)
+    return namespace['_decode'], namespace['_encode']
+
+
+_decode, _encode = _build_codec()
+
+
+def _upgrade(data: dict) -> dict:
+    """Converte registros de versões antigas (cópia; o original não muda)"""
+    version = data.get('schema_version', 0)
+    for from_version in range(version, BET_SCHEMA_VERSION):
+        upgrade = _UPGRADES.get(from_version)
+        if upgrade is not None:
+            data = upgrade(dict(data))
+    return data
+
+
+# ==================== VISÃO ====================
+
+class BetView:
+    """
+    Aposta somente leitura sobre um registro armazenado
+
+    Para varreduras (histórico, listagens): nada é copiado, e cada campo
+    é normalizado só quando lido. Use `to_bet()` para obter uma aposta
+    que possa ser alterada.
+    """
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data: dict):
+        object.__setattr__(self, '_data', data)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("BetView é somente leitura; use to_bet() para alterar a aposta")
+
+    def __repr__(self) -> str:
+        return f"BetView(bet_id={self._data.get('bet_id')!r})"
+
+    is_fully_confirmed = Bet.is_fully_confirmed
+
+    def to_bet(self) -> Bet:
+        return _decode(self._data)
+
+    def to_dict(self) -> dict:
+        return _encode(self.to_bet())
+
+
+def _view_property(name: str, coercer: Optional[Callable], default):
+    if coercer is None:
+        return property(lambda self: self._data.get(name, default))
+    return property(lambda self: coercer(self._data.get(name, default)))
+
+
+for _field in fields(Bet):
+    _coercer_name = _coercer(_field.type)
+    setattr(BetView, _field.name, _view_property(
+        _field.name,
+        _CODEC_GLOBALS[_coercer_name] if _coercer_name else None,
+        None if _field.default is MISSING else _field.default,
+    ))
+del _field, _coercer_name
@@ -0,0 +1,55 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+
+@dataclass(slots=True, frozen=True)
+class GuildConfig:
+    """Configuração de um servidor, montada a partir das seções do estado
+
+    Imutável: é descartada do cache quando alguma das seções muda.
+    `subscription_expires_at` é um epoch (segundos), já convertido.
+    """
+    guild_id: int
+    mediator_role_id: Optional[int] = None
+    language: str = "pt"
+    results_channel_id: Optional[int] = None
+    central_channel_id: Optional[int] = None
+    central_message_id: Optional[int] = None
+    has_subscription: bool = False
+    subscription_permanent: bool = False
+    subscription_expires_at: Optional[float] = None
+
+    @property
+    def central_configured(self) -> bool:
+        return self.central_message_id is not None
+
+    def is_mediator(self, member) -> bool:
+        """Verifica se o membro tem o cargo de mediador configurado"""
+        if not self.mediator_role_id:
+            return False
+        return any(role.id == self.mediator_role_id for role in getattr(member, 'roles', ()))
+
+    @classmethod
+    def from_state(cls, guild_id: int, data: dict) -> 'GuildConfig':
+        """Monta a configuração a partir do documento de estado"""
+        key = str(guild_id)
+        central = data.get('mediator_central', {}).get(key)
+        subscription = data.get('subscriptions', {}).get(key)
+        expires_at = None
+        if subscription and not subscription.get('permanent') and subscription.get('expires_at'):
+            try:
+                expires_at = datetime.fromisoformat(subscription['expires_at']).timestamp()
+            except (TypeError, ValueError):
+                expires_at = None
+        return cls(
+            guild_id=guild_id,
+            mediator_role_id=data.get('mediator_roles', {}).get(key),
+            language=data.get('languages', {}).get(key, 'pt'),
+            results_channel_id=data.get('results_channels', {}).get(key),
+            central_channel_id=central.get('channel_id') if central else None,
+            central_message_id=central.get('message_id') if central else None,
+            has_subscription=bool(subscription),
+            subscription_permanent=bool(subscription and subscription.get('permanent')),
+            subscription_expires_at=expires_at,
+        )
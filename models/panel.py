@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+# Ciclo de vida de um painel de fila
+PANEL_LIVE = "live"                # mensagem existe (ou ainda não foi verificada)
+PANEL_MISSING = "missing"          # uma verificação não encontrou a mensagem
+PANEL_TOMBSTONED = "tombstoned"    # mensagem apagada; removido após o prazo de carência
+
+
+@dataclass(slots=True)
+class PanelRecord:
+    """Painel de fila registrado (uma mensagem com botões de fila)
+
+    `state`/`state_since` são gravados junto dos metadados; `last_activity`
+    (último clique) e `last_verified` (última verificação) ficam só em
+    memória, em epoch.
+    """
+    message_id: int
+    channel_id: int
+    kind: str                  # 'queue' (fila avulsa) ou 'panel' (painel unificado)
+    mode: str                  # modo da fila ou tipo do painel (1v1, 2v2...)
+    bet_value: float
+    mediator_fee: float
+    currency_type: str = "sonhos"
+    state: str = PANEL_LIVE
+    state_since: Optional[float] = None
+    last_activity: float = 0.0
+    last_verified: float = 0.0
+
+    @property
+    def queue_id(self) -> Optional[str]:
+        return f"{self.mode}_{self.message_id}" if self.kind == 'queue' else None
+
+    @property
+    def last_seen(self) -> float:
+        return max(self.last_activity, self.last_verified)
+
+    @classmethod
+    def from_metadata(cls, message_id: int, metadata: dict) -> 'PanelRecord':
+        is_panel = metadata.get('type') == 'panel'
+        state_since = metadata.get('state_since')
+        try:
+            state_since = datetime.fromisoformat(state_since).timestamp() if state_since else None
+        except (TypeError, ValueError):
+            state_since = None
+        return cls(
+            message_id=message_id,
+            channel_id=int(metadata.get('channel_id') or 0),
+            kind='panel' if is_panel else 'queue',
+            mode=metadata.get('panel_type') if is_panel else metadata.get('mode'),
+            bet_value=float(metadata.get('bet_value') or 0),
+            mediator_fee=float(metadata.get('mediator_fee') or 0),
+            currency_type=metadata.get('currency_type', 'sonhos'),
+            state=metadata.get('state', PANEL_LIVE),
+            state_since=state_since,
+        )
@@ -0,0 +1,115 @@
+"""
+Codec das apostas (models/bet.py): registros de versões antigas passam
+por _UPGRADES, campos desconhecidos são ignorados e o dicionário de
+entrada nunca é alterado.
+"""
+
+import copy
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import bet as bet_module
+from models.bet import BET_SCHEMA_VERSION, Bet, BetView
+
+
+def stored_bet(**overrides):
+    record = {
+        'bet_id': 'b1',
+        'mode': '2v2-mob',
+        'player1_id': '10',
+        'player2_id': 20,
+        'mediator_id': 30,
+        'channel_id': 40,
+        'team1_ids': ['10', 11],
+        'team2_ids': [20, 21],
+        'bet_value': 5,
+        'created_at': '2024-05-01T12:00:00',
+    }
+    record.update(overrides)
+    return record
+
+
+def rename_valor(record):
+    """Upgrade de exemplo: a versão 0 gravava o valor como 'valor'"""
+    if 'valor' in record:
+        record['bet_value'] = record.pop('valor')
+    return record
+
+
+class UpgradeTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(bet_module._UPGRADES, {0: rename_valor})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_old_record_is_upgraded(self):
+        record = stored_bet(valor=12.5)
+        del record['bet_value']
+        self.assertEqual(Bet.from_dict(record).bet_value, 12.5)
+        self.assertEqual(Bet.view(record).bet_value, 12.5)
+
+    def test_upgrade_gets_a_copy(self):
+        record = stored_bet(valor=12.5)
+        del record['bet_value']
+        before = copy.deepcopy(record)
+        Bet.from_dict(record)
+        self.assertEqual(record, before)
+
+    def test_current_version_is_not_upgraded(self):
+        upgrade = mock.Mock(side_effect=rename_valor)
+        with mock.patch.dict(bet_module._UPGRADES, {0: upgrade}):
+            Bet.from_dict(stored_bet(schema_version=BET_SCHEMA_VERSION))
+            upgrade.assert_not_called()
+            Bet.from_dict(stored_bet())
+            upgrade.assert_called_once()
+
+
+class DecodeTest(unittest.TestCase):
+
+    def test_unknown_fields_are_ignored(self):
+        bet = Bet.from_dict(stored_bet(campo_novo='x', schema_version=99))
+        self.assertFalse(hasattr(bet, 'campo_novo'))
+        self.assertNotIn('campo_novo', bet.to_dict())
+        self.assertEqual(bet.to_dict()['schema_version'], BET_SCHEMA_VERSION)
+
+    def test_missing_fields_use_defaults_and_types_are_normalized(self):
+        bet = Bet.from_dict(stored_bet())
+        self.assertEqual(bet.player1_id, 10)
+        self.assertEqual(bet.team1_ids, [10, 11])
+        self.assertIs(type(bet.bet_value), float)
+        self.assertEqual(bet.currency_type, 'sonhos')
+        self.assertIsNone(bet.winner_id)
+        self.assertFalse(bet.player1_confirmed)
+
+    def test_from_dict_does_not_mutate_its_input(self):
+        record = stored_bet(winner_id='20', extra={'a': [1]})
+        before = copy.deepcopy(record)
+        bet = Bet.from_dict(record)
+        bet.team1_ids.append(99)
+        bet.player1_confirmed = True
+        self.assertEqual(record, before)
+        self.assertIsNot(bet.team2_ids, record['team2_ids'])
+
+    def test_round_trip(self):
+        bet = Bet.from_dict(stored_bet(mediator_pix='pix', winner_team=1))
+        encoded = bet.to_dict()
+        self.assertEqual(Bet.from_dict(encoded), bet)
+        self.assertIsNot(encoded['team1_ids'], bet.team1_ids)
+
+    def test_view_reads_without_copying(self):
+        record = stored_bet()
+        view = Bet.view(record)
+        self.assertIsInstance(view, BetView)
+        self.assertEqual(view.player1_id, 10)
+        self.assertEqual(view.to_bet(), Bet.from_dict(record))
+        with self.assertRaises(AttributeError):
+            view.bet_value = 1.0
+
+
+if __name__ == '__main__':
+    unittest.main()
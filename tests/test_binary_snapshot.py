@@ -0,0 +1,118 @@
+"""
+Snapshot binário (utils/binary_snapshot.py): a volta tem que devolver
+exatamente o que foi gravado, com os mesmos tipos e as mesmas chaves.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.binary_snapshot import (
+    BinarySnapshot,
+    SnapshotFormatError,
+    decode_value,
+    encode_value,
+    write_binary_snapshot,
+)
+
+
+def round_trip(value):
+    return decode_value(encode_value(value))
+
+
+class RoundTripTest(unittest.TestCase):
+
+    def assertSameTypes(self, expected, actual):
+        """Igualdade com tipos exatos (1 == 1.0 == True no Python)"""
+        self.assertIs(type(actual), type(expected), f"{actual!r} != {expected!r}")
+        if isinstance(expected, dict):
+            self.assertEqual(list(actual), list(expected))
+            for key in expected:
+                self.assertSameTypes(expected[key], actual[key])
+        elif isinstance(expected, list):
+            self.assertEqual(len(actual), len(expected))
+            for item_expected, item_actual in zip(expected, actual, strict=True):
+                self.assertSameTypes(item_expected, item_actual)
+        else:
+            self.assertEqual(actual, expected)
+
+    def test_non_canonical_numeric_keys_stay_as_written(self):
+        value = {
+            '123': 1,
+            '-5': 2,
+            '0': 3,
+            '0123': 4,        # zero à esquerda: não é o inteiro 123
+            '-0': 5,          # int('-0') == 0, mas a chave é outra
+            '+7': 6,
+            '1e3': 7,
+            '': 8,
+            '9223372036854775808': 9,   # acima do int64
+            '١٢': 10,          # dígitos não ASCII (isdigit() aceita)
+        }
+        self.assertSameTypes(value, round_trip(value))
+
+    def test_iso_strings_that_are_not_exact_isoformat_stay_strings(self):
+        value = [
+            '2024-05-01T12:00:00',
+            '2024-05-01T12:00:00.123456',
+            '2024-05-01T12:00:00.000000',    # isoformat() omite os micros zerados
+            '2024-05-01T12:00:00+00:00',     # com fuso
+            '2024-05-01 12:00:00',
+            '2024-05-01T12:00',
+            '2024-05-01',
+            '2024-13-01T12:00:00',
+            '1960-01-01T00:00:00',           # antes do epoch
+        ]
+        self.assertSameTypes(value, round_trip(value))
+
+    def test_numbers_keep_their_type(self):
+        value = {
+            'int': 1,
+            'float_integral': 1.0,
+            'negative_zero': -0.0,
+            'float': 2.5,
+            'bool': True,
+            'false': False,
+            'none': None,
+            'bigint': 2 ** 70,
+            'negative_bigint': -(2 ** 70),
+            'int64_max': 2 ** 63 - 1,
+        }
+        decoded = round_trip(value)
+        self.assertSameTypes(value, decoded)
+        self.assertEqual(str(decoded['negative_zero']), '-0.0')
+
+    def test_file_round_trip_reads_sections_separately(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        path = os.path.join(data_dir, 'state.bin')
+        sections = {
+            'queues': {'1v1-mob_0123': [10, 20]},
+            'queue_timestamps': {'1v1-mob_0123': {'10': '2024-05-01T12:00:00'}},
+            'bet_history': [{'bet_id': 'b1', 'bet_value': 5.0}],
+        }
+        write_binary_snapshot(path, sections, meta={'seq': 7, 'ts': 1.5})
+
+        with BinarySnapshot(path) as snapshot:
+            self.assertEqual(snapshot.meta, {'seq': 7, 'ts': 1.5})
+            self.assertEqual(snapshot.sections(), list(sections))
+            history = snapshot.section('bet_history')
+            self.assertSameTypes(sections['bet_history'], history)
+            self.assertSameTypes(sections, snapshot.load())
+
+    def test_not_a_snapshot(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        path = os.path.join(data_dir, 'state.bin')
+        with open(path, 'wb') as f:
+            f.write(b'{"queues": {}}')
+        with self.assertRaises(SnapshotFormatError):
+            BinarySnapshot(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
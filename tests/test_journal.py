@@ -0,0 +1,146 @@
+"""
+Recuperação do journal (StateJournal): replay das linhas gravadas depois
+dos arquivos de seção, tolerando a última linha cortada por um crash.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.journal import StateJournal
+
+
+def new_journal(data_dir):
+    # Sem compactação automática: o teste decide quando regravar as seções
+    return StateJournal(data_dir, max_bytes=10 ** 9, snapshot_interval=10 ** 9)
+
+
+class JournalReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+
+    def test_truncated_last_line_is_ignored(self):
+        journal = new_journal(self.data_dir)
+        data = {'queues': {'1v1-mob_1': [10]}, 'languages': {}}
+        journal.append(data, {'queues': {'1v1-mob_1'}})
+        data['languages']['5'] = 'en'
+        journal.append(data, {'languages': {'5'}})
+
+        # Crash no meio do append seguinte: só parte da linha chegou ao disco
+        with open(journal.journal_file, 'ab') as f:
+            f.write(b'{"seq":3,"ts":1,"ops":[["set","queues","1v1-mob_1",[10,')
+
+        recovered = new_journal(self.data_dir)
+        state = recovered.recover()
+
+        self.assertEqual(state['queues'], {'1v1-mob_1': [10]})
+        self.assertEqual(state['languages'], {'5': 'en'})
+        self.assertEqual(recovered.seq, 2)
+
+    def test_appends_after_a_truncated_line_are_recovered(self):
+        journal = new_journal(self.data_dir)
+        data = {'queues': {'1v1-mob_1': [10]}}
+        journal.append(data, {'queues': {'1v1-mob_1'}})
+        with open(journal.journal_file, 'ab') as f:
+            f.write(b'{"seq":2,"ts":1,"op')
+
+        # O processo reinicia, recupera e continua acrescentando
+        restarted = new_journal(self.data_dir)
+        data = restarted.recover()
+        data['queues']['1v1-mob_1'].append(20)
+        restarted.append(data, {'queues': {'1v1-mob_1'}})
+
+        recovered = new_journal(self.data_dir).recover()
+        self.assertEqual(recovered, {'queues': {'1v1-mob_1': [10, 20]}})
+
+    def test_line_missing_only_the_newline_is_kept(self):
+        journal = new_journal(self.data_dir)
+        data = {'queues': {'1v1-mob_1': [10]}}
+        journal.append(data, {'queues': {'1v1-mob_1'}})
+        with open(journal.journal_file, 'rb+') as f:
+            f.truncate(os.path.getsize(journal.journal_file) - 1)
+
+        restarted = new_journal(self.data_dir)
+        data = restarted.recover()
+        data['queues']['1v1-mob_2'] = [20]
+        restarted.append(data, {'queues': {'1v1-mob_2'}})
+
+        self.assertEqual(new_journal(self.data_dir).recover(),
+                         {'queues': {'1v1-mob_1': [10], '1v1-mob_2': [20]}})
+
+    def test_deleted_key_is_replayed(self):
+        journal = new_journal(self.data_dir)
+        data = {'queues': {'a_1': [1], 'b_2': [2]}}
+        journal.compact(data, full=True)
+        del data['queues']['a_1']
+        journal.append(data, {'queues': {'a_1'}})
+
+        self.assertEqual(new_journal(self.data_dir).recover(), {'queues': {'b_2': [2]}})
+
+
+class SectionFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+
+    def test_only_changed_sections_are_rewritten(self):
+        journal = new_journal(self.data_dir)
+        data = {'queues': {}, 'languages': {'5': 'pt'}}
+        journal.compact(data, full=True)
+        languages_file = journal._section_path('languages')
+        before = os.stat(languages_file).st_mtime_ns
+
+        data['queues']['1v1-mob_1'] = [10]
+        journal.append(data, {'queues': {'1v1-mob_1'}})
+        journal.compact(data)
+
+        self.assertEqual(os.stat(languages_file).st_mtime_ns, before)
+        self.assertEqual(new_journal(self.data_dir).recover(), data)
+
+    def test_section_older_than_journal_gets_the_newer_entries(self):
+        journal = new_journal(self.data_dir)
+        data = {'queues': {}, 'languages': {'5': 'pt'}}
+        journal.compact(data, full=True)                  # as duas seções em seq 0
+        data['queues']['1v1-mob_1'] = [10]
+        journal.append(data, {'queues': {'1v1-mob_1'}})   # seq 1
+        journal.compact(data)                             # só queues regravada (seq 1)
+
+        data['languages']['5'] = 'en'
+        journal.append(data, {'languages': {'5'}})        # seq 2
+        data['queues']['1v1-mob_1'] = [10, 20]
+        journal.append(data, {'queues': {'1v1-mob_1'}})   # seq 3
+
+        recovered = new_journal(self.data_dir)
+        self.assertEqual(recovered.recover(), {
+            'queues': {'1v1-mob_1': [10, 20]},
+            'languages': {'5': 'en'},
+        })
+        self.assertEqual(recovered.seq, 3)
+
+    def test_entries_already_in_the_section_are_not_replayed(self):
+        journal = new_journal(self.data_dir)
+        data = {'bet_history': []}
+        journal.compact(data, full=True)
+        data['bet_history'].append({'bet_id': 'b1'})
+        journal.append(data, {'bet_history': {'b1'}})
+        with open(journal.journal_file, 'rb') as f:
+            lines = f.read()
+
+        # Crash depois de regravar a seção e antes de truncar o journal
+        journal.compact(data)
+        with open(journal.journal_file, 'wb') as f:
+            f.write(lines)
+
+        recovered = new_journal(self.data_dir).recover()
+        self.assertEqual(recovered, {'bet_history': [{'bet_id': 'b1'}]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+"""
+Matchmaking (utils/matchmaking.py): quantos jogadores cada modo precisa
+por time, quando a partida sai da fila e como ela volta se não puder ser
+criada.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.database import HybridDatabase
+from utils.matchmaking import (
+    ALREADY_QUEUED,
+    JOINED,
+    MODE_SPECS,
+    NOT_QUEUED,
+    PANEL_FAMILIES,
+    TEAM_FULL,
+    Match,
+    Matchmaker,
+    get_mode_spec,
+)
+
+MESSAGE_ID = 555
+
+
+def fill(matchmaker, spec, players_per_team, first_user=100):
+    """Entra `players_per_team` jogadores em cada time; devolve a última partida"""
+    match, user_id = None, first_user
+    for team in ((1, 2) if spec.has_teams else (1,)):
+        count = players_per_team if spec.has_teams else players_per_team * 2
+        for _ in range(count):
+            status, _ = matchmaker.join(spec, MESSAGE_ID, user_id, team)
+            assert status == JOINED, status
+            user_id += 1
+            found, _ = matchmaker.pop_match(spec, MESSAGE_ID)
+            match = found or match
+    return match
+
+
+class ModeSpecTest(unittest.TestCase):
+
+    def test_team_sizes(self):
+        for family, size in (('1v1', 1), ('2v2', 2), ('3v3', 3), ('4v4', 4)):
+            for mode in PANEL_FAMILIES[family]:
+                spec = MODE_SPECS[mode]
+                self.assertEqual(spec.team_size, size, mode)
+                self.assertEqual(spec.total_players, size * 2, mode)
+                self.assertEqual(spec.has_teams, size > 1, mode)
+
+    def test_queue_ids_keep_the_old_layout(self):
+        self.assertEqual(get_mode_spec('1v1-mob').queue_ids(MESSAGE_ID),
+                         ('1v1-mob_555',))
+        self.assertEqual(get_mode_spec('3v3-misto').queue_ids(MESSAGE_ID),
+                         ('3v3-misto_555_team1', '3v3-misto_555_team2'))
+
+    def test_unknown_mode_uses_the_prefix(self):
+        self.assertEqual(get_mode_spec('4v4-emu').team_size, 4)
+        self.assertEqual(get_mode_spec('x1-antigo').team_size, 1)
+
+
+class MatchmakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.matchmaker = Matchmaker({}, {})
+
+    def test_match_pops_only_when_every_team_is_full(self):
+        for mode, spec in MODE_SPECS.items():
+            with self.subTest(mode=mode):
+                if spec.has_teams:
+                    short = fill(Matchmaker({}, {}), spec, spec.team_size - 1)
+                    self.assertIsNone(short)
+                match = fill(Matchmaker({}, {}), spec, spec.team_size)
+                self.assertEqual(len(match.team1), spec.team_size)
+                self.assertEqual(len(match.team2), spec.team_size)
+                self.assertEqual(match.mode, mode)
+
+    def test_popped_players_leave_the_queue(self):
+        spec = MODE_SPECS['2v2-mob']
+        match = fill(self.matchmaker, spec, 2)
+        self.assertEqual(match.team1, [100, 101])
+        self.assertEqual(match.team2, [102, 103])
+        for qid in spec.queue_ids(MESSAGE_ID):
+            self.assertEqual(self.matchmaker.queues[qid], [])
+            self.assertEqual(self.matchmaker.timestamps[qid], {})
+
+    def test_one_v_one_pairs_the_first_two(self):
+        spec = MODE_SPECS['1v1-mob']
+        queues = {'1v1-mob_555': [1, 2, 3]}
+        matchmaker = Matchmaker(queues, {})
+        match, changed = matchmaker.pop_match(spec, MESSAGE_ID)
+        self.assertEqual((match.team1, match.team2), ([1], [2]))
+        self.assertEqual(queues['1v1-mob_555'], [3])
+        self.assertEqual(changed, {'1v1-mob_555'})
+
+    def test_full_team_and_duplicate_join(self):
+        spec = MODE_SPECS['2v2-misto']
+        for user_id in (1, 2):
+            self.matchmaker.join(spec, MESSAGE_ID, user_id, team=1)
+        self.assertEqual(self.matchmaker.join(spec, MESSAGE_ID, 3, team=1),
+                         (TEAM_FULL, set()))
+        self.assertEqual(self.matchmaker.join(spec, MESSAGE_ID, 1, team=2),
+                         (ALREADY_QUEUED, set()))
+
+    def test_one_queue_per_panel(self):
+        modes = PANEL_FAMILIES['1v1']
+        self.matchmaker.join(MODE_SPECS[modes[0]], MESSAGE_ID, 1, scope=modes)
+        status, changed = self.matchmaker.join(MODE_SPECS[modes[1]], MESSAGE_ID, 1,
+                                               scope=modes)
+        self.assertEqual((status, changed), (ALREADY_QUEUED, set()))
+
+    def test_requeue_puts_players_back_in_front(self):
+        spec = MODE_SPECS['2v2-mob']
+        match = fill(self.matchmaker, spec, 2)
+        self.matchmaker.join(spec, MESSAGE_ID, 200, team=1)
+
+        changed = self.matchmaker.requeue(match, MESSAGE_ID)
+
+        team1, team2 = spec.queue_ids(MESSAGE_ID)
+        self.assertEqual(changed, {team1, team2})
+        self.assertEqual(self.matchmaker.queues[team1], [100, 101, 200])
+        self.assertEqual(self.matchmaker.queues[team2], [102, 103])
+        self.assertEqual(set(self.matchmaker.timestamps[team1]), {'100', '101', '200'})
+
+    def test_requeue_skips_players_already_back(self):
+        queues = {'1v1-mob_555': [2]}
+        changed = Matchmaker(queues, {}).requeue(Match('1v1-mob', [1], [2]), MESSAGE_ID)
+        self.assertEqual(changed, {'1v1-mob_555'})
+        self.assertEqual(queues['1v1-mob_555'], [1, 2])
+
+
+class DatabaseMatchTest(unittest.TestCase):
+    """pop_match/requeue_match do banco gravam as filas alteradas"""
+
+    def setUp(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        self.db = HybridDatabase(data_dir, connect_postgres=False)
+
+    def test_pop_and_requeue(self):
+        modes = PANEL_FAMILIES['2v2']
+        for user_id, team in ((1, 1), (2, 1), (3, 2)):
+            result = self.db.join_queue(MESSAGE_ID, '2v2-mob', user_id, team, modes)
+            self.assertEqual(result.status, JOINED)
+            self.assertIsNone(result.match)
+        result = self.db.pop_match(MESSAGE_ID, '2v2-mob', modes)
+        self.assertEqual((result.status, result.match), (NOT_QUEUED, None))
+
+        result = self.db.join_queue(MESSAGE_ID, '2v2-mob', 4, 2, modes)
+        self.assertEqual(result.match, Match('2v2-mob', [1, 2], [3, 4]))
+        self.assertEqual(result.state.players('2v2-mob'), [])
+
+        state = self.db.requeue_match(MESSAGE_ID, result.match, modes)
+        self.assertEqual(state.teams('2v2-mob'), ([1, 2], [3, 4]))
+        self.assertEqual(self.db.get_queue('2v2-mob_555_team1'), [1, 2])
+
+        result = self.db.pop_match(MESSAGE_ID, '2v2-mob', modes)
+        self.assertEqual(result.status, JOINED)
+        self.assertEqual(result.match.players, [1, 2, 3, 4])
+        self.assertEqual(self.db.get_queue('2v2-mob_555_team2'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,248 @@
+"""
+Compare-and-swap entre instâncias (state_versions): conflito, merge de
+três vias e gravação forçada depois de DB_PG_CAS_RETRIES tentativas.
+O PostgreSQL é um pool falso no formato do asyncpg que guarda só as
+tabelas de filas e de versões.
+"""
+
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.async_database import _AsyncCoreDatabase
+from utils.postgres_store import (
+    CAS_INSERT_SQL,
+    CAS_UPDATE_SQL,
+    FORCE_VERSION_SQL,
+    LOAD_QUEUE_KEYS_QUERIES,
+    LOAD_QUEUE_VERSIONS_SQL,
+    AsyncNormalizedPostgresStore,
+    _to_dollar_params,
+)
+from utils.replication import merge_group, merge_members
+
+CAS_KINDS = {
+    _to_dollar_params(CAS_UPDATE_SQL): 'update',
+    _to_dollar_params(CAS_INSERT_SQL): 'insert',
+    _to_dollar_params(FORCE_VERSION_SQL): 'force',
+}
+LOAD_QUEUES_SQL, LOAD_MEMBERS_SQL = map(_to_dollar_params, LOAD_QUEUE_KEYS_QUERIES)
+
+QUEUE_ID = '1v1-mob_555'
+
+
+class FakePostgres:
+    """queues/queue_members/state_versions em memória"""
+
+    def __init__(self):
+        self.members = {}       # queue_id -> [(user_id, joined_at)] na ordem
+        self.versions = {}      # (seção, chave) -> versão
+        self.cas = []           # tipos de compare-and-swap executados, em ordem
+        self.notifications = []
+        self.before_cas = None  # outra instância gravando entre a leitura e o CAS
+
+    def write_queue(self, queue_id, user_ids):
+        """Gravação feita por outra instância (sem passar por este processo)"""
+        self.members[queue_id] = [(user_id, None) for user_id in user_ids]
+        key = ('queues', queue_id)
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def queue(self, queue_id):
+        return [user_id for user_id, _ in self.members.get(queue_id, [])]
+
+
+class FakeConnection:
+
+    def __init__(self, pg):
+        self.pg = pg
+
+    def transaction(self):
+        return contextlib.nullcontext()
+
+    async def fetchval(self, sql, *params):
+        kind = CAS_KINDS.get(sql)
+        if kind is None:
+            raise AssertionError(f"SQL inesperado: {sql}")
+        if self.pg.before_cas is not None:
+            self.pg.before_cas()
+        self.pg.cas.append(kind)
+        key = (params[0], params[1])
+        current = self.pg.versions.get(key)
+        if kind == 'update' and current != params[2]:
+            return None
+        if kind == 'insert' and current is not None:
+            return None
+        self.pg.versions[key] = (current or 0) + 1
+        return self.pg.versions[key]
+
+    async def fetch(self, sql, queue_ids):
+        if sql == LOAD_QUEUES_SQL:
+            return [(qid,) for qid in queue_ids if qid in self.pg.members]
+        if sql == LOAD_MEMBERS_SQL:
+            return [(qid, user_id, joined_at) for qid in queue_ids
+                    for user_id, joined_at in self.pg.members.get(qid, [])]
+        if sql == _to_dollar_params(LOAD_QUEUE_VERSIONS_SQL):
+            return [(qid, self.pg.versions[('queues', qid)]) for qid in queue_ids
+                    if ('queues', qid) in self.pg.versions]
+        raise AssertionError(f"SQL inesperado: {sql}")
+
+    async def execute(self, sql, *params):
+        statement = ' '.join(sql.split())
+        if statement.startswith('DELETE FROM queue_members'):
+            self.pg.members[params[0]] = []
+        elif statement.startswith('DELETE FROM queues'):
+            self.pg.members.pop(params[0], None)
+        elif statement.startswith('INSERT INTO queues'):
+            self.pg.members.setdefault(params[0], [])
+        elif statement.startswith('INSERT INTO queue_members'):
+            queue_id, user_id, _position, joined_at = params
+            self.pg.members[queue_id].append((user_id, joined_at))
+        elif statement.startswith('SELECT pg_notify'):
+            self.pg.notifications.append(params)
+        else:
+            raise AssertionError(f"SQL inesperado: {sql}")
+
+
+class FakePool:
+
+    def __init__(self, pg):
+        self.pg = pg
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield FakeConnection(self.pg)
+
+
+class QueueCommitTest(unittest.IsolatedAsyncioTestCase):
+    """sync_queue_keys/commit_queue_keys: o que lock_panel_queues faz com a fila"""
+
+    def setUp(self):
+        self.pg = FakePostgres()
+        self.conn = FakeConnection(self.pg)
+
+    def new_instance(self, **env):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        with mock.patch.dict(os.environ, env):
+            os.environ.pop('DATABASE_URL', None)
+            db = _AsyncCoreDatabase(data_dir)
+        db.async_store = AsyncNormalizedPostgresStore(FakePool(self.pg))
+        # Sem write-behind: só o commit sob o lock grava no banco
+        db._schedule_flush = lambda: None
+        return db
+
+    async def test_unchanged_key_is_not_written(self):
+        db = self.new_instance()
+        self.pg.write_queue(QUEUE_ID, [7])
+        await db.sync_queue_keys(self.conn, [QUEUE_ID])
+        await db.commit_queue_keys(self.conn, [QUEUE_ID])
+
+        self.assertEqual(db.get_queue(QUEUE_ID), [7])
+        self.assertEqual(self.pg.cas, [])
+
+    async def test_first_write_creates_the_version(self):
+        db = self.new_instance()
+        await db.sync_queue_keys(self.conn, [QUEUE_ID])
+        db.add_to_queue(QUEUE_ID, 7)
+        await db.commit_queue_keys(self.conn, [QUEUE_ID])
+
+        self.assertEqual(self.pg.cas, ['insert'])
+        self.assertEqual(self.pg.queue(QUEUE_ID), [7])
+        self.assertEqual(self.pg.versions[('queues', QUEUE_ID)], 1)
+        self.assertEqual(len(self.pg.notifications), 1)
+        with db._pg_state_lock:
+            self.assertFalse(db._changed_locally('queues', QUEUE_ID))
+
+    async def test_conflict_merges_with_the_other_instance(self):
+        db = self.new_instance()
+        self.pg.write_queue(QUEUE_ID, [7])
+        await db.sync_queue_keys(self.conn, [QUEUE_ID])
+
+        # Outra instância gravou a fila sem o lock depois da nossa leitura
+        self.pg.write_queue(QUEUE_ID, [7, 9])
+        db.add_to_queue(QUEUE_ID, 8)
+        await db.commit_queue_keys(self.conn, [QUEUE_ID])
+
+        self.assertEqual(self.pg.cas, ['update', 'update'])
+        self.assertEqual(self.pg.queue(QUEUE_ID), [7, 9, 8])
+        self.assertEqual(db.get_queue(QUEUE_ID), [7, 9, 8])
+        self.assertEqual(self.pg.versions[('queues', QUEUE_ID)], 3)
+
+    async def test_local_removal_is_reapplied_on_merge(self):
+        db = self.new_instance()
+        self.pg.write_queue(QUEUE_ID, [7, 9])
+        await db.sync_queue_keys(self.conn, [QUEUE_ID])
+
+        self.pg.write_queue(QUEUE_ID, [7, 9, 10])
+        db.remove_from_queue(QUEUE_ID, 7)
+        await db.commit_queue_keys(self.conn, [QUEUE_ID])
+
+        self.assertEqual(self.pg.queue(QUEUE_ID), [9, 10])
+        self.assertEqual(db.get_queue(QUEUE_ID), [9, 10])
+
+    async def test_forced_write_after_cas_retries(self):
+        db = self.new_instance(DB_PG_CAS_RETRIES='2')
+        self.assertEqual(db.pg_cas_retries, 2)
+        self.pg.write_queue(QUEUE_ID, [7])
+        await db.sync_queue_keys(self.conn, [QUEUE_ID])
+
+        # Alguém grava a fila a cada tentativa: o CAS nunca passa
+        others = iter(range(100, 200))
+        self.pg.before_cas = lambda: self.pg.write_queue(
+            QUEUE_ID, self.pg.queue(QUEUE_ID) + [next(others)])
+        db.add_to_queue(QUEUE_ID, 8)
+        await db.commit_queue_keys(self.conn, [QUEUE_ID])
+
+        self.assertEqual(self.pg.cas, ['update', 'update', 'force'])
+        # A gravação forçada leva o valor mesclado com a última leitura
+        self.assertEqual(self.pg.queue(QUEUE_ID), [7, 100, 101, 8])
+        with db._pg_state_lock:
+            self.assertFalse(db._changed_locally('queues', QUEUE_ID))
+
+
+class MergeTest(unittest.TestCase):
+
+    def test_members_union_keeps_both_sides(self):
+        self.assertEqual(merge_members([1, 2], [1, 2, 3], [1, 2, 4]), [1, 2, 4, 3])
+
+    def test_removals_on_either_side_win(self):
+        # 1 saiu aqui, 2 saiu na outra instância, 5 entrou lá e 6 aqui
+        self.assertEqual(merge_members([1, 2, 3], [2, 3, 6], [1, 3, 5]), [3, 5, 6])
+
+    def test_queue_timestamps_follow_the_merged_members(self):
+        ours = {'queues': [1, 3], 'queue_timestamps': {'1': 'a', '3': 'c'}}
+        theirs = {'queues': [1, 4], 'queue_timestamps': {'1': 'a', '4': 'd'}}
+        merged = merge_group('queues', [1], ours, theirs)
+        self.assertEqual(merged['queues'], [1, 4, 3])
+        self.assertEqual(merged['queue_timestamps'], {'1': 'a', '3': 'c', '4': 'd'})
+
+    def test_deleted_queue_stays_deleted(self):
+        ours = {'queues': None, 'queue_timestamps': None}
+        theirs = {'queues': [1, 4], 'queue_timestamps': {}}
+        self.assertEqual(merge_group('queues', [1], ours, theirs),
+                         {'queues': None, 'queue_timestamps': None})
+
+    def test_mediator_central_merges_members(self):
+        ours = {'mediator_central': {'channel_id': 1, 'mediators': {
+            '10': {'pix': 'novo'}, '30': {}}}}     # entrada vazia também é nossa
+        theirs = {'mediator_central': {'channel_id': 1, 'mediators': {
+            '10': {'pix': 'antigo'}, '20': {'pix': 'b'}}}}
+        merged = merge_group('mediator_central', ['10'], ours, theirs)
+        mediators = merged['mediator_central']['mediators']
+        self.assertEqual(mediators,
+                         {'10': {'pix': 'novo'}, '20': {'pix': 'b'}, '30': {}})
+        self.assertEqual(list(mediators), ['10', '20', '30'])
+
+    def test_other_groups_reapply_the_local_value(self):
+        ours, theirs = {'languages': 'en'}, {'languages': 'pt'}
+        self.assertIs(merge_group('guild_config', None, ours, theirs), ours)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Edições de painéis (utils/panel_edits.py): várias marcações viram uma
+edição por janela, edições no mesmo canal respeitam o intervalo do
+canal e uma falha não acrescenta espera além desses dois limites.
+"""
+
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.panel_edits import PanelEditScheduler
+
+WINDOW = 0.05
+CHANNEL_INTERVAL = 0.03
+# Folga para o agendamento do event loop nas comparações de tempo
+SLACK = 0.04
+
+
+class Recorder:
+    """`send` falso: guarda (message_id, instante) de cada edição"""
+
+    def __init__(self, failures=0):
+        self.calls = []
+        self.failures = failures
+
+    async def __call__(self, message_id):
+        self.calls.append((message_id, time.monotonic()))
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Discord indisponível")
+
+    def times(self, message_id):
+        return [at for mid, at in self.calls if mid == message_id]
+
+
+class PanelEditSchedulerTest(unittest.IsolatedAsyncioTestCase):
+
+    def new_scheduler(self, send, channel_interval=CHANNEL_INTERVAL):
+        return PanelEditScheduler(send, WINDOW, channel_interval)
+
+    async def drain(self, scheduler):
+        while scheduler._workers:
+            await asyncio.sleep(0.005)
+
+    async def test_marks_are_coalesced_into_one_edit_per_window(self):
+        send = Recorder()
+        scheduler = self.new_scheduler(send)
+
+        for _ in range(3):
+            scheduler.mark_dirty(1, 100)
+        await asyncio.sleep(0.01)
+        for _ in range(4):
+            scheduler.mark_dirty(1, 100)        # dentro da janela da primeira edição
+        await self.drain(scheduler)
+
+        first, second = send.times(100)
+        self.assertGreaterEqual(second - first, WINDOW)
+        self.assertEqual(scheduler.stats.sent, 2)
+        self.assertEqual(scheduler.stats.coalesced, 5)
+        self.assertEqual(scheduler.status()['pending'], 0)
+
+    async def test_same_channel_edits_are_spaced(self):
+        send = Recorder()
+        scheduler = self.new_scheduler(send, channel_interval=0.05)
+        for message_id in (100, 101, 102):
+            scheduler.mark_dirty(1, message_id)
+        scheduler.mark_dirty(2, 200)
+        await self.drain(scheduler)
+
+        same_channel = sorted(at for mid, at in send.calls if mid != 200)
+        for earlier, later in zip(same_channel, same_channel[1:], strict=False):
+            self.assertGreaterEqual(later - earlier, 0.05 - 0.001)
+        # Outro canal não espera pelo bucket do canal 1
+        self.assertLess(send.times(200)[0] - same_channel[0], SLACK)
+
+    async def test_failure_adds_no_extra_backoff(self):
+        send = Recorder(failures=1)
+        scheduler = self.new_scheduler(send)
+        scheduler.mark_dirty(1, 100)
+        await self.drain(scheduler)
+        self.assertEqual(scheduler.stats.failed, 1)
+        self.assertEqual(scheduler.stats.sent, 0)
+
+        scheduler.mark_dirty(1, 100)
+        await self.drain(scheduler)
+
+        failed, retried = send.times(100)
+        self.assertGreaterEqual(retried - failed, WINDOW)
+        self.assertLess(retried - failed, WINDOW + SLACK)
+        self.assertEqual(scheduler.stats.sent, 1)
+
+    async def test_forget_before_the_window_reserves_no_channel_slot(self):
+        send = Recorder()
+        scheduler = self.new_scheduler(send)
+        scheduler.mark_dirty(1, 100)
+        await asyncio.sleep(0.01)
+        reserved = scheduler._channel_free[1]
+
+        scheduler.mark_dirty(1, 100)
+        scheduler.forget(100)                   # mensagem apagada antes da janela
+        await self.drain(scheduler)
+
+        self.assertEqual(len(send.calls), 1)
+        self.assertEqual(scheduler._channel_free[1], reserved)
+
+    async def test_inline_edit_counts_as_the_window_edit(self):
+        send = Recorder()
+        scheduler = self.new_scheduler(send)
+        self.assertTrue(scheduler.claim_inline_edit(100))
+        self.assertFalse(scheduler.claim_inline_edit(100))
+
+        scheduler.mark_dirty(1, 100)
+        await self.drain(scheduler)
+
+        self.assertEqual(len(send.calls), 1)
+        self.assertFalse(scheduler.claim_inline_edit(100))
+
+
+if __name__ == '__main__':
+    unittest.main()
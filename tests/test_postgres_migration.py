@@ -0,0 +1,122 @@
+"""
+Migração do documento JSONB antigo para as tabelas normalizadas
+(NormalizedPostgresStore.migrate_from_jsonb), com um pool falso que
+registra os comandos em vez de falar com o PostgreSQL.
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.postgres_store import LEGACY_EXISTS_SQL, LEGACY_LOAD_SQL, NormalizedPostgresStore
+
+
+class FakeCursor:
+    def __init__(self, legacy_document):
+        self.legacy_document = legacy_document
+        self.executed = []
+        self._result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        self.executed.append((sql, params))
+        if sql == LEGACY_EXISTS_SQL:
+            self._result = (True,)
+        elif sql == LEGACY_LOAD_SQL:
+            self._result = (self.legacy_document,)
+        else:
+            self._result = None
+
+    def fetchone(self):
+        return self._result
+
+
+class FakeConnection:
+    closed = 0
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.committed = False
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def getconn(self):
+        return self.connection
+
+    def putconn(self, conn, close=False):
+        pass
+
+
+def run_migration(document):
+    cursor = FakeCursor(document)
+    connection = FakeConnection(cursor)
+    migrated = NormalizedPostgresStore(FakePool(connection)).migrate_from_jsonb()
+    return migrated, connection, cursor.executed
+
+
+def central_member_rows(executed):
+    return [params for sql, params in executed if 'INSERT INTO mediator_central_members' in sql]
+
+
+class LegacyMediatorCentralTest(unittest.TestCase):
+
+    def test_members_without_joined_at_get_a_timestamp(self):
+        document = {
+            'mediator_central': {
+                '111': {
+                    'channel_id': 1, 'message_id': 2, 'created_at': '2024-05-01T12:00:00',
+                    'mediators': {
+                        '10': {'pix': 'a@pix'},                                     # sem joined_at
+                        '20': {'pix': 'b@pix', 'joined_at': ''},                   # vazio
+                        '30': {'pix': 'c@pix', 'joined_at': 'ontem'},              # fora do ISO
+                        '40': {'pix': 'd@pix', 'joined_at': '2024-05-02T08:30:00'},
+                    },
+                },
+            },
+        }
+        migrated, connection, executed = run_migration(document)
+
+        self.assertTrue(migrated)
+        self.assertTrue(connection.committed)
+        rows = {params[1]: params[3] for params in central_member_rows(executed)}
+        self.assertEqual(set(rows), {10, 20, 30, 40})
+        for user_id in (10, 20, 30):
+            self.assertEqual(rows[user_id], datetime(2024, 5, 1, 12, 0))
+        self.assertEqual(rows[40], datetime(2024, 5, 2, 8, 30))
+
+    def test_central_without_created_at_uses_migration_time(self):
+        document = {
+            'mediator_central': {
+                '111': {'channel_id': 1, 'message_id': 2, 'mediators': {'10': {'pix': 'a@pix'}}},
+            },
+        }
+        before = datetime.now()
+        _, _, executed = run_migration(document)
+
+        (row,) = central_member_rows(executed)
+        self.assertIsNotNone(row[3])
+        self.assertGreaterEqual(row[3], before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Locks de fila (utils/locks.py): o tempo limite vira LockTimeout, conta
+no /health e não deixa o lock preso; filas diferentes não se bloqueiam.
+"""
+
+import asyncio
+import contextlib
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.locks import (
+    LocalLockProvider,
+    LockTimeout,
+    PostgresAdvisoryLockProvider,
+    advisory_key,
+)
+
+QUEUE_ID = '1v1-mob_555'
+
+
+class LocalLockProviderTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_timeout_raises_lock_timeout(self):
+        provider = LocalLockProvider(timeout=10)
+        async with provider.lock(QUEUE_ID):
+            with self.assertRaises(LockTimeout) as raised:
+                async with provider.lock(QUEUE_ID, timeout=0.01):
+                    self.fail("lock obtido com a fila ocupada")
+
+        self.assertEqual(raised.exception.name, QUEUE_ID)
+        self.assertEqual(raised.exception.timeout, 0.01)
+        self.assertEqual(provider.stats.timeouts, 1)
+        self.assertEqual(provider.stats.acquired, 1)
+
+        # A tentativa que expirou não deixa o lock preso
+        async with provider.lock(QUEUE_ID, timeout=0.01):
+            pass
+        self.assertEqual(provider.stats.acquired, 2)
+
+    async def test_provider_timeout_is_the_default(self):
+        provider = LocalLockProvider(timeout=0.01)
+        async with provider.lock(QUEUE_ID):
+            with self.assertRaises(LockTimeout) as raised:
+                async with provider.lock(QUEUE_ID):
+                    pass
+        self.assertEqual(raised.exception.timeout, 0.01)
+
+    async def test_other_queues_are_not_blocked(self):
+        provider = LocalLockProvider(timeout=0.01)
+        async with provider.lock(QUEUE_ID), provider.lock('2v2-mob_556'):
+            pass
+        self.assertEqual(provider.stats.timeouts, 0)
+
+    async def test_waiter_gets_the_lock_when_released(self):
+        provider = LocalLockProvider(timeout=1)
+        order = []
+
+        async def hold():
+            async with provider.lock(QUEUE_ID):
+                order.append('first')
+                await asyncio.sleep(0.02)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        async with provider.lock(QUEUE_ID):
+            order.append('second')
+        await holder
+
+        self.assertEqual(order, ['first', 'second'])
+        self.assertEqual(provider.stats.acquired, 2)
+        self.assertGreaterEqual(provider.stats.max_wait, 0.01)
+
+
+class BusyConnection:
+    """Outra instância segura o advisory lock o tempo todo"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def fetchval(self, sql, key):
+        self.calls.append((sql, key))
+        return False
+
+
+class BusyPool:
+
+    def __init__(self):
+        self.conn = BusyConnection()
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+class PostgresAdvisoryLockProviderTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_timeout_when_another_instance_holds_the_lock(self):
+        pool = BusyPool()
+        provider = PostgresAdvisoryLockProvider(pool, timeout=0.01)
+        provider.RETRY_INTERVAL = 0.001
+
+        with self.assertRaises(LockTimeout):
+            async with provider.lock(QUEUE_ID):
+                self.fail("advisory lock obtido com a fila ocupada")
+
+        self.assertEqual(provider.stats.timeouts, 1)
+        self.assertTrue(pool.conn.calls)
+        keys = {key for _, key in pool.conn.calls}
+        self.assertEqual(keys, {advisory_key(QUEUE_ID)})
+        # Sem o advisory lock não há o que soltar no servidor
+        statements = ' '.join(sql for sql, _ in pool.conn.calls)
+        self.assertNotIn('pg_advisory_unlock', statements)
+        # O asyncio.Lock local foi liberado
+        self.assertFalse(provider._get(QUEUE_ID).locked())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,438 @@
+"""
+API assíncrona do Sistema Híbrido de Database - StormBet Apostas
+Mesmos métodos do HybridDatabase, mas awaitable: o estado continua em
+memória e toda gravação (JSON e PostgreSQL) acontece fora do event loop.
+"""
+
+import asyncio
+import contextlib
+import copy
+import functools
+import logging
+from typing import List, Optional, Tuple
+
+from models.bet import Bet, BetView
+from utils.database import HybridDatabase
+from utils.postgres_store import AsyncNormalizedPostgresStore, VersionedWrite
+from utils.replication import GROUP_SECTIONS, group_values
+
+logger = logging.getLogger('bot')
+
+
+class _AsyncCoreDatabase(HybridDatabase):
+    """
+    HybridDatabase cujo flush para o PostgreSQL usa asyncpg
+
+    O JSON continua sendo gravado em thread; as chaves sujas são
+    aplicadas no PostgreSQL pelo pool asyncpg, no próprio event loop.
+    """
+
+    def __init__(self, data_dir: str = "data"):
+        super().__init__(data_dir, connect_postgres=False)
+        self.async_store: Optional[AsyncNormalizedPostgresStore] = None
+        self._fallback_flush: Optional[asyncio.Task] = None
+        self._finishing_bets = set()    # bet_id com append no histórico em andamento
+
+    def _schedule_flush(self):
+        """Sem flusher ativo, grava numa task (I/O em thread) em vez de bloquear o event loop"""
+        if self._flush_task is not None and not self._flush_task.done():
+            super()._schedule_flush()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Fora do event loop (inicialização, scripts): grava na hora
+            self.flush()
+            return
+        if self._fallback_flush is None or self._fallback_flush.done():
+            self._fallback_flush = loop.create_task(self._fallback_flush_loop())
+
+    async def _fallback_flush_loop(self):
+        """Grava até não sobrar mutação (inclusive as feitas durante a gravação)"""
+        try:
+            while self.is_dirty() and not self._txn_depth:
+                await self._flush_async()
+        except Exception as e:
+            logger.error(f"❌ Erro no flush: {e}")
+
+    async def stop_write_behind(self):
+        await super().stop_write_behind()
+        if self._fallback_flush is not None:
+            await self._fallback_flush
+            self._fallback_flush = None
+
+    async def finish_bet_async(self, bet: Bet):
+        """finish_bet com o append no histórico (arquivo) em thread
+
+        A aposta só sai das ativas depois do append, para o flush nunca
+        replicar a chave do histórico antes da entrada existir.
+        """
+        if self._txn_depth:
+            # Em transação o histórico só vai para o arquivo no commit
+            self.finish_bet(bet)
+            return
+        if bet.bet_id in self._finishing_bets or bet.bet_id not in self._data['active_bets']:
+            return
+        self._finishing_bets.add(bet.bet_id)
+        try:
+            await asyncio.to_thread(self.history.append, bet.to_dict())
+            self._remove_finished_bet(bet.bet_id)
+        finally:
+            self._finishing_bets.discard(bet.bet_id)
+
+    async def _flush_async(self):
+        if self.async_store is None:
+            await super()._flush_async()
+            return
+        if self._txn_depth or not self.is_dirty():
+            return
+
+        snapshot, version, dirty, replicate = self._take_snapshot()
+        await asyncio.to_thread(self._persist, snapshot, version, dirty)
+
+        # Circuito aberto: as chaves acumulam para a ressincronização
+        self._queue_pg_pending(replicate)
+        if not self.pg_breaker.allow_request():
+            return
+        try:
+            await self._push_pg_pending_async(snapshot)
+            self.pg_breaker.record_success()
+        except Exception as e:
+            self.pg_breaker.record_failure()
+            logger.error(f"❌ Erro ao salvar no PostgreSQL (asyncpg): {e}")
+            logger.warning("⚠️ Dados salvos apenas em JSON")
+
+    async def _push_pg_pending_async(self, data: dict):
+        """Aplica as chaves pendentes via asyncpg (devolve-as se falhar)"""
+        pending, write = self._begin_pg_write(data)
+        try:
+            await self.async_store.apply_versioned(write)
+        except Exception:
+            self._end_pg_write(pending, write, committed=False)
+            raise
+        self._end_pg_write(pending, write, committed=True)
+
+    async def _resync_postgres(self):
+        if self.async_store is None:
+            await super()._resync_postgres()
+            return
+        await self.async_store.ping()
+        await self._push_pg_pending_async(copy.deepcopy(self._data))
+
+    async def sync_queue_keys(self, conn, queue_ids):
+        """Relê as filas do PostgreSQL na conexão que segura o advisory lock
+
+        Outra instância pode ter gravado a fila e soltado o lock antes do
+        NOTIFY chegar aqui: a operação tem que partir do valor do banco.
+        """
+        if conn is None or self.async_store is None or not self.pg_breaker.is_closed:
+            return
+        document, versions = await self.async_store.load_queues(conn, queue_ids)
+        await self._wait_transaction()
+        for queue_id in queue_ids:
+            self._adopt_pg_value('queues', queue_id, versions.get(('queues', queue_id), 0),
+                                 group_values(document, 'queues', queue_id))
+
+    async def commit_queue_keys(self, conn, queue_ids):
+        """Grava já, com compare-and-swap, as filas alteradas sob o lock
+
+        Roda antes de soltar o advisory lock, então quem pegar o lock em
+        seguida (em qualquer instância) lê a fila atualizada. Conflito = alguém
+        gravou a fila sem o lock: relê, mescla e tenta de novo (a última
+        tentativa grava sem comparar, como no write-behind).
+        """
+        if conn is None or self.async_store is None or not self.pg_breaker.is_closed:
+            return
+        sections = GROUP_SECTIONS['queues']
+        for attempt in range(self.pg_cas_retries + 1):
+            with self._pg_state_lock:
+                changed = [qid for qid in queue_ids if self._changed_locally('queues', qid)]
+                forced = attempt == self.pg_cas_retries
+                expected = {('queues', qid): None if forced else self._pg_versions.get(('queues', qid), 0)
+                            for qid in changed}
+            if not changed:
+                return
+            data = {
+                section: {qid: copy.deepcopy(self._data[section][qid])
+                          for qid in changed if qid in self._data.get(section, {})}
+                for section in sections
+            }
+            write = VersionedWrite(data, {section: set(changed) for section in sections}, expected, self.instance_id)
+            await self.async_store.apply_versioned(write, conn)
+            self._record_committed(write)
+            if not write.conflicts:
+                return
+            await self.sync_queue_keys(conn, [key for _, key in write.conflicts])
+
+    async def _fetch_pg_state(self) -> tuple:
+        if self.async_store is None:
+            return await super()._fetch_pg_state()
+        return await self.async_store.load(), await self.async_store.load_versions()
+
+    async def _listen_loop(self):
+        """LISTEN via asyncpg: o callback enfileira, o loop aplica fora de transações"""
+        if self.async_store is None:
+            await super()._listen_loop()
+            return
+        if not self.pg_notify:
+            return
+        queue = asyncio.Queue()
+        conn, first = None, True
+        try:
+            while True:
+                try:
+                    if conn is None or conn.is_closed():
+                        conn = await self.async_store.open_listener(queue.put_nowait)
+                        # Reconexão: NOTIFYs podem ter se perdido enquanto estava fora
+                        if not first:
+                            await self._refresh_from_postgres()
+                        first = False
+                    try:
+                        payloads = [await asyncio.wait_for(queue.get(), timeout=5)]
+                    except asyncio.TimeoutError:
+                        continue
+                    while not queue.empty():
+                        payloads.append(queue.get_nowait())
+                    await self._apply_notifications(payloads)
+                except Exception as e:
+                    logger.warning(f"⚠️ LISTEN do PostgreSQL (asyncpg) interrompido: {e}")
+                    if conn is not None and not conn.is_closed():
+                        await conn.close()
+                    conn = None
+                    await asyncio.sleep(self.pg_breaker.reset_timeout)
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+
+    def health(self) -> dict:
+        status = super().health()
+        if self.async_store is not None:
+            status['backend'] = 'postgres (asyncpg)'
+            status['postgres'] = self.pg_breaker.status()
+            with self._pg_state_lock:
+                status['postgres']['pending_sections'] = len(self._pg_pending)
+                status['postgres']['cas_conflicts'] = self._pg_conflict_total
+        return status
+
+
+def _awaitable(name: str):
+    """Cria a versão awaitable de um método do HybridDatabase
+
+    Só para métodos que trabalham no estado em memória; os que fazem I/O
+    (histórico, flush) têm versão própria que leva o I/O para thread.
+    """
+    sync_method = getattr(HybridDatabase, name)
+
+    @functools.wraps(sync_method)
+    async def method(self, *args, **kwargs):
+        return sync_method(self.core, *args, **kwargs)
+
+    return method
+
+
+class AsyncHybridDatabase:
+    """
+    Database híbrido com API assíncrona
+
+    Funcionamento:
+    1. Instanciar (carrega o JSON local) e chamar `await db.connect()` no event loop
+    2. Com DATABASE_URL → pool asyncpg, schema normalizado e estado recarregado do PostgreSQL
+    3. Sem asyncpg instalado → usa psycopg2 em thread (mesmo schema)
+    4. `await db.close()` grava o que estiver pendente e fecha o pool
+    """
+
+    def __init__(self, data_dir: str = "data"):
+        self.core = _AsyncCoreDatabase(data_dir)
+        self.database_url = self.core.database_url
+        self._connected = False
+
+    async def connect(self):
+        """Conecta ao PostgreSQL (se configurado) e inicia o write-behind"""
+        if self._connected:
+            return
+        self._connected = True
+        if self.database_url:
+            try:
+                store = await AsyncNormalizedPostgresStore.connect(
+                    self.database_url, timeout=self.core.pg_connect_timeout)
+                await store.create_schema()
+                if await store.migrate_from_jsonb(fallback_loader=self.core._load_from_json):
+                    logger.info("✅ Dados migrados para o schema normalizado")
+                self.core._replace_state(await store.load())
+                self.core._track_pg_state(self.core._data, await store.load_versions())
+                self.core.async_store = store
+                logger.info(f"🐘 PostgreSQL (asyncpg) ativado: {self.database_url[:20]}...")
+            except ImportError:
+                logger.warning("⚠️ asyncpg não instalado, usando psycopg2 em thread")
+                await asyncio.to_thread(self._connect_psycopg2)
+            except Exception as e:
+                logger.error(f"❌ Erro ao inicializar PostgreSQL (asyncpg): {e}")
+                logger.warning("⚠️ Fallback para modo JSON")
+
+        self.core.start_write_behind()
+
+    def _connect_psycopg2(self):
+        self.core.use_postgres = True
+        self.core._init_postgres()
+        if self.core.use_postgres:
+            self.core._replace_state(self.core._load_from_postgres())
+
+    async def close(self):
+        """Grava mutações pendentes e fecha o pool do PostgreSQL"""
+        await self.core.stop_write_behind()
+        if self.core.async_store is not None:
+            await self.core.async_store.close()
+            self.core.async_store = None
+        self._connected = False
+
+    async def flush(self):
+        """Grava imediatamente todas as mutações pendentes"""
+        await self.core._flush_async()
+
+    async def sync_queues(self, conn, queue_ids):
+        """Relê as filas no PostgreSQL ao pegar o advisory lock (`conn` None = lock local, nada a fazer)"""
+        try:
+            await self.core.sync_queue_keys(conn, queue_ids)
+        except Exception as e:
+            self.core.pg_breaker.record_failure()
+            logger.error(f"❌ Erro ao reler filas do PostgreSQL: {e}")
+
+    async def commit_queues(self, conn, queue_ids):
+        """Grava as filas no PostgreSQL antes de soltar o advisory lock
+
+        Se falhar, as mudanças continuam sujas e vão pelo write-behind.
+        """
+        try:
+            await self.core.commit_queue_keys(conn, queue_ids)
+        except Exception as e:
+            self.core.pg_breaker.record_failure()
+            logger.error(f"❌ Erro ao gravar filas no PostgreSQL sob o lock: {e}")
+            logger.warning("⚠️ Mudança fica para o write-behind")
+
+    def health(self) -> dict:
+        """Resumo do armazenamento para o healthcheck"""
+        return self.core.health()
+
+    async def wait_subscription_change(self, timeout: float) -> bool:
+        """Aguarda uma mudança nas assinaturas (ou o timeout)"""
+        return await self.core.wait_subscription_change(timeout)
+
+    def flush_sync(self):
+        """Último recurso no shutdown, quando o event loop já terminou (grava o JSON)"""
+        self.core.flush()
+
+    async def finish_bet(self, bet: Bet):
+        """Finaliza uma aposta e move para o histórico (append em thread)"""
+        await self.core.finish_bet_async(bet)
+
+    async def get_bet_history(self) -> List[BetView]:
+        """Retorna o histórico de apostas (lido do arquivo em thread)"""
+        return await asyncio.to_thread(self.core.get_bet_history)
+
+    async def get_bet_history_page(self, guild_id: Optional[int], page: int = 0, page_size: int = 10,
+                                   player_id: Optional[int] = None) -> Tuple[List[BetView], int]:
+        """Uma página do histórico (mais recentes primeiro) e o total de apostas"""
+        if self.core.async_store is not None and self.core.pg_breaker.is_closed:
+            # Apostas recém-finalizadas precisam estar no PostgreSQL antes da consulta
+            if self.core.is_dirty():
+                await self.flush()
+            try:
+                entries, total = await self.core.async_store.history_page(
+                    guild_id, player_id, page * page_size, page_size)
+                return [Bet.view(entry) for entry in entries], total
+            except Exception as e:
+                self.core.pg_breaker.record_failure()
+                logger.error(f"❌ Erro ao ler histórico do PostgreSQL (asyncpg): {e}")
+                logger.warning("⚠️ Usando histórico local")
+        if self.core.use_postgres and self.core.pg_breaker.is_closed:
+            if self.core.is_dirty():
+                await self.flush()
+            return await asyncio.to_thread(self.core.get_bet_history_page, guild_id, page, page_size, player_id)
+        return self.core.get_bet_history_page(guild_id, page, page_size, player_id)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """`async with db.transaction():` — ver HybridDatabase.transaction()"""
+        with self.core.transaction():
+            yield self
+
+    def _load_data(self) -> dict:
+        """Estado em memória (para rotinas que editam várias seções de uma vez)"""
+        return self.core._load_data()
+
+    def _save_data(self, data: dict, sections: Optional[tuple] = None, keys: Optional[tuple] = None):
+        """Registra mutações feitas diretamente no estado em memória"""
+        self.core._save_data(data, sections, keys)
+
+    # ==================== MÉTODOS DA API ====================
+
+    add_to_queue = _awaitable('add_to_queue')
+    remove_from_queue = _awaitable('remove_from_queue')
+    get_queue = _awaitable('get_queue')
+    set_queue = _awaitable('set_queue')
+    remove_from_all_queues = _awaitable('remove_from_all_queues')
+    is_user_in_active_bet = _awaitable('is_user_in_active_bet')
+    add_active_bet = _awaitable('add_active_bet')
+    get_active_bet = _awaitable('get_active_bet')
+    get_bet_by_channel = _awaitable('get_bet_by_channel')
+    get_active_bets_for_user = _awaitable('get_active_bets_for_user')
+    update_active_bet = _awaitable('update_active_bet')
+    get_all_active_bets = _awaitable('get_all_active_bets')
+    get_expired_queue_players = _awaitable('get_expired_queue_players')
+    get_next_queue_expiry = _awaitable('get_next_queue_expiry')
+    set_mediator_role = _awaitable('set_mediator_role')
+    get_mediator_role = _awaitable('get_mediator_role')
+    set_guild_language = _awaitable('set_guild_language')
+    set_language = _awaitable('set_language')
+    get_language = _awaitable('get_language')
+    set_results_channel = _awaitable('set_results_channel')
+    get_results_channel = _awaitable('get_results_channel')
+    get_guild_config = _awaitable('get_guild_config')
+    get_all_queue_ids = _awaitable('get_all_queue_ids')
+    get_panel_state = _awaitable('get_panel_state')
+    join_queue = _awaitable('join_queue')
+    leave_queue = _awaitable('leave_queue')
+    pop_match = _awaitable('pop_match')
+    requeue_match = _awaitable('requeue_match')
+    save_queue_metadata = _awaitable('save_queue_metadata')
+    get_queue_metadata = _awaitable('get_queue_metadata')
+    get_all_queue_metadata = _awaitable('get_all_queue_metadata')
+    save_panel_metadata = _awaitable('save_panel_metadata')
+    get_panel_metadata = _awaitable('get_panel_metadata')
+    get_queue_ids_for_message = _awaitable('get_queue_ids_for_message')
+    get_user_panels = _awaitable('get_user_panels')
+    delete_queue_metadata = _awaitable('delete_queue_metadata')
+    get_panel = _awaitable('get_panel')
+    find_panel = _awaitable('find_panel')
+    get_panel_stats = _awaitable('get_panel_stats')
+    touch_panel = _awaitable('touch_panel')
+    mark_panel_verified = _awaitable('mark_panel_verified')
+    mark_panel_missing = _awaitable('mark_panel_missing')
+    tombstone_panel = _awaitable('tombstone_panel')
+    get_panels_to_verify = _awaitable('get_panels_to_verify')
+    compact_panels = _awaitable('compact_panels')
+    cleanup_orphaned_data = _awaitable('cleanup_orphaned_data')
+    create_subscription = _awaitable('create_subscription')
+    get_subscription = _awaitable('get_subscription')
+    is_subscription_active = _awaitable('is_subscription_active')
+    get_all_subscriptions = _awaitable('get_all_subscriptions')
+    get_expired_subscriptions = _awaitable('get_expired_subscriptions')
+    get_subscription_expiry = _awaitable('get_subscription_expiry')
+    get_next_subscription_expiry = _awaitable('get_next_subscription_expiry')
+    remove_subscription = _awaitable('remove_subscription')
+    save_mediator_central_config = _awaitable('save_mediator_central_config')
+    get_mediator_central_config = _awaitable('get_mediator_central_config')
+    add_mediator_to_central = _awaitable('add_mediator_to_central')
+    remove_mediator_from_central = _awaitable('remove_mediator_from_central')
+    get_mediators_in_central = _awaitable('get_mediators_in_central')
+    get_first_mediator_from_central = _awaitable('get_first_mediator_from_central')
+    add_mediator_to_end_of_central = _awaitable('add_mediator_to_end_of_central')
+    get_expired_mediators_in_central = _awaitable('get_expired_mediators_in_central')
+    get_expired_mediators = _awaitable('get_expired_mediators')
+    get_next_mediator_expiry = _awaitable('get_next_mediator_expiry')
+    get_mediator_central_guilds = _awaitable('get_mediator_central_guilds')
+    is_mediator_in_central = _awaitable('is_mediator_in_central')
+    save_mediator_pix = _awaitable('save_mediator_pix')
+    get_mediator_pix = _awaitable('get_mediator_pix')
+    is_mediator_central_configured = _awaitable('is_mediator_central_configured')
+    delete_mediator_central_config = _awaitable('delete_mediator_central_config')
@@ -0,0 +1,281 @@
+"""
+Formato binário compacto de snapshot - StormBet Apostas
+Seções prefixadas pelo tamanho, chaves numéricas como inteiros e datas
+ISO como epoch (microssegundos). A leitura usa mmap: só o índice é lido
+na abertura e cada seção é decodificada quando pedida.
+
+Layout (little-endian):
+    MAGIC (6) | versão do formato (u16) | meta (valor codificado)
+    | nº de seções (u32) | [nome (u16 + utf-8) | tamanho (u64) | valor] ...
+"""
+
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+MAGIC = b"SBSNAP"
+FORMAT_VERSION = 1
+
+_NONE, _TRUE, _FALSE, _INT, _FLOAT, _STR, _LIST, _DICT, _TIMESTAMP, _BIGINT = range(10)
+_KEY_STR, _KEY_INT = 0, 1
+
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+_EPOCH = datetime(1970, 1, 1)
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+class SnapshotFormatError(ValueError):
+    """Arquivo que não é um snapshot binário válido (ou de versão desconhecida)"""
+
+
+# ==================== CODIFICAÇÃO ====================
+
+def _int_key(key: str) -> Optional[int]:
+    """Chave string que representa um inteiro canônico ("123", não "0123")"""
+    if not key or not (key.isdigit() or (key[0] == '-' and key[1:].isdigit())):
+        return None
+    value = int(key)
+    if str(value) != key or not _INT64_MIN <= value <= _INT64_MAX:
+        return None
+    return value
+
+
+def _timestamp(value: str) -> Optional[int]:
+    """Microssegundos desde o epoch, se a string for um isoformat() sem fuso"""
+    if len(value) < 19 or value[10] != 'T' or value[4] != '-':
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    # Só converte se a volta reproduz exatamente a mesma string
+    if parsed.tzinfo is not None or parsed.isoformat() != value:
+        return None
+    delta = parsed - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _encode(value, out: bytearray):
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, int):
+        if _INT64_MIN <= value <= _INT64_MAX:
+            out.append(_INT)
+            out += _I64.pack(value)
+        else:
+            _encode_text(_BIGINT, str(value), out)
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _F64.pack(value)
+    elif isinstance(value, str):
+        micros = _timestamp(value)
+        if micros is not None:
+            out.append(_TIMESTAMP)
+            out += _I64.pack(micros)
+        else:
+            _encode_text(_STR, value, out)
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        out += _U32.pack(len(value))
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        out += _U32.pack(len(value))
+        for key, item in value.items():
+            key = str(key)
+            int_key = _int_key(key)
+            if int_key is not None:
+                out.append(_KEY_INT)
+                out += _I64.pack(int_key)
+            else:
+                encoded = key.encode('utf-8')
+                out.append(_KEY_STR)
+                out += _U32.pack(len(encoded))
+                out += encoded
+            _encode(item, out)
+    else:
+        raise TypeError(f"Tipo não suportado no snapshot binário: {type(value).__name__}")
+
+
+def _encode_text(tag: int, text: str, out: bytearray):
+    encoded = text.encode('utf-8')
+    out.append(tag)
+    out += _U32.pack(len(encoded))
+    out += encoded
+
+
+def encode_value(value) -> bytes:
+    out = bytearray()
+    _encode(value, out)
+    return bytes(out)
+
+
+# ==================== DECODIFICAÇÃO ====================
+
+def _decode(buf, pos: int):
+    tag = buf[pos]
+    pos += 1
+    if tag == _NONE:
+        return None, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _INT:
+        return _I64.unpack_from(buf, pos)[0], pos + 8
+    if tag == _FLOAT:
+        return _F64.unpack_from(buf, pos)[0], pos + 8
+    if tag == _STR or tag == _BIGINT:
+        length = _U32.unpack_from(buf, pos)[0]
+        pos += 4
+        text = str(buf[pos:pos + length], 'utf-8')
+        return (int(text) if tag == _BIGINT else text), pos + length
+    if tag == _TIMESTAMP:
+        micros = _I64.unpack_from(buf, pos)[0]
+        return (_EPOCH + timedelta(microseconds=micros)).isoformat(), pos + 8
+    if tag == _LIST:
+        count = _U32.unpack_from(buf, pos)[0]
+        pos += 4
+        items = []
+        for _ in range(count):
+            item, pos = _decode(buf, pos)
+            items.append(item)
+        return items, pos
+    if tag == _DICT:
+        count = _U32.unpack_from(buf, pos)[0]
+        pos += 4
+        result = {}
+        for _ in range(count):
+            if buf[pos] == _KEY_INT:
+                key = str(_I64.unpack_from(buf, pos + 1)[0])
+                pos += 9
+            else:
+                length = _U32.unpack_from(buf, pos + 1)[0]
+                pos += 5
+                key = str(buf[pos:pos + length], 'utf-8')
+                pos += length
+            result[key], pos = _decode(buf, pos)
+        return result, pos
+    raise SnapshotFormatError(f"Tag desconhecida no snapshot binário: {tag}")
+
+
+def decode_value(buf):
+    return _decode(memoryview(buf), 0)[0]
+
+
+# ==================== ARQUIVO ====================
+
+def write_binary_snapshot(path: str, sections: Dict[str, object], meta: Optional[dict] = None):
+    """Grava (atômico, com fsync) um snapshot binário com as seções informadas"""
+    temp_file = f"{path}.tmp"
+    try:
+        with open(temp_file, 'wb') as f:
+            f.write(MAGIC)
+            f.write(_U16.pack(FORMAT_VERSION))
+            f.write(encode_value(meta or {}))
+            f.write(_U32.pack(len(sections)))
+            for name, value in sections.items():
+                encoded_name = name.encode('utf-8')
+                payload = encode_value(value)
+                f.write(_U16.pack(len(encoded_name)))
+                f.write(encoded_name)
+                f.write(_U64.pack(len(payload)))
+                f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, path)
+    except Exception:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+class BinarySnapshot:
+    """
+    Leitor de snapshot binário via mmap
+
+    A abertura lê apenas o cabeçalho e o índice de seções (pulando os
+    dados pelo tamanho); `section(nome)` decodifica só aquela seção.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Arquivo vazio (mmap não aceita tamanho 0)
+            self._file.close()
+            raise SnapshotFormatError(f"Snapshot binário vazio: {path}")
+        try:
+            self._view = memoryview(self._map)
+            self.meta, self._offsets = self._read_index()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_index(self):
+        view = self._view
+        if len(view) < len(MAGIC) + 2 or bytes(view[:len(MAGIC)]) != MAGIC:
+            raise SnapshotFormatError(f"Arquivo não é um snapshot binário: {self.path}")
+        pos = len(MAGIC)
+        version = _U16.unpack_from(view, pos)[0]
+        if version > FORMAT_VERSION:
+            raise SnapshotFormatError(f"Versão de snapshot não suportada ({version}): {self.path}")
+        meta, pos = _decode(view, pos + 2)
+        count = _U32.unpack_from(view, pos)[0]
+        pos += 4
+        offsets = {}
+        for _ in range(count):
+            name_length = _U16.unpack_from(view, pos)[0]
+            pos += 2
+            name = str(view[pos:pos + name_length], 'utf-8')
+            pos += name_length
+            length = _U64.unpack_from(view, pos)[0]
+            pos += 8
+            if pos + length > len(view):
+                raise SnapshotFormatError(f"Seção '{name}' truncada em {self.path}")
+            offsets[name] = (pos, length)
+            pos += length
+        return meta, offsets
+
+    def sections(self) -> List[str]:
+        return list(self._offsets)
+
+    def section(self, name: str):
+        """Decodifica uma seção (KeyError se não existir)"""
+        start, length = self._offsets[name]
+        return decode_value(self._view[start:start + length])
+
+    def load(self, names: Optional[Iterable[str]] = None) -> dict:
+        """Decodifica as seções pedidas (todas se `names` for None)"""
+        wanted = self._offsets if names is None else [n for n in names if n in self._offsets]
+        return {name: self.section(name) for name in wanted}
+
+    def close(self):
+        view = getattr(self, '_view', None)
+        if view is not None:
+            view.release()
+            self._view = None
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
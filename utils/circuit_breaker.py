@@ -0,0 +1,71 @@
+"""
+Circuit breaker - StormBet Apostas
+Evita que cada gravação pague o timeout de conexão enquanto o
+PostgreSQL está fora do ar.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger('bot')
+
+
+class CircuitBreaker:
+    """
+    Estados:
+    - closed: chamadas passam normalmente
+    - open: após `failure_threshold` falhas seguidas, nenhuma chamada é feita
+    - half_open: após `reset_timeout` segundos, UMA tentativa é liberada;
+      sucesso fecha o circuito, falha volta a abri-lo
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_closed(self) -> bool:
+        return self.state == self.CLOSED
+
+    def allow_request(self) -> bool:
+        """Indica se a chamada pode ir ao backend (libera a tentativa do half-open)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"🟢 {self.name}: circuito fechado (backend recuperado)")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"🔴 {self.name}: circuito aberto, nova tentativa em {self.reset_timeout:.0f}s")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def status(self) -> dict:
+        """Resumo para o healthcheck"""
+        status = {'state': self.state, 'failures': self.failures}
+        if self.state != self.CLOSED:
+            status['open_for'] = round(time.monotonic() - self.opened_at, 1)
+        return status
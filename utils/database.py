@@ -4,10 +4,36 @@ Suporta PostgreSQL (opcional) + JSON (fallback e backup)
 Múltiplas camadas de segurança para nunca perder dados
 """
 
+import asyncio
+import contextlib
+import copy
+import heapq
 import json
+import math
 import os
-from typing import Dict, List, Optional
-from models.bet import Bet
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from models.bet import Bet, BetView
+from models.guild_config import GuildConfig
+from models.panel import PANEL_LIVE, PANEL_MISSING, PANEL_TOMBSTONED, PanelRecord
+from utils.postgres_store import NormalizedPostgresStore, VersionedWrite, merge_dirty, subtract_dirty
+from utils.replication import (
+    GROUP_SECTIONS, base_members, expand_whole_sections, group_values, merge_group, versioned_keys,
+)
+from utils.journal import StateJournal
+from utils.sqlite_store import SQLiteStore
+from utils.history import BetHistoryLedger
+from utils.matchmaking import (
+    IN_ACTIVE_BET, JOINED, NOT_QUEUED, Match, Matchmaker, PanelState, QueueResult, get_mode_spec,
+)
+from utils.mediator_central import MediatorCentralIndex
+from utils.panel_registry import PanelRegistry
+from utils.circuit_breaker import CircuitBreaker
+from utils.snapshots import SnapshotService
 from datetime import datetime, timedelta
 import logging
 
@@ -250,6 +276,10 @@ def get_translations(lang: str) -> dict:
     return TRANSLATIONS.get(lang, TRANSLATIONS["pt"])
 
 
+# Seções do estado que compõem o GuildConfig de um servidor
+GUILD_CONFIG_SECTIONS = ('mediator_roles', 'languages', 'results_channels', 'mediator_central', 'subscriptions')
+
+
 class HybridDatabase:
     """
     Database híbrido com suporte a PostgreSQL opcional e JSON como fallback
@@ -259,9 +289,21 @@ class HybridDatabase:
     2. Sempre mantém backup em JSON
     3. Se PostgreSQL falhar → usa JSON automaticamente
     4. Múltiplas camadas de backup para garantir integridade
+    5. Backup local em journal append-only + snapshots (DB_JSON_MODE=journal,
+       padrão), num arquivo SQLite em modo WAL (DB_JSON_MODE=sqlite) ou na
+       rotação tripla de arquivos JSON (DB_JSON_MODE=rotation)
+    6. Estado carregado UMA vez e mantido em memória (fonte da verdade);
+       mutações marcam seções sujas e são gravadas em background
+       (write-behind) a cada DB_FLUSH_INTERVAL segundos ou quando
+       DB_FLUSH_THRESHOLD mutações se acumulam. DB_FLUSH_INTERVAL=0
+       volta ao modo write-through (grava a cada mutação).
+    7. Várias instâncias no mesmo PostgreSQL: cada chave tem uma versão,
+       gravada com compare-and-swap (conflitos são mesclados e regravados)
+       e anunciada via LISTEN/NOTIFY para as outras instâncias atualizarem
+       o estado em memória (DB_PG_NOTIFY=0 desativa).
     """
     
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", connect_postgres: bool = True):
         # Detectar ambiente
         self.is_flyio = os.getenv("FLY_APP_NAME") is not None
         self.is_railway = os.getenv("RAILWAY_ENVIRONMENT") is not None or os.getenv("RAILWAY_STATIC_URL") is not None
@@ -277,66 +319,129 @@ class HybridDatabase:
         self.data_file = os.path.join(self.data_dir, "bets.json")
         self.backup_file = os.path.join(self.data_dir, "bets.backup.json")
         self.backup2_file = os.path.join(self.data_dir, "bets.backup2.json")
+
+        # Journal append-only (substitui a rotação tripla a cada mutação)
+        self.json_mode = os.getenv("DB_JSON_MODE", "journal")
+        self.journal = None
+        if self.json_mode == "journal":
+            self.journal = StateJournal(
+                self.data_dir,
+                max_bytes=int(os.getenv("DB_JOURNAL_MAX_BYTES", "1000000")),
+                snapshot_interval=float(os.getenv("DB_SNAPSHOT_INTERVAL", "300")),
+            )
+
+        # SQLite: tabelas normalizadas locais, uma transação por flush
+        self.sqlite = None
+        if self.json_mode == "sqlite":
+            os.makedirs(self.data_dir, exist_ok=True)
+            self.sqlite = SQLiteStore(os.path.join(self.data_dir, os.getenv("DB_SQLITE_FILE", "stormbet.db")))
         
+        # Histórico de apostas fora do estado em memória (segmentos append-only)
+        self.history = BetHistoryLedger(os.path.join(self.data_dir, "history"))
+
+        # Snapshots comprimidos em background (só quando o estado mudou)
+        self.snapshots = SnapshotService(
+            os.path.join(self.data_dir, "snapshots"),
+            interval=float(os.getenv("DB_BACKUP_INTERVAL", "900")),
+            keep=int(os.getenv("DB_BACKUP_KEEP", "12")),
+        )
+        self._snapshot_task = None
+        # Estado veio de outro backend: a cópia local é regravada inteira no próximo flush
+        self._local_stale = False
+
         # Verificar se PostgreSQL está disponível
         self.database_url = os.getenv("DATABASE_URL")
         self.use_postgres = self.database_url is not None
         self.pg_conn = None
-        
-        if self.use_postgres:
+        self.pg_connect_timeout = int(os.getenv("DB_PG_CONNECT_TIMEOUT", "5"))
+        self.pg_breaker = CircuitBreaker(
+            "PostgreSQL",
+            failure_threshold=int(os.getenv("DB_PG_FAILURE_THRESHOLD", "3")),
+            reset_timeout=float(os.getenv("DB_PG_RETRY_INTERVAL", "30")),
+        )
+        self._probe_task = None
+
+        # Concorrência otimista entre instâncias que compartilham o PostgreSQL
+        # Sufixo aleatório: containers diferentes podem ter o mesmo hostname/PID
+        self.instance_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.pg_notify = os.getenv("DB_PG_NOTIFY", "1") != "0"
+        self.pg_cas_retries = int(os.getenv("DB_PG_CAS_RETRIES", "5"))
+        self._pg_versions = {}          # (grupo, chave) -> versão lida do PostgreSQL
+        self._pg_base = {}              # (grupo, chave) -> membros na versão lida (merge de 3 vias)
+        self._pg_inflight = set()       # (grupo, chave) sendo gravados agora
+        self._pg_conflicts = set()      # (grupo, chave) recusados pelo compare-and-swap
+        self._pg_conflict_attempts = {}
+        self._pg_conflict_total = 0
+        # Protege _pg_pending/_pg_inflight/_pg_versions/_pg_base/_pg_conflicts*: o
+        # flush do psycopg2 roda em thread enquanto o event loop aplica NOTIFYs.
+        # Reentrante (flush síncrono dentro do loop) e nunca segurado durante I/O
+        self._pg_state_lock = threading.RLock()
+        self._remote_dirty = {}         # chaves vindas de outra instância (não voltam ao PostgreSQL)
+        self._listen_task = None
+        
+        # connect_postgres=False: conexão feita depois por outro driver (ex.: asyncpg)
+        if self.use_postgres and not connect_postgres:
+            self.use_postgres = False
+            logger.info(f"💾 Backup JSON ativo: {self.data_file} (PostgreSQL conectado de forma assíncrona)")
+        elif self.use_postgres:
             self._init_postgres()
             if self.database_url:
                 logger.info(f"🐘 PostgreSQL ativado: {self.database_url[:20]}...")
             logger.info(f"💾 Backup JSON ativo: {self.data_file}")
         else:
             logger.info(f"📁 Modo JSON: {self.data_file}")
-            logger.info(f"💾 Sistema de backup triplo ativado")
+            if self.journal is not None:
+                logger.info(f"📓 Journal append-only ativado: {self.journal.journal_file}")
+            elif self.sqlite is not None:
+                logger.info(f"🗃️ SQLite (WAL) ativado: {self.sqlite.path}")
+            else:
+                logger.info(f"💾 Sistema de backup triplo ativado")
         
         self._ensure_file_exists()
+
+        # Write-behind: estado em memória + gravação em background
+        self.flush_interval = float(os.getenv("DB_FLUSH_INTERVAL", "2"))
+        self.flush_threshold = int(os.getenv("DB_FLUSH_THRESHOLD", "50"))
+        self._dirty = {}  # {seção: set(chaves) | None (seção inteira)}
+        self._pg_pending = {}  # chaves que falharam no PostgreSQL (retentadas no próximo flush)
+        self._pending_writes = 0
+        self._version = 0
+        self._flushed_version = 0
+        self._persist_lock = threading.Lock()
+        self._flush_task = None
+        self._flush_wakeup = None
+        self._txn_depth = 0
+        self._txn_dirty = {}    # chaves alteradas dentro da transação aberta
+        self._txn_history = []  # apostas finalizadas, gravadas no histórico só no commit
+        # Cache limitado (LRU) de GuildConfig, invalidado pelas chaves sujas
+        self._guild_configs = OrderedDict()
+        self.guild_cache_size = int(os.getenv("DB_GUILD_CACHE_SIZE", "1024"))
+        self._subscriptions_changed = asyncio.Event()
+        self.central = MediatorCentralIndex()
+        self.panels = PanelRegistry()
+        self._data = self._load_from_storage()
+        self._import_legacy_history()
+        self._rebuild_indexes()
+        logger.info(f"🧠 Estado carregado em memória (flush a cada {self.flush_interval}s ou {self.flush_threshold} mutações)")
     
     def _init_postgres(self):
         """Inicializa conexão PostgreSQL e cria tabelas"""
         try:
-            import psycopg2
-            from psycopg2 import pool  # type: ignore
+            import psycopg2.pool  # type: ignore
             
             # Criar pool de conexões para melhor performance
             self.pg_pool = psycopg2.pool.SimpleConnectionPool(  # type: ignore
                 1, 10,  # min, max conexões
-                self.database_url
+                self.database_url,
+                connect_timeout=self.pg_connect_timeout
             )
             
-            # Criar tabelas se não existirem
-            conn = self.pg_pool.getconn()
-            try:
-                with conn.cursor() as cur:
-                    # Tabela única para armazenar todo o JSON
-                    cur.execute("""
-                        CREATE TABLE IF NOT EXISTS stormbet_data (
-                            id INTEGER PRIMARY KEY DEFAULT 1,
-                            data JSONB NOT NULL,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            CONSTRAINT single_row CHECK (id = 1)
-                        )
-                    """)
-                    
-                    # Criar índice para busca rápida
-                    cur.execute("""
-                        CREATE INDEX IF NOT EXISTS idx_stormbet_data_updated 
-                        ON stormbet_data(updated_at)
-                    """)
-                    
-                    # Inserir dados vazios se não existir
-                    cur.execute("""
-                        INSERT INTO stormbet_data (id, data) 
-                        VALUES (1, %s)
-                        ON CONFLICT (id) DO NOTHING
-                    """, (json.dumps(self._get_empty_data()),))
-                    
-                    conn.commit()
-                    logger.info("✅ Tabelas PostgreSQL criadas/verificadas")
-            finally:
-                self.pg_pool.putconn(conn)
+            # Tabelas normalizadas (uma por seção) + migração do JSONB antigo
+            self.pg_store = NormalizedPostgresStore(self.pg_pool)
+            self.pg_store.create_schema()
+            if self.pg_store.migrate_from_jsonb(fallback_loader=self._load_legacy_document):
+                logger.info("✅ Dados migrados para o schema normalizado")
+            logger.info("✅ Tabelas PostgreSQL criadas/verificadas")
                 
         except ImportError:
             logger.warning("⚠️ psycopg2 não instalado, usando apenas JSON")
@@ -353,7 +458,6 @@ class HybridDatabase:
             'queue_timestamps': {},
             'queue_metadata': {},
             'active_bets': {},
-            'bet_history': [],
             'mediator_roles': {},
             'languages': {},
             'results_channels': {},
@@ -363,17 +467,19 @@ class HybridDatabase:
     def _ensure_file_exists(self):
         """Garante que arquivos JSON existem"""
         os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+        if self.journal is not None or self.sqlite is not None:
+            return
         if not os.path.exists(self.data_file):
             self._save_json(self._get_empty_data())
     
-    def _load_data(self) -> dict:
-        """Carrega dados (PostgreSQL se disponível, senão JSON)"""
+    def _load_from_storage(self) -> dict:
+        """Carrega dados do armazenamento (PostgreSQL se disponível, senão JSON)"""
         # Tentar PostgreSQL primeiro
         if self.use_postgres:
             try:
                 data = self._load_from_postgres()
-                # Sempre fazer backup em JSON também
-                self._save_json_silent(data)
+                # A cópia local é alinhada no primeiro flush, fora da inicialização
+                self._local_stale = True
                 return data
             except Exception as e:
                 logger.error(f"❌ Erro ao carregar do PostgreSQL: {e}")
@@ -383,45 +489,86 @@ class HybridDatabase:
         return self._load_from_json()
     
     def _load_from_postgres(self) -> dict:
-        """Carrega dados do PostgreSQL"""
-        import psycopg2
-        import psycopg2.extras
-        conn = self.pg_pool.getconn()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT data FROM stormbet_data WHERE id = 1")
-                row = cur.fetchone()
-                if row and row[0]:
-                    data = row[0]
-                    # PostgreSQL retorna JSONB como dict automaticamente com psycopg2
-                    if isinstance(data, str):
-                        data = json.loads(data)
-                    
-                    # Validar estrutura de dados
-                    if not isinstance(data, dict):
-                        logger.error(f"❌ Dados do PostgreSQL não são dict: {type(data)}")
-                        # Tentar recuperar do backup JSON
-                        logger.warning("⚠️ Tentando recuperar do backup JSON...")
-                        return self._load_from_json()
-                    
-                    # Garantir que todas as chaves necessárias existem
-                    required_keys = ['queues', 'queue_timestamps', 'queue_metadata', 
-                                   'active_bets', 'bet_history', 'mediator_roles', 
-                                   'results_channels', 'subscriptions']
-                    for key in required_keys:
-                        if key not in data:
-                            data[key] = {} if key != 'bet_history' else []
-                    
-                    return data
-                return self._get_empty_data()
-        except Exception as e:
-            logger.error(f"❌ Erro ao carregar do PostgreSQL: {e}")
-            logger.warning("⚠️ Usando backup JSON como fallback")
-            return self._load_from_json()
-        finally:
-            self.pg_pool.putconn(conn)
+        """Carrega dados do PostgreSQL (remonta o documento a partir das tabelas)"""
+        data = self.pg_store.load()
+        for key, value in self._get_empty_data().items():
+            data.setdefault(key, value)
+        self._track_pg_state(data, self.pg_store.load_versions())
+        return data
     
     def _load_from_json(self) -> dict:
+        """Carrega dados locais (journal ou SQLite se ativos, senão JSON com backup triplo)"""
+        if self.sqlite is not None:
+            return self._load_from_sqlite()
+
+        if self.journal is not None:
+            try:
+                data = self.journal.recover()
+                if data is not None:
+                    return data
+            except Exception as e:
+                logger.error(f"❌ Erro ao recuperar do journal: {e}")
+                logger.warning("⚠️ Tentando arquivos JSON antigos")
+
+            # Primeira execução em modo journal: importa o bets.json e cria o snapshot
+            data = self._load_from_json_files()
+            try:
+                self.journal.compact(data)
+            except Exception as e:
+                logger.error(f"❌ Erro ao criar snapshot inicial do journal: {e}")
+            return data
+
+        return self._load_from_json_files()
+
+    def _load_from_sqlite(self) -> dict:
+        """Carrega do SQLite; na primeira execução importa o journal ou o bets.json"""
+        try:
+            if not self.sqlite.is_empty():
+                data = self.sqlite.load()
+                for key, value in self._get_empty_data().items():
+                    data.setdefault(key, value)
+                return data
+        except Exception as e:
+            logger.error(f"❌ Erro ao carregar do SQLite: {e}")
+            logger.warning("⚠️ Tentando journal e arquivos JSON")
+            return self._load_local_fallback()
+
+        data = self._load_local_fallback()
+        try:
+            self.sqlite.import_document(data)
+        except Exception as e:
+            logger.error(f"❌ Erro ao importar dados para o SQLite: {e}")
+        return data
+
+    def _load_local_fallback(self) -> dict:
+        """Estado do journal (se existir) ou dos arquivos JSON"""
+        journal = StateJournal(self.data_dir)
+        if journal.exists():
+            try:
+                data = journal.recover()
+                if data is not None:
+                    return data
+            except Exception as e:
+                logger.error(f"❌ Erro ao recuperar do journal: {e}")
+        return self._load_from_json_files()
+
+    def _load_legacy_document(self) -> dict:
+        """Documento local completo, com o histórico, para a migração ao PostgreSQL"""
+        data = self._load_from_json()
+        if not data.get('bet_history'):
+            data['bet_history'] = self.history.all_entries()
+        return data
+
+    def _import_legacy_history(self):
+        """Move a antiga lista `bet_history` do estado para o ledger de histórico"""
+        legacy = self._data.pop('bet_history', None)
+        if legacy is None:
+            return
+        self.history.import_entries(legacy)
+        # Regrava o estado local já sem o histórico
+        self._save_json_silent(self._data)
+
+    def _load_from_json_files(self) -> dict:
         """Carrega dados do JSON com sistema de backup triplo"""
         files_to_try = [self.data_file, self.backup_file, self.backup2_file]
         
@@ -448,45 +595,535 @@ class HybridDatabase:
             except Exception as e:
                 logger.error(f"❌ Erro ao ler {file_path}: {e}")
         
+        # Último recurso: snapshot periódico mais recente
+        data = self.snapshots.load_latest()
+        if isinstance(data, dict):
+            logger.info("🗄️ Estado recuperado do snapshot periódico mais recente")
+            return data
+
         # Se todos falharam, retornar dados vazios
         logger.warning("⚠️ Todos os arquivos falharam, iniciando com dados vazios")
         return self._get_empty_data()
     
-    def _save_data(self, data: dict):
+    def _load_data(self) -> dict:
+        """Retorna o estado em memória (fonte da verdade, sem I/O)"""
+        return self._data
+
+    def _save_data(self, data: dict, sections: Optional[tuple] = None, keys: Optional[tuple] = None,
+                   remote: bool = False):
+        """Registra uma mutação no estado em memória e agenda a gravação
+
+        `sections` indica quais seções do documento mudaram (None = todas) e
+        `keys` quais chaves dentro delas (None = seção inteira). O backend
+        PostgreSQL usa essa informação para gravar só as linhas afetadas.
+        `remote=True`: mudança que veio de outra instância (já está no
+        PostgreSQL), gravada só localmente.
+        """
+        changed_keys = None if keys is None else {str(key) for key in keys}
+        if data is not self._data:
+            self._data = data
+            self._rebuild_indexes()
+        else:
+            self._update_indexes(sections or tuple(data.keys()), changed_keys)
+        changed = {section: changed_keys for section in (sections or data.keys())}
+        merge_dirty(self._dirty, changed)
+        if remote:
+            merge_dirty(self._remote_dirty, changed)
+        elif self._remote_dirty:
+            # Alterada aqui depois de chegar de fora: volta a ser replicada
+            for section, section_keys in changed.items():
+                remote_keys = self._remote_dirty.get(section, ())
+                if section_keys is None or remote_keys is None:
+                    self._remote_dirty.pop(section, None)
+                elif remote_keys:
+                    remote_keys -= section_keys
+                    if not remote_keys:
+                        del self._remote_dirty[section]
+        self._pending_writes += 1
+        self._version += 1
+
+        # Dentro de transação: a gravação fica para o commit
+        if self._txn_depth:
+            merge_dirty(self._txn_dirty, changed)
+            return
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Grava agora (sem flusher) ou acorda o flusher se necessário"""
+        # Sem flusher ativo: grava na hora
+        if self._flush_task is None or self._flush_task.done():
+            self.flush()
+        elif self.flush_interval <= 0 or self._pending_writes >= self.flush_threshold:
+            self._flush_wakeup.set()
+
+    def health(self) -> dict:
+        """Resumo do armazenamento para o healthcheck"""
+        snapshot_age = self.snapshots.age()
+        status = {
+            'backend': 'postgres' if self.use_postgres else ('sqlite' if self.sqlite is not None else 'json'),
+            'dirty': self.is_dirty(),
+            'snapshot_age': None if snapshot_age is None else round(snapshot_age),
+            'snapshot_generations': len(self.snapshots.generations()),
+        }
+        if self.use_postgres:
+            status['postgres'] = self.pg_breaker.status()
+            with self._pg_state_lock:
+                status['postgres']['pending_sections'] = len(self._pg_pending)
+                status['postgres']['cas_conflicts'] = self._pg_conflict_total
+        return status
+
+    def is_dirty(self) -> bool:
+        """Indica se há mutações ainda não gravadas"""
+        return self._version != self._flushed_version
+
+    def flush(self):
+        """Grava imediatamente todas as mutações pendentes (chamar no shutdown)"""
+        if self._txn_depth or not self.is_dirty():
+            return
+        snapshot, version, dirty, replicate = self._take_snapshot()
+        self._persist(snapshot, version, dirty, replicate)
+
+    def _take_snapshot(self) -> tuple:
+        """Copia o estado atual e limpa o controle de chaves sujas
+
+        Retorna também as chaves a replicar no PostgreSQL: as sujas, menos
+        as que vieram de outra instância.
+        """
+        snapshot = copy.deepcopy(self._data)
+        version = self._version
+        dirty = self._dirty
+        replicate = subtract_dirty(dirty, self._remote_dirty) if self._remote_dirty else dirty
+        # Até chegarem em _pg_pending, NOTIFYs de outra instância não sobrescrevem essas chaves
+        with self._pg_state_lock:
+            self._pg_inflight.update(versioned_keys(replicate)[0])
+        self._dirty = {}
+        self._remote_dirty = {}
+        self._pending_writes = 0
+        return snapshot, version, dirty, replicate
+
+    def _persist(self, snapshot: dict, version: int, dirty: dict, replicate: Optional[dict] = None):
+        """Grava um snapshot no armazenamento (seguro para rodar em thread)"""
+        with self._persist_lock:
+            if version <= self._flushed_version:
+                return
+            self._write_to_storage(snapshot, dirty, dirty if replicate is None else replicate)
+            self._flushed_version = version
+
+    def _replace_state(self, data: dict):
+        """Substitui o estado em memória (ex.: recarregado de outro backend)"""
+        for key, value in self._get_empty_data().items():
+            data.setdefault(key, value)
+        self._data = data
+        self._local_stale = True
+        self._import_legacy_history()
+        self._rebuild_indexes()
+        self._dirty = {}
+        self._remote_dirty = {}
+        self._pending_writes = 0
+        self._flushed_version = self._version
+
+    def start_write_behind(self):
+        """Inicia o flusher em background no event loop atual"""
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        self._flush_wakeup = asyncio.Event()
+        self._flush_task = asyncio.get_running_loop().create_task(self._write_behind_loop())
+        self._probe_task = asyncio.get_running_loop().create_task(self._postgres_probe_loop())
+        self._snapshot_task = asyncio.get_running_loop().create_task(self._snapshot_loop())
+        self._listen_task = asyncio.get_running_loop().create_task(self._listen_loop())
+        logger.info("🧠 Write-behind ativado")
+
+    async def stop_write_behind(self):
+        """Para o flusher e grava o que estiver pendente"""
+        for task in (self._flush_task, self._probe_task, self._snapshot_task, self._listen_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._flush_task = None
+        self._probe_task = None
+        self._snapshot_task = None
+        self._listen_task = None
+        await self._flush_async()
+        await self.write_snapshot()
+
+    async def _flush_async(self):
+        """Grava as mutações pendentes sem bloquear o event loop"""
+        if self._txn_depth or not self.is_dirty():
+            return
+        # Cópia feita no event loop (consistente); I/O vai para thread
+        snapshot, version, dirty, replicate = self._take_snapshot()
+        await asyncio.to_thread(self._persist, snapshot, version, dirty, replicate)
+
+    async def _write_behind_loop(self):
+        """Grava o estado sujo a cada intervalo ou ao atingir o limite de mutações"""
+        # DB_FLUSH_INTERVAL=0: acorda a cada mutação (write-through fora do event loop)
+        timeout = self.flush_interval if self.flush_interval > 0 else None
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+
+            try:
+                await self._flush_async()
+                if self._pg_conflicts:
+                    await self._resolve_pg_conflicts()
+            except Exception as e:
+                logger.error(f"❌ Erro no flush write-behind: {e}")
+
+    async def _snapshot_loop(self):
+        """Grava um snapshot comprimido a cada intervalo, se o estado mudou"""
+        while True:
+            await asyncio.sleep(self.snapshots.interval)
+            await self.write_snapshot()
+
+    async def write_snapshot(self):
+        """Snapshot completo do estado atual; a cópia é feita no event loop, o I/O em thread"""
+        if self._version == self.snapshots.last_version:
+            return
+        snapshot, version = copy.deepcopy(self._data), self._version
+        try:
+            await asyncio.to_thread(self.snapshots.write, snapshot, version)
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar snapshot: {e}")
+
+    async def _postgres_probe_loop(self):
+        """Health probe: com o circuito aberto, testa o PostgreSQL e ressincroniza"""
+        while True:
+            await asyncio.sleep(self.pg_breaker.reset_timeout)
+            if self.pg_breaker.is_closed or not self.pg_breaker.allow_request():
+                continue
+            try:
+                await self._resync_postgres()
+            except Exception as e:
+                self.pg_breaker.record_failure()
+                logger.warning(f"⚠️ PostgreSQL ainda indisponível: {e}")
+            else:
+                self.pg_breaker.record_success()
+                logger.info("✅ PostgreSQL recuperado: estado local ressincronizado")
+
+    async def _resync_postgres(self):
+        """Grava no PostgreSQL tudo o que acumulou localmente durante a queda"""
+        if not self.use_postgres:
+            return
+        snapshot = copy.deepcopy(self._data)
+        await asyncio.to_thread(self._resync_postgres_sync, snapshot)
+
+    def _resync_postgres_sync(self, snapshot: dict):
+        with self._persist_lock:
+            self.pg_store.ping()
+            self._push_pg_pending(snapshot)
+
+    def _push_pg_pending(self, data: dict):
+        """Aplica as chaves pendentes no PostgreSQL (devolve-as se falhar)"""
+        pending, write = self._begin_pg_write(data)
+        try:
+            self._save_to_postgres(write)
+        except Exception:
+            self._end_pg_write(pending, write, committed=False)
+            raise
+        self._end_pg_write(pending, write, committed=True)
+
+    def _queue_pg_pending(self, dirty: dict):
+        """Passa chaves recém-gravadas localmente para a fila do PostgreSQL"""
+        with self._pg_state_lock:
+            merge_dirty(self._pg_pending, dirty)
+            self._pg_inflight.clear()
+
+    def _begin_pg_write(self, data: dict) -> tuple:
+        """Retira as chaves pendentes e monta a gravação versionada"""
+        with self._pg_state_lock:
+            pending, self._pg_pending = self._pg_pending, {}
+            return pending, self._versioned_write(data, pending)
+
+    def _end_pg_write(self, pending: dict, write: VersionedWrite, committed: bool):
+        """Depois do I/O: registra versões/conflitos, ou devolve as chaves se falhou"""
+        with self._pg_state_lock:
+            self._pg_inflight.clear()
+            if committed:
+                self._record_pg_write(write)
+            else:
+                merge_dirty(self._pg_pending, pending)
+
+    def _write_to_storage(self, data: dict, dirty: dict, replicate: Optional[dict] = None):
         """Salva dados (PostgreSQL + JSON para redundância)"""
-        # Sempre salvar em JSON primeiro (backup garantido)
-        self._save_json(data)
+        # Sempre salvar localmente primeiro (backup garantido)
+        if 'bet_history' in dirty:
+            self.history.sync()
+        if self.sqlite is not None and self._local_stale:
+            self.sqlite.import_document(data)
+            self._local_stale = False
+        elif self.sqlite is not None:
+            self.sqlite.apply(data, dirty)
+        elif self.journal is not None and self._local_stale:
+            self.journal.compact(data, full=True)
+            self._local_stale = False
+        elif self.journal is not None:
+            self.journal.append(data, {section: keys for section, keys in dirty.items() if section != 'bet_history'})
+        else:
+            self._save_json(data)
         
-        # Se PostgreSQL está ativo, salvar lá também
+        # Se PostgreSQL está ativo, salvar lá também (só as chaves alteradas)
+        # Circuito aberto: nada de esperar timeout; as chaves acumulam para a ressincronização
         if self.use_postgres:
+            self._queue_pg_pending(dirty if replicate is None else replicate)
+            if not self.pg_breaker.allow_request():
+                return
             try:
-                self._save_to_postgres(data)
+                self._push_pg_pending(data)
+                self.pg_breaker.record_success()
             except Exception as e:
+                self.pg_breaker.record_failure()
                 logger.error(f"❌ Erro ao salvar no PostgreSQL: {e}")
                 logger.warning("⚠️ Dados salvos apenas em JSON")
     
-    def _save_to_postgres(self, data: dict):
-        """Salva dados no PostgreSQL"""
-        import psycopg2
-        import psycopg2.extras
-        
+    def _with_history(self, data: dict, dirty: dict) -> dict:
+        """Anexa ao snapshot as apostas finalizadas que o PostgreSQL ainda não recebeu"""
+        bet_ids = dirty.get('bet_history')
+        if not bet_ids:
+            return data
+        return {**data, 'bet_history': self.history.get_entries(bet_ids)}
+
+    def _save_to_postgres(self, write: VersionedWrite):
+        """Grava no PostgreSQL apenas as chaves alteradas, com compare-and-swap"""
         # Validar que data é um dict
-        if not isinstance(data, dict):
-            logger.error(f"❌ Tentativa de salvar dados não-dict: {type(data)}")
-            raise ValueError(f"Dados devem ser dict, recebido: {type(data)}")
-        
-        conn = self.pg_pool.getconn()
+        if not isinstance(write.data, dict):
+            logger.error(f"❌ Tentativa de salvar dados não-dict: {type(write.data)}")
+            raise ValueError(f"Dados devem ser dict, recebido: {type(write.data)}")
+        self.pg_store.apply_versioned(write)
+
+    # ==================== CONCORRÊNCIA ENTRE INSTÂNCIAS ====================
+
+    def _track_pg_state(self, data: dict, versions: dict):
+        """Guarda as versões lidas do PostgreSQL e a base para o merge de 3 vias"""
+        base = {}
+        for group in ('queues', 'mediator_central'):
+            for key in data.get(GROUP_SECTIONS[group][0], {}):
+                base[(group, key)] = base_members(group, group_values(data, group, key))
+        with self._pg_state_lock:
+            self._pg_versions = dict(versions)
+            self._pg_base = base
+
+    def _versioned_write(self, data: dict, pending: dict) -> VersionedWrite:
+        """Monta a gravação com a versão esperada de cada chave pendente (sob _pg_state_lock)
+
+        Seções sujas inteiras viram a lista das suas chaves: nada é gravado
+        no PostgreSQL sem compare-and-swap.
+        """
+        pending = expand_whole_sections(data, pending, self._pg_versions)
+        keys, _ = versioned_keys(pending)
+        expected = {}
+        for version_key in keys:
+            # Conflitos demais seguidos: a próxima tentativa grava sem comparar
+            forced = self._pg_conflict_attempts.get(version_key, 0) >= self.pg_cas_retries
+            expected[version_key] = None if forced else self._pg_versions.get(version_key, 0)
+        self._pg_inflight.update(keys)
+        return VersionedWrite(self._with_history(data, pending), pending, expected, self.instance_id)
+
+    def _record_pg_write(self, write: VersionedWrite):
+        """Atualiza versões/base após o commit e separa as chaves em conflito (sob _pg_state_lock)"""
+        self._pg_versions.update(write.versions)
+        for group, key in write.versions:
+            self._pg_conflict_attempts.pop((group, key), None)
+            base = base_members(group, group_values(write.data, group, key))
+            if base is not None:
+                self._pg_base[(group, key)] = base
+        if not write.conflicts:
+            return
+
+        # Continuam pendentes até o merge; a próxima gravação usa a versão nova
+        for group, key in write.conflicts:
+            self._pg_conflict_attempts[(group, key)] = self._pg_conflict_attempts.get((group, key), 0) + 1
+            merge_dirty(self._pg_pending, {
+                section: {key} for section in GROUP_SECTIONS[group] if section in write.dirty
+            })
+        self._pg_conflicts.update(write.conflicts)
+        self._pg_conflict_total += len(write.conflicts)
+        logger.warning(f"⚠️ PostgreSQL: {len(write.conflicts)} chave(s) alteradas por outra instância, mesclando")
+
+    async def _fetch_pg_state(self) -> tuple:
+        """Documento e versões atuais do PostgreSQL"""
+        return await asyncio.to_thread(lambda: (self.pg_store.load(), self.pg_store.load_versions()))
+
+    async def _wait_transaction(self):
+        """Mudanças externas não entram no meio de uma transação aberta"""
+        while self._txn_depth:
+            await asyncio.sleep(0.05)
+
+    def _set_group_values(self, key: str, values: dict, remote: bool = False):
+        """Substitui o valor de uma chave em todas as seções do grupo"""
+        for section, value in values.items():
+            target = self._data.setdefault(section, {})
+            if value is None:
+                target.pop(key, None)
+            else:
+                target[key] = value
+        self._save_data(self._data, tuple(values), (key,), remote=remote)
+
+    def _changed_locally(self, group: str, key: str) -> bool:
+        """Chave com mudança local ainda não confirmada no PostgreSQL (sob _pg_state_lock)"""
+        if (group, key) in self._pg_inflight or (group, key) in self._pg_conflicts:
+            return True
+        for section in GROUP_SECTIONS[group]:
+            for dirty, excluded in ((self._pg_pending, {}), (self._dirty, self._remote_dirty)):
+                if section not in dirty:
+                    continue
+                keys = dirty[section]
+                if keys is None or (key in keys and key not in (excluded.get(section) or ())):
+                    return True
+        return False
+
+    async def _resolve_pg_conflicts(self):
+        """Mescla as chaves recusadas com a versão atual do banco e agenda nova gravação"""
+        await self._wait_transaction()
+        with self._pg_state_lock:
+            conflicts, self._pg_conflicts = self._pg_conflicts, set()
         try:
-            with conn.cursor() as cur:
-                # PostgreSQL aceita dict diretamente como JSONB com psycopg2.extras.Json
-                cur.execute("""
-                    UPDATE stormbet_data 
-                    SET data = %s, updated_at = CURRENT_TIMESTAMP 
-                    WHERE id = 1
-                """, (psycopg2.extras.Json(data),))
-                conn.commit()
+            document, versions = await self._fetch_pg_state()
+        except Exception:
+            with self._pg_state_lock:
+                self._pg_conflicts.update(conflicts)
+            raise
+        for group, key in conflicts:
+            ours = group_values(self._data, group, key)
+            theirs = group_values(document, group, key)
+            base = base_members(group, theirs)
+            with self._pg_state_lock:
+                merged = merge_group(group, self._pg_base.get((group, key)), ours, theirs)
+                self._pg_versions[(group, key)] = versions.get((group, key), 0)
+                if base is not None:
+                    self._pg_base[(group, key)] = base
+            self._set_group_values(key, merged)
+        logger.info(f"🔀 {len(conflicts)} conflito(s) mesclados com a versão de outra instância")
+        if self._flush_wakeup is not None:
+            self._flush_wakeup.set()
+
+    def _apply_remote_change(self, group: str, key: str, version: int, values: dict) -> bool:
+        """Aplica no estado em memória uma chave gravada por outra instância"""
+        base = base_members(group, values)
+        with self._pg_state_lock:
+            if version <= self._pg_versions.get((group, key), 0):
+                return False
+            if self._changed_locally(group, key):
+                # A nossa gravação vai falhar no compare-and-swap e ser mesclada
+                return False
+            self._pg_versions[(group, key)] = version
+            if base is not None:
+                self._pg_base[(group, key)] = base
+        self._set_group_values(key, values, remote=True)
+        return True
+
+    def _adopt_pg_value(self, group: str, key: str, version: int, theirs: dict):
+        """Traz a chave para a versão relida do PostgreSQL
+
+        Mudança local ainda não confirmada é mesclada (merge de 3 vias) e
+        continua suja; sem ela, o valor do banco entra como mudança remota.
+        """
+        base = base_members(group, theirs)
+        with self._pg_state_lock:
+            if version <= self._pg_versions.get((group, key), 0):
+                return
+            local = self._changed_locally(group, key)
+            values = theirs
+            if local:
+                ours = group_values(self._data, group, key)
+                values = merge_group(group, self._pg_base.get((group, key)), ours, theirs)
+            self._pg_versions[(group, key)] = version
+            if base is not None:
+                self._pg_base[(group, key)] = base
+        self._set_group_values(key, values, remote=not local)
+
+    def _record_committed(self, write: VersionedWrite):
+        """Chaves gravadas fora do flush: versões/base e, se o valor em memória
+        ainda é o gravado, deixam de ser replicadas pelo write-behind"""
+        with self._pg_state_lock:
+            self._pg_versions.update(write.versions)
+            for group, key in write.versions:
+                written = group_values(write.data, group, key)
+                base = base_members(group, written)
+                if base is not None:
+                    self._pg_base[(group, key)] = base
+                if group_values(self._data, group, key) != written:
+                    continue
+                self._pg_conflicts.discard((group, key))
+                self._pg_conflict_attempts.pop((group, key), None)
+                for section in GROUP_SECTIONS[group]:
+                    pending = self._pg_pending.get(section)
+                    if pending:
+                        pending.discard(key)
+                        if not pending:
+                            del self._pg_pending[section]
+                    dirty = self._dirty.get(section)
+                    if dirty and key in dirty:
+                        remote = self._remote_dirty.setdefault(section, set())
+                        if remote is not None:
+                            remote.add(key)
+
+    async def _apply_notifications(self, payloads: List[str]):
+        """Processa payloads do NOTIFY; mudanças sem valor disparam recarga"""
+        await self._wait_transaction()
+        refresh = False
+        for payload in payloads:
+            try:
+                message = json.loads(payload)
+            except (TypeError, ValueError):
+                continue
+            if message.get('i') == self.instance_id:
+                continue
+            for change in message.get('c', []):
+                group, key = change.get('s'), change.get('k')
+                if group not in GROUP_SECTIONS:
+                    continue
+                if key is None or 'd' not in change:
+                    refresh = True
+                else:
+                    self._apply_remote_change(group, key, change.get('v', 0), change['d'])
+        if refresh:
+            await self._refresh_from_postgres()
+
+    async def _refresh_from_postgres(self):
+        """Aplica todas as chaves com versão mais nova no PostgreSQL"""
+        document, versions = await self._fetch_pg_state()
+        await self._wait_transaction()
+        applied = 0
+        for (group, key), version in versions.items():
+            if group in GROUP_SECTIONS and self._apply_remote_change(group, key, version, group_values(document, group, key)):
+                applied += 1
+        if applied:
+            logger.info(f"🔄 {applied} chave(s) atualizadas a partir de outra instância")
+
+    async def _listen_loop(self):
+        """LISTEN no PostgreSQL (psycopg2): atualiza o estado quando outra instância grava"""
+        if not self.use_postgres or not self.pg_notify:
+            return
+        conn, first = None, True
+        try:
+            while True:
+                try:
+                    if conn is None or conn.closed:
+                        conn = await asyncio.to_thread(
+                            self.pg_store.open_listener, self.database_url, self.pg_connect_timeout)
+                        # Reconexão: NOTIFYs podem ter se perdido enquanto estava fora
+                        if not first:
+                            await self._refresh_from_postgres()
+                        first = False
+                    payloads = await asyncio.to_thread(self.pg_store.wait_notifications, conn, 5)
+                    if payloads:
+                        await self._apply_notifications(payloads)
+                except Exception as e:
+                    logger.warning(f"⚠️ LISTEN do PostgreSQL interrompido: {e}")
+                    if conn is not None and not conn.closed:
+                        conn.close()
+                    conn = None
+                    await asyncio.sleep(self.pg_breaker.reset_timeout)
         finally:
-            self.pg_pool.putconn(conn)
+            if conn is not None and not conn.closed:
+                conn.close()
     
     def _save_json(self, data: dict):
         """Salva em JSON com sistema de backup triplo"""
@@ -513,10 +1150,257 @@ class HybridDatabase:
     def _save_json_silent(self, data: dict):
         """Salva JSON sem levantar exceções (para backups automáticos)"""
         try:
-            self._save_json(data)
+            if self.sqlite is not None:
+                self.sqlite.import_document(data)
+            elif self.journal is not None:
+                self.journal.compact(data)
+            else:
+                self._save_json(data)
         except Exception as e:
             logger.warning(f"⚠️ Falha no backup JSON automático: {e}")
     
+    # ==================== TRANSAÇÕES ====================
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Unidade de trabalho: várias mutações, uma única gravação
+
+        Os métodos da API continuam alterando o estado em memória, mas nada
+        é gravado até o fim do bloco. Se o bloco levantar exceção, as chaves
+        alteradas voltam ao valor anterior. Transações aninhadas fazem parte
+        da mais externa. Mantenha no bloco apenas operações de banco: o que
+        outras corrotinas alterarem enquanto ele estiver aberto entra na
+        mesma transação.
+        """
+        if self._txn_depth:
+            self._txn_depth += 1
+            try:
+                yield self
+            finally:
+                self._txn_depth -= 1
+            return
+
+        backup = copy.deepcopy(self._data)
+        self._txn_depth = 1
+        try:
+            yield self
+        except BaseException:
+            self._txn_depth = 0
+            self._rollback(backup, self._txn_dirty)
+            raise
+        else:
+            self._txn_depth = 0
+            for entry in self._txn_history:
+                self.history.append(entry)
+            if self._txn_dirty:
+                self._schedule_flush()
+        finally:
+            self._txn_dirty = {}
+            self._txn_history = []
+
+    def _rollback(self, backup: dict, dirty: dict):
+        """Restaura as chaves alteradas na transação a partir da cópia inicial"""
+        for section, keys in dirty.items():
+            before = backup.get(section)
+            if keys is None or not isinstance(before, dict):
+                if section in backup:
+                    self._data[section] = before
+                else:
+                    self._data.pop(section, None)
+                continue
+            current = self._data.setdefault(section, {})
+            for key in keys:
+                if key in before:
+                    current[key] = before[key]
+                else:
+                    current.pop(key, None)
+        # As chaves continuam sujas: o valor restaurado é o que será gravado
+        self._rebuild_indexes()
+        logger.warning(f"↩️ Transação desfeita ({len(dirty)} seções restauradas)")
+
+    # ==================== ÍNDICES EM MEMÓRIA ====================
+    # Mantidos a cada _save_data (pelas chaves sujas) e reconstruídos no load
+
+    def _rebuild_indexes(self):
+        """Reconstrói todos os índices secundários a partir do estado"""
+        self._rebuild_queue_indexes()
+        self._rebuild_bet_indexes()
+        self._rebuild_subscription_index()
+        self.central.rebuild(self._data.get('mediator_central', {}))
+        self.panels.rebuild(self._data.get('queue_metadata', {}))
+        self._guild_configs.clear()
+
+    def _rebuild_queue_indexes(self):
+        self._idx_queue_users = {}     # queue_id -> set(user_id)
+        self._idx_user_queues = {}     # user_id -> set(queue_id)
+        self._idx_message_queues = {}  # message_id -> set(queue_id) do painel
+        self._queue_join_epochs = {}   # queue_id -> {user_id: (iso, epoch)}
+        self._expiry_heap = []         # min-heap (epoch de entrada, queue_id, user_id)
+        queue_ids = set(self._data.get('queues', {})) | set(self._data.get('queue_timestamps', {}))
+        for queue_id in queue_ids:
+            self._index_queue(queue_id)
+
+    def _rebuild_bet_indexes(self):
+        self._idx_bet_users = {}    # bet_id -> (channel_id, set(user_id))
+        self._idx_user_bets = {}    # user_id -> set(bet_id)
+        self._idx_channel_bet = {}  # channel_id -> bet_id
+        for bet_id in self._data.get('active_bets', {}):
+            self._index_bet(bet_id)
+
+    def _rebuild_subscription_index(self):
+        self._entitlements = {}        # guild_id -> epoch de expiração (inf = permanente)
+        self._subscription_heap = []   # min-heap (epoch de expiração, guild_id)
+        for guild_id in self._data.get('subscriptions', {}):
+            self._index_subscription(guild_id)
+        self._subscriptions_changed.set()
+
+    def _update_indexes(self, sections, keys: Optional[set]):
+        """Atualiza os índices afetados por uma mutação"""
+        queues_changed = 'queues' in sections or 'queue_timestamps' in sections
+        if queues_changed:
+            if keys is None:
+                self._rebuild_queue_indexes()
+            else:
+                for queue_id in keys:
+                    self._index_queue(queue_id)
+        if 'active_bets' in sections:
+            if keys is None:
+                self._rebuild_bet_indexes()
+            else:
+                for bet_id in keys:
+                    self._index_bet(bet_id)
+        if 'subscriptions' in sections:
+            if keys is None:
+                self._rebuild_subscription_index()
+            else:
+                for guild_id in keys:
+                    self._index_subscription(guild_id)
+        if 'mediator_central' in sections:
+            centrals = self._data.get('mediator_central', {})
+            if keys is None:
+                self.central.rebuild(centrals)
+            else:
+                for guild_id in keys:
+                    self.central.reindex(guild_id, centrals.get(guild_id))
+        if 'queue_metadata' in sections:
+            metadata = self._data.get('queue_metadata', {})
+            if keys is None:
+                self.panels.rebuild(metadata)
+            else:
+                for message_id in keys:
+                    self.panels.reindex(message_id, metadata.get(message_id))
+        if self._guild_configs and any(section in GUILD_CONFIG_SECTIONS for section in sections):
+            if keys is None:
+                self._guild_configs.clear()
+            else:
+                for guild_id in keys:
+                    self._guild_configs.pop(guild_id, None)
+
+    @staticmethod
+    def _message_id_from_queue(queue_id: str) -> Optional[int]:
+        """Extrai o message_id do painel de IDs como `2v2-mob_123_team1`"""
+        for part in queue_id.split('_')[1:]:
+            if part.isdigit():
+                return int(part)
+        return None
+
+    def _index_queue(self, queue_id: str):
+        """Reindexa uma fila (membros + timestamps)"""
+        for user_id in self._idx_queue_users.pop(queue_id, ()):
+            user_queues = self._idx_user_queues.get(user_id)
+            if user_queues is not None:
+                user_queues.discard(queue_id)
+                if not user_queues:
+                    del self._idx_user_queues[user_id]
+
+        queue = self._data.get('queues', {}).get(queue_id)
+        timestamps = self._data.get('queue_timestamps', {}).get(queue_id)
+        message_id = self._message_id_from_queue(queue_id)
+        if message_id is not None:
+            panel_queues = self._idx_message_queues.setdefault(message_id, set())
+            if queue is None and timestamps is None:
+                panel_queues.discard(queue_id)
+                if not panel_queues:
+                    del self._idx_message_queues[message_id]
+            else:
+                panel_queues.add(queue_id)
+
+        members = set(queue or ())
+        previous_epochs = self._queue_join_epochs.pop(queue_id, {})
+        join_epochs = {}
+        for user_id_str, timestamp_str in (timestamps or {}).items():
+            try:
+                user_id = int(user_id_str)
+                entry = previous_epochs.get(user_id)
+                if entry is None or entry[0] != timestamp_str:
+                    # Só entradas novas/alteradas são convertidas e vão para o heap
+                    entry = (timestamp_str, datetime.fromisoformat(timestamp_str).timestamp())
+                    heapq.heappush(self._expiry_heap, (entry[1], queue_id, user_id))
+            except (TypeError, ValueError):
+                continue
+            members.add(user_id)
+            join_epochs[user_id] = entry
+        if join_epochs:
+            self._queue_join_epochs[queue_id] = join_epochs
+        if members:
+            self._idx_queue_users[queue_id] = members
+            for user_id in members:
+                self._idx_user_queues.setdefault(user_id, set()).add(queue_id)
+
+    def _index_bet(self, bet_id: str):
+        """Reindexa uma aposta ativa (jogadores + canal)"""
+        previous = self._idx_bet_users.pop(bet_id, None)
+        if previous is not None:
+            channel_id, users = previous
+            if self._idx_channel_bet.get(channel_id) == bet_id:
+                del self._idx_channel_bet[channel_id]
+            for user_id in users:
+                user_bets = self._idx_user_bets.get(user_id)
+                if user_bets is not None:
+                    user_bets.discard(bet_id)
+                    if not user_bets:
+                        del self._idx_user_bets[user_id]
+
+        bet_data = self._data.get('active_bets', {}).get(bet_id)
+        if not bet_data:
+            return
+        try:
+            users = {bet_data.get('player1_id'), bet_data.get('player2_id')}
+            users.update(bet_data.get('team1_ids') or [])
+            users.update(bet_data.get('team2_ids') or [])
+            users.discard(None)
+            channel_id = int(bet_data.get('channel_id'))
+        except (TypeError, ValueError):
+            # Dados corrompidos não devem travar o bot
+            logger.warning(f"⚠️ Aposta {bet_id} com dados inválidos, ignorada nos índices")
+            return
+        self._idx_bet_users[bet_id] = (channel_id, users)
+        self._idx_channel_bet[channel_id] = bet_id
+        for user_id in users:
+            self._idx_user_bets.setdefault(user_id, set()).add(bet_id)
+
+    def _index_subscription(self, guild_id_str: str):
+        """Recalcula o epoch de expiração de uma assinatura"""
+        try:
+            guild_id = int(guild_id_str)
+        except (TypeError, ValueError):
+            return
+        subscription = self._data.get('subscriptions', {}).get(guild_id_str)
+        previous = self._entitlements.pop(guild_id, None)
+        if subscription:
+            if subscription.get('permanent'):
+                expires = math.inf
+            else:
+                try:
+                    expires = datetime.fromisoformat(subscription['expires_at']).timestamp()
+                except (KeyError, TypeError, ValueError):
+                    # Sem data válida: assinatura inativa
+                    expires = 0.0
+            self._entitlements[guild_id] = expires
+            if expires != previous and expires != math.inf:
+                heapq.heappush(self._subscription_heap, (expires, guild_id))
+        self._subscriptions_changed.set()
+
     # ==================== MÉTODOS DA API ====================
     # Mantendo compatibilidade total com o código existente
     
@@ -548,7 +1432,7 @@ class HybridDatabase:
         else:
             logger.info(f"⚠️ DB: Usuário {user_id} já estava na fila {queue_id}")
         
-        self._save_data(data)
+        self._save_data(data, ('queues', 'queue_timestamps'), (queue_id,))
 
     def remove_from_queue(self, queue_id: str, user_id: int):
         """Remove um jogador da fila"""
@@ -569,12 +1453,12 @@ class HybridDatabase:
                 del data['queue_timestamps'][queue_id][user_id_str]
                 logger.info(f"⏱️ DB: Timestamp removido para {user_id} na fila {queue_id}")
 
-        self._save_data(data)
+        self._save_data(data, ('queues', 'queue_timestamps'), (queue_id,))
 
     def get_queue(self, queue_id: str) -> List[int]:
         """Retorna a fila de um painel específico"""
         data = self._load_data()
-        return data['queues'].get(queue_id, [])
+        return list(data['queues'].get(queue_id, []))
 
     def set_queue(self, queue_id: str, users: List[int]):
         """Substitui a fila inteira (preserva ordem)"""
@@ -597,128 +1481,198 @@ class HybridDatabase:
             new_ts[uid_str] = data['queue_timestamps'][queue_id].get(uid_str, now)
         data['queue_timestamps'][queue_id] = new_ts
 
-        self._save_data(data)
+        self._save_data(data, ('queues', 'queue_timestamps'), (queue_id,))
 
     def remove_from_all_queues(self, user_id: int):
         """Remove um jogador de todas as filas"""
         data = self._load_data()
-        for mode in data['queues']:
-            if user_id in data['queues'][mode]:
-                data['queues'][mode].remove(user_id)
-        if 'queue_timestamps' in data:
-            for queue_id in data['queue_timestamps']:
-                if str(user_id) in data['queue_timestamps'][queue_id]:
-                    del data['queue_timestamps'][queue_id][str(user_id)]
-        self._save_data(data)
+        changed = set(self._idx_user_queues.get(user_id, ()))
+        for queue_id in changed:
+            queue = data['queues'].get(queue_id)
+            if queue is not None and user_id in queue:
+                queue.remove(user_id)
+            data.get('queue_timestamps', {}).get(queue_id, {}).pop(str(user_id), None)
+        if changed:
+            self._save_data(data, ('queues', 'queue_timestamps'), tuple(changed))
+
+    # ==================== MATCHMAKING ====================
+
+    def _matchmaker(self) -> Matchmaker:
+        data = self._load_data()
+        return Matchmaker(data.setdefault('queues', {}), data.setdefault('queue_timestamps', {}))
+
+    def _save_queues(self, changed: set):
+        if changed:
+            self._save_data(self._load_data(), ('queues', 'queue_timestamps'), tuple(changed))
+
+    def get_panel_state(self, message_id: int, modes: Tuple[str, ...]) -> PanelState:
+        """Filas atuais dos modos de um painel"""
+        return self._matchmaker().state(message_id, modes)
+
+    def join_queue(self, message_id: int, mode: str, user_id: int, team: Optional[int] = None,
+                   panel_modes: Tuple[str, ...] = ()) -> QueueResult:
+        """Entra na fila do painel e, se ela completou, já retira a partida
+
+        Tudo numa única gravação. `panel_modes` são os modos do mesmo painel
+        (o jogador só pode estar em uma fila por painel).
+        """
+        spec = get_mode_spec(mode)
+        modes = panel_modes or (mode,)
+        matchmaker = self._matchmaker()
+        if self.is_user_in_active_bet(user_id):
+            return QueueResult(IN_ACTIVE_BET, matchmaker.state(message_id, modes))
+        status, changed = matchmaker.join(spec, message_id, user_id, team, modes)
+        match = None
+        if status == JOINED:
+            match, popped = matchmaker.pop_match(spec, message_id)
+            changed |= popped
+        self._save_queues(changed)
+        if match:
+            logger.info(f"🎯 Partida montada na fila {mode}_{message_id}: {match.team1} vs {match.team2}")
+        return QueueResult(status, matchmaker.state(message_id, modes), match)
+
+    def leave_queue(self, message_id: int, modes: Tuple[str, ...], user_id: int) -> QueueResult:
+        """Sai de qualquer fila do painel"""
+        matchmaker = self._matchmaker()
+        status, changed = matchmaker.leave(message_id, modes, user_id)
+        self._save_queues(changed)
+        return QueueResult(status, matchmaker.state(message_id, modes))
+
+    def pop_match(self, message_id: int, mode: str, panel_modes: Tuple[str, ...] = ()) -> QueueResult:
+        """Retira uma partida da fila do modo, se ela estiver completa"""
+        matchmaker = self._matchmaker()
+        match, changed = matchmaker.pop_match(get_mode_spec(mode), message_id)
+        self._save_queues(changed)
+        return QueueResult(JOINED if match else NOT_QUEUED, matchmaker.state(message_id, panel_modes or (mode,)), match)
+
+    def requeue_match(self, message_id: int, match: Match, panel_modes: Tuple[str, ...] = ()) -> PanelState:
+        """Devolve à fila os jogadores de uma partida que não foi criada"""
+        matchmaker = self._matchmaker()
+        self._save_queues(matchmaker.requeue(match, message_id))
+        return matchmaker.state(message_id, panel_modes or (match.mode,))
 
     def is_user_in_active_bet(self, user_id: int) -> bool:
         """Verifica se um jogador está em uma aposta ativa"""
-        data = self._load_data()
-        for bet_data in data['active_bets'].values():
-            try:
-                if bet_data.get('player1_id') == user_id or bet_data.get('player2_id') == user_id:
-                    return True
-                team1_ids = bet_data.get('team1_ids') or []
-                team2_ids = bet_data.get('team2_ids') or []
-                if user_id in team1_ids or user_id in team2_ids:
-                    return True
-            except Exception:
-                # Em caso de dados corrompidos, não travar o bot
-                continue
-        return False
+        return bool(self._idx_user_bets.get(user_id))
 
     def add_active_bet(self, bet: Bet):
         """Adiciona uma aposta ativa"""
         data = self._load_data()
-        bet_dict = bet.to_dict()
-        bet_dict['bet_value'] = float(bet_dict['bet_value'])
-        bet_dict['mediator_fee'] = float(bet_dict['mediator_fee'])
-        data['active_bets'][bet.bet_id] = bet_dict
-        self._save_data(data)
+        data['active_bets'][bet.bet_id] = bet.to_dict()
+        self._save_data(data, ('active_bets',), (bet.bet_id,))
 
     def get_active_bet(self, bet_id: str) -> Optional[Bet]:
         """Retorna uma aposta ativa pelo ID"""
         data = self._load_data()
         bet_data = data['active_bets'].get(bet_id)
         if bet_data:
-            bet_data['bet_value'] = float(bet_data.get('bet_value', 0))
-            bet_data['mediator_fee'] = float(bet_data.get('mediator_fee', 0))
             return Bet.from_dict(bet_data)
         return None
 
     def get_bet_by_channel(self, channel_id: int) -> Optional[Bet]:
         """Retorna uma aposta pelo ID do canal"""
-        data = self._load_data()
-        logger.info(f"🔍 DB: Buscando aposta para channel_id={channel_id}")
-        logger.info(f"📊 DB: {len(data['active_bets'])} apostas ativas no banco")
-        
-        for bet_id, bet_data in data['active_bets'].items():
-            stored_channel_id = bet_data.get('channel_id')
-            if int(stored_channel_id) == int(channel_id):
-                logger.info(f"✅ DB: Aposta encontrada! bet_id={bet_id}")
-                bet_data['bet_value'] = float(bet_data.get('bet_value', 0))
-                bet_data['mediator_fee'] = float(bet_data.get('mediator_fee', 0))
-                return Bet.from_dict(bet_data)
-        
-        logger.info(f"❌ DB: Nenhuma aposta encontrada para channel_id={channel_id}")
-        return None
+        bet_id = self._idx_channel_bet.get(int(channel_id))
+        if bet_id is None:
+            logger.info(f"❌ DB: Nenhuma aposta encontrada para channel_id={channel_id}")
+            return None
+
+        logger.info(f"✅ DB: Aposta encontrada! bet_id={bet_id}")
+        return Bet.from_dict(self._load_data()['active_bets'][bet_id])
+
+    def get_active_bets_for_user(self, user_id: int) -> List[BetView]:
+        """Retorna as apostas ativas de um jogador (somente leitura)"""
+        active_bets = self._load_data()['active_bets']
+        return [Bet.view(active_bets[bet_id]) for bet_id in self._idx_user_bets.get(user_id, ())]
 
     def update_active_bet(self, bet: Bet):
         """Atualiza uma aposta ativa"""
         data = self._load_data()
         data['active_bets'][bet.bet_id] = bet.to_dict()
-        self._save_data(data)
+        self._save_data(data, ('active_bets',), (bet.bet_id,))
 
     def finish_bet(self, bet: Bet):
         """Finaliza uma aposta e move para o histórico"""
-        data = self._load_data()
-        if bet.bet_id in data['active_bets']:
-            del data['active_bets'][bet.bet_id]
-            data['bet_history'].append(bet.to_dict())
-            self._save_data(data)
+        if bet.bet_id not in self._data['active_bets']:
+            return
+        if self._txn_depth:
+            self._txn_history.append(bet.to_dict())
+        else:
+            self.history.append(bet.to_dict())
+        self._remove_finished_bet(bet.bet_id)
 
-    def get_bet_history(self) -> List[Bet]:
-        """Retorna o histórico de apostas"""
+    def _remove_finished_bet(self, bet_id: str):
+        """Tira das apostas ativas uma aposta já acrescentada ao histórico"""
         data = self._load_data()
-        return [Bet.from_dict(bet_data) for bet_data in data['bet_history']]
+        if bet_id in data['active_bets']:
+            del data['active_bets'][bet_id]
+            self._save_data(data, ('active_bets', 'bet_history'), (bet_id,))
+
+    def get_bet_history(self) -> List[BetView]:
+        """Retorna o histórico de apostas (somente leitura)"""
+        return [Bet.view(bet_data) for bet_data in self.history.all_entries()]
+
+    def get_bet_history_page(self, guild_id: Optional[int], page: int = 0, page_size: int = 10,
+                             player_id: Optional[int] = None) -> Tuple[List[BetView], int]:
+        """Retorna uma página do histórico (mais recentes primeiro, somente leitura) e o total"""
+        offset = page * page_size
+        # Só lê do PostgreSQL com o circuito fechado (após a ressincronização)
+        if self.use_postgres and self.pg_breaker.is_closed:
+            try:
+                entries, total = self.pg_store.history_page(guild_id, player_id, offset, page_size)
+                return [Bet.view(entry) for entry in entries], total
+            except Exception as e:
+                self.pg_breaker.record_failure()
+                logger.error(f"❌ Erro ao ler histórico do PostgreSQL: {e}")
+                logger.warning("⚠️ Usando histórico local")
+        entries, total = self.history.page(guild_id, player_id, offset, page_size)
+        return [Bet.view(entry) for entry in entries], total
 
     def get_all_active_bets(self) -> Dict[str, Bet]:
         """Retorna todas as apostas ativas"""
         data = self._load_data()
         return {bet_id: Bet.from_dict(bet_data) for bet_id, bet_data in data['active_bets'].items()}
 
+    def _is_live_expiry(self, entry: tuple) -> bool:
+        """Entradas do heap ficam obsoletas quando o jogador sai ou reentra"""
+        epoch, queue_id, user_id = entry
+        current = self._queue_join_epochs.get(queue_id, {}).get(user_id)
+        return current is not None and current[1] == epoch
+
     def get_expired_queue_players(self, timeout_minutes: int = 5):
         """Retorna jogadores que estão há mais de X minutos na fila"""
-        data = self._load_data()
+        cutoff = time.time() - timeout_minutes * 60
         expired = {}
-        current_time = datetime.now()
-
-        for queue_id, timestamps in data.get('queue_timestamps', {}).items():
-            expired_users = []
-            for user_id_str, timestamp_str in timestamps.items():
-                join_time = datetime.fromisoformat(timestamp_str)
-                time_diff = (current_time - join_time).total_seconds() / 60
-
-                if time_diff >= timeout_minutes:
-                    expired_users.append(int(user_id_str))
-
-            if expired_users:
-                expired[queue_id] = expired_users
-
+        due = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= cutoff:
+            entry = heapq.heappop(self._expiry_heap)
+            if self._is_live_expiry(entry):
+                due.append(entry)
+                expired.setdefault(entry[1], []).append(entry[2])
+
+        # Continuam no heap até saírem de fato da fila
+        for entry in due:
+            heapq.heappush(self._expiry_heap, entry)
         return expired
 
+    def get_next_queue_expiry(self, timeout_minutes: int = 5) -> Optional[float]:
+        """Epoch em que o próximo jogador expira (None se as filas estão vazias)"""
+        while self._expiry_heap and not self._is_live_expiry(self._expiry_heap[0]):
+            heapq.heappop(self._expiry_heap)
+        if not self._expiry_heap:
+            return None
+        return self._expiry_heap[0][0] + timeout_minutes * 60
+
     def set_mediator_role(self, guild_id: int, role_id: int):
         """Define o cargo de mediador para um servidor"""
         data = self._load_data()
         if 'mediator_roles' not in data:
             data['mediator_roles'] = {}
         data['mediator_roles'][str(guild_id)] = role_id
-        self._save_data(data)
+        self._save_data(data, ('mediator_roles',), (guild_id,))
 
     def get_mediator_role(self, guild_id: int):
         """Retorna o ID do cargo de mediador configurado para o servidor"""
-        data = self._load_data()
-        return data.get('mediator_roles', {}).get(str(guild_id))
+        return self.get_guild_config(guild_id).mediator_role_id
 
     def set_guild_language(self, guild_id: int, language_code: str):
         """Define o idioma preferido para um servidor"""
@@ -726,7 +1680,7 @@ class HybridDatabase:
         if 'languages' not in data:
             data['languages'] = {}
         data['languages'][str(guild_id)] = language_code
-        self._save_data(data)
+        self._save_data(data, ('languages',), (guild_id,))
 
     def set_language(self, guild_id: int, language_code: str):
         """Define o idioma preferido para um servidor"""
@@ -734,12 +1688,11 @@ class HybridDatabase:
         if 'languages' not in data:
             data['languages'] = {}
         data['languages'][str(guild_id)] = language_code
-        self._save_data(data)
+        self._save_data(data, ('languages',), (guild_id,))
 
     def get_language(self, guild_id: int) -> str:
         """Retorna o idioma configurado para o servidor (padrão: pt)"""
-        data = self._load_data()
-        return data.get('languages', {}).get(str(guild_id), 'pt')
+        return self.get_guild_config(guild_id).language
 
     def set_results_channel(self, guild_id: int, channel_id: int):
         """Define o canal de resultados para um servidor"""
@@ -747,12 +1700,28 @@ class HybridDatabase:
         if 'results_channels' not in data:
             data['results_channels'] = {}
         data['results_channels'][str(guild_id)] = channel_id
-        self._save_data(data)
+        self._save_data(data, ('results_channels',), (guild_id,))
 
     def get_results_channel(self, guild_id: int):
         """Retorna o ID do canal de resultados configurado para o servidor"""
-        data = self._load_data()
-        return data.get('results_channels', {}).get(str(guild_id))
+        return self.get_guild_config(guild_id).results_channel_id
+
+    def get_guild_config(self, guild_id: int) -> GuildConfig:
+        """Configuração do servidor (cargo, idioma, canais, central, assinatura)
+
+        Servida do cache; a entrada é descartada quando uma das seções do
+        servidor muda (localmente ou por outra instância).
+        """
+        key = str(guild_id)
+        config = self._guild_configs.get(key)
+        if config is not None:
+            self._guild_configs.move_to_end(key)
+            return config
+        config = GuildConfig.from_state(int(guild_id), self._data)
+        self._guild_configs[key] = config
+        if len(self._guild_configs) > self.guild_cache_size:
+            self._guild_configs.popitem(last=False)
+        return config
 
     def get_all_queue_ids(self) -> List[str]:
         """Retorna todos os IDs de filas existentes"""
@@ -796,7 +1765,7 @@ class HybridDatabase:
         data['queue_metadata'][str(message_id)] = metadata
         
         logger.info(f"💾 Salvando metadados no banco: queue_id={queue_id}, bet_value={bet_value}, mediator_fee={mediator_fee}, currency={currency_type}")
-        self._save_data(data)
+        self._save_data(data, ('queue_metadata',), (message_id,))
         
         # Verificar se foi salvo corretamente
         saved_data = self._load_data()
@@ -813,11 +1782,14 @@ class HybridDatabase:
         return data['queue_metadata'].get(str(message_id))
 
     def get_all_queue_metadata(self) -> dict:
-        """Retorna todos os metadados de filas"""
+        """Retorna os metadados de todos os painéis não apagados"""
         data = self._load_data()
         if 'queue_metadata' not in data:
             return {}
-        return data['queue_metadata']
+        return {
+            message_id: metadata for message_id, metadata in data['queue_metadata'].items()
+            if metadata.get('state') != PANEL_TOMBSTONED
+        }
 
     def save_panel_metadata(self, message_id: int, panel_type: str, bet_value: float, mediator_fee: float, channel_id: int, currency_type: str = "sonhos"):
         """Salva metadados de um painel unificado (1v1, 2v2, 3v3 ou 4v4)."""
@@ -852,7 +1824,7 @@ class HybridDatabase:
         }
 
         data['queue_metadata'][str(message_id)] = metadata
-        self._save_data(data)
+        self._save_data(data, ('queue_metadata',), (message_id,))
 
         # Verifica se salvou corretamente (debug de painel)
         saved_data = self._load_data()
@@ -870,6 +1842,16 @@ class HybridDatabase:
             return None
         return metadata
 
+    def get_queue_ids_for_message(self, message_id: int) -> List[str]:
+        """Retorna as filas ligadas a uma mensagem de painel"""
+        return sorted(self._idx_message_queues.get(int(message_id), ()))
+
+    def get_user_panels(self, user_id: int) -> List[PanelRecord]:
+        """Painéis registrados com alguma fila em que o jogador está"""
+        message_ids = {self._message_id_from_queue(qid) for qid in self._idx_user_queues.get(user_id, ())}
+        panels = (self.panels.get(message_id) for message_id in sorted(message_ids - {None}))
+        return [panel for panel in panels if panel is not None]
+
     def delete_queue_metadata(self, message_id: int):
         """Remove metadados de uma fila"""
         data = self._load_data()
@@ -879,25 +1861,111 @@ class HybridDatabase:
         message_id_str = str(message_id)
         if message_id_str in data['queue_metadata']:
             del data['queue_metadata'][message_id_str]
-            self._save_data(data)
+            self._save_data(data, ('queue_metadata',), (message_id,))
             logger.info(f"🗑️ DB: Metadados da mensagem {message_id} removidos")
 
+    # ==================== REGISTRO DE PAINÉIS ====================
+
+    def get_panel(self, message_id: int) -> Optional[PanelRecord]:
+        """Registro do painel da mensagem (None se não for um painel conhecido)"""
+        return self.panels.get(message_id)
+
+    def find_panel(self, channel_id: int, mode: str) -> Optional[PanelRecord]:
+        """Painel não apagado do canal com o modo/tipo informado"""
+        return self.panels.find(channel_id, mode)
+
+    def get_panel_stats(self) -> dict:
+        """Quantidade de painéis por estado (live / missing / tombstoned)"""
+        return self.panels.counts()
+
+    def _set_panel_state(self, message_id: int, state: str):
+        metadata = self._data.get('queue_metadata', {}).get(str(message_id))
+        if metadata is None or metadata.get('state', PANEL_LIVE) == state:
+            return
+        if state == PANEL_LIVE:
+            metadata.pop('state', None)
+            metadata.pop('state_since', None)
+        else:
+            metadata['state'] = state
+            metadata['state_since'] = datetime.now().isoformat()
+        self._save_data(self._data, ('queue_metadata',), (message_id,))
+        logger.info(f"🪧 Painel {message_id}: {state}")
+
+    def touch_panel(self, message_id: int):
+        """Registra atividade no painel (um clique prova que a mensagem existe)"""
+        record = self.panels.get(message_id)
+        if record is None:
+            return
+        record.last_activity = time.time()
+        if record.state != PANEL_LIVE:
+            self._set_panel_state(message_id, PANEL_LIVE)
+
+    def mark_panel_verified(self, message_id: int, found: bool = True):
+        """Resultado de uma verificação: encontrada (volta a live) ou inconclusiva"""
+        record = self.panels.get(message_id)
+        if record is None:
+            return
+        record.last_verified = time.time()
+        if found and record.state != PANEL_LIVE:
+            self._set_panel_state(message_id, PANEL_LIVE)
+
+    def mark_panel_missing(self, message_id: int) -> Optional[str]:
+        """Mensagem não encontrada: live -> missing, missing -> tombstoned"""
+        record = self.panels.get(message_id)
+        if record is None:
+            return None
+        record.last_verified = time.time()
+        state = PANEL_TOMBSTONED if record.state != PANEL_LIVE else PANEL_MISSING
+        self._set_panel_state(message_id, state)
+        return state
+
+    def tombstone_panel(self, message_id: int):
+        """Mensagem do painel apagada: removido após o prazo de carência"""
+        if self.panels.get(message_id) is not None:
+            self._set_panel_state(message_id, PANEL_TOMBSTONED)
+
+    def get_panels_to_verify(self, max_idle_seconds: float, limit: int = 50,
+                             missing_recheck_seconds: float = 600) -> List[PanelRecord]:
+        """Painéis sem atividade há mais de `max_idle_seconds` (os mais antigos primeiro)"""
+        now = time.time()
+        return self.panels.due_for_verification(now - max_idle_seconds, now - missing_recheck_seconds, limit)
+
+    def compact_panels(self, grace_seconds: float) -> int:
+        """Remove painéis apagados há mais de `grace_seconds` (metadados + filas)"""
+        expired = self.panels.tombstoned_before(time.time() - grace_seconds)
+        if not expired:
+            return 0
+        data = self._load_data()
+        with self.transaction():
+            for record in expired:
+                queue_ids = self.get_queue_ids_for_message(record.message_id)
+                for queue_id in queue_ids:
+                    data['queues'].pop(queue_id, None)
+                    data.get('queue_timestamps', {}).pop(queue_id, None)
+                if queue_ids:
+                    self._save_data(data, ('queues', 'queue_timestamps'), tuple(queue_ids))
+                del data['queue_metadata'][str(record.message_id)]
+                self._save_data(data, ('queue_metadata',), (record.message_id,))
+        logger.info(f"🧹 {len(expired)} painel(is) apagado(s) removido(s) do registro")
+        return len(expired)
+
     def cleanup_orphaned_data(self):
         """Remove dados órfãos para economizar espaço"""
         data = self._load_data()
-        cleaned = False
+        # queue_ids removidos ou com timestamps aparados (só essas chaves são gravadas)
+        changed = set()
         
         if 'queues' in data:
             empty_queues = [qid for qid, queue in data['queues'].items() if not queue]
             for qid in empty_queues:
                 del data['queues'][qid]
-                cleaned = True
+                changed.add(qid)
         
         if 'queue_timestamps' in data and 'queues' in data:
             orphaned_timestamps = [qid for qid in data['queue_timestamps'].keys() if qid not in data['queues']]
             for qid in orphaned_timestamps:
                 del data['queue_timestamps'][qid]
-                cleaned = True
+                changed.add(qid)
         
         if 'queue_timestamps' in data and 'queues' in data:
             for qid in list(data['queue_timestamps'].keys()):
@@ -907,14 +1975,10 @@ class HybridDatabase:
                     orphaned_users = timestamp_users - queue_users
                     for user_id in orphaned_users:
                         del data['queue_timestamps'][qid][user_id]
-                        cleaned = True
+                        changed.add(qid)
         
-        if 'bet_history' in data and len(data['bet_history']) > 100:
-            data['bet_history'] = data['bet_history'][-100:]
-            cleaned = True
-        
-        if cleaned:
-            self._save_data(data)
+        if changed:
+            self._save_data(data, ('queues', 'queue_timestamps'), tuple(changed))
             return True
         return False
 
@@ -957,7 +2021,7 @@ class HybridDatabase:
         
         # Substitui a assinatura antiga pela nova de forma atômica
         data['subscriptions'][guild_id_str] = subscription
-        self._save_data(data)
+        self._save_data(data, ('subscriptions',), (guild_id,))
         
         logger.info(f"🔒 Transição de assinatura concluída sem desconexão para guild {guild_id}")
 
@@ -970,38 +2034,51 @@ class HybridDatabase:
 
     def is_subscription_active(self, guild_id: int) -> bool:
         """Verifica se um servidor tem assinatura ativa"""
-        subscription = self.get_subscription(guild_id)
-        if not subscription:
-            return False
-        
-        if subscription.get('permanent'):
-            return True
-        
-        expires_at = subscription.get('expires_at')
-        if not expires_at:
-            return False
-        
-        return datetime.fromisoformat(expires_at) > datetime.now()
+        return self._entitlements.get(int(guild_id), 0.0) > time.time()
+
+    def get_subscription_expiry(self, guild_id: int) -> Optional[float]:
+        """Epoch de expiração da assinatura (inf = permanente, None = sem assinatura)"""
+        return self._entitlements.get(int(guild_id))
 
     def get_all_subscriptions(self) -> dict:
         """Retorna todas as assinaturas"""
         data = self._load_data()
-        return data.get('subscriptions', {})
+        return dict(data.get('subscriptions', {}))
+
+    def _is_live_subscription_expiry(self, entry: tuple) -> bool:
+        """Entradas do heap ficam obsoletas quando a assinatura muda ou é removida"""
+        epoch, guild_id = entry
+        return self._entitlements.get(guild_id) == epoch
 
     def get_expired_subscriptions(self) -> List[int]:
         """Retorna lista de guild_ids com assinaturas expiradas"""
-        subscriptions = self.get_all_subscriptions()
-        expired = []
-        
-        for guild_id_str, sub in subscriptions.items():
-            if sub.get('permanent'):
-                continue
-            
-            expires_at = sub.get('expires_at')
-            if expires_at and datetime.fromisoformat(expires_at) <= datetime.now():
-                expired.append(int(guild_id_str))
-        
-        return expired
+        now = time.time()
+        due = {}
+        while self._subscription_heap and self._subscription_heap[0][0] <= now:
+            entry = heapq.heappop(self._subscription_heap)
+            if entry[0] > 0 and self._is_live_subscription_expiry(entry):
+                due[entry[1]] = entry
+        # Continuam no heap até a assinatura ser removida ou renovada
+        for entry in due.values():
+            heapq.heappush(self._subscription_heap, entry)
+        return list(due)
+
+    def get_next_subscription_expiry(self) -> Optional[float]:
+        """Epoch em que a próxima assinatura expira (None se nenhuma expira)"""
+        heap = self._subscription_heap
+        while heap and (heap[0][0] <= 0 or not self._is_live_subscription_expiry(heap[0])):
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    async def wait_subscription_change(self, timeout: float) -> bool:
+        """Aguarda uma assinatura ser criada/alterada/removida (ou o timeout)"""
+        try:
+            await asyncio.wait_for(self._subscriptions_changed.wait(), timeout)
+            changed = True
+        except asyncio.TimeoutError:
+            changed = False
+        self._subscriptions_changed.clear()
+        return changed
 
     def remove_subscription(self, guild_id: int):
         """Remove a assinatura de um servidor"""
@@ -1012,7 +2089,7 @@ class HybridDatabase:
         guild_id_str = str(guild_id)
         if guild_id_str in data['subscriptions']:
             del data['subscriptions'][guild_id_str]
-            self._save_data(data)
+            self._save_data(data, ('subscriptions',), (guild_id,))
             logger.info(f"🗑️ Assinatura removida para guild {guild_id}")
 
     # ==================== CENTRAL DE MEDIADORES ====================
@@ -1029,7 +2106,7 @@ class HybridDatabase:
             'mediators': {},  # {user_id: {'joined_at': timestamp, 'pix': pix_key}}
             'created_at': datetime.now().isoformat()
         }
-        self._save_data(data)
+        self._save_data(data, ('mediator_central',), (guild_id,))
         logger.info(f"💾 Central de mediadores configurado para guild {guild_id}")
 
     def get_mediator_central_config(self, guild_id: int) -> Optional[dict]:
@@ -1058,7 +2135,7 @@ class HybridDatabase:
             'pix': pix_key
         }
         data['mediator_central'][guild_str]['mediators'] = mediators
-        self._save_data(data)
+        self._save_data(data, ('mediator_central',), (guild_id,))
         logger.info(f"✅ Mediador {user_id} adicionado ao central do guild {guild_id}")
         return True
 
@@ -1078,7 +2155,7 @@ class HybridDatabase:
         if user_str in mediators:
             del mediators[user_str]
             data['mediator_central'][guild_str]['mediators'] = mediators
-            self._save_data(data)
+            self._save_data(data, ('mediator_central',), (guild_id,))
             logger.info(f"🗑️ Mediador {user_id} removido do central do guild {guild_id}")
 
     def get_mediators_in_central(self, guild_id: int) -> dict:
@@ -1091,24 +2168,20 @@ class HybridDatabase:
         if guild_str not in data['mediator_central']:
             return {}
         
-        return data['mediator_central'][guild_str].get('mediators', {})
+        mediators = data['mediator_central'][guild_str].get('mediators', {})
+        # Na ordem de atendimento (FIFO do índice); entradas sem data válida no fim
+        ordered = {str(user_id): mediators[str(user_id)] for user_id in self.central.members(guild_id)}
+        for user_id_str, entry in mediators.items():
+            ordered.setdefault(user_id_str, entry)
+        return ordered
 
     def get_first_mediator_from_central(self, guild_id: int) -> Optional[tuple]:
         """Retorna o primeiro mediador da fila (mais antigo) do central (user_id, pix_key) ou None se vazio"""
-        mediators = self.get_mediators_in_central(guild_id)
-        
-        if not mediators:
+        user_id = self.central.first(guild_id)
+        if user_id is None:
             return None
-        
-        # Ordena por joined_at para pegar o primeiro (mais antigo)
-        sorted_mediators = sorted(
-            mediators.items(),
-            key=lambda x: x[1]['joined_at']
-        )
-        
-        user_id_str, data = sorted_mediators[0]
-        pix_key = data['pix']
-        return (int(user_id_str), pix_key)
+        entry = self._data['mediator_central'][str(guild_id)]['mediators'][str(user_id)]
+        return (user_id, entry['pix'])
 
     def add_mediator_to_end_of_central(self, guild_id: int, user_id: int, pix_key: str) -> bool:
         """Adiciona mediador ao FINAL da fila do central (novo timestamp). Retorna False se central está cheio"""
@@ -1132,29 +2205,32 @@ class HybridDatabase:
             'pix': pix_key
         }
         data['mediator_central'][guild_str]['mediators'] = mediators
-        self._save_data(data)
+        self._save_data(data, ('mediator_central',), (guild_id,))
         logger.info(f"✅ Mediador {user_id} adicionado ao FINAL da fila do central do guild {guild_id}")
         return True
 
     def get_expired_mediators_in_central(self, guild_id: int, timeout_hours: int = 2) -> List[int]:
         """Retorna lista de mediadores que estão há mais de X horas no central"""
-        mediators = self.get_mediators_in_central(guild_id)
-        expired = []
-        current_time = datetime.now()
-        
-        for user_id_str, data in mediators.items():
-            joined_at = datetime.fromisoformat(data['joined_at'])
-            hours_waiting = (current_time - joined_at).total_seconds() / 3600
-            
-            if hours_waiting >= timeout_hours:
-                expired.append(int(user_id_str))
-        
-        return expired
+        cutoff = time.time() - timeout_hours * 3600
+        return [user_id for user_id in self.central.members(guild_id)
+                if self.central.joined_epoch(guild_id, user_id) <= cutoff]
+
+    def get_expired_mediators(self, timeout_hours: int = 2) -> Dict[int, List[int]]:
+        """Mediadores há mais de X horas no central, por servidor (só servidores com vencidos)"""
+        return self.central.expired(time.time() - timeout_hours * 3600)
+
+    def get_next_mediator_expiry(self, timeout_hours: int = 2) -> Optional[float]:
+        """Epoch em que o próximo mediador expira (None se os centrais estão vazios)"""
+        joined = self.central.next_entry()
+        return None if joined is None else joined + timeout_hours * 3600
+
+    def get_mediator_central_guilds(self) -> List[int]:
+        """Servidores com central de mediadores configurado"""
+        return list(self.central.configured)
 
     def is_mediator_in_central(self, guild_id: int, user_id: int) -> bool:
         """Verifica se um mediador está no central"""
-        mediators = self.get_mediators_in_central(guild_id)
-        return str(user_id) in mediators
+        return self.central.contains(guild_id, user_id)
 
     def save_mediator_pix(self, user_id: int, pix_key: str):
         """Salva a chave PIX de um mediador (global, para próximas vezes)"""
@@ -1163,7 +2239,7 @@ class HybridDatabase:
             data['mediator_pix_keys'] = {}
         
         data['mediator_pix_keys'][str(user_id)] = pix_key
-        self._save_data(data)
+        self._save_data(data, ('mediator_pix_keys',), (user_id,))
         logger.info(f"💾 PIX salvo para mediador {user_id}")
 
     def get_mediator_pix(self, user_id: int) -> Optional[str]:
@@ -1173,8 +2249,7 @@ class HybridDatabase:
 
     def is_mediator_central_configured(self, guild_id: int) -> bool:
         """Verifica se o central de mediadores está configurado para o servidor"""
-        config = self.get_mediator_central_config(guild_id)
-        return config is not None
+        return guild_id in self.central.configured
 
     def delete_mediator_central_config(self, guild_id: int):
         """Remove a configuração do central de mediadores"""
@@ -1183,7 +2258,7 @@ class HybridDatabase:
         
         if 'mediator_central' in data and guild_str in data['mediator_central']:
             del data['mediator_central'][guild_str]
-            self._save_data(data)
+            self._save_data(data, ('mediator_central',), (guild_id,))
             logger.info(f"🗑️ Central de mediadores removido do guild {guild_id}")
 
 
@@ -0,0 +1,204 @@
+"""
+Histórico de apostas (ledger) - StormBet Apostas
+Apostas finalizadas ficam fora do estado em memória, em segmentos
+JSONL append-only, com índices por servidor, jogador e aposta.
+A ordem de append é a ordem de finalização, então as páginas saem
+das mais recentes para as mais antigas sem ordenar nada.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger('bot')
+
+
+def entry_player_ids(entry: dict) -> List[int]:
+    """Todos os jogadores de uma aposta (1v1 e times)"""
+    players = [entry.get('player1_id'), entry.get('player2_id')]
+    players.extend(entry.get('team1_ids') or [])
+    players.extend(entry.get('team2_ids') or [])
+    seen = []
+    for user_id in players:
+        if user_id is not None and int(user_id) not in seen:
+            seen.append(int(user_id))
+    return seen
+
+
+class BetHistoryLedger:
+    """
+    Histórico append-only em segmentos (`segment-000001.jsonl`, ...)
+
+    Em memória ficam apenas as posições de cada entrada (segmento,
+    offset, tamanho); uma página lê só as linhas que vai exibir.
+    """
+
+    def __init__(self, history_dir: str, segment_size: int = 5000):
+        self.history_dir = history_dir
+        self.segment_size = segment_size
+        self._lock = threading.Lock()
+        self._locations = []   # posição -> (segmento, offset, tamanho, guild_id)
+        self._by_guild = {}    # guild_id -> [posições]
+        self._by_player = {}   # user_id -> [posições]
+        self._by_bet = {}      # bet_id -> posição
+        self._segment = 1
+        self._segment_count = 0
+        self._handle = None
+        os.makedirs(self.history_dir, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.history_dir, f"segment-{segment:06d}.jsonl")
+
+    def _segments(self) -> List[int]:
+        segments = []
+        for name in os.listdir(self.history_dir):
+            if name.startswith("segment-") and name.endswith(".jsonl"):
+                try:
+                    segments.append(int(name[8:-6]))
+                except ValueError:
+                    continue
+        return sorted(segments)
+
+    # ==================== CARGA ====================
+
+    def _load(self):
+        """Reconstrói os índices lendo os segmentos existentes"""
+        segments = self._segments()
+        for segment in segments:
+            path = self._segment_path(segment)
+            count = 0
+            with open(path, 'rb') as f:
+                offset = 0
+                for raw in f:
+                    if not raw.endswith(b'\n'):
+                        # Última linha incompleta (crash durante o append)
+                        logger.warning(f"⚠️ Histórico: linha incompleta descartada em {path}")
+                        break
+                    try:
+                        self._index(json.loads(raw), segment, offset, len(raw))
+                        count += 1
+                    except (json.JSONDecodeError, TypeError, ValueError):
+                        logger.warning(f"⚠️ Histórico: linha inválida ignorada em {path}")
+                    offset += len(raw)
+            if offset != os.path.getsize(path):
+                with open(path, 'r+b') as f:
+                    f.truncate(offset)
+            self._segment, self._segment_count = segment, count
+
+        if segments:
+            logger.info(f"📚 Histórico carregado: {len(self._locations)} apostas em {len(segments)} segmentos")
+
+    def _index(self, entry: dict, segment: int, offset: int, length: int):
+        position = len(self._locations)
+        guild_id = entry.get('guild_id')
+        guild_id = int(guild_id) if guild_id is not None else None
+        self._locations.append((segment, offset, length, guild_id))
+        self._by_guild.setdefault(guild_id, []).append(position)
+        for user_id in entry_player_ids(entry):
+            self._by_player.setdefault(user_id, []).append(position)
+        if entry.get('bet_id'):
+            self._by_bet[entry['bet_id']] = position
+
+    # ==================== ESCRITA ====================
+
+    def append(self, entry: dict):
+        """Acrescenta uma aposta finalizada ao segmento atual"""
+        line = (json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._lock:
+            if self._segment_count >= self.segment_size:
+                self._close_handle()
+                self._segment += 1
+                self._segment_count = 0
+            if self._handle is None:
+                self._handle = open(self._segment_path(self._segment), 'ab')
+            offset = self._handle.tell()
+            self._handle.write(line)
+            self._handle.flush()
+            self._segment_count += 1
+            self._index(entry, self._segment, offset, len(line))
+
+    def sync(self):
+        """Garante no disco tudo o que foi acrescentado (chamado no flush)"""
+        with self._lock:
+            if self._handle is not None:
+                os.fsync(self._handle.fileno())
+
+    def close(self):
+        with self._lock:
+            self._close_handle()
+
+    def _close_handle(self):
+        if self._handle is not None:
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+            self._handle.close()
+            self._handle = None
+
+    # ==================== LEITURA ====================
+
+    def _read(self, positions: Iterable[int]) -> List[dict]:
+        entries = []
+        handles = {}
+        try:
+            with self._lock:
+                if self._handle is not None:
+                    self._handle.flush()
+                locations = [self._locations[position] for position in positions]
+            for segment, offset, length, _ in locations:
+                f = handles.get(segment)
+                if f is None:
+                    f = handles[segment] = open(self._segment_path(segment), 'rb')
+                f.seek(offset)
+                entries.append(json.loads(f.read(length)))
+        finally:
+            for f in handles.values():
+                f.close()
+        return entries
+
+    def page(self, guild_id: Optional[int] = None, player_id: Optional[int] = None,
+             offset: int = 0, limit: int = 10) -> Tuple[List[dict], int]:
+        """Retorna uma página (mais recentes primeiro) e o total de entradas do filtro"""
+        if player_id is not None:
+            positions = self._by_player.get(int(player_id), [])
+            if guild_id is not None:
+                positions = [p for p in positions if self._locations[p][3] == int(guild_id)]
+        elif guild_id is not None:
+            positions = self._by_guild.get(int(guild_id), [])
+        else:
+            positions = range(len(self._locations))
+
+        total = len(positions)
+        end = max(total - offset, 0)
+        start = max(end - limit, 0)
+        return self._read(reversed(positions[start:end])), total
+
+    def get_entries(self, bet_ids: Set[str]) -> List[dict]:
+        """Entradas pelo bet_id (usado para retentar a gravação no PostgreSQL)"""
+        positions = sorted(self._by_bet[bet_id] for bet_id in bet_ids if bet_id in self._by_bet)
+        return self._read(positions)
+
+    def contains(self, bet_id: str) -> bool:
+        return bet_id in self._by_bet
+
+    def all_entries(self) -> List[dict]:
+        """Histórico completo, do mais antigo ao mais recente"""
+        return self._read(range(len(self._locations)))
+
+    def import_entries(self, entries: List[dict]) -> int:
+        """Importa o histórico antigo (lista `bet_history` do estado), sem duplicar"""
+        imported = 0
+        for entry in entries:
+            if not isinstance(entry, dict) or self.contains(entry.get('bet_id')):
+                continue
+            self.append(entry)
+            imported += 1
+        if imported:
+            self.sync()
+            logger.info(f"📚 {imported} apostas antigas importadas para o histórico")
+        return imported
@@ -0,0 +1,258 @@
+"""
+Journal append-only + snapshots por seção - StormBet Apostas
+Cada flush grava UMA linha JSON compacta com as chaves alteradas
+(write-ahead log). Periodicamente as seções alteradas são regravadas,
+cada uma no seu próprio arquivo binário compacto, e o log é truncado.
+Recuperação = arquivos de seção + replay do log.
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional, Set
+
+from utils.binary_snapshot import BinarySnapshot, write_binary_snapshot
+
+logger = logging.getLogger('bot')
+
+
+class StateJournal:
+    """
+    Write-ahead log do estado em memória
+
+    Operações registradas (cada uma idempotente, exceto `append`, que é
+    protegida pelo número de sequência):
+    - ["set", seção, chave, valor]
+    - ["del", seção, chave]
+    - ["put", seção, valor]          (seção inteira)
+    - ["append", seção, [entradas]]  (bet_history antigo)
+
+    Cada seção vive em `state/<seção>.bin` (utils/binary_snapshot.py, lido
+    via mmap) com o `seq` do journal até o
+    qual ela está gravada e um contador `version` próprio. Uma entrada do
+    journal só é reaplicada nas seções cujo arquivo é anterior a ela, então
+    a compactação regrava apenas as seções que mudaram: um clique em fila
+    não regrava assinaturas, chaves PIX ou configurações.
+    """
+
+    def __init__(self, data_dir: str, max_bytes: int = 1_000_000, snapshot_interval: float = 300):
+        self.sections_dir = os.path.join(data_dir, "state")
+        self.journal_file = os.path.join(data_dir, "state.journal.jsonl")
+        # Snapshot único das versões anteriores (importado na recuperação)
+        self.legacy_snapshot_file = os.path.join(data_dir, "state.snapshot.json")
+        self.max_bytes = max_bytes
+        self.snapshot_interval = snapshot_interval
+        self.seq = 0
+        self.last_snapshot_at = time.time()
+        self.section_versions = {}  # seção -> versão (incrementada a cada mutação)
+        self._persisted_versions = {}  # seção -> versão gravada no arquivo da seção
+        self._journal_bytes = 0
+
+    def _section_path(self, section: str) -> str:
+        return os.path.join(self.sections_dir, f"{section}.bin")
+
+    def _section_files(self, extension: str = ".bin") -> Dict[str, str]:
+        if not os.path.isdir(self.sections_dir):
+            return {}
+        return {
+            name[:-len(extension)]: os.path.join(self.sections_dir, name)
+            for name in os.listdir(self.sections_dir)
+            if name.endswith(extension)
+        }
+
+    def _legacy_section_files(self) -> Dict[str, str]:
+        """Seções ainda em JSON (versão anterior), convertidas na próxima compactação"""
+        return self._section_files(".json")
+
+    def exists(self) -> bool:
+        return (
+            bool(self._section_files())
+            or bool(self._legacy_section_files())
+            or os.path.exists(self.legacy_snapshot_file)
+            or os.path.exists(self.journal_file)
+        )
+
+    # ==================== RECUPERAÇÃO ====================
+
+    def recover(self) -> Optional[dict]:
+        """Reconstrói o estado: arquivos de seção + replay das entradas posteriores"""
+        if not self.exists():
+            return None
+
+        data, section_seqs, base_seq = {}, {}, 0
+        if os.path.exists(self.legacy_snapshot_file):
+            with open(self.legacy_snapshot_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            base_seq = snapshot.get('seq', 0)
+            for section, value in snapshot.get('data', {}).items():
+                data[section] = value
+                section_seqs[section] = base_seq
+            self.last_snapshot_at = snapshot.get('ts', time.time())
+
+        for section, path in self._legacy_section_files().items():
+            with open(path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get('seq', 0) < section_seqs.get(section, 0):
+                continue
+            data[section] = stored.get('data')
+            section_seqs[section] = stored.get('seq', 0)
+            self.section_versions[section] = stored.get('version', 0)
+
+        for section, path in self._section_files().items():
+            with BinarySnapshot(path) as snapshot:
+                meta = snapshot.meta
+                if meta.get('seq', 0) < section_seqs.get(section, 0):
+                    continue
+                data[section] = snapshot.section(section)
+            section_seqs[section] = meta.get('seq', 0)
+            self.section_versions[section] = self._persisted_versions[section] = meta.get('version', 0)
+            self.last_snapshot_at = max(self.last_snapshot_at, meta.get('ts', 0))
+        self.seq = max(section_seqs.values(), default=0)
+
+        replayed = 0
+        if os.path.exists(self.journal_file):
+            offset, torn_tail, unterminated = 0, None, False
+            with open(self.journal_file, 'rb') as f:
+                for line_number, raw in enumerate(f, start=1):
+                    start, offset = offset, offset + len(raw)
+                    line = raw.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Última linha parcialmente escrita (crash durante o append)
+                        logger.warning(f"⚠️ Journal: linha {line_number} inválida ignorada")
+                        if not raw.endswith(b'\n'):
+                            torn_tail = start
+                        continue
+                    unterminated = not raw.endswith(b'\n')
+                    seq = record.get('seq', 0)
+                    ops = [op for op in record.get('ops', []) if seq > section_seqs.get(op[1], 0)]
+                    if ops:
+                        self._replay(data, ops)
+                        self._bump_versions(ops)
+                        replayed += 1
+                    self.seq = max(self.seq, seq)
+            if torn_tail is not None:
+                # O próximo append emendaria na linha quebrada e se perderia junto
+                with open(self.journal_file, 'r+b') as f:
+                    f.truncate(torn_tail)
+            elif unterminated:
+                with open(self.journal_file, 'ab') as f:
+                    f.write(b'\n')
+            self._journal_bytes = os.path.getsize(self.journal_file)
+
+        logger.info(f"📓 Estado recuperado: {len(section_seqs)} seções + {replayed} entradas do journal")
+        return data
+
+    @staticmethod
+    def _replay(data: dict, ops: list):
+        for op in ops:
+            kind, section = op[0], op[1]
+            if kind == 'set':
+                data.setdefault(section, {})[op[2]] = op[3]
+            elif kind == 'del':
+                data.get(section, {}).pop(op[2], None)
+            elif kind == 'put':
+                data[section] = op[2]
+            elif kind == 'append':
+                data.setdefault(section, []).extend(op[2])
+
+    def _bump_versions(self, ops: list):
+        for section in {op[1] for op in ops}:
+            self.section_versions[section] = self.section_versions.get(section, 0) + 1
+
+    # ==================== ESCRITA ====================
+
+    @staticmethod
+    def build_ops(data: dict, dirty: Dict[str, Optional[Set[str]]]) -> list:
+        """Converte o mapa de chaves sujas em operações de redo"""
+        ops = []
+        for section, keys in dirty.items():
+            value = data.get(section)
+            if keys is None or value is None:
+                ops.append(['put', section, value])
+            elif isinstance(value, list):
+                ops.append(['append', section, [entry for entry in value if entry.get('bet_id') in keys]])
+            else:
+                for key in keys:
+                    if key in value:
+                        ops.append(['set', section, key, value[key]])
+                    else:
+                        ops.append(['del', section, key])
+        return ops
+
+    def append(self, data: dict, dirty: Dict[str, Optional[Set[str]]]):
+        """Acrescenta uma linha ao journal e compacta se necessário"""
+        ops = self.build_ops(data, dirty)
+        if ops:
+            self.seq += 1
+            line = json.dumps({'seq': self.seq, 'ts': time.time(), 'ops': ops},
+                              ensure_ascii=False, separators=(',', ':')) + '\n'
+            encoded = line.encode('utf-8')
+            with open(self.journal_file, 'ab') as f:
+                f.write(encoded)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_bytes += len(encoded)
+            self._bump_versions(ops)
+
+        if self._compaction_due():
+            self.compact(data)
+
+    def _compaction_due(self) -> bool:
+        return (
+            self._journal_bytes >= self.max_bytes
+            or (self._journal_bytes > 0 and time.time() - self.last_snapshot_at >= self.snapshot_interval)
+        )
+
+    def changed_sections(self, data: dict) -> list:
+        """Seções cuja versão em memória é mais nova que a do arquivo"""
+        files = self._section_files()
+        return [
+            section for section in data
+            if section not in files
+            or self.section_versions.get(section, 0) != self._persisted_versions.get(section)
+        ]
+
+    def compact(self, data: dict, full: bool = False):
+        """Regrava (atômico) as seções alteradas e trunca o journal
+
+        `full=True` regrava todas as seções, por exemplo quando o estado
+        veio de outro backend e os arquivos locais podem estar defasados.
+        """
+        os.makedirs(self.sections_dir, exist_ok=True)
+        now = time.time()
+        sections = list(data) if full else self.changed_sections(data)
+        for section in sections:
+            if full:
+                self.section_versions[section] = self.section_versions.get(section, 0) + 1
+            version = self.section_versions.setdefault(section, 0)
+            self._write_section(section, {'seq': self.seq, 'version': version, 'ts': now, 'data': data[section]})
+            self._persisted_versions[section] = version
+
+        # Seções que saíram do estado (ex.: bet_history migrado) não voltam na recuperação
+        for section, path in self._section_files().items():
+            if section not in data:
+                os.remove(path)
+                self._persisted_versions.pop(section, None)
+        # Seções em JSON já foram regravadas em binário (não constam em _section_files)
+        for path in self._legacy_section_files().values():
+            os.remove(path)
+        if os.path.exists(self.legacy_snapshot_file):
+            os.remove(self.legacy_snapshot_file)
+
+        # Entradas já incluídas nas seções (seq <= seção) seriam ignoradas
+        # no replay mesmo se o truncamento não acontecer
+        with open(self.journal_file, 'wb') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_bytes = 0
+        self.last_snapshot_at = now
+        logger.info(f"📓 Snapshot por seção gravado (seq={self.seq}, {len(sections)} seções regravadas), journal truncado")
+
+    def _write_section(self, section: str, payload: dict):
+        meta = {key: value for key, value in payload.items() if key != 'data'}
+        write_binary_snapshot(self._section_path(section), {section: payload['data']}, meta=meta)
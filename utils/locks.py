@@ -0,0 +1,167 @@
+"""
+Locks de fila - StormBet Apostas
+Serializam entradas/saídas e o matchmaking de uma fila. O provedor em
+processo (asyncio.Lock) basta para uma instância; com várias instâncias
+no mesmo PostgreSQL, o provedor de advisory locks garante que só uma
+delas mexe na fila por vez.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger('bot')
+
+
+class LockTimeout(Exception):
+    """O lock não foi obtido dentro do tempo limite"""
+
+    def __init__(self, name: str, timeout: float):
+        super().__init__(f"Lock '{name}' não obtido em {timeout:.1f}s")
+        self.name = name
+        self.timeout = timeout
+
+
+class LockStats:
+    """Métricas de espera por lock (para o /health)"""
+
+    def __init__(self):
+        self.acquired = 0
+        self.timeouts = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, waited: float, acquired: bool):
+        if acquired:
+            self.acquired += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            if waited >= 0.001:
+                self.contended += 1
+        else:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        return {
+            'acquired': self.acquired,
+            'contended': self.contended,
+            'timeouts': self.timeouts,
+            'avg_wait_ms': round(self.total_wait / self.acquired * 1000, 2) if self.acquired else 0.0,
+            'max_wait_ms': round(self.max_wait * 1000, 2),
+        }
+
+
+class LocalLockProvider:
+    """asyncio.Lock por nome, válido só dentro deste processo"""
+
+    kind = "local"
+
+    def __init__(self, timeout: Optional[float] = None, stats: Optional[LockStats] = None):
+        self.timeout = timeout
+        self.stats = stats or LockStats()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _get(self, name: str) -> asyncio.Lock:
+        # Sem await entre a consulta e a criação: não há corrida no event loop
+        lock = self._locks.get(name)
+        if lock is None:
+            lock = self._locks[name] = asyncio.Lock()
+        return lock
+
+    async def _acquire_local(self, name: str, timeout: Optional[float], started: float) -> asyncio.Lock:
+        lock = self._get(name)
+        try:
+            await asyncio.wait_for(lock.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.stats.record(time.monotonic() - started, acquired=False)
+            raise LockTimeout(name, timeout)
+        return lock
+
+    @contextlib.asynccontextmanager
+    async def lock(self, name: str, timeout: Optional[float] = None):
+        """`async with provider.lock(queue_id) as conn:` — LockTimeout se demorar demais
+
+        `conn` é a conexão que segura o advisory lock (None no provedor local).
+        """
+        started = time.monotonic()
+        lock = await self._acquire_local(name, self.timeout if timeout is None else timeout, started)
+        self.stats.record(time.monotonic() - started, acquired=True)
+        try:
+            yield None
+        finally:
+            lock.release()
+
+    def status(self) -> dict:
+        return {'provider': self.kind, **self.stats.snapshot()}
+
+
+def advisory_key(name: str) -> int:
+    """Chave bigint (com sinal) estável para pg_advisory_lock a partir do nome"""
+    digest = hashlib.blake2b(f"stormbet:{name}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class PostgresAdvisoryLockProvider(LocalLockProvider):
+    """
+    Advisory lock de sessão do PostgreSQL (pool asyncpg), por hash do nome
+
+    Dentro do processo a disputa continua no asyncio.Lock, então cada
+    instância segura no máximo uma conexão por fila. O advisory lock é
+    tentado com pg_try_advisory_lock até o tempo limite, sem prender a
+    conexão em espera no servidor. A conexão é entregue a quem pegou o
+    lock, para reler e gravar a fila nela antes de soltá-lo (sem pegar uma
+    segunda conexão do pool).
+    """
+
+    kind = "postgres"
+    RETRY_INTERVAL = 0.05
+
+    def __init__(self, pool, timeout: Optional[float] = None, stats: Optional[LockStats] = None):
+        super().__init__(timeout, stats)
+        self.pool = pool
+
+    @contextlib.asynccontextmanager
+    async def lock(self, name: str, timeout: Optional[float] = None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        local = await self._acquire_local(name, timeout, started)
+        try:
+            key = advisory_key(name)
+            async with self.pool.acquire() as conn:
+                while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", key):
+                    if deadline is not None and time.monotonic() >= deadline:
+                        self.stats.record(time.monotonic() - started, acquired=False)
+                        raise LockTimeout(name, timeout)
+                    await asyncio.sleep(self.RETRY_INTERVAL)
+                self.stats.record(time.monotonic() - started, acquired=True)
+                try:
+                    yield conn
+                finally:
+                    await conn.fetchval("SELECT pg_advisory_unlock($1)", key)
+        finally:
+            local.release()
+
+
+def create_lock_provider(db) -> LocalLockProvider:
+    """Escolhe o provedor pelo QUEUE_LOCK_PROVIDER (auto | local | postgres)
+
+    `auto` usa advisory locks quando há um pool asyncpg conectado.
+    QUEUE_LOCK_TIMEOUT (segundos, padrão 10) limita a espera.
+    """
+    choice = os.getenv("QUEUE_LOCK_PROVIDER", "auto").lower()
+    timeout = float(os.getenv("QUEUE_LOCK_TIMEOUT", "10")) or None
+    store = getattr(getattr(db, 'core', db), 'async_store', None)
+
+    if choice in ("auto", "postgres") and store is not None:
+        logger.info("🔒 Locks de fila: advisory locks do PostgreSQL (válidos entre instâncias)")
+        return PostgresAdvisoryLockProvider(store.pool, timeout)
+    if choice == "postgres":
+        logger.warning("⚠️ QUEUE_LOCK_PROVIDER=postgres sem pool asyncpg conectado, usando locks locais")
+    logger.info("🔒 Locks de fila: em processo")
+    return LocalLockProvider(timeout)
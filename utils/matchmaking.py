@@ -0,0 +1,207 @@
+"""
+Matchmaking - StormBet Apostas
+Uma tabela de modos (ModeSpec) e as operações de fila de todos os
+painéis: entrar, sair e montar a partida. Trabalha direto sobre as seções
+`queues`/`queue_timestamps` do estado, sem I/O; o banco aplica cada
+operação e grava tudo de uma vez (ver HybridDatabase.join_queue).
+
+Layout das filas (compatível com os painéis antigos):
+- 1v1: uma fila `{modo}_{message_id}`
+- times: `{modo}_{message_id}_team1` e `{modo}_{message_id}_team2`
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+# Resultado de uma operação de fila
+JOINED = "joined"
+LEFT = "left"
+ALREADY_QUEUED = "already_queued"
+NOT_QUEUED = "not_queued"
+TEAM_FULL = "team_full"
+IN_ACTIVE_BET = "in_active_bet"
+
+
+@dataclass(slots=True, frozen=True)
+class ModeSpec:
+    """Um modo de jogo: tamanho do time e rótulos do painel"""
+    mode: str          # '2v2-mob'
+    team_size: int
+    label: str         # '2v2 MOB'
+    emoji: str         # '📱' / '💻'
+
+    @property
+    def family(self) -> str:
+        """Painel unificado do modo ('2v2' para '2v2-mob')"""
+        return self.mode.split('-', 1)[0]
+
+    @property
+    def has_teams(self) -> bool:
+        return self.team_size > 1
+
+    @property
+    def total_players(self) -> int:
+        return self.team_size * 2
+
+    def queue_ids(self, message_id: int) -> Tuple[str, ...]:
+        base = f"{self.mode}_{message_id}"
+        if self.has_teams:
+            return f"{base}_team1", f"{base}_team2"
+        return (base,)
+
+
+MODE_SPECS: Dict[str, ModeSpec] = {
+    spec.mode: spec for spec in (
+        ModeSpec("1v1-mob", 1, "1v1 MOB", "📱"),
+        ModeSpec("1v1-misto", 1, "1v1 MISTO", "💻"),
+        ModeSpec("2v2-mob", 2, "2v2 MOB", "📱"),
+        ModeSpec("2v2-misto", 2, "2v2 MISTO", "💻"),
+        ModeSpec("3v3-mob", 3, "3v3 MOB", "📱"),
+        ModeSpec("3v3-misto", 3, "3v3 MISTO", "💻"),
+        ModeSpec("4v4-mob", 4, "4v4 MOB", "📱"),
+        ModeSpec("4v4-misto", 4, "4v4 MISTO", "💻"),
+    )
+}
+
+# Painéis unificados: tipo do painel -> modos (na ordem dos botões)
+PANEL_FAMILIES: Dict[str, Tuple[str, ...]] = {
+    family: tuple(spec.mode for spec in MODE_SPECS.values() if spec.family == family)
+    for family in ("1v1", "2v2", "3v3", "4v4")
+}
+
+
+def get_mode_spec(mode: str) -> ModeSpec:
+    """ModeSpec do modo; modos fora da tabela usam o prefixo ('3v3...') ou 1v1"""
+    spec = MODE_SPECS.get(mode)
+    if spec is None:
+        team_size = int(mode[0]) if len(mode) >= 3 and mode[0].isdigit() and mode[1] == 'v' else 1
+        spec = ModeSpec(mode, team_size, mode.replace('-', ' ').title(), "")
+    return spec
+
+
+@dataclass(slots=True)
+class Match:
+    """Partida montada: jogadores já retirados da fila"""
+    mode: str
+    team1: List[int]
+    team2: List[int]
+
+    @property
+    def players(self) -> List[int]:
+        return self.team1 + self.team2
+
+
+@dataclass(slots=True)
+class PanelState:
+    """Filas de um painel: modo -> times (uma lista só no 1v1)"""
+    message_id: int
+    slots: Dict[str, Tuple[List[int], ...]] = field(default_factory=dict)
+
+    def teams(self, mode: str) -> Tuple[List[int], ...]:
+        teams = self.slots.get(mode)
+        if teams is None:
+            teams = tuple([] for _ in get_mode_spec(mode).queue_ids(self.message_id))
+        return teams
+
+    def players(self, mode: str) -> List[int]:
+        return [user_id for team in self.teams(mode) for user_id in team]
+
+
+@dataclass(slots=True)
+class QueueResult:
+    status: str
+    state: PanelState
+    match: Optional[Match] = None
+
+
+class Matchmaker:
+    """
+    Operações de fila sobre as seções do estado
+
+    Cada operação devolve o conjunto de queue_ids alterados, para o banco
+    marcar só essas chaves como sujas.
+    """
+
+    def __init__(self, queues: dict, timestamps: dict):
+        self.queues = queues
+        self.timestamps = timestamps
+
+    def state(self, message_id: int, modes: Tuple[str, ...]) -> PanelState:
+        return PanelState(message_id, {
+            mode: tuple(list(self.queues.get(qid, ())) for qid in get_mode_spec(mode).queue_ids(message_id))
+            for mode in modes
+        })
+
+    def _find(self, message_id: int, modes: Tuple[str, ...], user_id: int) -> Optional[str]:
+        for mode in modes:
+            for qid in get_mode_spec(mode).queue_ids(message_id):
+                if user_id in self.queues.get(qid, ()):
+                    return qid
+        return None
+
+    def _append(self, qid: str, user_id: int):
+        self.queues.setdefault(qid, []).append(user_id)
+        self.timestamps.setdefault(qid, {})[str(user_id)] = datetime.now().isoformat()
+
+    def _remove(self, qid: str, user_ids: List[int]):
+        queue = self.queues.get(qid, [])
+        timestamps = self.timestamps.get(qid, {})
+        for user_id in user_ids:
+            if user_id in queue:
+                queue.remove(user_id)
+            timestamps.pop(str(user_id), None)
+
+    def join(self, spec: ModeSpec, message_id: int, user_id: int, team: Optional[int] = None,
+             scope: Tuple[str, ...] = ()) -> Tuple[str, Set[str]]:
+        """Entra na fila (ou no time) do modo; `scope` = modos do mesmo painel"""
+        if self._find(message_id, scope or (spec.mode,), user_id):
+            return ALREADY_QUEUED, set()
+        qids = spec.queue_ids(message_id)
+        qid = qids[(team or 1) - 1] if spec.has_teams else qids[0]
+        if spec.has_teams and len(self.queues.get(qid, ())) >= spec.team_size:
+            return TEAM_FULL, set()
+        self._append(qid, user_id)
+        return JOINED, {qid}
+
+    def leave(self, message_id: int, modes: Tuple[str, ...], user_id: int) -> Tuple[str, Set[str]]:
+        """Sai de qualquer fila do painel"""
+        changed = set()
+        for mode in modes:
+            for qid in get_mode_spec(mode).queue_ids(message_id):
+                if user_id in self.queues.get(qid, ()):
+                    self._remove(qid, [user_id])
+                    changed.add(qid)
+        return (LEFT if changed else NOT_QUEUED), changed
+
+    def pop_match(self, spec: ModeSpec, message_id: int) -> Tuple[Optional[Match], Set[str]]:
+        """Retira os jogadores de uma partida, se a fila do modo completou"""
+        qids = spec.queue_ids(message_id)
+        if spec.has_teams:
+            team1, team2 = (self.queues.get(qid, []) for qid in qids)
+            if len(team1) < spec.team_size or len(team2) < spec.team_size:
+                return None, set()
+            match = Match(spec.mode, team1[:spec.team_size], team2[:spec.team_size])
+            self._remove(qids[0], match.team1)
+            self._remove(qids[1], match.team2)
+        else:
+            queue = self.queues.get(qids[0], [])
+            if len(queue) < 2:
+                return None, set()
+            match = Match(spec.mode, queue[:1], queue[1:2])
+            self._remove(qids[0], match.players)
+        return match, set(qids)
+
+    def requeue(self, match: Match, message_id: int) -> Set[str]:
+        """Devolve os jogadores de uma partida que não pôde ser criada (no início da fila)"""
+        spec = get_mode_spec(match.mode)
+        qids = spec.queue_ids(message_id)
+        teams = (match.team1, match.team2) if spec.has_teams else (match.players,)
+        for qid, players in zip(qids, teams):
+            queue = self.queues.setdefault(qid, [])
+            returning = [user_id for user_id in players if user_id not in queue]
+            queue[:0] = returning
+            now = datetime.now().isoformat()
+            for user_id in returning:
+                self.timestamps.setdefault(qid, {})[str(user_id)] = now
+        return set(qids)
@@ -0,0 +1,105 @@
+"""
+Índice da Central de Mediadores - StormBet Apostas
+Derivado da seção `mediator_central` do estado: uma fila (deque) por
+servidor na ordem de entrada, um heap global com os horários de entrada
+(para o timeout) e o conjunto de servidores com central configurado.
+Reindexado pelas chaves sujas, como os índices de filas e apostas.
+"""
+
+import heapq
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+
+class MediatorCentralIndex:
+    """
+    Filas FIFO de mediadores por servidor + heap de expiração
+
+    `first()` é O(1); `expired()` só olha entradas vencidas do heap,
+    sem percorrer servidores. Entradas do heap ficam obsoletas quando o
+    mediador sai ou reentra e são descartadas quando chegam ao topo.
+    """
+
+    def __init__(self):
+        self.configured: Set[int] = set()
+        self._queues: Dict[int, Deque[int]] = {}                 # guild_id -> deque(user_id)
+        self._joined: Dict[int, Dict[int, Tuple[str, float]]] = {}  # guild_id -> {user_id: (iso, epoch)}
+        self._heap: List[Tuple[float, int, int]] = []             # (epoch de entrada, guild_id, user_id)
+
+    def rebuild(self, centrals: dict):
+        self.configured = set()
+        self._queues = {}
+        self._joined = {}
+        self._heap = []
+        for guild_id in centrals:
+            self.reindex(guild_id, centrals.get(guild_id))
+
+    def reindex(self, guild_id_str: str, central: Optional[dict]):
+        """Reindexa um servidor a partir do valor atual do central (None = removido)"""
+        try:
+            guild_id = int(guild_id_str)
+        except (TypeError, ValueError):
+            return
+        previous = self._joined.pop(guild_id, {})
+        self._queues.pop(guild_id, None)
+        if central is None:
+            self.configured.discard(guild_id)
+            return
+        self.configured.add(guild_id)
+
+        joined = {}
+        for user_id_str, entry in (central.get('mediators') or {}).items():
+            try:
+                user_id = int(user_id_str)
+                iso = entry['joined_at']
+                cached = previous.get(user_id)
+                if cached is None or cached[0] != iso:
+                    # Só entradas novas/alteradas são convertidas e vão para o heap
+                    cached = (iso, datetime.fromisoformat(iso).timestamp())
+                    heapq.heappush(self._heap, (cached[1], guild_id, user_id))
+            except (KeyError, TypeError, ValueError):
+                continue
+            joined[user_id] = cached
+        if joined:
+            self._joined[guild_id] = joined
+            self._queues[guild_id] = deque(sorted(joined, key=lambda uid: joined[uid][1]))
+
+    def first(self, guild_id: int) -> Optional[int]:
+        """Mediador há mais tempo esperando (None se a fila estiver vazia)"""
+        queue = self._queues.get(guild_id)
+        return queue[0] if queue else None
+
+    def members(self, guild_id: int) -> List[int]:
+        """Mediadores do servidor na ordem de atendimento"""
+        return list(self._queues.get(guild_id, ()))
+
+    def contains(self, guild_id: int, user_id: int) -> bool:
+        return user_id in self._joined.get(guild_id, ())
+
+    def joined_epoch(self, guild_id: int, user_id: int) -> Optional[float]:
+        entry = self._joined.get(guild_id, {}).get(user_id)
+        return None if entry is None else entry[1]
+
+    def _is_live(self, entry: Tuple[float, int, int]) -> bool:
+        epoch, guild_id, user_id = entry
+        return self.joined_epoch(guild_id, user_id) == epoch
+
+    def expired(self, cutoff: float) -> Dict[int, List[int]]:
+        """Mediadores que entraram antes de `cutoff`, por servidor"""
+        expired, due = {}, []
+        while self._heap and self._heap[0][0] <= cutoff:
+            entry = heapq.heappop(self._heap)
+            if self._is_live(entry):
+                due.append(entry)
+                expired.setdefault(entry[1], []).append(entry[2])
+        # Continuam no heap até saírem de fato do central
+        for entry in due:
+            heapq.heappush(self._heap, entry)
+        return expired
+
+    def next_entry(self) -> Optional[float]:
+        """Epoch de entrada do mediador há mais tempo esperando (em qualquer servidor)"""
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
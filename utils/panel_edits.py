@@ -0,0 +1,156 @@
+"""
+Edições de painéis - StormBet Apostas
+Quem muda uma fila só marca o painel como sujo; um worker por mensagem
+redesenha com o estado mais recente e envia no máximo uma edição por
+janela. Edições no mesmo canal dividem o mesmo bucket de rate limit do
+Discord, então cada canal também tem um intervalo mínimo entre edições.
+Assim o número de edições cresce com o tempo, não com os cliques.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger('bot')
+
+
+class EditStats:
+    """Métricas das edições (para o /health)"""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.total_delay = 0.0
+        self.max_delay = 0.0
+
+    def record(self, delay: float, latency: float):
+        self.sent += 1
+        self.total_delay += delay
+        self.max_delay = max(self.max_delay, delay)
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def snapshot(self) -> dict:
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'coalesced': self.coalesced,
+            'avg_delay_ms': round(self.total_delay / self.sent * 1000, 2) if self.sent else 0.0,
+            'max_delay_ms': round(self.max_delay * 1000, 2),
+            'avg_latency_ms': round(self.total_latency / self.sent * 1000, 2) if self.sent else 0.0,
+            'max_latency_ms': round(self.max_latency * 1000, 2),
+        }
+
+
+class PanelEditScheduler:
+    """
+    Agrupa as edições de cada painel
+
+    `send(message_id)` é chamado pelo worker da mensagem e deve montar o
+    embed na hora (estado mais recente) e editar a mensagem. Marcações
+    feitas enquanto o painel já está sujo são absorvidas pela próxima
+    edição. `delay` = tempo entre a primeira marcação e o envio;
+    `latency` = duração da chamada de edição.
+    """
+
+    def __init__(self, send: Callable[[int], Awaitable[None]], window: float = 1.0,
+                 channel_interval: float = 1.0):
+        self.send = send
+        self.window = window
+        self.channel_interval = channel_interval
+        self.stats = EditStats()
+        self._dirty: Dict[int, float] = {}          # message_id -> primeira marcação pendente
+        self._channels: Dict[int, int] = {}         # message_id -> channel_id
+        self._last_edit: Dict[int, float] = {}      # message_id -> última edição (monotonic)
+        self._channel_free: Dict[int, float] = {}   # channel_id -> próximo horário livre do bucket
+        self._workers: Dict[int, asyncio.Task] = {}
+
+    def mark_dirty(self, channel_id: int, message_id: int):
+        """Agenda o redesenho do painel (sem await: pode ser chamado de qualquer lugar)"""
+        self._channels[message_id] = channel_id
+        if message_id in self._dirty:
+            self.stats.coalesced += 1
+        else:
+            self._dirty[message_id] = time.monotonic()
+        if message_id not in self._workers:
+            self._workers[message_id] = asyncio.get_running_loop().create_task(self._run(message_id))
+
+    def claim_inline_edit(self, message_id: int) -> bool:
+        """True se quem chamou pode editar o painel agora, fora do worker
+
+        Vale para a resposta ao clique (`response.edit_message`), que não
+        usa o bucket do canal: só é liberada sem edição pendente e fora da
+        janela da última edição, e conta como a edição da janela.
+        """
+        now = time.monotonic()
+        if message_id in self._workers or now < self._last_edit.get(message_id, 0) + self.window:
+            return False
+        self._last_edit[message_id] = now
+        return True
+
+    def forget(self, message_id: int):
+        """Descarta o que estiver pendente para a mensagem (apagada)"""
+        self._dirty.pop(message_id, None)
+        self._last_edit.pop(message_id, None)
+
+    def _reserve_channel(self, channel_id: int) -> float:
+        """Próximo horário livre do bucket do canal (já reservado para quem chamou)"""
+        slot = max(time.monotonic(), self._channel_free.get(channel_id, 0))
+        self._channel_free[channel_id] = slot + self.channel_interval
+        return slot
+
+    async def _run(self, message_id: int):
+        try:
+            while message_id in self._dirty:
+                wait = self._last_edit.get(message_id, 0) + self.window - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                # Só reserva o canal se ainda houver edição (forget descarta)
+                marked = self._dirty.pop(message_id, None)
+                if marked is None:
+                    break
+                channel_id = self._channels.get(message_id, 0)
+                wait = self._reserve_channel(channel_id) - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                started = time.monotonic()
+                self._last_edit[message_id] = started
+                try:
+                    # 429 já é refeito pelo discord.py; aqui só se espaça o canal
+                    await self.send(message_id)
+                except Exception as e:
+                    self.stats.failed += 1
+                    logger.warning(f"⚠️ Erro ao editar painel {message_id}: {e}")
+                    continue
+                self.stats.record(started - marked, time.monotonic() - started)
+        finally:
+            self._workers.pop(message_id, None)
+            self._dirty.pop(message_id, None)
+            self._channels.pop(message_id, None)
+
+    def status(self) -> dict:
+        return {
+            'pending': len(self._dirty),
+            'workers': len(self._workers),
+            'window_s': self.window,
+            'channel_interval_s': self.channel_interval,
+            **self.stats.snapshot(),
+        }
+
+
+def create_panel_edit_scheduler(send: Callable[[int], Awaitable[None]],
+                                window: Optional[float] = None) -> PanelEditScheduler:
+    """PANEL_EDIT_WINDOW (segundos, padrão 1) = no máximo uma edição por painel na janela;
+    PANEL_CHANNEL_EDIT_INTERVAL (segundos, padrão 1) = espaço entre edições no mesmo canal
+    (o Discord permite cerca de 5 edições a cada 5 s por canal)"""
+    if window is None:
+        window = float(os.getenv("PANEL_EDIT_WINDOW", "1"))
+    channel_interval = float(os.getenv("PANEL_CHANNEL_EDIT_INTERVAL", "1"))
+    return PanelEditScheduler(send, window, channel_interval)
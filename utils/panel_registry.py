@@ -0,0 +1,96 @@
+"""
+Registro de painéis de fila - StormBet Apostas
+Índice da seção `queue_metadata`: um PanelRecord por mensagem, com o
+estado do ciclo de vida (live / missing / tombstoned) e a última
+atividade. Painéis apagados são removidos do estado depois do prazo de
+carência, então o custo acompanha os painéis vivos, não todos os que já
+foram criados.
+"""
+
+from typing import Dict, List, Optional, Set
+
+from models.panel import PANEL_LIVE, PANEL_MISSING, PANEL_TOMBSTONED, PanelRecord
+
+
+class PanelRegistry:
+    """Painéis por message_id, com índice por canal"""
+
+    def __init__(self):
+        self._records: Dict[int, PanelRecord] = {}
+        self._by_channel: Dict[int, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def rebuild(self, metadata: dict):
+        previous = self._records
+        self._records = {}
+        self._by_channel = {}
+        for message_id in metadata:
+            self.reindex(message_id, metadata.get(message_id), previous)
+
+    def reindex(self, message_id_str: str, metadata: Optional[dict], previous: Optional[dict] = None):
+        """Reindexa um painel (None = removido); a atividade em memória é mantida"""
+        try:
+            message_id = int(message_id_str)
+        except (TypeError, ValueError):
+            return
+        old = (previous if previous is not None else self._records).get(message_id)
+        self._records.pop(message_id, None)
+        if old is not None:
+            channel_panels = self._by_channel.get(old.channel_id)
+            if channel_panels is not None:
+                channel_panels.discard(message_id)
+                if not channel_panels:
+                    del self._by_channel[old.channel_id]
+        if not metadata:
+            return
+        try:
+            record = PanelRecord.from_metadata(message_id, metadata)
+        except (TypeError, ValueError):
+            return
+        if old is not None:
+            record.last_activity = old.last_activity
+            record.last_verified = old.last_verified
+        self._records[message_id] = record
+        self._by_channel.setdefault(record.channel_id, set()).add(message_id)
+
+    def get(self, message_id: int) -> Optional[PanelRecord]:
+        return self._records.get(int(message_id))
+
+    def find(self, channel_id: int, mode: str) -> Optional[PanelRecord]:
+        """Painel não apagado do canal com o modo informado"""
+        for message_id in self._by_channel.get(channel_id, ()):
+            record = self._records[message_id]
+            if record.mode == mode and record.state != PANEL_TOMBSTONED:
+                return record
+        return None
+
+    def records(self, include_tombstoned: bool = False) -> List[PanelRecord]:
+        return [r for r in self._records.values() if include_tombstoned or r.state != PANEL_TOMBSTONED]
+
+    def due_for_verification(self, live_cutoff: float, missing_cutoff: float, limit: int) -> List[PanelRecord]:
+        """Painéis sem atividade/verificação desde o corte, os mais antigos primeiro
+
+        Painéis `missing` usam um corte menor: são confirmados (ou
+        revividos) logo na próxima varredura.
+        """
+        due = [
+            r for r in self._records.values()
+            if (r.state == PANEL_LIVE and r.last_seen < live_cutoff)
+            or (r.state == PANEL_MISSING and r.last_seen < missing_cutoff)
+        ]
+        due.sort(key=lambda r: r.last_seen)
+        return due[:limit]
+
+    def tombstoned_before(self, cutoff: float) -> List[PanelRecord]:
+        return [
+            r for r in self._records.values()
+            if r.state == PANEL_TOMBSTONED and (r.state_since or 0) <= cutoff
+        ]
+
+    def counts(self) -> dict:
+        counts = {PANEL_LIVE: 0, PANEL_MISSING: 0, PANEL_TOMBSTONED: 0}
+        for record in self._records.values():
+            counts[record.state] = counts.get(record.state, 0) + 1
+        return counts
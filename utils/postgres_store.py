@@ -0,0 +1,1023 @@
+"""
+Schema PostgreSQL normalizado - StormBet Apostas
+Cada seção do estado vive na sua própria tabela; gravações são
+INSERT/UPDATE/DELETE direcionados apenas às chaves que mudaram.
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from utils.history import entry_player_ids
+from utils.replication import (
+    NOTIFY_CHANNEL,
+    build_notify_payloads,
+    versioned_keys,
+    without_keys,
+)
+
+logger = logging.getLogger('bot')
+
+SCHEMA_VERSION = 4
+
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS stormbet_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS queues (
+        queue_id TEXT PRIMARY KEY
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS queue_members (
+        queue_id TEXT NOT NULL REFERENCES queues(queue_id) ON DELETE CASCADE,
+        user_id BIGINT NOT NULL,
+        position INTEGER NOT NULL,
+        joined_at TIMESTAMP,
+        PRIMARY KEY (queue_id, user_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_queue_members_user ON queue_members(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_queue_members_joined ON queue_members(joined_at)",
+    """
+    CREATE TABLE IF NOT EXISTS queue_metadata (
+        message_id BIGINT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        mode TEXT NOT NULL,
+        bet_value DOUBLE PRECISION NOT NULL,
+        mediator_fee DOUBLE PRECISION NOT NULL,
+        channel_id BIGINT NOT NULL,
+        currency_type TEXT NOT NULL DEFAULT 'sonhos'
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_queue_metadata_channel "
+    "ON queue_metadata(channel_id)",
+    """
+    CREATE TABLE IF NOT EXISTS active_bets (
+        bet_id TEXT PRIMARY KEY,
+        channel_id BIGINT NOT NULL,
+        mediator_id BIGINT,
+        data JSONB NOT NULL,
+        created_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_active_bets_channel ON active_bets(channel_id)",
+    """
+    CREATE TABLE IF NOT EXISTS bet_history (
+        id BIGSERIAL PRIMARY KEY,
+        bet_id TEXT NOT NULL,
+        channel_id BIGINT,
+        data JSONB NOT NULL,
+        finished_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_bet_history_bet ON bet_history(bet_id)",
+    "CREATE INDEX IF NOT EXISTS idx_bet_history_finished ON bet_history(finished_at)",
+    # v2: histórico consultado por servidor/jogador, fora do estado em memória
+    "ALTER TABLE bet_history ADD COLUMN IF NOT EXISTS guild_id BIGINT",
+    "ALTER TABLE bet_history ADD COLUMN IF NOT EXISTS player_ids BIGINT[]",
+    "CREATE INDEX IF NOT EXISTS idx_bet_history_guild "
+    "ON bet_history(guild_id, finished_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_bet_history_players "
+    "ON bet_history USING GIN (player_ids)",
+    """
+    CREATE TABLE IF NOT EXISTS guild_config (
+        guild_id BIGINT PRIMARY KEY,
+        mediator_role_id BIGINT,
+        language TEXT,
+        results_channel_id BIGINT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS subscriptions (
+        guild_id BIGINT PRIMARY KEY,
+        permanent BOOLEAN NOT NULL DEFAULT FALSE,
+        created_at TIMESTAMP,
+        expires_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_subscriptions_expires ON subscriptions(expires_at)",
+    """
+    CREATE TABLE IF NOT EXISTS mediator_central (
+        guild_id BIGINT PRIMARY KEY,
+        channel_id BIGINT NOT NULL,
+        message_id BIGINT NOT NULL,
+        created_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS mediator_central_members (
+        guild_id BIGINT NOT NULL
+            REFERENCES mediator_central(guild_id) ON DELETE CASCADE,
+        user_id BIGINT NOT NULL,
+        pix TEXT,
+        joined_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (guild_id, user_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_central_members_joined "
+    "ON mediator_central_members(guild_id, joined_at)",
+    """
+    CREATE TABLE IF NOT EXISTS mediator_pix_keys (
+        user_id BIGINT PRIMARY KEY,
+        pix TEXT NOT NULL
+    )
+    """,
+    # v3: versão por chave para compare-and-swap entre instâncias
+    """
+    CREATE TABLE IF NOT EXISTS state_versions (
+        section TEXT NOT NULL,
+        key TEXT NOT NULL,
+        version BIGINT NOT NULL,
+        PRIMARY KEY (section, key)
+    )
+    """,
+    # v4: ciclo de vida dos painéis (live / missing / tombstoned)
+    "ALTER TABLE queue_metadata "
+    "ADD COLUMN IF NOT EXISTS state TEXT NOT NULL DEFAULT 'live'",
+    "ALTER TABLE queue_metadata ADD COLUMN IF NOT EXISTS state_since TIMESTAMP",
+]
+
+# Seções do estado que compartilham a tabela guild_config
+GUILD_CONFIG_COLUMNS = {
+    'mediator_roles': 'mediator_role_id',
+    'languages': 'language',
+    'results_channels': 'results_channel_id',
+}
+
+
+def _iso(value) -> Optional[str]:
+    """Converte datetime do PostgreSQL de volta para o formato ISO do estado"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _ts(value) -> Optional[datetime]:
+    """Converte timestamps ISO do estado em datetime (aceito pelos dois drivers)"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _json(value) -> Optional[dict]:
+    """JSONB pode vir como dict (psycopg2) ou str (asyncpg)"""
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+
+def merge_dirty(target: Dict[str, Optional[Set[str]]],
+                source: Dict[str, Optional[Set[str]]]):
+    """Une mapas de chaves sujas (None = seção inteira)"""
+    for section, keys in source.items():
+        if section in target and target[section] is None:
+            continue
+        if keys is None:
+            target[section] = None
+        else:
+            target.setdefault(section, set()).update(keys)
+
+
+def subtract_dirty(dirty: Dict[str, Optional[Set[str]]],
+                   removed: Dict[str, Optional[Set[str]]]) -> dict:
+    """Cópia de `dirty` sem as chaves de `removed` (seção inteira suja é mantida)"""
+    result = {}
+    for section, keys in dirty.items():
+        if section not in removed or keys is None:
+            result[section] = keys
+        elif removed[section] is not None and keys - removed[section]:
+            result[section] = keys - removed[section]
+    return result
+
+
+# Consultas de leitura, na ordem consumida por assemble_document()
+LOAD_QUERIES = [
+    "SELECT queue_id FROM queues",
+    "SELECT queue_id, user_id, joined_at FROM queue_members "
+    "ORDER BY queue_id, position",
+    "SELECT message_id, kind, mode, bet_value, mediator_fee, channel_id, "
+    "currency_type, state, state_since FROM queue_metadata",
+    "SELECT bet_id, data FROM active_bets",
+    "SELECT guild_id, mediator_role_id, language, results_channel_id FROM guild_config",
+    "SELECT guild_id, permanent, created_at, expires_at FROM subscriptions",
+    "SELECT guild_id, channel_id, message_id, created_at FROM mediator_central",
+    "SELECT guild_id, user_id, pix, joined_at FROM mediator_central_members "
+    "ORDER BY guild_id, joined_at",
+    "SELECT user_id, pix FROM mediator_pix_keys",
+]
+
+# Releitura de filas específicas (sob o advisory lock da fila)
+LOAD_QUEUE_KEYS_QUERIES = [
+    "SELECT queue_id FROM queues WHERE queue_id = ANY(%s::text[])",
+    "SELECT queue_id, user_id, joined_at FROM queue_members "
+    "WHERE queue_id = ANY(%s::text[]) ORDER BY queue_id, position",
+]
+LOAD_QUEUE_VERSIONS_SQL = (
+    "SELECT key, version FROM state_versions "
+    "WHERE section = 'queues' AND key = ANY(%s::text[])"
+)
+
+MIGRATION_CHECK_SQL = "SELECT value FROM stormbet_meta WHERE key = 'jsonb_migrated'"
+LEGACY_EXISTS_SQL = "SELECT to_regclass('stormbet_data') IS NOT NULL"
+LEGACY_LOAD_SQL = "SELECT data FROM stormbet_data WHERE id = 1"
+MIGRATION_MARK_SQL = """
+    INSERT INTO stormbet_meta (key, value) VALUES ('jsonb_migrated', %s)
+    ON CONFLICT (key) DO NOTHING
+"""
+SCHEMA_VERSION_SQL = """
+    INSERT INTO stormbet_meta (key, value) VALUES ('schema_version', %s)
+    ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+"""
+
+
+def assemble_document(results: list) -> dict:
+    """Remonta o documento de estado a partir das linhas de LOAD_QUERIES"""
+    (queue_rows, member_rows, metadata_rows, bet_rows,
+     guild_rows, subscription_rows, central_rows, central_member_rows,
+     pix_rows) = results
+
+    data = {
+        'queues': {},
+        'queue_timestamps': {},
+        'queue_metadata': {},
+        'active_bets': {},
+        'mediator_roles': {},
+        'languages': {},
+        'results_channels': {},
+        'subscriptions': {},
+        'mediator_central': {},
+        'mediator_pix_keys': {},
+    }
+
+    _assemble_queues(data, queue_rows, member_rows)
+
+    for (message_id, kind, mode, bet_value, mediator_fee, channel_id, currency_type,
+         state, state_since) in metadata_rows:
+        metadata = {
+            'bet_value': bet_value,
+            'mediator_fee': mediator_fee,
+            'channel_id': channel_id,
+            'message_id': message_id,
+            'currency_type': currency_type,
+        }
+        if kind == 'panel':
+            metadata = {'type': 'panel', 'panel_type': mode, **metadata}
+        else:
+            metadata = {'queue_id': f"{mode}_{message_id}", 'mode': mode, **metadata}
+        if state and state != 'live':
+            metadata['state'] = state
+            metadata['state_since'] = _iso(state_since)
+        data['queue_metadata'][str(message_id)] = metadata
+
+    for bet_id, bet_data in bet_rows:
+        data['active_bets'][bet_id] = _json(bet_data)
+
+    for guild_id, role_id, language, results_channel_id in guild_rows:
+        if role_id is not None:
+            data['mediator_roles'][str(guild_id)] = role_id
+        if language is not None:
+            data['languages'][str(guild_id)] = language
+        if results_channel_id is not None:
+            data['results_channels'][str(guild_id)] = results_channel_id
+
+    for guild_id, permanent, created_at, expires_at in subscription_rows:
+        data['subscriptions'][str(guild_id)] = {
+            'guild_id': guild_id,
+            'permanent': permanent,
+            'created_at': _iso(created_at),
+            'expires_at': _iso(expires_at),
+        }
+
+    for guild_id, channel_id, message_id, created_at in central_rows:
+        data['mediator_central'][str(guild_id)] = {
+            'channel_id': channel_id,
+            'message_id': message_id,
+            'mediators': {},
+            'created_at': _iso(created_at),
+        }
+
+    for guild_id, user_id, pix, joined_at in central_member_rows:
+        central = data['mediator_central'].get(str(guild_id))
+        if central is not None:
+            central['mediators'][str(user_id)] = {
+                'joined_at': _iso(joined_at),
+                'pix': pix,
+            }
+
+    for user_id, pix in pix_rows:
+        data['mediator_pix_keys'][str(user_id)] = pix
+
+    return data
+
+
+def _assemble_queues(data: dict, queue_rows, member_rows):
+    for (queue_id,) in queue_rows:
+        data['queues'][queue_id] = []
+        data['queue_timestamps'][queue_id] = {}
+
+    for queue_id, user_id, joined_at in member_rows:
+        data['queues'].setdefault(queue_id, []).append(user_id)
+        if joined_at is not None:
+            queue_ts = data['queue_timestamps'].setdefault(queue_id, {})
+            queue_ts[str(user_id)] = _iso(joined_at)
+
+
+class _StatementBuffer:
+    """Acumula (sql, params) no lugar de um cursor, para qualquer driver executar"""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql: str, params: tuple = ()):
+        self.statements.append((sql, params))
+
+
+def build_write_statements(data: dict, dirty: Dict[str, Optional[Set[str]]]) -> list:
+    """Gera os INSERT/UPDATE/DELETE necessários para gravar as chaves sujas"""
+    buffer = _StatementBuffer()
+    if not dirty:
+        return buffer.statements
+
+    queue_keys = _union_keys(data, dirty, ('queues', 'queue_timestamps'))
+    if queue_keys is not None:
+        _write_queues(buffer, data, queue_keys)
+
+    if 'queue_metadata' in dirty:
+        _write_keyed(buffer, data, 'queue_metadata', dirty['queue_metadata'],
+                     "DELETE FROM queue_metadata", _write_queue_metadata,
+                     "DELETE FROM queue_metadata WHERE message_id = %s", int)
+
+    if 'active_bets' in dirty:
+        _write_keyed(buffer, data, 'active_bets', dirty['active_bets'],
+                     "DELETE FROM active_bets", _write_active_bet,
+                     "DELETE FROM active_bets WHERE bet_id = %s", str)
+
+    if 'bet_history' in dirty:
+        _write_bet_history(buffer, data, dirty['bet_history'])
+
+    guild_keys = _union_keys(data, dirty, tuple(GUILD_CONFIG_COLUMNS))
+    if guild_keys is not None:
+        _write_guild_config(buffer, data, guild_keys)
+
+    if 'subscriptions' in dirty:
+        _write_keyed(buffer, data, 'subscriptions', dirty['subscriptions'],
+                     "DELETE FROM subscriptions", _write_subscription,
+                     "DELETE FROM subscriptions WHERE guild_id = %s", int)
+
+    if 'mediator_central' in dirty:
+        _write_keyed(buffer, data, 'mediator_central', dirty['mediator_central'],
+                     "DELETE FROM mediator_central", _write_mediator_central,
+                     "DELETE FROM mediator_central WHERE guild_id = %s", int)
+
+    if 'mediator_pix_keys' in dirty:
+        _write_keyed(buffer, data, 'mediator_pix_keys', dirty['mediator_pix_keys'],
+                     "DELETE FROM mediator_pix_keys", _write_pix_key,
+                     "DELETE FROM mediator_pix_keys WHERE user_id = %s", int)
+
+    return buffer.statements
+
+
+def _union_keys(data: dict, dirty: dict, sections: tuple) -> Optional[Set[str]]:
+    """Une as chaves sujas de seções que compartilham a mesma tabela"""
+    touched = [s for s in sections if s in dirty]
+    if not touched:
+        return None
+    keys = set()
+    for section in touched:
+        if dirty[section] is None:
+            # Seção inteira: considera tudo que existe em qualquer uma delas
+            for s in sections:
+                keys.update(data.get(s, {}).keys())
+            keys.add(None)
+        else:
+            keys.update(dirty[section])
+    return keys
+
+
+def _write_keyed(cur, data, section, keys, delete_all_sql, write_one, delete_one_sql,
+                 key_type):
+    values = data.get(section, {})
+    if keys is None:
+        cur.execute(delete_all_sql)
+        keys = values.keys()
+    for key in keys:
+        if key in values:
+            write_one(cur, key, values[key])
+        else:
+            cur.execute(delete_one_sql, (key_type(key),))
+
+
+def _write_queues(cur, data: dict, keys: Set[str]):
+    if None in keys:
+        cur.execute("DELETE FROM queues")
+        keys = keys - {None}
+    queues = data.get('queues', {})
+    timestamps = data.get('queue_timestamps', {})
+    for queue_id in keys:
+        cur.execute("DELETE FROM queue_members WHERE queue_id = %s", (queue_id,))
+        if queue_id not in queues:
+            cur.execute("DELETE FROM queues WHERE queue_id = %s", (queue_id,))
+            continue
+        cur.execute(
+            "INSERT INTO queues (queue_id) VALUES (%s) ON CONFLICT DO NOTHING",
+            (queue_id,),
+        )
+        queue_ts = timestamps.get(queue_id, {})
+        for position, user_id in enumerate(queues[queue_id]):
+            cur.execute("""
+                INSERT INTO queue_members (queue_id, user_id, position, joined_at)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (queue_id, user_id) DO NOTHING
+            """, (queue_id, int(user_id), position, _ts(queue_ts.get(str(user_id)))))
+
+
+def _write_queue_metadata(cur, message_id: str, metadata: dict):
+    is_panel = metadata.get('type') == 'panel'
+    cur.execute("""
+        INSERT INTO queue_metadata (message_id, kind, mode, bet_value, mediator_fee,
+                                    channel_id, currency_type, state, state_since)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (message_id) DO UPDATE SET
+            kind = EXCLUDED.kind, mode = EXCLUDED.mode, bet_value = EXCLUDED.bet_value,
+            mediator_fee = EXCLUDED.mediator_fee, channel_id = EXCLUDED.channel_id,
+            currency_type = EXCLUDED.currency_type, state = EXCLUDED.state,
+            state_since = EXCLUDED.state_since
+    """, (
+        int(message_id),
+        'panel' if is_panel else 'queue',
+        metadata.get('panel_type') if is_panel else metadata.get('mode'),
+        float(metadata.get('bet_value', 0)),
+        float(metadata.get('mediator_fee', 0)),
+        int(metadata.get('channel_id', 0)),
+        metadata.get('currency_type', 'sonhos'),
+        metadata.get('state', 'live'),
+        _ts(metadata.get('state_since')),
+    ))
+
+
+def _write_active_bet(cur, bet_id: str, bet_data: dict):
+    cur.execute("""
+        INSERT INTO active_bets (bet_id, channel_id, mediator_id, data, created_at)
+        VALUES (%s, %s, %s, %s::jsonb, %s)
+        ON CONFLICT (bet_id) DO UPDATE SET
+            channel_id = EXCLUDED.channel_id, mediator_id = EXCLUDED.mediator_id,
+            data = EXCLUDED.data
+    """, (
+        bet_id,
+        int(bet_data.get('channel_id') or 0),
+        bet_data.get('mediator_id'),
+        json.dumps(bet_data),
+        _ts(bet_data.get('created_at')),
+    ))
+
+
+def build_history_queries(guild_id: Optional[int], player_id: Optional[int],
+                          offset: int, limit: int) -> Tuple[tuple, tuple]:
+    """(sql, params) da página e da contagem do histórico filtrado"""
+    conditions, params = [], []
+    if guild_id is not None:
+        conditions.append("guild_id = %s")
+        params.append(int(guild_id))
+    if player_id is not None:
+        conditions.append("%s = ANY(player_ids)")
+        params.append(int(player_id))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    page_sql = f"""
+        SELECT data FROM bet_history {where}
+        ORDER BY finished_at DESC NULLS LAST, id DESC
+        LIMIT %s OFFSET %s
+    """
+    count_sql = f"SELECT COUNT(*) FROM bet_history {where}"
+    page_params = tuple(params) + (int(limit), int(offset))
+    return (page_sql, page_params), (count_sql, tuple(params))
+
+
+def _write_bet_history(cur, data: dict, keys: Optional[Set[str]]):
+    if 'bet_history' not in data:
+        # O histórico vive fora do estado em memória; nada a regravar
+        return
+    history = data['bet_history']
+    if keys is None:
+        cur.execute("DELETE FROM bet_history")
+        entries = history
+    else:
+        # Histórico é append-only: grava só as apostas recém-finalizadas
+        entries = [entry for entry in history if entry.get('bet_id') in keys]
+    for entry in entries:
+        cur.execute("""
+            INSERT INTO bet_history
+                (bet_id, channel_id, guild_id, player_ids, data, finished_at)
+            VALUES (%s, %s, %s, %s, %s::jsonb, %s)
+        """, (
+            entry.get('bet_id'),
+            entry.get('channel_id'),
+            entry.get('guild_id'),
+            entry_player_ids(entry),
+            json.dumps(entry),
+            _ts(entry.get('finished_at')),
+        ))
+
+
+def _write_guild_config(cur, data: dict, keys: Set[str]):
+    if None in keys:
+        cur.execute("DELETE FROM guild_config")
+        keys = keys - {None}
+    for guild_id in keys:
+        values = {
+            column: data.get(section, {}).get(guild_id)
+            for section, column in GUILD_CONFIG_COLUMNS.items()
+        }
+        if all(value is None for value in values.values()):
+            cur.execute(
+                "DELETE FROM guild_config WHERE guild_id = %s", (int(guild_id),)
+            )
+            continue
+        cur.execute("""
+            INSERT INTO guild_config
+                (guild_id, mediator_role_id, language, results_channel_id)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (guild_id) DO UPDATE SET
+                mediator_role_id = EXCLUDED.mediator_role_id,
+                language = EXCLUDED.language,
+                results_channel_id = EXCLUDED.results_channel_id
+        """, (
+            int(guild_id),
+            values['mediator_role_id'],
+            values['language'],
+            values['results_channel_id'],
+        ))
+
+
+def _write_subscription(cur, guild_id: str, subscription: dict):
+    cur.execute("""
+        INSERT INTO subscriptions (guild_id, permanent, created_at, expires_at)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (guild_id) DO UPDATE SET
+            permanent = EXCLUDED.permanent, created_at = EXCLUDED.created_at,
+            expires_at = EXCLUDED.expires_at
+    """, (
+        int(guild_id),
+        bool(subscription.get('permanent')),
+        _ts(subscription.get('created_at')),
+        _ts(subscription.get('expires_at')),
+    ))
+
+
+def _write_mediator_central(cur, guild_id: str, central: dict):
+    cur.execute("""
+        INSERT INTO mediator_central (guild_id, channel_id, message_id, created_at)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (guild_id) DO UPDATE SET
+            channel_id = EXCLUDED.channel_id, message_id = EXCLUDED.message_id,
+            created_at = EXCLUDED.created_at
+    """, (
+        int(guild_id),
+        central.get('channel_id'),
+        central.get('message_id'),
+        _ts(central.get('created_at')),
+    ))
+    cur.execute(
+        "DELETE FROM mediator_central_members WHERE guild_id = %s", (int(guild_id),)
+    )
+    # joined_at é NOT NULL: entradas antigas sem horário (ou fora do ISO) entram
+    # com o horário de criação do central, ou com o da gravação
+    fallback_joined_at = _ts(central.get('created_at')) or datetime.now()
+    for user_id, entry in central.get('mediators', {}).items():
+        cur.execute("""
+            INSERT INTO mediator_central_members (guild_id, user_id, pix, joined_at)
+            VALUES (%s, %s, %s, %s)
+        """, (
+            int(guild_id),
+            int(user_id),
+            entry.get('pix'),
+            _ts(entry.get('joined_at')) or fallback_joined_at,
+        ))
+
+
+def _write_pix_key(cur, user_id: str, pix_key: str):
+    cur.execute("""
+        INSERT INTO mediator_pix_keys (user_id, pix) VALUES (%s, %s)
+        ON CONFLICT (user_id) DO UPDATE SET pix = EXCLUDED.pix
+    """, (int(user_id), pix_key))
+
+
+LOAD_VERSIONS_SQL = "SELECT section, key, version FROM state_versions"
+CAS_UPDATE_SQL = """
+    UPDATE state_versions SET version = version + 1
+    WHERE section = %s AND key = %s AND version = %s
+    RETURNING version
+"""
+CAS_INSERT_SQL = """
+    INSERT INTO state_versions (section, key, version) VALUES (%s, %s, 1)
+    ON CONFLICT DO NOTHING
+    RETURNING version
+"""
+FORCE_VERSION_SQL = """
+    INSERT INTO state_versions (section, key, version) VALUES (%s, %s, 1)
+    ON CONFLICT (section, key) DO UPDATE SET version = state_versions.version + 1
+    RETURNING version
+"""
+NOTIFY_SQL = "SELECT pg_notify(%s, %s)"
+
+
+class VersionedWrite:
+    """Plano de uma gravação com compare-and-swap
+
+    `expected` traz a versão lida de cada (grupo, chave) suja; None força a
+    gravação (última tentativa depois de vários conflitos). Chaves cuja
+    versão mudou no banco ficam em `conflicts` e NÃO são gravadas; as demais
+    são gravadas na mesma transação e anunciadas via NOTIFY.
+
+    `dirty` precisa vir por chave (ver expand_whole_sections): seção inteira
+    só é gravada sem versão, na migração/importação (`apply`).
+    """
+
+    def __init__(self, data: dict, dirty: Dict[str, Optional[Set[str]]],
+                 expected: Dict[tuple, Optional[int]], instance_id: str):
+        self.data = data
+        self.dirty = dirty
+        self.expected = expected
+        self.instance_id = instance_id
+        self.keys, whole_groups = versioned_keys(dirty)
+        if whole_groups:
+            raise ValueError(
+                f"Gravação versionada com seções inteiras: {sorted(whole_groups)}"
+            )
+        self.versions = {}
+        self.conflicts = set()
+
+    def cas_statements(self):
+        """(chave, [(sql, params), ...]) — executa em ordem até um retornar a versão"""
+        for group, key in sorted(self.keys):
+            expected = self.expected.get((group, key), 0)
+            if expected is None:
+                yield (group, key), [(FORCE_VERSION_SQL, (group, key))]
+            elif expected == 0:
+                # Chave nunca versionada: só vence quem criar a linha primeiro
+                yield (group, key), [(CAS_INSERT_SQL, (group, key))]
+            else:
+                yield (group, key), [(CAS_UPDATE_SQL, (group, key, expected))]
+
+    def write_statements(self) -> list:
+        """Gravações das chaves que passaram no compare-and-swap"""
+        dirty = without_keys(self.dirty, self.conflicts)
+        return build_write_statements(self.data, dirty)
+
+    def notify_statements(self) -> list:
+        if not self.versions:
+            return []
+        payloads = build_notify_payloads(self.instance_id, self.data, self.versions)
+        return [(NOTIFY_SQL, (NOTIFY_CHANNEL, payload)) for payload in payloads]
+
+
+def _to_dollar_params(sql: str) -> str:
+    """Converte placeholders %s (psycopg2) em $1, $2... (asyncpg)"""
+    parts = sql.split('%s')
+    numbered = (f"${i}{part}" for i, part in enumerate(parts[1:], start=1))
+    return parts[0] + ''.join(numbered)
+
+
+class NormalizedPostgresStore:
+    """
+    Armazenamento PostgreSQL com uma tabela por seção do estado (psycopg2)
+
+    `load()` remonta o documento em memória a partir das tabelas e
+    `apply()` grava apenas as chaves marcadas como sujas, numa única
+    transação. O custo de escrita depende do tamanho da mudança, não
+    do tamanho do banco.
+    """
+
+    def __init__(self, pg_pool):
+        self.pg_pool = pg_pool
+
+    def _putconn(self, conn):
+        # Conexões derrubadas (queda do servidor) são descartadas, não reaproveitadas
+        self.pg_pool.putconn(conn, close=bool(conn.closed))
+
+    def ping(self):
+        """Health probe: levanta exceção se o PostgreSQL não responder"""
+        conn = self.pg_pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.commit()
+        finally:
+            self._putconn(conn)
+
+    def create_schema(self):
+        """Cria tabelas e índices se não existirem"""
+        conn = self.pg_pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                for statement in SCHEMA_SQL:
+                    cur.execute(statement)
+                cur.execute(SCHEMA_VERSION_SQL, (str(SCHEMA_VERSION),))
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self._putconn(conn)
+
+    def migrate_from_jsonb(self, fallback_loader=None) -> bool:
+        """Importa (uma única vez) o documento da antiga tabela stormbet_data
+
+        A tabela antiga é mantida intacta como backup. Se ela não existir,
+        `fallback_loader` (ex.: leitura do bets.json local) fornece os dados.
+        """
+        conn = self.pg_pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(MIGRATION_CHECK_SQL)
+                if cur.fetchone():
+                    return False
+
+                data = None
+                cur.execute(LEGACY_EXISTS_SQL)
+                if cur.fetchone()[0]:
+                    cur.execute(LEGACY_LOAD_SQL)
+                    row = cur.fetchone()
+                    if row and row[0]:
+                        data = _json(row[0])
+
+                if data is None and fallback_loader is not None:
+                    data = fallback_loader()
+
+                if isinstance(data, dict):
+                    statements = build_write_statements(data, dict.fromkeys(data))
+                    for sql, params in statements:
+                        cur.execute(sql, params)
+                    logger.info("🐘 Migração para tabelas normalizadas concluída")
+
+                cur.execute(MIGRATION_MARK_SQL, (datetime.now().isoformat(),))
+            conn.commit()
+            return isinstance(data, dict)
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self._putconn(conn)
+
+    def import_document(self, data: dict):
+        """Substitui todo o conteúdo das tabelas pelo documento informado"""
+        self.apply(data, dict.fromkeys(data))
+
+    def load(self) -> dict:
+        """Remonta o documento de estado a partir das tabelas"""
+        conn = self.pg_pool.getconn()
+        try:
+            results = []
+            with conn.cursor() as cur:
+                for query in LOAD_QUERIES:
+                    cur.execute(query)
+                    results.append(cur.fetchall())
+            conn.commit()
+        finally:
+            self._putconn(conn)
+        return assemble_document(results)
+
+    def history_page(self, guild_id: Optional[int], player_id: Optional[int],
+                     offset: int, limit: int) -> Tuple[List[dict], int]:
+        """Uma página do histórico (mais recentes primeiro) e o total filtrado"""
+        (page_sql, page_params), (count_sql, count_params) = build_history_queries(
+            guild_id, player_id, offset, limit
+        )
+        conn = self.pg_pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(page_sql, page_params)
+                entries = [_json(row[0]) for row in cur.fetchall()]
+                cur.execute(count_sql, count_params)
+                total = cur.fetchone()[0]
+            conn.commit()
+        finally:
+            self._putconn(conn)
+        return entries, total
+
+    def apply(self, data: dict, dirty: Dict[str, Optional[Set[str]]]):
+        """Grava as chaves sujas de `data` numa única transação"""
+        statements = build_write_statements(data, dirty)
+        if not statements:
+            return
+        conn = self.pg_pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                for sql, params in statements:
+                    cur.execute(sql, params)
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self._putconn(conn)
+
+    def load_versions(self) -> Dict[tuple, int]:
+        """Versão atual de cada (grupo, chave)"""
+        conn = self.pg_pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(LOAD_VERSIONS_SQL)
+                rows = cur.fetchall()
+            conn.commit()
+        finally:
+            self._putconn(conn)
+        return {(section, key): version for section, key, version in rows}
+
+    def apply_versioned(self, write: VersionedWrite) -> VersionedWrite:
+        """Compare-and-swap + gravação + NOTIFY numa única transação"""
+        conn = self.pg_pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                for version_key, attempts in write.cas_statements():
+                    for sql, params in attempts:
+                        cur.execute(sql, params)
+                        row = cur.fetchone()
+                        if row is not None:
+                            write.versions[version_key] = row[0]
+                            break
+                    else:
+                        write.conflicts.add(version_key)
+                for sql, params in write.write_statements() + write.notify_statements():
+                    cur.execute(sql, params)
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self._putconn(conn)
+        return write
+
+    def open_listener(self, database_url: str, connect_timeout: int = 5):
+        """Conexão dedicada (autocommit) com LISTEN no canal de invalidação"""
+        import psycopg2
+        conn = psycopg2.connect(database_url, connect_timeout=connect_timeout)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        return conn
+
+    @staticmethod
+    def wait_notifications(conn, timeout: float) -> List[str]:
+        """Bloqueia até `timeout` segundos e devolve os payloads recebidos"""
+        import select
+        if select.select([conn], [], [], timeout) == ([], [], []):
+            return []
+        conn.poll()
+        payloads = [notify.payload for notify in conn.notifies]
+        conn.notifies.clear()
+        return payloads
+
+
+class AsyncNormalizedPostgresStore:
+    """Mesmo schema do NormalizedPostgresStore, sobre um pool asyncpg"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    @classmethod
+    async def connect(cls, database_url: str, min_size: int = 1, max_size: int = 10,
+                      timeout: float = 5):
+        import asyncpg
+        pool = await asyncpg.create_pool(
+            database_url, min_size=min_size, max_size=max_size, timeout=timeout
+        )
+        store = cls(pool)
+        store.database_url = database_url
+        store.timeout = timeout
+        return store
+
+    async def close(self):
+        await self.pool.close()
+
+    async def ping(self):
+        """Health probe: levanta exceção se o PostgreSQL não responder"""
+        async with self.pool.acquire() as conn:
+            await conn.fetchval("SELECT 1")
+
+    async def create_schema(self):
+        """Cria tabelas e índices se não existirem"""
+        async with self.pool.acquire() as conn, conn.transaction():
+            for statement in SCHEMA_SQL:
+                await conn.execute(statement)
+            await conn.execute(
+                _to_dollar_params(SCHEMA_VERSION_SQL), str(SCHEMA_VERSION)
+            )
+
+    async def migrate_from_jsonb(self, fallback_loader=None) -> bool:
+        """Versão assíncrona de NormalizedPostgresStore.migrate_from_jsonb"""
+        async with self.pool.acquire() as conn, conn.transaction():
+            if await conn.fetchval(MIGRATION_CHECK_SQL):
+                return False
+
+            data = None
+            if await conn.fetchval(LEGACY_EXISTS_SQL):
+                blob = await conn.fetchval(LEGACY_LOAD_SQL)
+                if blob:
+                    data = _json(blob)
+
+            if data is None and fallback_loader is not None:
+                data = fallback_loader()
+
+            if isinstance(data, dict):
+                for sql, params in build_write_statements(data, dict.fromkeys(data)):
+                    await conn.execute(_to_dollar_params(sql), *params)
+                logger.info("🐘 Migração para tabelas normalizadas concluída")
+
+            await conn.execute(
+                _to_dollar_params(MIGRATION_MARK_SQL), datetime.now().isoformat()
+            )
+            return isinstance(data, dict)
+
+    async def load(self) -> dict:
+        """Remonta o documento de estado a partir das tabelas"""
+        async with self.pool.acquire() as conn:
+            results = [await conn.fetch(query) for query in LOAD_QUERIES]
+        return assemble_document(results)
+
+    async def history_page(self, guild_id: Optional[int], player_id: Optional[int],
+                           offset: int, limit: int) -> Tuple[List[dict], int]:
+        """Uma página do histórico (mais recentes primeiro) e o total filtrado"""
+        (page_sql, page_params), (count_sql, count_params) = build_history_queries(
+            guild_id, player_id, offset, limit
+        )
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(_to_dollar_params(page_sql), *page_params)
+            total = await conn.fetchval(_to_dollar_params(count_sql), *count_params)
+        return [_json(row[0]) for row in rows], total
+
+    async def apply(self, data: dict, dirty: Dict[str, Optional[Set[str]]]):
+        """Grava as chaves sujas de `data` numa única transação"""
+        statements = build_write_statements(data, dirty)
+        if not statements:
+            return
+        async with self.pool.acquire() as conn, conn.transaction():
+            for sql, params in statements:
+                await conn.execute(_to_dollar_params(sql), *params)
+
+    async def load_versions(self) -> Dict[tuple, int]:
+        """Versão atual de cada (grupo, chave)"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(LOAD_VERSIONS_SQL)
+        return {(row[0], row[1]): row[2] for row in rows}
+
+    async def load_queues(self, conn, queue_ids) -> Tuple[dict, Dict[tuple, int]]:
+        """Só as filas informadas (queues/queue_timestamps) e as versões delas
+
+        Lidas na conexão dada: a que segura o advisory lock da fila.
+        """
+        queue_ids = list(queue_ids)
+        results = [
+            await conn.fetch(_to_dollar_params(query), queue_ids)
+            for query in LOAD_QUEUE_KEYS_QUERIES
+        ]
+        data = {'queues': {}, 'queue_timestamps': {}}
+        _assemble_queues(data, *results)
+        rows = await conn.fetch(_to_dollar_params(LOAD_QUEUE_VERSIONS_SQL), queue_ids)
+        return data, {('queues', row[0]): row[1] for row in rows}
+
+    async def apply_versioned(self, write: VersionedWrite, conn=None) -> VersionedWrite:
+        """Compare-and-swap + gravação + NOTIFY numa única transação
+
+        `conn`: grava numa conexão já aberta (ex.: a do advisory lock).
+        """
+        if conn is None:
+            async with self.pool.acquire() as conn:
+                return await self.apply_versioned(write, conn)
+        async with conn.transaction():
+            for version_key, attempts in write.cas_statements():
+                for sql, params in attempts:
+                    version = await conn.fetchval(_to_dollar_params(sql), *params)
+                    if version is not None:
+                        write.versions[version_key] = version
+                        break
+                else:
+                    write.conflicts.add(version_key)
+            for sql, params in write.write_statements() + write.notify_statements():
+                await conn.execute(_to_dollar_params(sql), *params)
+        return write
+
+    async def open_listener(self, callback):
+        """Conexão dedicada com LISTEN; `callback(payload)` a cada NOTIFY"""
+        import asyncpg
+        conn = await asyncpg.connect(self.database_url, timeout=self.timeout)
+        await conn.add_listener(
+            NOTIFY_CHANNEL, lambda _conn, _pid, _channel, payload: callback(payload)
+        )
+        return conn
@@ -0,0 +1,173 @@
+"""
+Concorrência otimista entre instâncias - StormBet Apostas
+Várias instâncias do bot (MULTIPLOS_BOTS_RENDER.md) compartilham o mesmo
+PostgreSQL. Cada chave do estado tem uma versão (tabela state_versions):
+a gravação só acontece se a versão lida ainda for a atual (compare-and-swap)
+e cada commit é anunciado via NOTIFY para as outras instâncias.
+"""
+
+import json
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+NOTIFY_CHANNEL = "stormbet_state"
+# Limite do payload do NOTIFY é 8000 bytes; acima disso só a versão é enviada
+NOTIFY_MAX_BYTES = 7500
+
+# Seções que compartilham linha/chave no PostgreSQL têm uma única versão
+VERSION_GROUPS = {
+    'queues': 'queues',
+    'queue_timestamps': 'queues',
+    'queue_metadata': 'queue_metadata',
+    'active_bets': 'active_bets',
+    'mediator_roles': 'guild_config',
+    'languages': 'guild_config',
+    'results_channels': 'guild_config',
+    'subscriptions': 'subscriptions',
+    'mediator_central': 'mediator_central',
+    'mediator_pix_keys': 'mediator_pix_keys',
+}
+
+GROUP_SECTIONS: Dict[str, Tuple[str, ...]] = {}
+for _section, _group in VERSION_GROUPS.items():
+    GROUP_SECTIONS[_group] = GROUP_SECTIONS.get(_group, ()) + (_section,)
+del _section, _group
+
+VersionKey = Tuple[str, str]
+
+
+def versioned_keys(dirty: Dict[str, Optional[Set[str]]]) -> Tuple[Set[VersionKey], Set[str]]:
+    """Separa as chaves sujas em (grupo, chave) e grupos gravados inteiros"""
+    keys, whole_groups = set(), set()
+    for section, section_keys in dirty.items():
+        group = VERSION_GROUPS.get(section)
+        if group is None:
+            continue
+        if section_keys is None:
+            whole_groups.add(group)
+        else:
+            keys.update((group, key) for key in section_keys)
+    return {k for k in keys if k[0] not in whole_groups}, whole_groups
+
+
+def expand_whole_sections(data: dict, dirty: Dict[str, Optional[Set[str]]],
+                          known: Iterable[VersionKey]) -> Dict[str, Optional[Set[str]]]:
+    """Troca as seções sujas inteiras pelas suas chaves, para que cada uma
+    passe pelo compare-and-swap
+
+    Chaves de um grupo = as que existem em qualquer seção dele + as que já
+    têm versão no PostgreSQL (apagadas aqui desde a última leitura).
+    """
+    whole = {VERSION_GROUPS[s] for s, keys in dirty.items() if keys is None and s in VERSION_GROUPS}
+    if not whole:
+        return dirty
+    group_keys = {group: {key for g, key in known if g == group} for group in whole}
+    for group in whole:
+        for section in GROUP_SECTIONS[group]:
+            group_keys[group].update(data.get(section, {}).keys())
+    return {
+        section: set(group_keys[VERSION_GROUPS[section]]) if keys is None and section in VERSION_GROUPS else keys
+        for section, keys in dirty.items()
+    }
+
+
+def without_keys(dirty: Dict[str, Optional[Set[str]]], excluded: Iterable[VersionKey]) -> dict:
+    """Cópia de `dirty` sem as chaves (grupo, chave) informadas"""
+    excluded_by_group = {}
+    for group, key in excluded:
+        excluded_by_group.setdefault(group, set()).add(key)
+    result = {}
+    for section, keys in dirty.items():
+        skip = excluded_by_group.get(VERSION_GROUPS.get(section))
+        if keys is None or not skip:
+            result[section] = keys
+        elif keys - skip:
+            result[section] = keys - skip
+    return result
+
+
+def group_values(data: dict, group: str, key: str) -> dict:
+    """Valor da chave em cada seção do grupo (None = ausente)"""
+    return {section: data.get(section, {}).get(key) for section in GROUP_SECTIONS[group]}
+
+
+def build_notify_payloads(instance_id: str, data: dict, versions: Dict[VersionKey, int]) -> List[str]:
+    """Payloads do NOTIFY: mudanças com os valores novos, em lotes < 8000 bytes"""
+    changes = []
+    for (group, key), version in versions.items():
+        change = {'s': group, 'k': key, 'v': version, 'd': group_values(data, group, key)}
+        if len(json.dumps(change, separators=(',', ':'))) > NOTIFY_MAX_BYTES:
+            # Grande demais: quem receber busca o valor no PostgreSQL
+            del change['d']
+        changes.append(change)
+
+    payloads, batch, size = [], [], 0
+    for change in changes:
+        encoded = len(json.dumps(change, separators=(',', ':')))
+        if batch and size + encoded > NOTIFY_MAX_BYTES:
+            payloads.append(json.dumps({'i': instance_id, 'c': batch}, separators=(',', ':')))
+            batch, size = [], 0
+        batch.append(change)
+        size += encoded + 1
+    if batch:
+        payloads.append(json.dumps({'i': instance_id, 'c': batch}, separators=(',', ':')))
+    return payloads
+
+
+# ==================== MERGE DE CONFLITOS ====================
+
+def merge_members(base: Iterable, ours: Optional[list], theirs: Optional[list]) -> list:
+    """Merge de três vias de uma lista de membros (ordem de entrada preservada)
+
+    Mantém o que a outra instância fez (theirs), remove quem saiu aqui
+    e acrescenta no fim quem entrou aqui desde a versão base.
+    """
+    base = set(base or ())
+    ours = list(ours or ())
+    ours_set = set(ours)
+    removed_here = base - ours_set
+    merged = [member for member in (theirs or ()) if member not in removed_here]
+    merged_set = set(merged)
+    for member in ours:
+        if member not in base and member not in merged_set:
+            merged.append(member)
+            merged_set.add(member)
+    return merged
+
+
+def merge_group(group: str, base, ours: dict, theirs: dict) -> dict:
+    """Resolve um conflito de versão para uma chave; retorna o valor por seção
+
+    Filas e a central de mediadores fazem merge de membros; nas demais
+    seções a mudança local é reaplicada sobre a versão mais nova.
+    """
+    if group == 'queues':
+        if ours['queues'] is None:
+            return {'queues': None, 'queue_timestamps': None}
+        members = merge_members(base, ours['queues'], theirs['queues'])
+        timestamps = {}
+        for source in (theirs['queue_timestamps'] or {}, ours['queue_timestamps'] or {}):
+            timestamps.update({uid: ts for uid, ts in source.items() if int(uid) in members})
+        return {'queues': members, 'queue_timestamps': timestamps}
+
+    if group == 'mediator_central' and ours['mediator_central'] and theirs['mediator_central']:
+        ours_members = ours['mediator_central'].get('mediators', {})
+        theirs_members = theirs['mediator_central'].get('mediators', {})
+        order = merge_members(base, list(ours_members), list(theirs_members))
+        merged = dict(ours['mediator_central'])
+        # Entrada nossa vence mesmo vazia ({} é falso)
+        merged['mediators'] = {
+            uid: ours_members[uid] if uid in ours_members else theirs_members[uid]
+            for uid in order
+        }
+        return {'mediator_central': merged}
+
+    return ours
+
+
+def base_members(group: str, values: dict):
+    """Parte do valor usada como base no merge de três vias (None se não houver)"""
+    if group == 'queues':
+        return list(values['queues'] or ())
+    if group == 'mediator_central':
+        return list((values['mediator_central'] or {}).get('mediators', {}))
+    return None
@@ -0,0 +1,87 @@
+"""
+Snapshots periódicos do estado - StormBet Apostas
+Cópias completas, comprimidas e com data/hora, gravadas em background
+apenas quando o estado mudou. Mantém as N gerações mais recentes.
+"""
+
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import List, Optional
+
+logger = logging.getLogger('bot')
+
+
+class SnapshotService:
+    """Gerações `state-AAAAMMDD-HHMMSS.json.gz` em `directory`"""
+
+    PREFIX = "state-"
+    SUFFIX = ".json.gz"
+
+    def __init__(self, directory: str, interval: float = 900, keep: int = 12):
+        self.directory = directory
+        self.interval = interval
+        self.keep = max(keep, 1)
+        self.last_version = None
+        os.makedirs(self.directory, exist_ok=True)
+        generations = self.generations()
+        self.last_snapshot_at = os.path.getmtime(generations[-1]) if generations else None
+
+    def generations(self) -> List[str]:
+        """Snapshots existentes, do mais antigo ao mais recente"""
+        names = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(self.PREFIX) and name.endswith(self.SUFFIX)
+        )
+        return [os.path.join(self.directory, name) for name in names]
+
+    def age(self) -> Optional[float]:
+        """Segundos desde o último snapshot (None se nunca houve)"""
+        if self.last_snapshot_at is None:
+            return None
+        return time.time() - self.last_snapshot_at
+
+    def write(self, data: dict, version: int) -> Optional[str]:
+        """Grava uma nova geração (atômica) se a versão do estado mudou"""
+        if version == self.last_version:
+            return None
+
+        now = time.time()
+        stamp = datetime.fromtimestamp(now).strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"{self.PREFIX}{stamp}{self.SUFFIX}")
+        temp_file = f"{path}.tmp"
+        try:
+            with gzip.open(temp_file, 'wt', encoding='utf-8') as f:
+                json.dump({'version': version, 'ts': now, 'data': data}, f,
+                          ensure_ascii=False, separators=(',', ':'))
+            os.replace(temp_file, path)
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+        self.last_version = version
+        self.last_snapshot_at = now
+        self._prune()
+        logger.info(f"🗄️ Snapshot gravado: {os.path.basename(path)}")
+        return path
+
+    def _prune(self):
+        for path in self.generations()[:-self.keep]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"⚠️ Não foi possível remover snapshot antigo {path}: {e}")
+
+    def load_latest(self) -> Optional[dict]:
+        """Estado do snapshot mais recente legível (último recurso na recuperação)"""
+        for path in reversed(self.generations()):
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    return json.load(f).get('data')
+            except Exception as e:
+                logger.warning(f"⚠️ Snapshot {os.path.basename(path)} ilegível: {e}")
+        return None
@@ -0,0 +1,227 @@
+"""
+Backend SQLite (WAL) - StormBet Apostas
+Mesmas tabelas normalizadas do PostgreSQL num arquivo local, só com a
+biblioteca padrão. Cada flush é UMA transação com as linhas alteradas;
+em modo WAL o fsync acontece no checkpoint, agrupando vários commits.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from utils.postgres_store import LOAD_QUERIES, assemble_document, build_write_statements
+
+logger = logging.getLogger('bot')
+
+SQLITE_SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS stormbet_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """,
+    "CREATE TABLE IF NOT EXISTS queues (queue_id TEXT PRIMARY KEY)",
+    """
+    CREATE TABLE IF NOT EXISTS queue_members (
+        queue_id TEXT NOT NULL REFERENCES queues(queue_id) ON DELETE CASCADE,
+        user_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        joined_at TEXT,
+        PRIMARY KEY (queue_id, user_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_queue_members_user ON queue_members(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_queue_members_joined ON queue_members(joined_at)",
+    """
+    CREATE TABLE IF NOT EXISTS queue_metadata (
+        message_id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        mode TEXT NOT NULL,
+        bet_value REAL NOT NULL,
+        mediator_fee REAL NOT NULL,
+        channel_id INTEGER NOT NULL,
+        currency_type TEXT NOT NULL DEFAULT 'sonhos',
+        state TEXT NOT NULL DEFAULT 'live',
+        state_since TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_queue_metadata_channel "
+    "ON queue_metadata(channel_id)",
+    """
+    CREATE TABLE IF NOT EXISTS active_bets (
+        bet_id TEXT PRIMARY KEY,
+        channel_id INTEGER NOT NULL,
+        mediator_id INTEGER,
+        data TEXT NOT NULL,
+        created_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_active_bets_channel ON active_bets(channel_id)",
+    """
+    CREATE TABLE IF NOT EXISTS guild_config (
+        guild_id INTEGER PRIMARY KEY,
+        mediator_role_id INTEGER,
+        language TEXT,
+        results_channel_id INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS subscriptions (
+        guild_id INTEGER PRIMARY KEY,
+        permanent INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT,
+        expires_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_subscriptions_expires ON subscriptions(expires_at)",
+    """
+    CREATE TABLE IF NOT EXISTS mediator_central (
+        guild_id INTEGER PRIMARY KEY,
+        channel_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        created_at TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS mediator_central_members (
+        guild_id INTEGER NOT NULL
+            REFERENCES mediator_central(guild_id) ON DELETE CASCADE,
+        user_id INTEGER NOT NULL,
+        pix TEXT,
+        joined_at TEXT NOT NULL,
+        PRIMARY KEY (guild_id, user_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_central_members_joined "
+    "ON mediator_central_members(guild_id, joined_at)",
+    """
+    CREATE TABLE IF NOT EXISTS mediator_pix_keys (
+        user_id INTEGER PRIMARY KEY,
+        pix TEXT NOT NULL
+    )
+    """,
+]
+
+# Colunas acrescentadas depois da criação do schema: (tabela, coluna, definição)
+SQLITE_ADDED_COLUMNS = [
+    ('queue_metadata', 'state', "TEXT NOT NULL DEFAULT 'live'"),
+    ('queue_metadata', 'state_since', 'TEXT'),
+]
+
+# O histórico continua no ledger local (utils/history.py)
+LOCAL_SECTIONS_EXCLUDED = ('bet_history',)
+
+
+def _to_sqlite(sql: str) -> str:
+    """Converte SQL gerado para o PostgreSQL (%s, ::jsonb) para o SQLite (?)"""
+    return sql.replace('::jsonb', '').replace('%s', '?')
+
+
+def _adapt(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+class SQLiteStore:
+    """
+    Estado normalizado num arquivo SQLite em modo WAL
+
+    `load()` remonta o documento em memória e `apply()` grava só as
+    chaves sujas, numa transação. As consultas são sempre as mesmas
+    strings parametrizadas, reaproveitadas do cache de statements.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sql_cache = {}
+        # Gravações rodam no thread do flush; o _lock serializa o acesso
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, cached_statements=256
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                for statement in SQLITE_SCHEMA_SQL:
+                    self.conn.execute(statement)
+                # SQLite não tem ADD COLUMN IF NOT EXISTS
+                for table, column, definition in SQLITE_ADDED_COLUMNS:
+                    rows = self.conn.execute(f"PRAGMA table_info({table})")
+                    if column not in {row[1] for row in rows}:
+                        self.conn.execute(
+                            f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
+                        )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _sql(self, sql: str) -> str:
+        converted = self._sql_cache.get(sql)
+        if converted is None:
+            converted = self._sql_cache[sql] = _to_sqlite(sql)
+        return converted
+
+    def is_empty(self) -> bool:
+        """Indica se o banco ainda não recebeu nenhum dado (primeira execução)"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT value FROM stormbet_meta WHERE key = 'initialized'"
+            ).fetchone() is None
+
+    def load(self) -> dict:
+        """Remonta o documento de estado a partir das tabelas"""
+        with self._lock:
+            results = [self.conn.execute(query).fetchall() for query in LOAD_QUERIES]
+        data = assemble_document(results)
+        for subscription in data['subscriptions'].values():
+            subscription['permanent'] = bool(subscription['permanent'])
+        return data
+
+    def apply(self, data: dict, dirty: Dict[str, Optional[Set[str]]]):
+        """Grava as chaves sujas de `data` numa única transação"""
+        dirty = {
+            section: keys for section, keys in dirty.items()
+            if section not in LOCAL_SECTIONS_EXCLUDED
+        }
+        statements = build_write_statements(data, dirty)
+        if not statements:
+            return
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                for sql, params in statements:
+                    params = tuple(_adapt(param) for param in params)
+                    self.conn.execute(self._sql(sql), params)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def import_document(self, data: dict):
+        """Substitui todo o conteúdo das tabelas pelo documento informado"""
+        self.apply(data, dict.fromkeys(data))
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO stormbet_meta (key, value) "
+                "VALUES ('initialized', ?)",
+                (datetime.now().isoformat(),),
+            )
+        logger.info(f"🗃️ Estado importado para o SQLite: {self.path}")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()